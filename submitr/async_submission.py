@@ -0,0 +1,206 @@
+# This file contains an asyncio counterpart of the core of submitr.submission, for services that drive many
+# submissions from one event loop rather than running a process per bundle. Its coroutines mirror
+# submit_any_ingestion, check_submit_ingestion, resume_uploads and do_uploads, and are made of the same steps
+# (which the commands use, and which stay the source of truth), but:
+#
+#   * Polling awaits asyncio.sleep (see check_repeatedly_async) rather than blocking in time.sleep.
+#   * The blocking steps, which use requests and boto3, run in thread pools of their own, so they never block
+#     the loop: portal requests in one (see run_blocking), and uploads in another (see run_upload), so that
+#     hours of uploads can't keep a poll waiting for a thread. Each pool has a fixed number of threads,
+#     however many submissions are going on, and a submission's uploads run up to parallel_uploads at a time.
+#   * Nothing is asked of the user, and nothing exits: results are returned, and failures are raised.
+
+import asyncio
+import functools
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .base import DEFAULT_APP, KEY_MANAGER
+from .exceptions import BundleValidationError
+from .submission import (
+    DEFAULT_INGESTION_TYPE, DEFAULT_SUBMISSION_PROTOCOL, UploadBatch,
+    _check_bundle_locally, _check_ingestion_progress, _get_ingestion_submission, _resolve_app_args, _submit_bundle,
+    get_polling_strategy, get_section, resolve_server,
+)
+from .utils import PollingStrategy, check_repeatedly_async
+
+
+ASYNC_PORTAL_THREADS_VAR = 'SUBMITR_ASYNC_PORTAL_THREADS'
+ASYNC_UPLOAD_THREADS_VAR = 'SUBMITR_ASYNC_UPLOAD_THREADS'
+
+# How many threads there are for blocking portal requests (and other quick steps), and for uploads,
+# unless set by the environment variables above when they're first needed.
+DEFAULT_ASYNC_PORTAL_THREADS = 8
+DEFAULT_ASYNC_UPLOAD_THREADS = 16
+
+_EXECUTORS: Dict[str, ThreadPoolExecutor] = {}
+_EXECUTORS_LOCK = threading.Lock()
+
+
+def _executor(kind: str, var: str, default: int) -> ThreadPoolExecutor:
+    with _EXECUTORS_LOCK:
+        executor = _EXECUTORS.get(kind)
+        if executor is None:
+            threads = int(os.environ.get(var) or default)
+            if threads < 1:
+                raise ValueError(f"The value of {var} must be a positive integer: {threads}")
+            executor = _EXECUTORS[kind] = ThreadPoolExecutor(max_workers=threads,
+                                                             thread_name_prefix=f"submitr-async-{kind}")
+        return executor
+
+
+def shutdown_executors() -> None:
+    """
+    Shuts down the thread pools in which blocking steps are run, once they've finished what they're doing.
+    New ones are made if they're needed again.
+    """
+    with _EXECUTORS_LOCK:
+        executors = list(_EXECUTORS.values())
+        _EXECUTORS.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+async def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Calls the given (blocking) function in the thread pool for portal requests, and returns what it returns.
+    That pool has SUBMITR_ASYNC_PORTAL_THREADS threads (default DEFAULT_ASYNC_PORTAL_THREADS).
+    """
+    executor = _executor('portal', ASYNC_PORTAL_THREADS_VAR, DEFAULT_ASYNC_PORTAL_THREADS)
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+async def run_upload(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Calls the given (blocking) function, such as an upload, in the thread pool for uploads,
+    and returns what it returns. That pool has SUBMITR_ASYNC_UPLOAD_THREADS threads
+    (default DEFAULT_ASYNC_UPLOAD_THREADS).
+    """
+    executor = _executor('upload', ASYNC_UPLOAD_THREADS_VAR, DEFAULT_ASYNC_UPLOAD_THREADS)
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+def _resolve_server_and_keydict(server: Optional[str], env: Optional[str], app: Optional[str]) -> Tuple[str, dict]:
+    # This is done in the event loop's thread, without awaiting anything, so that selecting the app (which is global)
+    # can't affect anything else. Everything after this is given the keydict explicitly.
+    app = app or DEFAULT_APP
+    if KEY_MANAGER.selected_app != app:
+        with KEY_MANAGER.locally_selected_app(app):
+            return _resolve_server_and_keydict(server, env, app)
+    server = resolve_server(server=server, env=env if not server else None)
+    return server, KEY_MANAGER.get_keydict_for_server(server)
+
+
+async def submit_any_ingestion(ingestion_filename, *, ingestion_type=DEFAULT_INGESTION_TYPE, server=None, env=None,
+                               validate_only=False, institution=None, project=None, lab=None, award=None,
+                               consortium=None, submission_center=None, app=None, upload_folder=None,
+                               subfolders=False, submission_protocol=DEFAULT_SUBMISSION_PROTOCOL, parallel_uploads=1,
+                               polling_strategy: Optional[PollingStrategy] = None, upload_order=None,
+                               local_validation=True, strict_local_validation=False) -> dict:
+    """
+    Submits a metadata bundle, waits for it to be processed, and (unless validate_only) uploads its files,
+    as submitr.submission.submit_any_ingestion does, but without blocking the event loop.
+    The arguments are as for that, except that there are no queries (no_query) and no upload plans (plan),
+    and that problems found by local_validation are returned rather than shown (or, if strict_local_validation,
+    raised, as a BundleValidationError, before anything is sent).
+
+    :return: a dictionary with the 'uuid' of the IngestionSubmission, whether its processing is 'done',
+        its 'status' (e.g., 'success' or 'error', if done), the last 'response' about it,
+        the 'outcomes' of any uploads (see do_uploads), and the 'bundle_problems' local_validation found
+        and the sheets it left to the portal ('sheets_skipped'), both empty if it wasn't done
+    """
+    app = app or DEFAULT_APP
+    app_args = _resolve_app_args(institution=institution, project=project, lab=lab, award=award, app=app,
+                                 consortium=consortium, submission_center=submission_center)
+    validator = await run_blocking(_check_bundle_locally, ingestion_filename, ingestion_type=ingestion_type,
+                                   upload_folder=upload_folder, subfolders=subfolders,
+                                   local_validation=local_validation)
+    problems = validator.problems if validator is not None else []
+    if problems and strict_local_validation:
+        raise BundleValidationError(ingestion_filename, problems)
+    server, keydict = _resolve_server_and_keydict(server, env, app)
+    uuid = await run_blocking(_submit_bundle, ingestion_filename, ingestion_type=ingestion_type, server=server,
+                              keydict=keydict, app_args=app_args, validate_only=validate_only,
+                              submission_protocol=submission_protocol)
+
+    check_done, check_status, check_response = await _await_ingestion(
+        uuid, server=server, keypair=KEY_MANAGER.keydict_to_keypair(keydict), polling_strategy=polling_strategy)
+    result = {'uuid': uuid, 'done': check_done, 'status': check_status, 'response': check_response, 'outcomes': [],
+              'bundle_problems': problems, 'sheets_skipped': validator.sheets_skipped if validator is not None else []}
+    if check_status == "success" and not validate_only:
+        upload_info = get_section(check_response, 'upload_info')
+        if upload_info:
+            folder = upload_folder or os.path.dirname(ingestion_filename)
+            result['outcomes'] = await do_uploads(upload_info, auth=keydict, folder=folder, subfolders=subfolders,
+                                                  parallel_uploads=parallel_uploads, upload_order=upload_order)
+    return result
+
+
+async def _await_ingestion(uuid, *, server, keypair, polling_strategy=None) -> Tuple[bool, str, dict]:
+
+    async def check_ingestion_progress():
+        return await run_blocking(_check_ingestion_progress, uuid, keypair=keypair, server=server)
+
+    return await check_repeatedly_async(check_ingestion_progress,
+                                        polling_strategy=polling_strategy or get_polling_strategy())
+
+
+async def check_submit_ingestion(uuid: str, server: Optional[str] = None, env: Optional[str] = None,
+                                 app: Optional[str] = None,
+                                 polling_strategy: Optional[PollingStrategy] = None) -> Tuple[bool, str, dict]:
+    """
+    Checks on the processing of an IngestionSubmission until it's done or the polling strategy gives up,
+    as submitr.submission.check_submit_ingestion does, but awaiting between checks. Rather than exiting
+    if it gives up, it returns (as when it's done) whether it's done, its status, and the last response.
+    """
+    server, keydict = _resolve_server_and_keydict(server, env, app)
+    return await _await_ingestion(uuid, server=server, keypair=KEY_MANAGER.keydict_to_keypair(keydict),
+                                  polling_strategy=polling_strategy)
+
+
+async def resume_uploads(uuid, server=None, env=None, bundle_filename=None, keydict=None, upload_folder=None,
+                         subfolders=False, parallel_uploads=1, upload_order=None, skip_existing=False) -> List[Dict]:
+    """
+    Uploads the files associated with a given IngestionSubmission, as submitr.submission.resume_uploads does,
+    but without blocking the event loop, and returns the outcomes of the uploads (see do_uploads).
+    """
+    if keydict is None:
+        server, keydict = _resolve_server_and_keydict(server, env, app=None)
+    else:
+        server = resolve_server(server=server, env=env)
+    upload_info = get_section(await run_blocking(_get_ingestion_submission, uuid, server=server, keydict=keydict),
+                              'upload_info')
+    if not upload_info:
+        return []
+    folder = upload_folder or (os.path.dirname(bundle_filename) if bundle_filename else None)
+    return await do_uploads(upload_info, auth=keydict, folder=folder, subfolders=subfolders,
+                            parallel_uploads=parallel_uploads, upload_order=upload_order,
+                            skip_existing=skip_existing)
+
+
+async def do_uploads(upload_spec_list, auth, folder=None, subfolders=False, parallel_uploads=1,
+                     upload_order=None, skip_existing=False) -> List[Dict]:
+    """
+    Uploads the files (and extra files) mentioned in the given upload_spec_list, as submitr.submission.do_uploads
+    does (with an UploadBatch), up to parallel_uploads at a time, in the thread pool for uploads (see run_upload).
+
+    :return: the outcome of each upload, as a dictionary with keys 'file', 'uuid', 'status' and 'error'
+        (see UploadMessageWrapper.make_outcome)
+    """
+    batch = await run_blocking(UploadBatch, upload_spec_list, auth=auth, folder=folder, no_query=True,
+                               subfolders=subfolders, parallel_uploads=parallel_uploads, upload_order=upload_order,
+                               skip_existing=skip_existing)
+    semaphore = asyncio.Semaphore(max(parallel_uploads, 1))
+
+    async def upload(file_path, uploader_wrapper):
+        async with semaphore:
+            await run_upload(batch.upload, file_path, uploader_wrapper)
+
+    await run_blocking(batch.start)
+    try:
+        await asyncio.gather(*[upload(file_path, uploader_wrapper) for file_path, uploader_wrapper in batch.uploads])
+    finally:
+        await run_upload(batch.stop)  # This waits for any checksums still going.
+    return batch.finish()
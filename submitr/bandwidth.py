@@ -0,0 +1,163 @@
+# This file contains the bandwidth limit for uploads, a token bucket from which the upload engine must take a token
+# for every byte it sends, so that (e.g.) one run of resume-uploads doesn't saturate a network link that's shared
+# with other traffic. The limit applies across all of a process's concurrent uploads, and can optionally be shared,
+# through a lock file, by all the submitr processes on a host that use the same state file.
+
+import io
+import json
+import os
+import threading
+import time
+
+from typing import Optional, Union
+from .base import SUBMITR_DIR
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - e.g., on Windows
+    fcntl = None
+
+
+MAX_BANDWIDTH_VAR = 'SUBMITR_MAX_BANDWIDTH'
+BANDWIDTH_STATE_FILE_VAR = 'SUBMITR_BANDWIDTH_STATE_FILE'
+
+# A rate, such as '400MB/s' (or just '400MB'), or nothing for no limit.
+DEFAULT_MAX_BANDWIDTH = os.environ.get(MAX_BANDWIDTH_VAR) or None
+DEFAULT_BANDWIDTH_STATE_FILE = (os.environ.get(BANDWIDTH_STATE_FILE_VAR)
+                                or os.path.join(SUBMITR_DIR, 'bandwidth_state.json'))
+
+# A shared bucket takes tokens from the state file in lots of at least this many bytes (or a twentieth of
+# a second's worth, if that's more), so that it need not lock the file for every part.
+SHARED_BANDWIDTH_QUANTUM = 256 * 1024
+
+
+def parse_bandwidth(bandwidth: Union[int, float, str]) -> float:
+    """
+    Given a rate such as '400MB/s', '400MB', '1.5G/s' or 1048576, returns a number of bytes per second.
+    """
+    if isinstance(bandwidth, (int, float)):
+        rate = float(bandwidth)
+    else:
+        from .utils import parse_byte_size  # Not imported at top level, so that scripts can import this quickly.
+        text = str(bandwidth).strip()
+        rate = float(parse_byte_size(text[:-2] if text.lower().endswith('/s') else text))
+    if rate <= 0:
+        raise ValueError(f"The maximum bandwidth must be positive: {bandwidth!r}")
+    return rate
+
+
+class TokenBucket:
+    """
+    A token bucket that limits the average rate at which bytes can be consumed (across all threads) to rate
+    bytes per second, allowing bursts of up to burst bytes (default one second's worth).
+
+    A consumer that takes more tokens than the bucket has goes into debt, and waits (outside any lock) until
+    the debt would have been refilled, so that waiting consumers are served in the order they asked.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = parse_bandwidth(rate)
+        self.burst = burst or self.rate
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def _reserve(self, n: float) -> float:
+        """
+        Takes n tokens, returning how many seconds to wait before using them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - n
+            self._updated = now
+            return max(0.0, -self._tokens / self.rate)
+
+    def consume(self, n: int) -> None:
+        """
+        Waits until n bytes can be sent without exceeding the rate.
+        """
+        if n > 0:
+            delay = self._reserve(n)
+            if delay > 0:
+                time.sleep(delay)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A TokenBucket whose tokens are kept in a state file, locked while in use, so that all the processes
+    on a host that use the same file share the same budget. (All of them should use the same rate.)
+    """
+
+    def __init__(self, rate: float, state_file: str = DEFAULT_BANDWIDTH_STATE_FILE, burst: Optional[float] = None):
+        if fcntl is None:  # pragma: no cover - e.g., on Windows
+            raise RuntimeError("A bandwidth limit can't be shared between processes on this platform.")
+        super().__init__(rate=rate, burst=burst)
+        self.state_file = state_file
+        self.quantum = max(SHARED_BANDWIDTH_QUANTUM, self.rate / 20)
+        self._allowance = 0.0  # tokens already taken from the state file, not yet consumed by this process
+
+    def _reserve_shared(self, n: float) -> float:
+        directory = os.path.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with io.open(os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o644), 'r+') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                try:
+                    state = json.loads(fp.read() or '{}')
+                    tokens, updated = float(state['tokens']), float(state['updated'])
+                except (ValueError, KeyError, TypeError):  # A new or damaged state is a full bucket.
+                    tokens, updated = self.burst, time.time()
+                # Unlike monotonic time, this can be compared between processes.
+                now = time.time()
+                tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate) - n
+                fp.seek(0)
+                fp.truncate()
+                fp.write(json.dumps({'tokens': tokens, 'updated': now}))
+                fp.flush()
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+        return max(0.0, -tokens / self.rate)
+
+    def _reserve(self, n: float) -> float:
+        with self._lock:
+            if self._allowance >= n:
+                self._allowance -= n
+                return 0.0
+            needed = max(n - self._allowance, self.quantum)
+            self._allowance += needed - n
+            return self._reserve_shared(needed)
+
+
+_BANDWIDTH_LIMITER: Optional[TokenBucket] = None
+_BANDWIDTH_LIMITER_CONFIGURED = False
+
+
+def configure_bandwidth_limit(max_bandwidth: Union[int, float, str, None] = None, shared: bool = False,
+                              state_file: Optional[str] = None) -> None:
+    """
+    Sets the most bandwidth that uploads (in this process) may use from now on.
+
+    :param max_bandwidth: a rate such as '400MB/s', or None for no limit (default SUBMITR_MAX_BANDWIDTH)
+    :param shared: whether to share the limit with other processes that use the same state file
+    :param state_file: the state file of a shared limit (default DEFAULT_BANDWIDTH_STATE_FILE)
+    """
+    global _BANDWIDTH_LIMITER, _BANDWIDTH_LIMITER_CONFIGURED
+    max_bandwidth = DEFAULT_MAX_BANDWIDTH if max_bandwidth is None else max_bandwidth
+    if not max_bandwidth:
+        _BANDWIDTH_LIMITER = None
+    elif shared:
+        _BANDWIDTH_LIMITER = SharedTokenBucket(max_bandwidth, state_file=state_file or DEFAULT_BANDWIDTH_STATE_FILE)
+    else:
+        _BANDWIDTH_LIMITER = TokenBucket(max_bandwidth)
+    _BANDWIDTH_LIMITER_CONFIGURED = True
+
+
+def get_bandwidth_limiter() -> Optional[TokenBucket]:
+    """
+    Returns the TokenBucket shared by all uploads, or None if their bandwidth isn't limited.
+    Unless configure_bandwidth_limit says otherwise, the limit comes from SUBMITR_MAX_BANDWIDTH.
+    """
+    if not _BANDWIDTH_LIMITER_CONFIGURED:
+        configure_bandwidth_limit()
+    return _BANDWIDTH_LIMITER
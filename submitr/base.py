@@ -1,9 +1,12 @@
+# This file is imported by every command, so (like the command scripts themselves) it must stay quick to import.
+# Anything slow to import, such as dcicutils.creds_utils, is only imported once it's actually needed.
+
 import contextlib
+import importlib
 import os
 
 from dcicutils.common import OrchestratedApp, APP_CGAP, APP_FOURFRONT, APP_SMAHT, ORCHESTRATED_APPS
-from dcicutils.creds_utils import KeyManager, CGAPKeyManager, FourfrontKeyManager, SMaHTKeyManager
-from dcicutils.exceptions import InvalidParameterError
+from typing import Callable, Dict
 
 
 # TODO: Integrate this better with dcicutils.env_utils
@@ -32,28 +35,115 @@ def _compute_default_app():  # factored out as a function for testing
 DEFAULT_ENV = _compute_default_env()
 DEFAULT_APP = _compute_default_app()
 
+# This is where submitr keeps state, such as its upload journal, between runs.
+SUBMITR_DIR_VAR = 'SUBMITR_DIR'
+SUBMITR_DIR = os.environ.get(SUBMITR_DIR_VAR) or os.path.join(os.path.expanduser('~'), '.submitr')
+
+
+# These are used by the command scripts to set up their arguments, which must be possible without importing
+# submitr.submission (which uses them, too).
+
+class SubmissionProtocol:
+    S3 = 's3'
+    UPLOAD = 'upload'
+
+
+SUBMISSION_PROTOCOLS = [SubmissionProtocol.S3, SubmissionProtocol.UPLOAD]
+DEFAULT_SUBMISSION_PROTOCOL = SubmissionProtocol.UPLOAD
+
+DEFAULT_INGESTION_TYPE = 'metadata_bundle'
+
+PROGRESS_CHECK_INTERVAL = 15  # seconds
+ATTEMPTS_BEFORE_TIMEOUT = 40
+
+# These environment variables, if set, give the defaults for a PollingStrategy (see get_polling_strategy).
+POLL_INTERVAL_VAR = 'SUBMITR_POLL_INTERVAL'
+POLL_MAX_INTERVAL_VAR = 'SUBMITR_POLL_MAX_INTERVAL'
+POLL_BACKOFF_VAR = 'SUBMITR_POLL_BACKOFF'
+POLL_JITTER_VAR = 'SUBMITR_POLL_JITTER'
+POLL_DEADLINE_VAR = 'SUBMITR_POLL_DEADLINE'
+
+
+def add_polling_arguments(parser) -> None:
+    """
+    Adds the --poll-* arguments, which a command gives to get_polling_strategy (see polling_arguments),
+    to the given argparse parser.
+    """
+    group = parser.add_argument_group(
+        'polling', description=f"By default, the submission is checked every {PROGRESS_CHECK_INTERVAL} seconds,"
+                               f" giving up after {ATTEMPTS_BEFORE_TIMEOUT} checks.")
+    group.add_argument('--poll-interval', '--poll_interval', type=int, default=None,
+                       help=f"seconds to wait before checking again on the submission"
+                            f" (default ${POLL_INTERVAL_VAR} or {PROGRESS_CHECK_INTERVAL},"
+                            f" or the --poll-max-interval if that's less)")
+    group.add_argument('--poll-max-interval', '--poll_max_interval', type=int, default=None,
+                       help=f"the most seconds to wait between checks (default ${POLL_MAX_INTERVAL_VAR} or no limit)")
+    group.add_argument('--poll-backoff', '--poll_backoff', type=float, default=None,
+                       help=f"how many times longer each wait is than the one before"
+                            f" (default ${POLL_BACKOFF_VAR} or 1)")
+    group.add_argument('--poll-jitter', '--poll_jitter', type=float, default=None,
+                       help=f"a fraction by which to randomly vary each wait (default ${POLL_JITTER_VAR} or 0)")
+    group.add_argument('--poll-deadline', '--poll_deadline', type=float, default=None,
+                       help=f"seconds after which to stop checking (default ${POLL_DEADLINE_VAR},"
+                            f" or else stop after {ATTEMPTS_BEFORE_TIMEOUT} checks)")
+
+
+def polling_arguments(args) -> Dict[str, float]:
+    """
+    Returns the keyword arguments for get_polling_strategy given by the --poll-* arguments (see add_polling_arguments)
+    in the given parsed args.
+    """
+    return {'interval': args.poll_interval, 'max_interval': args.poll_max_interval, 'backoff': args.poll_backoff,
+            'jitter': args.poll_jitter, 'deadline': args.poll_deadline}
+
+
+def lazy_function(module_name: str, name: str) -> Callable:
+    """
+    Returns a function that, when called, imports the named module (if it hasn't been already)
+    and calls the function of the given name in it.
+
+    This lets a command script define the names of the functions it calls (so that, e.g., they can be mocked)
+    without paying for importing the modules that implement them until they're called, if they ever are.
+    """
+    def lazy(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), name)(*args, **kwargs)
+    lazy.__name__ = lazy.__qualname__ = name
+    lazy.__doc__ = f"Calls {module_name}.{name}, importing {module_name} if need be."
+    return lazy
+
 
 class GenericKeyManager:
 
     # TODO: This might want to move to dcicutils at some point, but it'd need more trampoline methods
     #       -kmp 24-Feb-2023
 
+    # The names of the dcicutils.creds_utils classes of key manager for each app.
+    KEY_MANAGER_CLASS_NAMES = {
+        APP_CGAP: 'CGAPKeyManager',
+        APP_FOURFRONT: 'FourfrontKeyManager',
+        APP_SMAHT: 'SMaHTKeyManager',
+    }
+
     def __init__(self):
-        self._cgap_key_manager: KeyManager = CGAPKeyManager()
-        self._fourfront_key_manager: KeyManager = FourfrontKeyManager()
-        self._smaht_key_manager: KeyManager = SMaHTKeyManager()
-        self._key_manager: KeyManager = self._smaht_key_manager
+        # The key manager for each app is only made when first needed.
+        self._key_managers: Dict[OrchestratedApp, 'KeyManager'] = {}  # noQA - KeyManager is imported lazily
+        self._key_manager_app = APP_SMAHT
         self._selected_app = DEFAULT_APP
 
+    @property
+    def _key_manager(self) -> 'KeyManager':  # noQA - KeyManager is imported lazily
+        key_manager = self._key_managers.get(self._key_manager_app)
+        if key_manager is None:
+            creds_utils = importlib.import_module('dcicutils.creds_utils')
+            key_manager_class = getattr(creds_utils, self.KEY_MANAGER_CLASS_NAMES[self._key_manager_app])
+            key_manager = self._key_managers[self._key_manager_app] = key_manager_class()
+        return key_manager
+
     def select_app(self, app: OrchestratedApp):
-        if app == APP_CGAP:
-            self._key_manager = self._cgap_key_manager
-        elif app == APP_FOURFRONT:
-            self._key_manager = self._fourfront_key_manager
-        elif app == APP_SMAHT:
-            self._key_manager = self._smaht_key_manager
-        else:
+        if app not in self.KEY_MANAGER_CLASS_NAMES:
+            from dcicutils.exceptions import InvalidParameterError
             raise InvalidParameterError(parameter='app', value=app, options=ORCHESTRATED_APPS)
+        self._key_manager_app = app
         self._selected_app = app
 
     @property
@@ -69,6 +159,19 @@ class GenericKeyManager:
         finally:
             self.select_app(old_app)
 
+    @contextlib.contextmanager
+    def locally_using_keys_file(self, keys_file: str):
+        """
+        Within the context, gets keys for the selected app from the given keys file, rather than the usual one.
+        """
+        key_manager = self._key_manager
+        old_keys_file = key_manager.keys_file
+        try:
+            key_manager.keys_file = keys_file
+            yield
+        finally:
+            key_manager.keys_file = old_keys_file
+
     def get_keydict_for_env(self, env):
         return self._key_manager.get_keydict_for_env(env)
 
@@ -85,4 +188,10 @@ class GenericKeyManager:
 
 KEY_MANAGER = GenericKeyManager()
 
-DefaultKeyManager = SMaHTKeyManager
+
+def __getattr__(name):
+    # DefaultKeyManager is SMaHTKeyManager, but dcicutils.creds_utils is only imported if it's asked for.
+    if name == 'DefaultKeyManager':
+        from dcicutils.creds_utils import SMaHTKeyManager
+        return SMaHTKeyManager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
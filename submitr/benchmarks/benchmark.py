@@ -0,0 +1,242 @@
+"""
+Measures the throughput of submitr's submission and upload machinery against a local fake portal and S3 service
+(see submitr.benchmarks.fake_portal), using synthetic bundles of a given number of files of a given size.
+
+For each scenario, this reports files per second, megabytes per second, the median (p50) and 99th percentile (p99)
+time from requesting a file's upload credentials until the fake S3 service has all of it, and the peak resident
+memory (RSS) of the process so far. (The fake servers run in the same process, but keep none of the uploaded data.)
+
+Scenarios:
+  submit   - submit_any_ingestion, from posting the bundle through uploading its files
+  async-submit - the same, with the asyncio submit_any_ingestion of submitr.async_submission
+  uploads  - do_uploads, given the upload_info directly
+  resume   - resume_uploads, getting the upload_info from the (fake) IngestionSubmission
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import uuid as uuid_module
+
+from dcicutils.misc_utils import local_attrs, PRINT
+from typing import List, Optional
+from .. import async_submission as async_submission_module
+from .. import checksums as checksums_module
+from .. import submission as submission_module
+from .. import upload_journal as upload_journal_module
+from .. import upload_throughput as upload_throughput_module
+from ..base import KEY_MANAGER, DEFAULT_INGESTION_TYPE, SubmissionProtocol
+from ..checksums import ChecksumCache, FileChecksummer
+from ..portal_cache import configure_portal_cache
+from ..s3_upload import S3UploadEngine, UploadMode
+from ..upload_journal import UploadJournal
+from ..upload_throughput import UploadThroughputHistory
+from ..utils import parse_byte_size, PollingStrategy
+from .fake_portal import FakePortal
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - e.g., on Windows
+    resource = None
+
+
+EPILOG = __doc__
+
+SCENARIOS = ['submit', 'async-submit', 'uploads', 'resume']
+BENCHMARK_FILE_EXTENSION = '.fastq.gz'
+BENCHMARK_BUNDLE = 'benchmark-bundle.json'
+WRITE_BLOCK_SIZE = 1024 ** 2
+
+
+def make_synthetic_bundle(folder: str, file_count: int, file_size: int) -> List[dict]:
+    """
+    Writes a bundle file and file_count files of file_size random-ish bytes into folder,
+    returning upload_info (a list of dictionaries with 'uuid' and 'filename') for the files.
+    """
+    block = os.urandom(min(file_size, WRITE_BLOCK_SIZE)) if file_size else b''
+    upload_info = []
+    for i in range(file_count):
+        filename = f"benchmark-file-{i + 1:06d}{BENCHMARK_FILE_EXTENSION}"
+        with io.open(os.path.join(folder, filename), 'wb') as fp:
+            remaining = file_size
+            while remaining > 0:
+                fp.write(block[:remaining])
+                remaining -= len(block)
+        upload_info.append({'uuid': str(uuid_module.uuid4()), 'filename': filename})
+    # The fake portal doesn't look at the bundle, but it's checked locally before it's submitted (see validate_bundle).
+    with io.open(os.path.join(folder, BENCHMARK_BUNDLE), 'w') as fp:
+        json.dump([{'Individual ID': f"benchmark-individual-{i + 1:06d}", 'Sex': 'U', 'Relation to Proband': 'Proband',
+                    'Report Required': 'N', 'Analysis ID': 'benchmark-analysis',
+                    'Specimen ID': f"benchmark-specimen-{i + 1:06d}", 'Specimen Type': 'Peripheral Blood',
+                    'Workup Type': 'WGS', 'Files': upload_spec['filename']}
+                   for i, upload_spec in enumerate(upload_info)], fp)
+    return upload_info
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    """
+    Returns the given percentile of the values (by the nearest-rank method), or None if there are none.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def peak_rss_megabytes() -> Optional[float]:
+    """
+    Returns the peak resident memory of this process so far, in megabytes, or None if that can't be known.
+    """
+    if resource is None:  # pragma: no cover - e.g., on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, kilobytes elsewhere
+
+
+@contextlib.contextmanager
+def benchmark_environment(portal: FakePortal, folder: str, part_size: Optional[int] = None, verbose: bool = False):
+    """
+    Within the context, submitr talks only to the given fake portal (and its fake S3 service),
+    keeping its upload journal, checksum cache and throughput history in the given folder,
+    and its portal cache out of the way.
+    """
+    keys_file = os.path.join(folder, 'benchmark-keys.json')
+    with io.open(keys_file, 'w') as fp:
+        json.dump({'benchmark': portal.keydict}, fp)
+    upload_engine = S3UploadEngine(part_size=part_size, endpoint_url=portal.s3_endpoint_url)
+    upload_journal = UploadJournal(os.path.join(folder, 'upload_journal.json'))
+    checksummer = FileChecksummer(cache=ChecksumCache(os.path.join(folder, 'checksum_cache.json')))
+    throughput_history = UploadThroughputHistory(os.path.join(folder, 'upload_throughput.json'))
+    configure_portal_cache(enabled=False)
+    try:
+        with KEY_MANAGER.locally_using_keys_file(keys_file):
+            with local_attrs(submission_module, _UPLOAD_ENGINE=upload_engine, DEFAULT_UPLOAD_MODE=UploadMode.PYTHON):
+                with local_attrs(upload_journal_module, _UPLOAD_JOURNAL=upload_journal):
+                    with local_attrs(checksums_module, _FILE_CHECKSUMMER=checksummer):
+                        with local_attrs(upload_throughput_module, _UPLOAD_THROUGHPUT_HISTORY=throughput_history):
+                            with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+                                yield
+    finally:
+        configure_portal_cache()
+
+
+def run_scenario(scenario: str, portal: FakePortal, folder: str, upload_info: List[dict],
+                 parallel_uploads: int = 1) -> None:
+    if scenario == 'submit':
+        try:
+            submission_module.submit_any_ingestion(os.path.join(folder, BENCHMARK_BUNDLE),
+                                                   ingestion_type=DEFAULT_INGESTION_TYPE, server=portal.server,
+                                                   env=None, validate_only=False, no_query=True,
+                                                   submission_protocol=SubmissionProtocol.UPLOAD,
+                                                   parallel_uploads=parallel_uploads,
+                                                   polling_strategy=PollingStrategy(initial_interval=0,
+                                                                                    max_attempts=10))
+        except SystemExit as e:
+            if e.code:
+                raise RuntimeError(f"submit_any_ingestion exited with status {e.code}.")
+    elif scenario == 'async-submit':
+        result = asyncio.run(async_submission_module.submit_any_ingestion(
+            os.path.join(folder, BENCHMARK_BUNDLE), ingestion_type=DEFAULT_INGESTION_TYPE, server=portal.server,
+            submission_protocol=SubmissionProtocol.UPLOAD, parallel_uploads=parallel_uploads,
+            polling_strategy=PollingStrategy(initial_interval=0, max_attempts=10)))
+        if result['status'] != 'success':
+            raise RuntimeError(f"The submission's processing ended with status {result['status']!r}.")
+    elif scenario == 'uploads':
+        submission_module.do_uploads(upload_info, auth=portal.keydict, folder=folder, no_query=True,
+                                     parallel_uploads=parallel_uploads)
+    elif scenario == 'resume':
+        submission_module.resume_uploads(str(uuid_module.uuid4()), server=portal.server, keydict=portal.keydict,
+                                         upload_folder=folder, no_query=True, parallel_uploads=parallel_uploads)
+    else:
+        raise ValueError(f"Unknown benchmark scenario: {scenario!r}. Expected one of {', '.join(SCENARIOS)}.")
+
+
+def run_benchmark(scenario: str, file_count: int = 20, file_size: int = 1024 ** 2, parallel_uploads: int = 1,
+                  part_size: Optional[int] = None, verbose: bool = False) -> dict:
+    """
+    Runs the given scenario against a fresh fake portal and synthetic bundle, returning a dictionary of measurements.
+    """
+    with tempfile.TemporaryDirectory(prefix='submitr-benchmark-') as folder:
+        upload_info = make_synthetic_bundle(folder, file_count=file_count, file_size=file_size)
+        with FakePortal(upload_info=upload_info) as portal:
+            with benchmark_environment(portal, folder, part_size=part_size, verbose=verbose):
+                start = time.perf_counter()
+                run_scenario(scenario, portal, folder, upload_info, parallel_uploads=parallel_uploads)
+                seconds = time.perf_counter() - start
+            expected_uuids = {item['uuid'] for item in upload_info}
+            uploads = [upload for upload in portal.completed_uploads() if upload.uuid in expected_uuids]
+            request_counts = dict(portal.request_counts)
+    latencies = [upload.latency for upload in uploads]
+    megabytes = sum(upload.size for upload in uploads) / 1024 ** 2
+    return {
+        'scenario': scenario,
+        'files': len(uploads),
+        'failed': file_count - len(uploads),
+        'megabytes': megabytes,
+        'seconds': seconds,
+        'files_per_second': len(uploads) / seconds,
+        'megabytes_per_second': megabytes / seconds,
+        'p50_seconds': percentile(latencies, 50),
+        'p99_seconds': percentile(latencies, 99),
+        'peak_rss_megabytes': peak_rss_megabytes(),
+        'requests': request_counts,
+    }
+
+
+def show_results(results: List[dict]) -> None:
+    def number(value, fmt):
+        return 'n/a' if value is None else fmt % value
+    PRINT("%-8s %6s %6s %9s %9s %8s %8s %8s %8s %9s"
+          % ('scenario', 'files', 'failed', 'MB', 'seconds', 'files/s', 'MB/s', 'p50 s', 'p99 s', 'peak RSS'))
+    for result in results:
+        PRINT("%-8s %6d %6d %9.1f %9.2f %8.1f %8.1f %8s %8s %9s"
+              % (result['scenario'], result['files'], result['failed'], result['megabytes'], result['seconds'],
+                 result['files_per_second'], result['megabytes_per_second'],
+                 number(result['p50_seconds'], '%.3f'), number(result['p99_seconds'], '%.3f'),
+                 number(result['peak_rss_megabytes'], '%.0fMB')))
+
+
+def main(simulated_args_for_testing=None):
+    parser = argparse.ArgumentParser(  # noqa - PyCharm wrongly thinks the formatter_class is invalid
+        description="Benchmarks submitr against a local fake portal and S3 service.",
+        epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"the scenarios to run (default all: {', '.join(SCENARIOS)})")
+    parser.add_argument('--files', '-n', type=int, default=20, help="the number of files in the bundle (default 20)")
+    parser.add_argument('--file-size', '--file_size', '-z', default='1MB',
+                        help="the size of each file, such as 100KB or 64MB (default 1MB)")
+    parser.add_argument('--parallel-uploads', '--parallel_uploads', '-pu', type=int, default=1,
+                        help="how many files to upload at once (default 1)")
+    parser.add_argument('--part-size', '--part_size', default=None,
+                        help="the multipart upload part size (default $SUBMITR_UPLOAD_PART_SIZE or 16MB)")
+    parser.add_argument('--json', default=None, help="a file to which to also write the results as JSON")
+    parser.add_argument('--verbose', '-v', action='store_true', default=False,
+                        help="show submitr's output while running")
+    args = parser.parse_args(args=simulated_args_for_testing)
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"Unknown scenario: {scenario}. Expected one of {', '.join(SCENARIOS)}.")
+
+    results = [run_benchmark(scenario, file_count=args.files, file_size=parse_byte_size(args.file_size),
+                             parallel_uploads=args.parallel_uploads,
+                             part_size=parse_byte_size(args.part_size) if args.part_size else None,
+                             verbose=args.verbose)
+               for scenario in (args.scenarios or SCENARIOS)]
+    show_results(results)
+    if args.json:
+        with io.open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
+    exit(1 if any(result['failed'] for result in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
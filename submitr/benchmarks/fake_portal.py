@@ -0,0 +1,367 @@
+# This file contains a local stand-in for a portal, and for the S3 service it hands out upload credentials for,
+# so that submitr's throughput can be measured (see submitr.benchmarks.benchmark) without a real portal or AWS.
+# It implements only as much of either as submitr uses, and keeps no uploaded content, just its size.
+
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid as uuid_module
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+
+
+FAKE_ACCESS_KEY = {'key': 'benchmark-key', 'secret': 'benchmark-secret'}
+FAKE_BUCKET = 'benchmark-wfoutput'
+FAKE_METADATA_BUNDLES_BUCKET = 'benchmark-metadata-bundles'
+FAKE_USER_RECORD = {
+    'title': 'Benchmark User',
+    'contact_email': 'benchmark@example.org',
+    'consortia': [{'@id': '/consortia/benchmark-consortium/'}],
+    'submission_centers': [{'@id': '/submission-centers/benchmark-center/'}],
+}
+S3_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class FakeUpload:
+    """
+    What the fake portal knows about the upload of one file: when its upload credentials were handed out,
+    and when (and with how many bytes) its upload to the fake S3 service completed.
+    """
+
+    def __init__(self, uuid: str, filename: str, key: str):
+        self.uuid = uuid
+        self.filename = filename
+        self.key = key
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.size: Optional[int] = None
+
+    @property
+    def latency(self) -> Optional[float]:
+        return None if self.finished is None else self.finished - self.started
+
+
+class FakePortal:
+    """
+    A local HTTP server that acts enough like a portal for submit_any_ingestion, do_uploads and resume_uploads,
+    along with a second one that acts enough like S3 for S3UploadEngine (given its URL as endpoint_url).
+
+    Every IngestionSubmission is processed as soon as it's created, successfully, with the given upload_info.
+
+    Use it as a context manager, which starts and stops both servers.
+    """
+
+    def __init__(self, upload_info: Optional[List[dict]] = None, host: str = '127.0.0.1'):
+        self.upload_info = upload_info or []
+        self.host = host
+        self.lock = threading.Lock()
+        self.uploads: Dict[str, FakeUpload] = {}  # keyed by S3 key
+        self.request_counts: Dict[str, int] = {}
+        self.multipart_uploads: Dict[str, dict] = {}  # keyed by upload id
+        self._portal_server: Optional[ThreadingHTTPServer] = None
+        self._s3_server: Optional[ThreadingHTTPServer] = None
+        self._threads: List[threading.Thread] = []
+
+    def __enter__(self) -> 'FakePortal':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self) -> None:
+        self._portal_server = self._serve(FakePortalRequestHandler)
+        self._s3_server = self._serve(FakeS3RequestHandler)
+
+    def _serve(self, handler_class) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer((self.host, 0), handler_class)
+        server.daemon_threads = True
+        server.fake_portal = self
+        thread = threading.Thread(target=server.serve_forever, name=handler_class.__name__, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return server
+
+    def stop(self) -> None:
+        for server in (self._portal_server, self._s3_server):
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    @property
+    def server(self) -> str:
+        return "http://%s:%s" % self._portal_server.server_address[:2]
+
+    @property
+    def s3_endpoint_url(self) -> str:
+        return "http://%s:%s" % self._s3_server.server_address[:2]
+
+    @property
+    def keydict(self) -> dict:
+        return dict(FAKE_ACCESS_KEY, server=self.server)
+
+    def count_request(self, endpoint: str) -> None:
+        with self.lock:
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+
+    def completed_uploads(self) -> List[FakeUpload]:
+        with self.lock:
+            return [upload for upload in self.uploads.values() if upload.finished is not None]
+
+    def make_file_item(self, uuid: str, filename: str) -> dict:
+        key = f"{uuid}/{filename}"
+        with self.lock:
+            self.uploads[key] = FakeUpload(uuid=uuid, filename=filename, key=key)
+        return {
+            '@id': f'/files/{uuid}/',
+            'uuid': uuid,
+            'filename': filename,
+            'upload_credentials': {
+                'AccessKeyId': 'benchmark-access-key',
+                'SecretAccessKey': 'benchmark-secret-access-key',
+                'SessionToken': 'benchmark-session-token',
+                'upload_url': f's3://{FAKE_BUCKET}/{key}',
+                'key': key,
+            },
+        }
+
+    def finish_upload(self, key: str, size: int) -> None:
+        with self.lock:
+            upload = self.uploads.get(key)
+            if upload is not None:
+                upload.finished = time.perf_counter()
+                upload.size = size
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  # So that connections are kept alive, as with the real thing
+
+    @property
+    def fake_portal(self) -> FakePortal:
+        return self.server.fake_portal  # noQA - set by FakePortal._serve
+
+    def log_message(self, format, *args):  # noQA - argument name is dictated by BaseHTTPRequestHandler
+        pass  # Logging every request would slow things down, and clutter the benchmark output.
+
+    def read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = decode_chunks(self.rfile.readline, self.rfile.read)
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if 'aws-chunked' in self.headers.get('Content-Encoding', ''):
+            # Newer boto3 versions send the body in signed chunks, with a trailing checksum.
+            stream = _BytesReader(body)
+            body = decode_chunks(stream.readline, stream.read)
+        return body
+
+    def respond(self, status: int, body: bytes = b'', content_type: str = 'application/json',
+                headers: Optional[dict] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond_json(self, status: int, data: dict) -> None:
+        self.respond(status, json.dumps(data).encode('utf-8'))
+
+
+class _BytesReader:
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+
+    def readline(self) -> bytes:
+        end = self.data.find(b'\n', self.position)
+        end = len(self.data) if end < 0 else end + 1
+        line = self.data[self.position:end]
+        self.position = end
+        return line
+
+    def read(self, n: int) -> bytes:
+        chunk = self.data[self.position:self.position + n]
+        self.position += len(chunk)
+        return chunk
+
+
+def decode_chunks(readline, read) -> bytes:
+    """
+    Decodes a body sent in chunks (as with HTTP 'Transfer-Encoding: chunked' or S3 'aws-chunked' encoding),
+    each preceded by a line giving its size in hex (possibly followed by ';' and a signature),
+    with the last chunk empty and followed by optional trailers and a blank line.
+    """
+    chunks = []
+    while True:
+        size = int(readline().split(b';')[0].strip() or b'0', 16)
+        if size == 0:
+            break
+        chunks.append(read(size))
+        readline()  # The CRLF after the chunk
+    while readline().strip():  # Trailers, such as x-amz-checksum-crc32
+        pass
+    return b''.join(chunks)
+
+
+INGESTION_SUBMISSION_PATH = re.compile(r'^/ingestion-submissions/([^/]+)/?$')
+INGESTION_SUBMISSION_SUBMIT_PATH = re.compile(r'^/ingestion-submissions/([^/]+)/submit_for_ingestion/?$')
+ITEM_PATH = re.compile(r'^/([0-9a-f-]{36})/?$')
+
+
+class FakePortalRequestHandler(FakeRequestHandler):
+
+    def do_GET(self):  # noQA - method name is dictated by BaseHTTPRequestHandler
+        path = urlparse(self.path).path
+        if path == '/me':
+            self.fake_portal.count_request('/me')
+            self.respond_json(200, FAKE_USER_RECORD)
+        elif path == '/health':
+            self.fake_portal.count_request('/health')
+            self.respond_json(200, {'metadata_bundles_bucket': FAKE_METADATA_BUNDLES_BUCKET})
+        elif INGESTION_SUBMISSION_PATH.match(path):
+            self.fake_portal.count_request('/ingestion-submissions/<uuid>')
+            [uuid] = INGESTION_SUBMISSION_PATH.match(path).groups()
+            self.respond_json(200, self.ingestion_submission(uuid))
+        elif ITEM_PATH.match(path):
+            self.fake_portal.count_request('/<uuid>')
+            [uuid] = ITEM_PATH.match(path).groups()
+            self.respond_json(200, {'@id': f'/files/{uuid}/', 'uuid': uuid, 'extra_files': []})
+        else:
+            self.respond_json(404, {'status': 'error', 'title': 'Not Found'})
+
+    def do_POST(self):  # noQA - method name is dictated by BaseHTTPRequestHandler
+        path = urlparse(self.path).path
+        self.read_body()  # The bundle (or other data) isn't looked at, but must be read.
+        if path == '/submit_for_ingestion' and not self.headers.get('Content-Type', '').startswith('multipart/'):
+            # As an old portal does, this rejects anything but a bundle (e.g., a probe for this endpoint).
+            self.fake_portal.count_request('/submit_for_ingestion (rejected)')
+            self.respond_json(400, {'status': 'error', 'title': 'Bad Request',
+                                    'detail': "Expected request to have content_type 'multipart/form-data'."})
+        elif path == '/submit_for_ingestion':
+            self.fake_portal.count_request('/submit_for_ingestion')
+            self.respond_json(200, {'submission_id': str(uuid_module.uuid4())})
+        elif path == '/IngestionSubmission':
+            self.fake_portal.count_request('/IngestionSubmission')
+            uuid = str(uuid_module.uuid4())
+            self.respond_json(201, {'status': 'success', '@graph': [{'@id': f'/ingestion-submissions/{uuid}/',
+                                                                     'uuid': uuid}]})
+        elif INGESTION_SUBMISSION_SUBMIT_PATH.match(path):
+            self.fake_portal.count_request('/ingestion-submissions/<uuid>/submit_for_ingestion')
+            [uuid] = INGESTION_SUBMISSION_SUBMIT_PATH.match(path).groups()
+            self.respond_json(200, {'submission_id': uuid})
+        elif path == '/FileOther':
+            self.fake_portal.count_request('/FileOther')
+            item = self.fake_portal.make_file_item(str(uuid_module.uuid4()), 'bundle')
+            self.respond_json(201, {'status': 'success', '@graph': [item]})
+        else:
+            self.respond_json(404, {'status': 'error', 'title': 'Not Found'})
+
+    def do_PATCH(self):  # noQA - method name is dictated by BaseHTTPRequestHandler
+        path = urlparse(self.path).path
+        matched = ITEM_PATH.match(path)
+        if not matched:
+            self.respond_json(404, {'status': 'error', 'title': 'Not Found'})
+            return
+        self.fake_portal.count_request('/<uuid> (PATCH)')
+        [uuid] = matched.groups()
+        patch_data = json.loads(self.read_body() or b'{}')
+        item = self.fake_portal.make_file_item(uuid, patch_data.get('filename', 'unknown'))
+        self.respond_json(200, {'status': 'success', '@graph': [item]})
+
+    def ingestion_submission(self, uuid: str) -> dict:
+        return {
+            '@id': f'/ingestion-submissions/{uuid}/',
+            'uuid': uuid,
+            'ingestion_type': 'metadata_bundle',
+            'processing_status': {'state': 'done', 'outcome': 'success', 'progress': 'complete'},
+            'additional_data': {'upload_info': self.fake_portal.upload_info},
+        }
+
+
+class FakeS3RequestHandler(FakeRequestHandler):
+
+    def bucket_key_and_query(self):
+        parsed = urlparse(self.path)
+        _, bucket, key = (parsed.path.split('/', 2) + [''])[:3]
+        return bucket, key, {name: values[0] for name, values in parse_qs(parsed.query, keep_blank_values=True).items()}
+
+    def respond_xml(self, status: int, xml: str, headers: Optional[dict] = None) -> None:
+        self.respond(status, f'<?xml version="1.0" encoding="UTF-8"?>\n{xml}'.encode('utf-8'),
+                     content_type='application/xml', headers=headers)
+
+    def respond_no_such_upload(self) -> None:
+        self.respond_xml(404, '<Error><Code>NoSuchUpload</Code>'
+                              '<Message>The specified upload does not exist.</Message></Error>')
+
+    def do_PUT(self):  # noQA - method name is dictated by BaseHTTPRequestHandler
+        bucket, key, query = self.bucket_key_and_query()
+        body = self.read_body()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if 'uploadId' in query:
+            self.fake_portal.count_request('S3 UploadPart')
+            upload = self.fake_portal.multipart_uploads.get(query['uploadId'])
+            if upload is None:
+                self.respond_no_such_upload()
+                return
+            upload['parts'][int(query['partNumber'])] = (etag, len(body))
+        else:
+            self.fake_portal.count_request('S3 PutObject')
+            self.fake_portal.finish_upload(key, size=len(body))
+        self.respond(200, headers={'ETag': etag})
+
+    def do_POST(self):  # noQA - method name is dictated by BaseHTTPRequestHandler
+        bucket, key, query = self.bucket_key_and_query()
+        self.read_body()
+        if 'uploads' in query:
+            self.fake_portal.count_request('S3 CreateMultipartUpload')
+            upload_id = uuid_module.uuid4().hex
+            with self.fake_portal.lock:
+                self.fake_portal.multipart_uploads[upload_id] = {'key': key, 'parts': {}}
+            self.respond_xml(200, f'<InitiateMultipartUploadResult xmlns="{S3_XMLNS}">'
+                                  f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>'
+                                  f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+        elif 'uploadId' in query:
+            self.fake_portal.count_request('S3 CompleteMultipartUpload')
+            with self.fake_portal.lock:
+                upload = self.fake_portal.multipart_uploads.pop(query['uploadId'], None)
+            if upload is None:
+                self.respond_no_such_upload()
+                return
+            self.fake_portal.finish_upload(key, size=sum(size for _, size in upload['parts'].values()))
+            self.respond_xml(200, f'<CompleteMultipartUploadResult xmlns="{S3_XMLNS}">'
+                                  f'<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>'
+                                  f'<ETag>"{uuid_module.uuid4().hex}-{len(upload["parts"])}"</ETag>'
+                                  f'</CompleteMultipartUploadResult>')
+        else:
+            self.respond_xml(400, '<Error><Code>InvalidRequest</Code></Error>')
+
+    def do_GET(self):  # noQA - method name is dictated by BaseHTTPRequestHandler
+        bucket, key, query = self.bucket_key_and_query()
+        upload = self.fake_portal.multipart_uploads.get(query.get('uploadId'))
+        if upload is None:
+            self.respond_no_such_upload()
+            return
+        self.fake_portal.count_request('S3 ListParts')
+        parts = ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag><Size>{size}</Size></Part>'
+                        for number, (etag, size) in sorted(upload['parts'].items()))
+        self.respond_xml(200, f'<ListPartsResult xmlns="{S3_XMLNS}"><Bucket>{escape(bucket)}</Bucket>'
+                              f'<Key>{escape(key)}</Key><UploadId>{query["uploadId"]}</UploadId>'
+                              f'<IsTruncated>false</IsTruncated>{parts}</ListPartsResult>')
+
+    def do_DELETE(self):  # noQA - method name is dictated by BaseHTTPRequestHandler
+        bucket, key, query = self.bucket_key_and_query()
+        self.fake_portal.count_request('S3 AbortMultipartUpload')
+        with self.fake_portal.lock:
+            self.fake_portal.multipart_uploads.pop(query.get('uploadId'), None)
+        self.respond(204)
@@ -0,0 +1,226 @@
+# This file contains a generator of synthetic metadata bundles, for load testing a portal with submissions
+# of many samples (see submitr.scripts.make_sample_bundle). A bundle is written as a workbook (.xlsx) and as JSON,
+# with a row for each sample, in families of a proband and (usually) their mother and father, and a pair of FASTQ
+# files (see submitr.fastq_generation) for each sample, in the same folder, so that it can be submitted as it is
+# with submit-metadata-bundle --app cgap --upload_folder. Bundles are made to pass submitr.bundle_validation.
+
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+import zipfile
+
+from dcicutils.common import APP_CGAP
+from typing import Any, Dict, Iterable, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+from .fastq_generation import FastqGenerator, ReadLengths, paired_fastq_filenames
+from .generation_defaults import (
+    BUNDLE_FORMATS, DEFAULT_BUNDLE_NAME, DEFAULT_COMPRESSION_LEVEL, DEFAULT_READS, DEFAULT_SAMPLES,
+)
+from .utils import format_byte_size, format_duration
+
+
+BUNDLE_SHEET_NAME = 'Accession data'
+BUNDLE_APP = APP_CGAP  # the app whose accessioning format bundles are in, and so which they're submitted to
+
+# The columns of each sheet (as in the accessioning template), where a '*' marks those that are required.
+BUNDLE_HEADER = ['Individual ID*', 'Family ID', 'Birth Year', 'Sex*', 'Relation to Proband*', 'Report Required*',
+                 'Analysis ID*', 'Specimen ID*', 'Specimen Type*', 'Workup Type*', 'Files']
+
+# The members of each family, in order, with their sex (or None, for either) and whether a report is required.
+FAMILY_MEMBERS = [('Proband', None, 'Y'), ('Mother', 'F', 'N'), ('Father', 'M', 'N')]
+
+_SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+_DOCUMENT_RELATIONSHIP = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml'
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+
+def column_letters(index: int) -> str:
+    """
+    Returns the letters naming the column with the given (0-based) index, such as 'A', 'Z' or 'AA'.
+    """
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _cell_xml(reference: str, value: Any) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def write_xlsx(filename: str, sheets: Dict[str, Iterable[List[Any]]]) -> None:
+    """
+    Writes a workbook with the given sheets (rows of values by sheet name), in which numbers are numbers,
+    other values are (inline) strings, and None is an empty cell. Each sheet's rows are written as they come,
+    so they needn't all be in memory at once.
+    """
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        sheet_paths = [f'xl/worksheets/sheet{i}.xml' for i in range(1, len(sheets) + 1)]
+        workbook.writestr('[Content_Types].xml', (
+            f'{_XML_DECLARATION}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            f'<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{_CONTENT_TYPE}.sheet.main+xml"/>'
+            + ''.join(f'<Override PartName="/{path}" ContentType="{_CONTENT_TYPE}.worksheet+xml"/>'
+                      for path in sheet_paths)
+            + '</Types>'))
+        workbook.writestr('_rels/.rels', (
+            f'{_XML_DECLARATION}<Relationships xmlns="{_RELATIONSHIPS_NS}">'
+            f'<Relationship Id="rId1" Type="{_DOCUMENT_RELATIONSHIP}/officeDocument" Target="xl/workbook.xml"/>'
+            f'</Relationships>'))
+        workbook.writestr('xl/workbook.xml', (
+            f'{_XML_DECLARATION}<workbook xmlns="{_SPREADSHEET_NS}" xmlns:r="{_DOCUMENT_RELATIONSHIP}"><sheets>'
+            + ''.join(f'<sheet name={quoteattr(name)} sheetId="{i}" r:id="rId{i}"/>'
+                      for i, name in enumerate(sheets, start=1))
+            + '</sheets></workbook>'))
+        workbook.writestr('xl/_rels/workbook.xml.rels', (
+            f'{_XML_DECLARATION}<Relationships xmlns="{_RELATIONSHIPS_NS}">'
+            + ''.join(f'<Relationship Id="rId{i}" Type="{_DOCUMENT_RELATIONSHIP}/worksheet"'
+                      f' Target="{path[len("xl/"):]}"/>'
+                      for i, path in enumerate(sheet_paths, start=1))
+            + '</Relationships>'))
+        for path, rows in zip(sheet_paths, sheets.values()):
+            with workbook.open(path, 'w') as fp:
+                fp.write(f'{_XML_DECLARATION}<worksheet xmlns="{_SPREADSHEET_NS}"><sheetData>'.encode('utf-8'))
+                for row_number, row in enumerate(rows, start=1):
+                    fp.write((f'<row r="{row_number}">'
+                              + ''.join(_cell_xml(f'{column_letters(i)}{row_number}', value)
+                                        for i, value in enumerate(row) if value is not None)
+                              + '</row>').encode('utf-8'))
+                fp.write(b'</sheetData></worksheet>')
+
+
+def bundle_rows(samples: int, prefix: str, rng: random.Random) -> List[Dict[str, Any]]:
+    """
+    Returns a row (a dictionary of values by column, as in BUNDLE_HEADER) for each of the given number of samples,
+    in families (of FAMILY_MEMBERS) that share a Family ID and an Analysis ID, each sample with a pair of files.
+    The ids all start with the given prefix.
+    """
+    rows = []
+    proband_birth_year = None
+    for i in range(samples):
+        family = i // len(FAMILY_MEMBERS) + 1
+        relation, sex, report_required = FAMILY_MEMBERS[i % len(FAMILY_MEMBERS)]
+        if relation == 'Proband':
+            proband_birth_year = birth_year = rng.randrange(1950, 2010)
+        else:
+            birth_year = proband_birth_year - rng.randrange(18, 45)
+        specimen_id = f"{prefix}-SPECIMEN{i + 1:06d}"
+        rows.append(dict(zip(BUNDLE_HEADER, [
+            f"{prefix}-INDIVIDUAL{i + 1:06d}",
+            f"{prefix}-FAMILY{family:06d}",
+            birth_year,
+            sex or rng.choice('MF'),
+            relation,
+            report_required,
+            f"{prefix}-ANALYSIS{family:06d}",
+            specimen_id,
+            'Peripheral Blood',
+            'WGS',
+            ', '.join(paired_fastq_filenames(f"{specimen_id}.fastq.gz")),
+        ])))
+    return rows
+
+
+class BundleGenerator:
+    """
+    Writes a bundle of the given number of samples (see bundle_rows), named name.xlsx and (or) name.json,
+    into folder, along with a pair of .fastq.gz files of reads (of the given number, or size) for each sample.
+    Ids start with the given prefix, or else one that's new each time (or, with a seed, the same every time),
+    so that bundles made separately can be submitted to the same portal.
+    """
+
+    def __init__(self, folder: str, samples: int = DEFAULT_SAMPLES, name: str = DEFAULT_BUNDLE_NAME,
+                 formats: Optional[List[str]] = None, prefix: Optional[str] = None, reads: Optional[int] = None,
+                 size: Optional[int] = None, read_lengths: Optional[ReadLengths] = None, seed: Optional[str] = None,
+                 workers: Optional[int] = None, compression_level: int = DEFAULT_COMPRESSION_LEVEL):
+        self.folder = folder
+        self.samples = samples
+        self.formats = formats or BUNDLE_FORMATS
+        unknown_formats = [f for f in self.formats if f not in BUNDLE_FORMATS]
+        if unknown_formats:
+            raise ValueError(f"Bundle formats must be {' or '.join(BUNDLE_FORMATS)}: {', '.join(unknown_formats)}")
+        self.bundle_filenames = [os.path.join(folder, f"{name}.{bundle_format}") for bundle_format in self.formats]
+        token = os.urandom(3) if seed is None else hashlib.sha256(seed.encode('utf-8')).digest()[:3]
+        self.prefix = prefix or f"SYNTHETIC{token.hex().upper()}"
+        self.reads = DEFAULT_READS if reads is None and size is None else reads
+        self.size = size
+        self.read_lengths = read_lengths or ReadLengths()
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.compression_level = compression_level
+        self.rows: List[Dict[str, Any]] = []
+        self.data_filenames: List[str] = []
+        self.data_bytes = 0
+        self.seconds = 0.0
+
+    def write_bundles(self) -> None:
+        for filename in self.bundle_filenames:
+            if filename.endswith('.xlsx'):
+                write_xlsx(filename, {BUNDLE_SHEET_NAME: [BUNDLE_HEADER] + [list(row.values()) for row in self.rows]})
+            else:
+                # In JSON, the columns are named without the '*' marking those that are required.
+                with open(filename, 'w') as fp:
+                    json.dump({BUNDLE_SHEET_NAME: [{column.rstrip('*'): value for column, value in row.items()}
+                                                   for row in self.rows]}, fp, indent=1)
+
+    def write_data_files(self, row: Dict[str, Any], workers: int) -> FastqGenerator:
+        specimen_id = row['Specimen ID*']
+        seed = None if self.seed is None else f"{self.seed}:{specimen_id}"
+        return FastqGenerator(os.path.join(self.folder, f"{specimen_id}.fastq.gz"), number=self.reads,
+                              size=self.size, read_lengths=self.read_lengths, paired=True, seed=seed,
+                              workers=workers, compression_level=self.compression_level).run()
+
+    def run(self) -> 'BundleGenerator':
+        """
+        Writes the bundle (or bundles) and data files, returning this generator, which then has their names.
+        """
+        start_time = time.time()
+        os.makedirs(self.folder, exist_ok=True)
+        self.rows = bundle_rows(self.samples, self.prefix, random.Random(self.seed))
+        self.write_bundles()
+        # Many samples' files are made at once (in a worker process each), or a few samples' files at once
+        # (from a thread each) by a few worker processes each.
+        file_workers = max(1, self.workers // max(self.samples, 1))
+        sample_workers = max(1, self.workers // file_workers)
+        if file_workers == 1 and sample_workers > 1:
+            # Worker processes are started fresh, rather than forked from a process that may have other threads.
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=sample_workers,
+                                                              mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=sample_workers)
+        with executor:
+            for generator in executor.map(self.write_data_files, self.rows, itertools.repeat(file_workers)):
+                self.data_filenames.extend(generator.filenames)
+                self.data_bytes += sum(generator.bytes_written)
+        self.seconds = time.time() - start_time
+        return self
+
+    def summary(self) -> str:
+        """
+        Describes what was written, and how to submit it.
+        """
+        return (f"Wrote {' and '.join(self.bundle_filenames)}, of {self.samples} samples (with ids starting"
+                f" {self.prefix}), and {len(self.data_filenames)} data files ({format_byte_size(self.data_bytes)})"
+                f" in {format_duration(self.seconds)}. To submit it, do:\n"
+                f"    submit-metadata-bundle {self.bundle_filenames[0]} --app {BUNDLE_APP}"
+                f" --upload_folder {self.folder}")
+
+
+def generate_bundle(folder: str, **kwargs) -> BundleGenerator:
+    """
+    Writes a synthetic bundle and its data files into the given folder, taking the same arguments as BundleGenerator,
+    and returns the generator, which has the names of the files written.
+    """
+    return BundleGenerator(folder, **kwargs).run()
@@ -0,0 +1,377 @@
+# This file contains a local validator for metadata bundles, which checks a bundle for mistakes the portal would
+# reject it for (missing columns and values, badly typed values, identifiers used more than once, and data files that
+# aren't in the upload folder) before anything is sent, so that they're found in seconds rather than after a round of
+# polling. Its rules aren't the portal's own (which come from schemas it doesn't have), so what it finds is reported
+# as what the portal would probably reject, and is only fatal if asked (see submit_any_ingestion).
+#
+# It knows the accessioning format, in which each row of a sheet is a specimen, under a header row that names
+# its columns (see REQUIRED_COLUMNS). Of other sheets, only the columns that identify items (see IDENTIFIER_COLUMNS)
+# are checked, if the sheet's first row names any. Sheets with neither are left for the portal to validate (and are
+# listed, in BundleValidator.sheets_skipped), as are files in other formats. Workbooks (.xlsx) are read a row at a
+# time, straight from their XML, so that even very large ones are read quickly, without being loaded all at once.
+# JSON bundles are a list of rows (objects whose keys are the column names), or an object whose values are such
+# lists, by sheet name (and whose other values are ignored).
+
+import functools
+import json
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ElementTree
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# The header of a column (or key of a JSON item) is compared to these ignoring case, surrounding spaces,
+# the '*' that marks it as required, and whether words are separated by spaces or underscores.
+INDIVIDUAL_ID_COLUMN = 'individual id'
+SPECIMEN_ID_COLUMN = 'specimen id'
+FILES_COLUMN = 'files'
+REQUIRED_COLUMNS = [INDIVIDUAL_ID_COLUMN, 'sex', 'relation to proband', 'report required', 'analysis id',
+                    SPECIMEN_ID_COLUMN, 'specimen type', 'workup type']
+
+# Columns (in any sheet) whose values identify items, and so can be used only once in a bundle, and what each of
+# their values is called. Each cell of the 'aliases' column is a comma-separated list of them.
+IDENTIFIER_COLUMNS = {
+    'aliases': 'alias',
+    'submitted id': 'submitted id',
+    'uuid': 'uuid',
+    'accession': 'accession',
+}
+
+# The values allowed in some columns (compared ignoring case), and checks of others, with what they should be.
+COLUMN_CHOICES = {
+    'sex': ['M', 'F', 'U', 'Male', 'Female', 'Unknown'],
+    'report required': ['Y', 'N', 'Yes', 'No'],
+}
+COLUMN_CHECKS: Dict[str, Tuple[Callable[[str], bool], str]] = {
+    'birth year': (lambda value: re.fullmatch(r'[12][0-9]{3}(\.0*)?', value) is not None, "a four-digit year"),
+    'age': (lambda value: re.fullmatch(r'[0-9]+(\.[0-9]*)?', value) is not None, "a number"),
+}
+
+HEADER_SEARCH_ROWS = 10  # how many rows at the top of a sheet are searched for its header row
+MAX_BUNDLE_PROBLEMS = 100  # validation stops after this many problems
+
+XLSX_EXTENSIONS = ['.xlsx', '.xlsm']
+JSON_EXTENSIONS = ['.json']
+
+_MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_RELATIONSHIP_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+_PACKAGE_RELATIONSHIP = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+_ROW = f'{_MAIN_NS}row'
+_VALUE = f'{_MAIN_NS}v'
+_INLINE_STRING = f'{_MAIN_NS}is'
+_TEXT = f'{_MAIN_NS}t'
+_RUN = f'{_MAIN_NS}r'
+
+# A row, as read from a sheet: its row number, and the value (a string, or None if empty) in each column.
+Row = Tuple[int, List[Optional[str]]]
+# A file finder takes the name of a data file and returns its path (or None), and an error message (or None),
+# as search_for_file (in submitr.submission) does.
+FileFinder = Callable[[str], Tuple[Optional[str], Optional[str]]]
+
+
+class BundleFormatError(ValueError):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def _column_index(column: str) -> Optional[int]:
+    # The index of a column, given its letters (e.g., 0 for 'A', or 27 for 'AB').
+    if not column.isalpha():
+        return None
+    index = 0
+    for letter in column.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _text(element) -> str:
+    # The text of a string item (<si>) or inline string (<is>): either a single <t>, or the <t> of each run (<r>),
+    # leaving out phonetic hints (<rPh>).
+    parts = []
+    for child in element:
+        if child.tag == _TEXT:
+            parts.append(child.text or '')
+        elif child.tag == _RUN:
+            parts.extend(run_child.text or '' for run_child in child if run_child.tag == _TEXT)
+    return ''.join(parts)
+
+
+def _shared_strings(workbook: zipfile.ZipFile) -> List[str]:
+    if 'xl/sharedStrings.xml' not in workbook.namelist():
+        return []
+    strings = []
+    with workbook.open('xl/sharedStrings.xml') as fp:
+        for _, element in ElementTree.iterparse(fp):
+            if element.tag == f'{_MAIN_NS}si':
+                strings.append(_text(element))
+                element.clear()
+    return strings
+
+
+def _worksheet_paths(workbook: zipfile.ZipFile) -> List[Tuple[str, str]]:
+    # Returns the name of each sheet, and the path of its XML within the workbook, in the order of the tabs.
+    targets = {}
+    relationships = ElementTree.fromstring(workbook.read('xl/_rels/workbook.xml.rels'))
+    for relationship in relationships.iter(_PACKAGE_RELATIONSHIP):
+        target = relationship.get('Target', '')
+        targets[relationship.get('Id')] = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    sheets = ElementTree.fromstring(workbook.read('xl/workbook.xml')).iter(f'{_MAIN_NS}sheet')
+    return [(sheet.get('name'), targets[sheet.get(_RELATIONSHIP_ID)])
+            for sheet in sheets if sheet.get(_RELATIONSHIP_ID) in targets]
+
+
+def _worksheet_rows(workbook: zipfile.ZipFile, path: str, shared_strings: List[str]) -> Iterator[Row]:
+    try:
+        yield from _parse_worksheet_rows(workbook, path, shared_strings)
+    except (zipfile.BadZipFile, IndexError, ValueError, ElementTree.ParseError) as e:
+        raise BundleFormatError(f"The sheet {path} is not readable ({e}).")
+
+
+def _parse_worksheet_rows(workbook: zipfile.ZipFile, path: str, shared_strings: List[str]) -> Iterator[Row]:
+    # Only the ends of elements are parsed for, and the cells of each row are walked directly (rather than searched),
+    # since this is done for every cell of what may be a very large sheet.
+    row_number = 0
+    with workbook.open(path) as fp:
+        for _, element in ElementTree.iterparse(fp):
+            if element.tag != _ROW:
+                continue
+            row_number = int(element.get('r') or row_number + 1)
+            values: List[Optional[str]] = []
+            for cell in element:
+                value = None
+                for child in cell:
+                    if child.tag == _VALUE:
+                        value = child.text
+                    elif child.tag == _INLINE_STRING:
+                        value = _text(child)
+                if value is None or not value.strip():
+                    continue
+                cell_type = cell.get('t')
+                if cell_type == 's':
+                    value = shared_strings[int(value)]
+                elif cell_type == 'b':
+                    value = 'TRUE' if value == '1' else 'FALSE'
+                index = _column_index((cell.get('r') or '').rstrip('0123456789'))
+                if index is None:
+                    index = len(values)
+                values.extend([None] * (index + 1 - len(values)))
+                values[index] = value
+            element.clear()  # Rows already read are let go of, so the sheet is never all in memory.
+            yield row_number, values
+
+
+def xlsx_sheets(filename: str) -> Iterator[Tuple[str, Iterator[Row]]]:
+    """
+    Yields the name of each sheet of the given workbook, with an iterator over its (non-empty) rows,
+    which are read from the file as they're needed, so each should be used up before going on to the next sheet.
+    """
+    try:
+        with zipfile.ZipFile(filename) as workbook:
+            shared_strings = _shared_strings(workbook)
+            for sheet_name, path in _worksheet_paths(workbook):
+                yield sheet_name, _worksheet_rows(workbook, path, shared_strings)
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise BundleFormatError(f"{filename} is not a readable .xlsx workbook ({e}).")
+
+
+def json_sheets(filename: str) -> Iterator[Tuple[str, Iterator[Row]]]:
+    """
+    Yields the name of each sheet of the given JSON bundle, with an iterator over its rows, as for xlsx_sheets.
+    Each sheet's first row is its header, made of all the keys of its rows; the rest are numbered from 1.
+    Values of the bundle that aren't lists of objects (e.g., a "success": true) aren't sheets, and are ignored.
+    """
+    try:
+        with open(filename) as fp:
+            bundle = json.load(fp)
+    except ValueError as e:
+        raise BundleFormatError(f"{filename} is not readable as JSON ({e}).")
+    sheets = bundle if isinstance(bundle, dict) else {os.path.basename(filename): bundle}
+    for sheet_name, items in sheets.items():
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            continue
+        header = list({key: None for item in items for key in item})
+        yield sheet_name, iter([(0, header)] + [(i, [_json_value(item.get(key)) for key in header])
+                                                for i, item in enumerate(items, start=1)])
+
+
+def _json_value(value) -> Optional[str]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, list):
+        return ', '.join(str(item) for item in value)
+    return str(value)
+
+
+def _column_name(header: Optional[str]) -> str:
+    return ' '.join((header or '').replace('*', ' ').replace('_', ' ').split()).lower()
+
+
+class _TooManyProblems(Exception):
+    pass
+
+
+class BundleValidator:
+    """
+    Checks the sheets of a metadata bundle, keeping a list of the problems found (up to max_problems of them),
+    and of the sheets that weren't checked (see the comment at the top of this file).
+    If find_file is given (see FileFinder), the data files named in the 'Files' column are looked for with it.
+    """
+
+    def __init__(self, find_file: Optional[FileFinder] = None, max_problems: int = MAX_BUNDLE_PROBLEMS,
+                 row_kind: str = 'row'):
+        self.find_file = find_file
+        self.max_problems = max_problems
+        self.row_kind = row_kind
+        self.problems: List[str] = []
+        self.sheets_checked = 0
+        self.sheets_skipped: List[str] = []
+        self.rows_checked = 0
+        self._columns = set()  # the columns of the sheet being checked
+        self._identifiers: Dict[Tuple[str, str], str] = {}  # where each (kind of) identifier was first seen
+        self._files_checked = set()
+
+    def problem(self, message: str) -> None:
+        self.problems.append(message)
+        if len(self.problems) >= self.max_problems:
+            raise _TooManyProblems()
+
+    def check_sheets(self, sheets: Iterable[Tuple[str, Iterator[Row]]]) -> List[str]:
+        """
+        Checks the given sheets (as yielded by xlsx_sheets or json_sheets), and returns the problems found.
+        """
+        try:
+            for sheet_name, rows in sheets:
+                self.check_sheet(sheet_name, rows)
+        except _TooManyProblems:
+            self.problems.append(f"Stopped checking after {self.max_problems} problems.")
+        return self.problems
+
+    def check_sheet(self, sheet_name: str, rows: Iterator[Row]) -> None:
+        header = None
+        specimens = False  # whether this is a sheet of specimens, or just has columns of identifiers
+        first_row = True
+        for row_number, values in rows:
+            if header is None:
+                names = [_column_name(value) for value in values]
+                if INDIVIDUAL_ID_COLUMN in names:
+                    header = self._check_header(sheet_name, row_number, values, required_columns=REQUIRED_COLUMNS)
+                    header_row_number = row_number
+                    specimens = True
+                elif first_row and any(name in IDENTIFIER_COLUMNS for name in names):
+                    header = self._check_header(sheet_name, row_number, values, required_columns=[])
+                    header_row_number = row_number  # The header of any other sheet is its first row.
+                elif row_number > HEADER_SEARCH_ROWS:
+                    break  # This is a sheet the portal is left to check.
+                first_row = not any(names)
+                continue
+            row = {name: values[index].strip() for index, name in header.items()
+                   if index < len(values) and values[index] is not None}
+            if not row:
+                continue  # Blank rows are skipped, as are comments (whose first column starts with '#').
+            leading_value = row.get(INDIVIDUAL_ID_COLUMN, '') if specimens else (values[0] or '').strip()
+            if leading_value.startswith('#'):
+                continue
+            if specimens and row_number == header_row_number + 1 and ' ' in leading_value:
+                continue  # This is a row describing what goes in each column, as some templates have.
+            self.rows_checked += 1
+            where = f"Sheet {sheet_name!r}, {self.row_kind} {row_number}"
+            if specimens:
+                self._check_row(where, row)
+            self._check_identifiers(where, row)
+        if header is None:
+            self.sheets_skipped.append(sheet_name)
+
+    def _check_header(self, sheet_name: str, row_number: int, values: List[Optional[str]],
+                      required_columns: List[str]) -> Dict[int, str]:
+        self.sheets_checked += 1
+        header = {}
+        for index, value in enumerate(values):
+            name = _column_name(value)
+            if not name:
+                continue
+            if name in header.values():
+                self.problem(f"Sheet {sheet_name!r}, {self.row_kind} {row_number}:"
+                             f" There is more than one {value.strip()!r} column.")
+            header[index] = name
+        self._columns = set(header.values())
+        for name in required_columns:
+            if name not in header.values():
+                self.problem(f"Sheet {sheet_name!r}: The required column {name.title()!r} is missing.")
+        return header
+
+    def _check_row(self, where: str, row: Dict[str, str]) -> None:
+        for name in REQUIRED_COLUMNS:
+            if not row.get(name) and name in self._columns:  # Missing columns are reported once, for the sheet.
+                self.problem(f"{where}: {name.title()!r} is required, but is empty.")
+        for name, choices in COLUMN_CHOICES.items():
+            value = row.get(name)
+            if value and value.lower() not in [choice.lower() for choice in choices]:
+                self.problem(f"{where}: {name.title()!r} is {value!r}, but should be one of {', '.join(choices)}.")
+        for name, (check, expected) in COLUMN_CHECKS.items():
+            value = row.get(name)
+            if value and not check(value):
+                self.problem(f"{where}: {name.title()!r} is {value!r}, but should be {expected}.")
+        self._check_unique(where, SPECIMEN_ID_COLUMN, row.get(SPECIMEN_ID_COLUMN))
+        if self.find_file is not None:
+            for file_name in (row.get(FILES_COLUMN) or '').split(','):
+                file_name = file_name.strip()
+                if file_name and file_name not in self._files_checked:
+                    self._files_checked.add(file_name)
+                    self._check_file(where, file_name)
+
+    def _check_identifiers(self, where: str, row: Dict[str, str]) -> None:
+        for name, kind in IDENTIFIER_COLUMNS.items():
+            for value in (row.get(name) or '').split(',') if name == 'aliases' else [row.get(name)]:
+                self._check_unique(where, kind, value and value.strip())
+
+    def _check_unique(self, where: str, kind: str, value: Optional[str]) -> None:
+        if not value:
+            return
+        if (kind, value) in self._identifiers:
+            self.problem(f"{where}: The {kind} {value!r} was already used ({self._identifiers[kind, value]}).")
+        else:
+            self._identifiers[kind, value] = where.lower()
+
+    def _check_file(self, where: str, file_name: str) -> None:
+        file_path, error_msg = self.find_file(file_name)
+        if error_msg:
+            self.problem(f"{where}: {error_msg}")
+        elif not file_path or not os.path.isfile(file_path):
+            self.problem(f"{where}: The file {file_name} is not in the upload folder.")
+
+
+def check_bundle(filename: str, find_file: Optional[FileFinder] = None,
+                 max_problems: int = MAX_BUNDLE_PROBLEMS) -> BundleValidator:
+    """
+    Checks the given metadata bundle (see BundleValidator), without sending anything anywhere.
+
+    :param filename: the name of a bundle file (.xlsx or .json; others are not checked)
+    :param find_file: a function to find data files with (see FileFinder), or None not to look for them
+    :param max_problems: the most problems to find before stopping
+    :return: the BundleValidator, with the problems found, and the sheets that weren't checked
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in XLSX_EXTENSIONS:
+        validator = BundleValidator(find_file=find_file, max_problems=max_problems)
+        sheets = xlsx_sheets(filename)
+    elif extension in JSON_EXTENSIONS:
+        validator = BundleValidator(find_file=find_file, max_problems=max_problems, row_kind='item')
+        sheets = json_sheets(filename)
+    else:
+        return BundleValidator(find_file=find_file, max_problems=max_problems)
+    try:
+        validator.check_sheets(sheets)
+    except BundleFormatError as e:
+        validator.problems.append(str(e))
+    return validator
+
+
+def validate_bundle(filename: str, find_file: Optional[FileFinder] = None,
+                    max_problems: int = MAX_BUNDLE_PROBLEMS) -> List[str]:
+    """
+    Checks the given metadata bundle (see check_bundle), and returns a list of the problems found
+    (empty if there are none).
+    """
+    return check_bundle(filename, find_file=find_file, max_problems=max_problems).problems
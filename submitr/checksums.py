@@ -0,0 +1,341 @@
+# This file contains the computation of checksums (md5 and, optionally, sha256 and crc32c) of files to be uploaded,
+# so that they can be sent to the portal with each file's metadata, without a separate pass over every file.
+# Large files are hashed in a pool of worker processes, ahead of their uploads, and the results are cached,
+# keyed by the identity of each file (its device, inode, size and modification time), so that a file
+# that hasn't changed is never hashed again, even in a later run (e.g., of resume-uploads).
+
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional
+from .base import SUBMITR_DIR
+
+try:
+    import crc32c as crc32c_module  # This is optional, and needed only for crc32c checksums.
+except ImportError:  # pragma: no cover - depends on what is installed
+    crc32c_module = None
+
+
+class ChecksumAlgorithm:
+    MD5 = 'md5'
+    SHA256 = 'sha256'
+    CRC32C = 'crc32c'
+
+
+CHECKSUM_ALGORITHMS = [ChecksumAlgorithm.MD5, ChecksumAlgorithm.SHA256, ChecksumAlgorithm.CRC32C]
+
+# The property of a File item in which the portal expects each kind of checksum.
+CHECKSUM_PROPERTIES = {
+    ChecksumAlgorithm.MD5: 'md5sum',
+    ChecksumAlgorithm.SHA256: 'sha256sum',
+    ChecksumAlgorithm.CRC32C: 'crc32c',
+}
+
+CHECKSUMS_VAR = 'SUBMITR_CHECKSUMS'
+CHECKSUM_WORKERS_VAR = 'SUBMITR_CHECKSUM_WORKERS'
+CHECKSUM_CACHE_VAR = 'SUBMITR_CHECKSUM_CACHE'
+
+# A comma-separated list of CHECKSUM_ALGORITHMS, or 'none' to compute no checksums.
+DEFAULT_CHECKSUMS = os.environ.get(CHECKSUMS_VAR) or ChecksumAlgorithm.MD5
+DEFAULT_CHECKSUM_WORKERS = int(os.environ.get(CHECKSUM_WORKERS_VAR) or min(os.cpu_count() or 1, 8))
+DEFAULT_CHECKSUM_CACHE_FILE = os.environ.get(CHECKSUM_CACHE_VAR) or os.path.join(SUBMITR_DIR, 'checksum_cache.json')
+
+# Files are read this much at a time (as a memory-mapped window), which must be a multiple of mmap's granularity.
+CHECKSUM_CHUNK_SIZE = 64 * 1024 ** 2
+# Files smaller than this are hashed when they're needed, since doing it in a worker process wouldn't save time.
+MIN_PRECOMPUTE_SIZE = 8 * 1024 ** 2
+
+# Entries not used for this long are dropped, so that the cache doesn't grow forever.
+CHECKSUM_CACHE_EXPIRATION_SECONDS = 90 * 24 * 60 * 60
+
+
+def parse_checksum_algorithms(algorithms: Optional[str]) -> List[str]:
+    """
+    Parses a comma-separated list of checksum algorithms (such as 'md5,sha256'), where 'none' means none of them.
+    """
+    result = []
+    for algorithm in (algorithms or '').lower().replace(' ', '').split(','):
+        if not algorithm or algorithm == 'none':
+            continue
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise ValueError(f"Unknown checksum algorithm: {algorithm!r}."
+                             f" Expected some of {', '.join(CHECKSUM_ALGORITHMS)}, or none.")
+        if algorithm == ChecksumAlgorithm.CRC32C and crc32c_module is None:
+            raise ValueError("Computing crc32c checksums needs the crc32c package (pip install crc32c).")
+        if algorithm not in result:
+            result.append(algorithm)
+    return result
+
+
+def file_cache_key(path: str) -> Optional[str]:
+    """
+    Returns a string identifying the file at path by its device, inode, size and modification time,
+    or None if there is no such file.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class _Crc32c:
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data) -> None:
+        self.value = crc32c_module.crc32c(data, self.value)
+
+    def hexdigest(self) -> str:
+        return "%08x" % self.value
+
+
+def _make_hasher(algorithm: str):
+    return _Crc32c() if algorithm == ChecksumAlgorithm.CRC32C else hashlib.new(algorithm)
+
+
+def compute_checksums(path: str, algorithms: List[str], chunk_size: int = CHECKSUM_CHUNK_SIZE) -> Dict[str, str]:
+    """
+    Returns a dictionary of the hex digests of the file at path, keyed by algorithm,
+    reading it just once, a memory-mapped window of chunk_size bytes at a time.
+    """
+    hashers = {algorithm: _make_hasher(algorithm) for algorithm in algorithms}
+    with open(path, 'rb') as fp:
+        size = os.fstat(fp.fileno()).st_size
+        for offset in range(0, size, chunk_size):
+            length = min(chunk_size, size - offset)
+            with mmap.mmap(fp.fileno(), length, access=mmap.ACCESS_READ, offset=offset) as window:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    window.madvise(mmap.MADV_SEQUENTIAL)
+                for hasher in hashers.values():
+                    hasher.update(window)
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers.items()}
+
+
+class ChecksumCache:
+    """
+    A cache, kept in a JSON file, of the checksums of files, keyed by file_cache_key.
+
+    Unlike the upload journal, changes are only written when save is called, since a cache entry
+    is cheap to lose (it just means hashing the file again), and there may be very many of them.
+    """
+
+    def __init__(self, filename: str = DEFAULT_CHECKSUM_CACHE_FILE):
+        self.filename = filename
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, dict]] = None
+        self._dirty = False
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.filename) as fp:
+                    entries = json.load(fp)
+            except (OSError, ValueError):  # A missing or damaged cache is just an empty one.
+                entries = {}
+            expired = time.time() - CHECKSUM_CACHE_EXPIRATION_SECONDS
+            self._entries = {key: entry for key, entry in entries.items()
+                             if isinstance(entry, dict) and entry.get('updated', 0) > expired}
+        return self._entries
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary_filename = f"{self.filename}.{os.getpid()}.tmp"
+            with open(temporary_filename, 'w') as fp:
+                json.dump(self._entries, fp, indent=1)
+            os.replace(temporary_filename, self.filename)  # So that an interruption can't leave a half-written cache
+            self._dirty = False
+
+    def get(self, path: str, algorithms: List[str]) -> Optional[Dict[str, str]]:
+        """
+        Returns the cached checksums of the file at path for the given algorithms,
+        or None if they aren't all known for the file as it is now.
+        """
+        key = file_cache_key(path)
+        with self._lock:
+            entry = self._load().get(key) if key else None
+            checksums = entry.get('checksums', {}) if entry else {}
+            if not all(algorithm in checksums for algorithm in algorithms):
+                return None
+            return {algorithm: checksums[algorithm] for algorithm in algorithms}
+
+    def put(self, path: str, checksums: Dict[str, str], key: Optional[str] = None) -> None:
+        """
+        Caches the given checksums (merged with any others already known) for the file at path,
+        which is identified by key, if given, or else by its file_cache_key now.
+        """
+        key = key or file_cache_key(path)
+        if not key:
+            return
+        with self._lock:
+            entries = self._load()
+            entries[key] = {'checksums': dict(entries.get(key, {}).get('checksums', {}), **checksums),
+                            'updated': time.time()}
+            self._dirty = True
+
+
+class FileChecksummer:
+    """
+    Gets the checksums of files for their uploads, from a ChecksumCache if they're known,
+    or else by computing them, which, for large files, can be started early (by precomputing)
+    in a pool of worker processes, so that it overlaps with the uploads of other files.
+    """
+
+    def __init__(self, algorithms: Optional[List[str]] = None, workers: Optional[int] = None,
+                 cache: Optional[ChecksumCache] = None):
+        """
+        :param algorithms: the CHECKSUM_ALGORITHMS to compute (default from SUBMITR_CHECKSUMS, or just md5)
+        :param workers: the most worker processes to hash files with at once (default DEFAULT_CHECKSUM_WORKERS)
+        :param cache: the ChecksumCache in which to keep checksums (default one in DEFAULT_CHECKSUM_CACHE_FILE)
+        """
+        self.algorithms = parse_checksum_algorithms(DEFAULT_CHECKSUMS) if algorithms is None else algorithms
+        self.workers = workers or DEFAULT_CHECKSUM_WORKERS
+        if self.workers < 1:
+            raise ValueError(f"The number of checksum workers must be a positive integer: {self.workers}")
+        self.cache = ChecksumCache() if cache is None else cache
+        self._lock = threading.Lock()
+        self._pending: Dict[str, concurrent.futures.Future] = {}  # keyed by file_cache_key
+        self._threads: Optional[concurrent.futures.ThreadPoolExecutor] = None  # see compute_in_background
+
+    def precompute(self, paths: Iterable[str]) -> 'FileChecksummer':
+        """
+        Starts computing, in worker processes, the checksums of those of the given files that are large enough
+        to be worth it and aren't already cached. Use the result as a context manager, which waits for them.
+        """
+        if not self.algorithms:
+            return self
+        todo = {}
+        for path in paths:
+            key = file_cache_key(path)
+            if (key and key not in self._pending and key not in todo and os.path.getsize(path) >= MIN_PRECOMPUTE_SIZE
+                    and self.cache.get(path, self.algorithms) is None):
+                todo[key] = path
+        if todo:
+            # Worker processes are started fresh, rather than forked from a process that may have other threads.
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(self.workers, len(todo)),
+                                                              mp_context=multiprocessing.get_context('spawn'))
+            with self._lock:
+                for key, path in todo.items():
+                    future = executor.submit(compute_checksums, path, self.algorithms)
+                    future.add_done_callback(lambda f, path=path, key=key: self._finish(f, path, key))
+                    self._pending[key] = future
+            executor.shutdown(wait=False)  # The workers stop once all the work submitted so far is done.
+        return self
+
+    def compute_in_background(self, path: str) -> None:
+        """
+        Starts computing, in a thread, the checksums of the file at path, unless they're already being computed,
+        so that they can be computed while the file is being uploaded. Use checksums to wait for them.
+        """
+        key = file_cache_key(path)
+        if not self.algorithms or key is None:
+            return
+        with self._lock:
+            if key in self._pending:
+                return
+            if self._threads is None:
+                # Hashing a large buffer releases the GIL, so these threads don't hold up the uploads.
+                self._threads = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                                      thread_name_prefix='checksums')
+            future = self._threads.submit(compute_checksums, path, self.algorithms)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._finish(f, path, key))
+
+    def __enter__(self) -> 'FileChecksummer':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._lock:
+            pending = list(self._pending.values())
+        for future in pending:
+            future.cancel()
+        concurrent.futures.wait(pending)
+        self.cache.save()
+
+    def _finish(self, future: concurrent.futures.Future, path: str, key: str) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(path, future.result(), key=key)
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def checksums(self, path: str) -> Dict[str, str]:
+        """
+        Returns a dictionary of the checksums of the file at path, keyed by algorithm, waiting for them to be
+        computed if they're being precomputed, or computing them now if need be. A missing file has none.
+        """
+        if not self.algorithms:
+            return {}
+        key = file_cache_key(path)
+        if key is None:
+            return {}
+        with self._lock:
+            future = self._pending.get(key)
+        result = None
+        if future is not None:
+            try:
+                result = future.result()
+            except Exception:  # E.g., a worker died. It'll be tried again here, where any error will be seen.
+                pass
+        if result is None:
+            result = self.cache.get(path, self.algorithms)
+        if result is None:
+            result = compute_checksums(path, self.algorithms)
+            self.cache.put(path, result, key=key)
+        with self._lock:
+            idle = all(pending.done() for pending in self._pending.values())
+        if idle:
+            self.cache.save()
+        return result
+
+    def ready_checksums(self, path: str) -> Optional[Dict[str, str]]:
+        """
+        Returns the checksums of the file at path if they can be had without a wait: if they're known,
+        or the file is too small for hashing it to take long. Otherwise returns None.
+        """
+        if not self.algorithms:
+            return {}
+        key = file_cache_key(path)
+        if key is None:
+            return {}
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            return self.checksums(path) if future.done() else None
+        if os.path.getsize(path) >= MIN_PRECOMPUTE_SIZE and self.cache.get(path, self.algorithms) is None:
+            return None
+        return self.checksums(path)
+
+
+def checksum_properties(checksums: Dict[str, str]) -> Dict[str, str]:
+    """
+    Returns the File item properties (see CHECKSUM_PROPERTIES) with which to send the given checksums to the portal.
+    """
+    return {CHECKSUM_PROPERTIES[algorithm]: digest for algorithm, digest in checksums.items()}
+
+
+_FILE_CHECKSUMMER: Optional[FileChecksummer] = None
+
+
+def get_file_checksummer() -> FileChecksummer:
+    """
+    Returns the FileChecksummer shared by all uploads, creating it on first use.
+    Its algorithms come from SUBMITR_CHECKSUMS (default md5), its number of worker processes from
+    SUBMITR_CHECKSUM_WORKERS, and its cache file is DEFAULT_CHECKSUM_CACHE_FILE (which can be set
+    with SUBMITR_CHECKSUM_CACHE).
+    """
+    global _FILE_CHECKSUMMER
+    if _FILE_CHECKSUMMER is None:
+        _FILE_CHECKSUMMER = FileChecksummer()
+    return _FILE_CHECKSUMMER
@@ -1,6 +1,17 @@
+from dcicutils.lang_utils import n_of
+
+
 class PortalPermissionError(PermissionError):
 
     def __init__(self, server):
         self.server = server
         super().__init__("Your credentials were rejected by %s. Either this is not the right server,"
                          " or you need to obtain up-to-date access keys." % server)
+
+
+class BundleValidationError(ValueError):
+
+    def __init__(self, filename, problems):
+        self.filename = filename
+        self.problems = problems
+        super().__init__("%s has %s: %s" % (filename, n_of(problems, "problem"), " ".join(problems)))
@@ -0,0 +1,276 @@
+# This file contains a generator of (pseudo)random FASTQ files, such as the paired-end .fastq.gz files of tens of
+# gigabytes that upload benchmarks need (see submitr.scripts.make_sample_fastq_file). Reads are made a batch
+# (of megabytes) at a time, with each step done by C code over the whole batch (random bytes from the OS or
+# from SHAKE-128, bytes.translate into bases and qualities, and a single join into records), rather than
+# a base at a time, though some of the work (e.g., the read names and lengths) is still done a read at a time.
+# Each batch is made, and compressed as BGZF (a series of independent gzip members of at most 64KB each, as bgzip
+# writes them, which any gzip reader can read), in a pool of worker processes, since making the records holds the
+# GIL, so that it all goes about as many times faster as there are workers (and cores for them).
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import multiprocessing
+import os
+import random
+import re
+import struct
+import time
+import zlib
+
+from typing import Callable, Iterator, List, Optional, Tuple
+from .generation_defaults import (
+    DEFAULT_COMPRESSION_LEVEL, DEFAULT_READ_LENGTH, READ_LENGTH_DISTRIBUTIONS, ReadLengthDistribution,
+)
+from .utils import format_byte_size, format_duration
+
+
+FASTQ_BATCH_SIZE = 8 * 1024 ** 2  # about this many bytes of reads are made (for each file) at a time
+BGZF_BLOCK_SIZE = 0xff00  # the most uncompressed bytes in a BGZF block (the same as bgzip puts in each)
+# The empty block with which BGZF files end, so that readers can tell that one is complete.
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+READ_NAME_FORMAT = '@SYNTHETIC.{read} {mate}:N:0:1'  # in the style of Illumina (whose mates are 1 and 2)
+
+# Each random byte is made into 4 bases (2 bits each), or into 2 qualities (4 bits each), by a translation table.
+_BASE_TABLES = [bytes(b'ACGT'[(byte >> shift) & 3] for byte in range(256)) for shift in (0, 2, 4, 6)]
+# Qualities are binned as a NovaSeq's are (to F, :, , and #), mostly F (Phred 37), as in a good run.
+_QUALITY_LEVELS = b'FFFFFFFFFFFF::,#'
+_QUALITY_TABLES = [bytes(_QUALITY_LEVELS[(byte >> shift) & 15] for byte in range(256)) for shift in (0, 4)]
+
+_FASTQ_SUFFIX = re.compile(r'(.*?)((?:\.fastq|\.fq)?(?:\.gz)?)$')
+
+RandomBytes = Callable[[int], bytes]
+
+
+def paired_fastq_filenames(filename: str) -> Tuple[str, str]:
+    """
+    Given a filename such as 'sample.fastq.gz', returns the names of its two paired-end files,
+    such as ('sample_R1.fastq.gz', 'sample_R2.fastq.gz').
+    """
+    name, suffix = _FASTQ_SUFFIX.match(filename).groups()
+    return f"{name}_R1{suffix}", f"{name}_R2{suffix}"
+
+
+class ReadLengths:
+    """
+    The lengths of the reads to make, which are at most length, and (unless the distribution is fixed)
+    at least min_length. With a normal distribution, they vary around length by about stddev.
+    """
+
+    def __init__(self, length: int = DEFAULT_READ_LENGTH, distribution: str = ReadLengthDistribution.FIXED,
+                 min_length: Optional[int] = None, stddev: Optional[float] = None):
+        if distribution not in READ_LENGTH_DISTRIBUTIONS:
+            raise ValueError(f"The read length distribution must be one of {', '.join(READ_LENGTH_DISTRIBUTIONS)}:"
+                             f" {distribution!r}")
+        self.length = length
+        self.distribution = distribution
+        self.min_length = length if distribution == ReadLengthDistribution.FIXED else (min_length or 1)
+        self.stddev = length / 10 if stddev is None else stddev
+        if not 1 <= self.min_length <= length:
+            raise ValueError(f"The read lengths must be from 1 to {length}, but the minimum is {self.min_length}.")
+
+    @property
+    def mean(self) -> float:
+        # This is only an estimate for a normal distribution (which is used only to decide how many reads to make
+        # at a time).
+        if self.distribution == ReadLengthDistribution.UNIFORM:
+            return (self.min_length + self.length) / 2
+        return self.length
+
+    def sample(self, rng: random.Random, count: int) -> List[int]:
+        """
+        Returns the lengths of count reads.
+        """
+        if self.distribution == ReadLengthDistribution.UNIFORM:
+            return [rng.randint(self.min_length, self.length) for _ in range(count)]
+        elif self.distribution == ReadLengthDistribution.NORMAL:
+            lo, hi, gauss = self.min_length, self.length, rng.gauss
+            return [min(max(round(gauss(hi, self.stddev)), lo), hi) for _ in range(count)]
+        return [self.length] * count
+
+
+def random_bases(random_bytes: RandomBytes, count: int) -> bytearray:
+    packed = random_bytes((count + 3) // 4)
+    bases = bytearray(len(packed) * 4)
+    for i, table in enumerate(_BASE_TABLES):
+        bases[i::4] = packed.translate(table)
+    del bases[count:]
+    return bases
+
+
+def random_qualities(random_bytes: RandomBytes, count: int) -> bytearray:
+    packed = random_bytes((count + 1) // 2)
+    qualities = bytearray(len(packed) * 2)
+    for i, table in enumerate(_QUALITY_TABLES):
+        qualities[i::2] = packed.translate(table)
+    del qualities[count:]
+    return qualities
+
+
+def fastq_records(first_read: int, mate: int, lengths: List[int], random_bytes: RandomBytes) -> bytes:
+    """
+    Returns the FASTQ records of reads of the given lengths, numbered from first_read.
+    """
+    count = len(lengths)
+    total = sum(lengths)
+    bases = memoryview(random_bases(random_bytes, total))
+    qualities = memoryview(random_qualities(random_bytes, total))
+    ends = list(itertools.accumulate(lengths))
+    starts = [0] + ends[:-1]
+    name_format = READ_NAME_FORMAT.format(read='%d', mate=mate).encode('ascii')
+    # Each record is its name, its bases, a '+' and its qualities, on lines of their own.
+    lines = [b'+'] * (4 * count)
+    lines[0::4] = [name_format % i for i in range(first_read, first_read + count)]
+    lines[1::4] = map(bases.__getitem__, map(slice, starts, ends))
+    lines[3::4] = map(qualities.__getitem__, map(slice, starts, ends))
+    lines.append(b'')
+    return b'\n'.join(lines)
+
+
+def bgzf_compress(data: bytes, level: int = DEFAULT_COMPRESSION_LEVEL) -> bytes:
+    """
+    Returns the given data compressed as BGZF blocks (without the BGZF_EOF block that ends a file).
+    """
+    view = memoryview(data)
+    return b''.join(_bgzf_block(view[start:start + BGZF_BLOCK_SIZE], level)
+                    for start in range(0, len(view), BGZF_BLOCK_SIZE))
+
+
+def _bgzf_block(data: memoryview, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)  # raw deflate, to add our own header
+    deflated = compressor.compress(data) + compressor.flush()
+    if len(deflated) + 26 > 0x10000:  # A block must fit in 64KB, which stored (level 0) data always does.
+        return _bgzf_block(data, 0)
+    # This is a gzip header with an extra field (BC) giving the size of the whole block, less 1.
+    header = struct.pack('<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2, len(deflated) + 25)
+    return header + deflated + struct.pack('<2I', zlib.crc32(data), len(data))
+
+
+class FastqGenerator:
+    """
+    Writes (pseudo)random reads to a FASTQ file, or (if paired) to a pair of them (as named by paired_fastq_filenames),
+    stopping after number reads (in each file), or once each file is at least size bytes, whichever is first.
+    Files whose names end in .gz are compressed (as BGZF). The reads are made (and compressed) by up to the given
+    number of worker processes (or, if that's 1, in a thread of this one, while the last batch is written).
+    With a seed, the same files are written every time (however many workers there are).
+    """
+
+    def __init__(self, filename: str, number: Optional[int] = None, size: Optional[int] = None,
+                 read_lengths: Optional[ReadLengths] = None, paired: bool = False, seed: Optional[str] = None,
+                 workers: Optional[int] = None, compression_level: int = DEFAULT_COMPRESSION_LEVEL):
+        if number is None and size is None:
+            raise ValueError("Either a number of reads or a size of file must be given.")
+        self.filenames = list(paired_fastq_filenames(filename)) if paired else [filename]
+        self.number = number
+        self.size = size
+        self.read_lengths = read_lengths or ReadLengths()
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        if self.workers < 1:
+            raise ValueError(f"The number of workers must be a positive integer: {self.workers}")
+        self.compression_level = compression_level
+        self.compressed = filename.endswith('.gz')
+        record_size = len(READ_NAME_FORMAT) + 10 + 2 * self.read_lengths.mean + 4
+        # A small file is made in smaller batches, so as not to overshoot its size by much.
+        batch_size = FASTQ_BATCH_SIZE if size is None else min(FASTQ_BATCH_SIZE, max(size // 8, 64 * 1024))
+        self.reads_per_batch = max(1, int(batch_size // record_size))
+        self.reads = 0  # in each file
+        self.bytes_written = [0] * len(self.filenames)
+        self.fastq_bytes = 0  # before compression, in all the files
+        self.seconds = 0.0
+
+    def _random_bytes(self, *labels) -> RandomBytes:
+        if self.seed is None:
+            return os.urandom
+        key = ':'.join(str(label) for label in (self.seed,) + labels).encode('utf-8')
+        counter = itertools.count()
+        return lambda size: hashlib.shake_128(b'%s:%d' % (key, next(counter))).digest(size)
+
+    def _batches(self) -> Iterator[Tuple[int, int, int]]:
+        # Yields the index, first read and number of reads of each batch.
+        for batch in itertools.count():
+            first_read = batch * self.reads_per_batch
+            count = self.reads_per_batch if self.number is None else min(self.reads_per_batch, self.number - first_read)
+            if count <= 0:
+                return
+            yield batch, first_read, count
+
+    def make_batch(self, batch: int, first_read: int, count: int) -> Tuple[int, List[bytes]]:
+        """
+        Returns the size of the FASTQ records of the given batch of reads (in all the files), and their data
+        (compressed, if the files are) for each file. The reads of a pair are named the same, and are as long
+        as each other.
+        """
+        rng = random.Random(None if self.seed is None else f"{self.seed}:{batch}")
+        lengths = self.read_lengths.sample(rng, count)
+        fastq_bytes, result = 0, []
+        for mate, _ in enumerate(self.filenames, start=1):
+            records = fastq_records(first_read, mate, lengths, self._random_bytes(batch, mate))
+            fastq_bytes += len(records)
+            result.append(bgzf_compress(records, self.compression_level) if self.compressed else records)
+        return fastq_bytes, result
+
+    def _finished(self) -> bool:
+        return ((self.number is not None and self.reads >= self.number)
+                or (self.size is not None and min(self.bytes_written) >= self.size))
+
+    def run(self) -> 'FastqGenerator':
+        """
+        Writes the file (or files), returning this generator, which then has the number of reads and bytes written.
+        """
+        start_time = time.time()
+        files = [open(filename, 'wb') for filename in self.filenames]
+        if self.workers > 1:
+            # Worker processes are started fresh, rather than forked from a process that may have other threads.
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                              mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            with executor:
+                # Enough batches are made ahead to keep every worker busy, but no more, so that memory stays bounded.
+                batches = self._batches()
+                pending = collections.deque((batch, executor.submit(self.make_batch, *batch))
+                                            for batch in itertools.islice(batches, 2 * self.workers))
+                while pending and not self._finished():
+                    (_, _, count), future = pending.popleft()
+                    batch = next(batches, None)
+                    if batch is not None:
+                        pending.append((batch, executor.submit(self.make_batch, *batch)))
+                    fastq_bytes, result = future.result()
+                    for i, (file, data) in enumerate(zip(files, result)):
+                        file.write(data)
+                        self.bytes_written[i] += len(data)
+                    self.reads += count
+                    self.fastq_bytes += fastq_bytes
+                for _, future in pending:
+                    future.cancel()
+            if self.compressed:
+                for i, file in enumerate(files):
+                    file.write(BGZF_EOF)
+                    self.bytes_written[i] += len(BGZF_EOF)
+        finally:
+            for file in files:
+                file.close()
+        self.seconds = time.time() - start_time
+        return self
+
+    def summary(self) -> str:
+        """
+        Describes what was written, and how quickly (in bytes of FASTQ, before compression, per second).
+        """
+        total = sum(self.bytes_written)
+        size = (f"{format_byte_size(total)}, compressed from {format_byte_size(self.fastq_bytes)} of FASTQ,"
+                if self.compressed else format_byte_size(total))
+        rate = f", at {format_byte_size(int(self.fastq_bytes / self.seconds))}/s" if self.seconds else ""
+        return (f"Wrote {self.reads} reads to {' and '.join(self.filenames)}"
+                f" ({size} in {format_duration(self.seconds)}{rate}).")
+
+
+def generate_fastq_files(filename: str, **kwargs) -> FastqGenerator:
+    """
+    Writes a FASTQ file (or a pair of them) of (pseudo)random reads, taking the same arguments as FastqGenerator,
+    and returns the generator, which has the names of the files, and how many reads and bytes were written.
+    """
+    return FastqGenerator(filename, **kwargs).run()
@@ -0,0 +1,32 @@
+# This file has the settings for making sample data (see submitr.fastq_generation and submitr.bundle_generation)
+# that the make-sample-... commands also need to set up their arguments. Like submitr.base, it must stay quick
+# to import, so that (e.g.) --help is quick; the generators themselves are only imported once they're needed.
+
+
+class ReadLengthDistribution:
+    FIXED = 'fixed'  # every read is as long as the length
+    UNIFORM = 'uniform'  # read lengths are equally likely to be anything from the minimum length to the length
+    NORMAL = 'normal'  # read lengths vary around the length, as they do after trimming (but never exceed it)
+
+
+READ_LENGTH_DISTRIBUTIONS = [ReadLengthDistribution.FIXED, ReadLengthDistribution.UNIFORM,
+                             ReadLengthDistribution.NORMAL]
+
+DEFAULT_READ_LENGTH = 150
+DEFAULT_COMPRESSION_LEVEL = 1  # the fastest, since it's compressing that takes most of the time
+
+# The defaults for make-sample-fastq-file, which (as they always have) make a small file of short reads.
+DEFAULT_SAMPLE_FASTQ_READS = 10
+DEFAULT_SAMPLE_FASTQ_READ_LENGTH = 10
+
+
+class BundleFormat:
+    XLSX = 'xlsx'
+    JSON = 'json'
+
+
+BUNDLE_FORMATS = [BundleFormat.XLSX, BundleFormat.JSON]
+
+DEFAULT_BUNDLE_NAME = 'sample-bundle'
+DEFAULT_SAMPLES = 3
+DEFAULT_READS = 1000  # in each data file
@@ -0,0 +1,152 @@
+# This file contains a reader of JSON files whose top level is an object of (possibly very large) arrays, such as
+# ontology dumps (see verify_ontology_file in submitr.scripts.submit_ontology), which reads them an item at a time,
+# rather than all at once, so that only one item (and a chunk of the file) is in memory at a time.
+# Each item is decoded by the json module, so it's about as fast as json.load, but needs memory only for the largest
+# item, rather than many times the size of the whole file.
+
+import json
+import re
+
+from typing import Any, Iterator, List, NamedTuple, TextIO, Tuple
+
+
+JSON_CHUNK_SIZE = 1024 * 1024  # characters read at a time
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_ITEM_SEPARATOR = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+_LONGEST_TOKEN = len('\\uFFFF')  # A value cut off in the middle of one of these might be misread (e.g., as an error).
+
+
+class JsonStreamError(ValueError):
+
+    def __init__(self, message, offset):
+        self.offset = offset
+        super().__init__("%s at byte %s" % (message, offset))
+
+
+class JsonItem(NamedTuple):
+    key: str  # the key, in the top-level object, of the value this is (or is an item of)
+    offset: int  # the byte offset in the file at which this starts
+    value: Any
+    in_array: bool  # whether this is an item of an array (rather than the whole value of the key)
+
+
+class JsonObjectStream:
+    """
+    Reads a JSON file (open as text, with newline='') whose top level is an object, yielding (see items) each item
+    of each of its values that's an array (and each of its other values whole), along with where it was in the file.
+    The keys are kept (in keys), with whether each one's value was an array.
+    """
+
+    def __init__(self, fp: TextIO, chunk_size: int = JSON_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.keys: List[Tuple[str, bool]] = []
+        self._buffer = ''
+        self._buffer_is_ascii = True  # in which case offsets in it are the same in bytes as in characters
+        self._position = 0  # where in the buffer reading has got to
+        self._offset = 0  # the byte offset in the file of that position
+        self._eof = False
+
+    def _read_more(self) -> bool:
+        # Adds another chunk of the file to what's left of the buffer, returning False if there's no more.
+        if self._eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False  # The buffer is left as it was, so positions in it (e.g., of a decoded value) still hold.
+        self._buffer = self._buffer[self._position:] + chunk
+        self._buffer_is_ascii = self._buffer.isascii()
+        self._position = 0
+        return True
+
+    def _advance(self, end: int) -> None:
+        if self._buffer_is_ascii:
+            self._offset += end - self._position
+        else:
+            self._offset += len(self._buffer[self._position:end].encode('utf-8'))
+        self._position = end
+
+    def _peek(self) -> str:
+        # Skips whitespace, and returns the next character (without reading it), or '' at the end of the file.
+        while True:
+            self._advance(_WHITESPACE.match(self._buffer, self._position).end())
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read_more():
+                return ''
+
+    def _expect(self, characters: str) -> str:
+        character = self._peek()
+        if not character or character not in characters:
+            expected = " or ".join(repr(c) for c in characters)
+            raise JsonStreamError(f"Expected {expected} but found {character!r}" if character
+                                  else f"Expected {expected} but the file ended", self._offset)
+        self._advance(self._position + 1)
+        return character
+
+    def _decode(self) -> Any:
+        # Decodes the value that starts at the current position (after _peek has skipped any whitespace before it),
+        # reading more of the file as long as the value might continue past the buffer.
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError as e:
+                # Only an error at (or a string running to) the end of the buffer might be fixed by reading more.
+                truncated = e.pos >= len(self._buffer) - _LONGEST_TOKEN or e.msg.startswith('Unterminated string')
+                if truncated and self._read_more():
+                    continue
+                raise JsonStreamError(e.msg, self._offset + len(self._buffer[self._position:e.pos].encode('utf-8')))
+            if (end == len(self._buffer) or not isinstance(value, (dict, list, str))
+                    and end > len(self._buffer) - _LONGEST_TOKEN) and self._read_more():
+                # A number, for example, might go on in the next chunk, even past what's left of this one,
+                # which might be the start of it that the decoder didn't take (e.g., the '.' of '123.45').
+                continue
+            self._advance(end)
+            return value
+
+    def items(self) -> Iterator[JsonItem]:
+        """
+        Yields the values (or the items of array values) of the file's top-level object, in order.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self._advance(self._position + 1)
+            return
+        while True:
+            self._peek()
+            key_offset = self._offset
+            key = self._decode()
+            if not isinstance(key, str):
+                raise JsonStreamError("Expected a key", key_offset)
+            self._expect(':')
+            if self._peek() == '[':
+                self.keys.append((key, True))
+                self._advance(self._position + 1)
+                if self._peek() == ']':
+                    self._advance(self._position + 1)
+                else:
+                    while True:
+                        offset = self._offset
+                        yield JsonItem(key, offset, self._decode(), in_array=True)
+                        # Usually, the separator (and the start of the next item) is already in the buffer.
+                        separator = _ITEM_SEPARATOR.match(self._buffer, self._position)
+                        if separator and separator.end() < len(self._buffer):
+                            self._advance(separator.end())
+                            ended = separator.group(1) == ']'
+                        else:
+                            ended = self._expect(',]') == ']'
+                            self._peek()
+                        if ended:
+                            break
+            else:
+                self.keys.append((key, False))
+                self._peek()
+                offset = self._offset
+                yield JsonItem(key, offset, self._decode(), in_array=False)
+            if self._expect(',}') == '}':
+                break
+        if self._peek():
+            raise JsonStreamError("Expected the end of the file", self._offset)
@@ -0,0 +1,161 @@
+# This file contains submitr's timing instrumentation: spans, each of which times one phase of a submission
+# (e.g., resolving the server, a portal request, a poll, or an upload), written as JSON lines to a metrics file
+# (see configure_metrics), so that where the wall time of a run goes can be seen (e.g., on a dashboard).
+# Spans can also be summarized as Prometheus metrics (see submitr.prometheus).
+# Unless there is somewhere for them to go, spans cost next to nothing.
+
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid as uuid_module
+
+from typing import Callable, Iterator, List, Optional, Tuple
+from .prometheus import DEFAULT_PROMETHEUS_FILE, PrometheusExporter
+
+
+METRICS_FILE_VAR = 'SUBMITR_METRICS_FILE'
+DEFAULT_METRICS_FILE = os.environ.get(METRICS_FILE_VAR) or None
+
+
+class MetricsRecorder:
+    """
+    Appends a JSON line to a file (if it has one) for each span, giving its name, id, parent span's id (if it
+    was started within another span in the same thread), start time (in seconds since the epoch), duration in
+    seconds, status ('ok' or 'error', with the error), thread name, and any attributes. Every line also has
+    the id of the run. Each span is also passed, as a dictionary of these, to each of the listeners.
+    """
+
+    def __init__(self, filename: Optional[str] = None, listeners: Optional[List[Callable[[dict], None]]] = None):
+        self.filename = filename
+        self.listeners = list(listeners or [])
+        self.run = uuid_module.uuid4().hex
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._local = threading.local()
+
+    def _span_stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes) -> Iterator[dict]:
+        with self._lock:
+            span_id = self._next_id
+            self._next_id += 1
+        stack = self._span_stack()
+        record = {'run': self.run, 'span': name, 'id': span_id, 'parent': stack[-1]['id'] if stack else None,
+                  'start': time.time(), 'seconds': None, 'status': 'ok', 'thread': threading.current_thread().name}
+        record.update(attributes)
+        stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except SystemExit as e:
+            if e.code not in (0, None):
+                record.update(status='error', error=f"exit code {e.code}")
+            raise
+        except BaseException as e:
+            record.update(status='error', error=f"{e.__class__.__name__}: {e}")
+            raise
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            stack.pop()
+            self.write(record)
+
+    def annotate(self, **attributes) -> None:
+        stack = self._span_stack()
+        if stack:
+            stack[-1].update(attributes)
+
+    def write(self, record: dict) -> None:
+        if self.filename:
+            line = json.dumps(record, default=str) + "\n"
+            with self._lock:
+                directory = os.path.dirname(self.filename)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.filename, 'a') as fp:
+                    fp.write(line)
+        for listener in self.listeners:
+            listener(record)
+
+
+_METRICS_RECORDER: Optional[MetricsRecorder] = None
+_METRICS_CONFIGURED = False
+
+
+def configure_metrics(metrics_file: Optional[str] = None, prometheus_file: Optional[str] = None) -> None:
+    """
+    Sets where spans go from now on.
+
+    :param metrics_file: the name of a file to append JSON lines to, or None (default SUBMITR_METRICS_FILE, if set)
+    :param prometheus_file: the name of a file to which to write a summary of the spans as Prometheus metrics,
+        or None (default SUBMITR_PROMETHEUS_FILE, if set; see submitr.prometheus)
+    """
+    global _METRICS_RECORDER, _METRICS_CONFIGURED
+    metrics_file = metrics_file or DEFAULT_METRICS_FILE
+    prometheus_file = prometheus_file or DEFAULT_PROMETHEUS_FILE
+    listeners = [PrometheusExporter(prometheus_file)] if prometheus_file else []
+    _METRICS_RECORDER = MetricsRecorder(metrics_file, listeners=listeners) if metrics_file or listeners else None
+    _METRICS_CONFIGURED = True
+
+
+def get_metrics_recorder() -> Optional[MetricsRecorder]:
+    """
+    Returns the MetricsRecorder spans are written by, or None if spans aren't being recorded.
+    Unless configure_metrics says otherwise, they go to SUBMITR_METRICS_FILE and SUBMITR_PROMETHEUS_FILE, if set.
+    """
+    if not _METRICS_CONFIGURED:
+        configure_metrics()
+    return _METRICS_RECORDER
+
+
+@contextlib.contextmanager
+def metrics_span(name: str, **attributes) -> Iterator[dict]:
+    """
+    Times the code in its body as a span with the given name and attributes, if spans are being recorded.
+    It yields a dictionary to which more attributes can be added.
+    """
+    recorder = get_metrics_recorder()
+    if recorder is None:
+        yield {}
+    else:
+        with recorder.span(name, **attributes) as record:
+            yield record
+
+
+def annotate_span(**attributes) -> None:
+    """
+    Adds the given attributes (e.g., a number of bytes, or a status) to the innermost span of the current thread.
+    """
+    recorder = get_metrics_recorder()
+    if recorder is not None:
+        recorder.annotate(**attributes)
+
+
+def timed_span(name: str, arguments: Tuple[str, ...] = ()) -> Callable:
+    """
+    A decorator that times each call to the function it decorates as a span with the given name.
+    The span's attributes include the values of the named arguments (which should not include credentials).
+    """
+
+    def _decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def _timed(*args, **kwargs):
+            if get_metrics_recorder() is None:
+                return fn(*args, **kwargs)
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            with metrics_span(name, **{argument: bound.get(argument) for argument in arguments}):
+                return fn(*args, **kwargs)
+
+        return _timed
+
+    return _decorator
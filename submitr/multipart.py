@@ -0,0 +1,141 @@
+# This file contains a streaming encoder for multipart/form-data request bodies, used to post bundles to the portal
+# (see _post_submission in submitr.submission). Given to requests as the data of a request, it's sent a chunk at a time,
+# with a Content-Length known up front, rather than the whole body (including the file) being built in memory first.
+# The body is the same as requests itself would build given the same data and files.
+
+import os
+import uuid as uuid_module
+
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+
+MULTIPART_CHUNK_SIZE = 1024 * 1024  # bytes, when iterated over
+
+# Each segment of a body is either some bytes or (an open file, where its data starts, how many bytes it has).
+Segment = Union[bytes, Tuple[BinaryIO, int, int]]
+
+
+def _quote(value: str) -> str:
+    # This quotes a name or filename in a Content-Disposition header, as urllib3 does (in the HTML5 style).
+    return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def _form_fields(data: Optional[dict]) -> List[Tuple[str, bytes]]:
+    # This flattens form data to (name, value) pairs, as requests does: each item of a list (or other iterable)
+    # value is a field of its own, values that are None are left out, and other values are sent as strings.
+    fields = []
+    for name, value in (data or {}).items():
+        if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+            value = [value]
+        for item in value:
+            if item is not None:
+                fields.append((name, item if isinstance(item, bytes) else str(item).encode('utf-8')))
+    return fields
+
+
+def _file_name(name: str, fp: BinaryIO) -> str:
+    # Like requests, this sends a file under the base name of the file it was opened from, if known, or else its field.
+    file_name = getattr(fp, 'name', None)
+    if isinstance(file_name, str) and file_name and not (file_name[0] == '<' and file_name[-1] == '>'):
+        return os.path.basename(file_name)
+    return name
+
+
+def _remaining_size(fp: BinaryIO) -> Tuple[int, int]:
+    # Returns where the given file is positioned, and how many bytes it has from there.
+    start = fp.tell()
+    fp.seek(0, os.SEEK_END)
+    end = fp.tell()
+    fp.seek(start)
+    return start, end - start
+
+
+class MultipartEncoder:
+    """
+    A multipart/form-data request body of the given form data (as for the data of requests.post) and files
+    (a dictionary of open binary files, or None for none, as for the files of requests.post), which is read
+    a chunk at a time. Its length is known, so that requests sends it with a Content-Length.
+    It can be rewound (with seek(0)), for sending again.
+    """
+
+    def __init__(self, data: Optional[dict] = None, files: Optional[Dict[str, Optional[BinaryIO]]] = None,
+                 boundary: Optional[str] = None):
+        self.boundary = boundary or uuid_module.uuid4().hex
+        self.files = [fp for fp in (files or {}).values() if fp is not None]
+        self._segments: List[Segment] = []
+        for name, value in _form_fields(data):
+            self._segments.append(self._part_header(name) + value + b'\r\n')
+        for name, fp in (files or {}).items():
+            if fp is not None:
+                self._segments.append(self._part_header(name, file_name=_file_name(name, fp)))
+                start, size = _remaining_size(fp)
+                self._segments.append((fp, start, size))
+                self._segments.append(b'\r\n')
+        self._segments.append(f'--{self.boundary}--\r\n'.encode('utf-8'))
+        self.len = sum(len(segment) if isinstance(segment, bytes) else segment[2] for segment in self._segments)
+        self.seek(0)
+
+    def _part_header(self, name: str, file_name: Optional[str] = None) -> bytes:
+        disposition = f'form-data; name="{_quote(name)}"'
+        if file_name is not None:
+            disposition += f'; filename="{_quote(file_name)}"'
+        return f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n\r\n'.encode('utf-8')
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return self.len
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Returns up to size more bytes of the body (or the rest of it, if size is negative), or b'' at the end.
+        """
+        chunks = []
+        wanted = self.len - self._position if size is None or size < 0 else size
+        while wanted > 0 and self._index < len(self._segments):
+            segment = self._segments[self._index]
+            if isinstance(segment, bytes):
+                chunk = segment[self._offset:self._offset + wanted]
+                segment_size = len(segment)
+            else:
+                fp, start, segment_size = segment
+                if self._offset == 0:
+                    fp.seek(start)
+                chunk = fp.read(min(wanted, segment_size - self._offset))
+                if not chunk:
+                    raise IOError(f"The file {_file_name('datafile', fp)} got shorter while it was being sent.")
+            chunks.append(chunk)
+            wanted -= len(chunk)
+            self._offset += len(chunk)
+            self._position += len(chunk)
+            if self._offset >= segment_size:
+                self._index += 1
+                self._offset = 0
+        return b''.join(chunks)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(MULTIPART_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """
+        Rewinds the body to its start, which is the only place it can be moved to.
+        """
+        if (offset, whence) != (0, os.SEEK_SET):
+            raise ValueError("A multipart body can only be rewound to its start.")
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+        return 0
+
+    def close(self) -> None:
+        for fp in self.files:
+            fp.close()
@@ -0,0 +1,123 @@
+# This file contains the checks that submit-ontology makes of an ontology file before submitting it
+# (see verify_ontology_file in submitr.scripts.submit_ontology). Ontology files can be several gigabytes,
+# so they're read an ontology term at a time (see submitr.json_streaming), and the term ids seen so far are
+# kept as fingerprints, so that the memory used stays small however many terms there are.
+
+import io
+
+from array import array
+from typing import List, Optional
+
+from .json_streaming import JsonObjectStream
+
+
+ONTOLOGY_TERMS_KEY = 'ontology_term'
+MAX_ONTOLOGY_PROBLEMS = 20  # the most problems with ontology terms that are described (though all are counted)
+
+
+class FingerprintSet:
+    """
+    A set of strings, each kept as a 64-bit fingerprint (a hash) in an open-addressed table of them,
+    which takes about 16 bytes per string, rather than the 100 or more a set of the strings would.
+    Two strings having the same fingerprint is so unlikely (about once in 10**19 pairs) as not to matter here.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._table = array('Q', bytes(8 * capacity))  # capacity must be a power of 2
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def fingerprint(string: str) -> int:
+        # Python's own (64-bit) string hash will do, since fingerprints are only compared within the process.
+        return hash(string) & 0xFFFFFFFFFFFFFFFF or 1
+
+    def add(self, string: str) -> bool:
+        """
+        Adds the given string to the set, returning False if it was there already (or True if it wasn't).
+        """
+        added = self._add_fingerprint(self.fingerprint(string))
+        if added and self._size * 2 > len(self._table):
+            self._grow()
+        return added
+
+    def _add_fingerprint(self, fingerprint: int) -> bool:
+        table = self._table
+        mask = len(table) - 1
+        i = fingerprint & mask
+        while table[i]:  # Empty places are 0, which is never a fingerprint.
+            if table[i] == fingerprint:
+                return False
+            i = (i + 1) & mask
+        table[i] = fingerprint
+        self._size += 1
+        return True
+
+    def _grow(self) -> None:
+        old_table = self._table
+        self._table = array('Q', bytes(16 * len(old_table)))
+        self._size = 0
+        for fingerprint in old_table:
+            if fingerprint:
+                self._add_fingerprint(fingerprint)
+
+
+class OntologyCheck:
+    """
+    The result of checking an ontology file: how many terms it has, and the problems with it (with where they are).
+    """
+
+    def __init__(self, filename: str, max_problems: int = MAX_ONTOLOGY_PROBLEMS):
+        self.filename = filename
+        self.max_problems = max_problems
+        self.term_count = 0
+        self.problem_count = 0
+        self.problems: List[str] = []
+
+    def problem(self, message: str) -> None:
+        self.problem_count += 1
+        if len(self.problems) < self.max_problems:
+            self.problems.append(message)
+
+
+def _term_problem(term) -> Optional[str]:
+    # Returns what's wrong with the structure of an ontology term, if anything.
+    if not isinstance(term, dict):
+        return "is not an object"
+    term_id = term.get('term_id')
+    if not isinstance(term_id, str) or not term_id:
+        return "has no term_id"
+    if 'term_name' in term and not isinstance(term['term_name'], str):
+        return f"({term_id}) has a term_name that is not a string"
+    parents = term.get('parents')
+    if parents is not None and not (isinstance(parents, list) and all(isinstance(p, str) for p in parents)):
+        return f"({term_id}) has parents that are not a list of term ids"
+    return None
+
+
+def check_ontology_file(filename: str, max_problems: int = MAX_ONTOLOGY_PROBLEMS) -> OntologyCheck:
+    """
+    Reads the given ontology (JSON) file a term at a time, counting its terms (the items of its ontology_term list)
+    and checking that each has a term_id (unlike any other's), a term_name that's a string, and parents that are
+    a list of term ids. Problems are described along with the byte offset in the file at which they are.
+    Raises an error (e.g., a JsonStreamError) if the file is not JSON, or has no ontology_term list.
+    """
+    check = OntologyCheck(filename, max_problems=max_problems)
+    term_ids = FingerprintSet()
+    with io.open(filename, 'r', encoding='utf-8', newline='') as fp:
+        stream = JsonObjectStream(fp)
+        for item in stream.items():
+            if item.key != ONTOLOGY_TERMS_KEY or not item.in_array:
+                continue
+            check.term_count += 1
+            problem = _term_problem(item.value)
+            if problem:
+                check.problem(f"The ontology term at byte {item.offset} {problem}.")
+            elif not term_ids.add(item.value['term_id']):
+                check.problem(f"The ontology term at byte {item.offset} has the same term_id"
+                              f" ({item.value['term_id']}) as one before it.")
+    if (ONTOLOGY_TERMS_KEY, True) not in stream.keys:
+        raise ValueError(f"There is no {ONTOLOGY_TERMS_KEY} list in {filename}.")
+    return check
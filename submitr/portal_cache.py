@@ -0,0 +1,204 @@
+# This file contains the portal cache, an optional local record of portal pages that rarely change,
+# such as the health page and the /me user record, so that each run of a submitr command need not fetch
+# them again. Entries are kept for a limited time (the TTL) and are keyed by server and access key id.
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from typing import Callable, Dict, Optional, Tuple, Union
+from .base import SUBMITR_DIR
+
+
+PORTAL_CACHE_VAR = 'SUBMITR_PORTAL_CACHE'
+PORTAL_CACHE_TTL_VAR = 'SUBMITR_PORTAL_CACHE_TTL'
+
+DEFAULT_PORTAL_CACHE_FILE = os.environ.get(PORTAL_CACHE_VAR) or os.path.join(SUBMITR_DIR, 'portal_cache.json')
+# The cache is only used if this is set to a positive number of seconds.
+DEFAULT_PORTAL_CACHE_TTL = float(os.environ.get(PORTAL_CACHE_TTL_VAR) or 0)
+
+
+class PortalCacheKind:
+    HEALTH_PAGE = 'health'
+    USER_RECORD = 'me'
+
+
+def _key_id_and_secret(auth: Union[Tuple, dict, None]) -> Tuple[Optional[str], Optional[str]]:
+    if isinstance(auth, dict):
+        return auth.get('key'), auth.get('secret')
+    elif isinstance(auth, (tuple, list)) and len(auth) == 2:
+        return auth[0], auth[1]
+    return None, None
+
+
+class PortalCache:
+    """
+    A cache, kept in a JSON file, of portal pages, keyed by kind of page, server and access key id.
+
+    Only a digest of the secret is kept, so that an entry is only used with the same credentials it was fetched with.
+    """
+
+    def __init__(self, filename: str = DEFAULT_PORTAL_CACHE_FILE, ttl: float = DEFAULT_PORTAL_CACHE_TTL):
+        self.filename = filename
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, dict]] = None
+
+    @staticmethod
+    def entry_key(kind: str, server: str, key_id: str) -> str:
+        return f"{kind}:{server.rstrip('/')}:{key_id}"
+
+    @staticmethod
+    def secret_digest(secret: str) -> str:
+        return hashlib.sha256(secret.encode('utf-8')).hexdigest()
+
+    def _load(self) -> Dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.filename) as fp:
+                    entries = json.load(fp)
+            except (OSError, ValueError):  # A missing or damaged cache is just an empty one.
+                entries = {}
+            expired = time.time() - self.ttl
+            self._entries = {key: entry for key, entry in entries.items()
+                             if isinstance(entry, dict) and entry.get('cached', 0) > expired}
+        return self._entries
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_filename = f"{self.filename}.{os.getpid()}.tmp"
+        # The user record is personal, so the cache is only readable by its owner.
+        with open(os.open(temporary_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as fp:
+            json.dump(self._entries, fp, indent=1)
+        os.replace(temporary_filename, self.filename)  # So that an interruption can't leave a half-written cache
+
+    def get(self, kind: str, server: str, auth: Union[Tuple, dict, None]) -> Optional[dict]:
+        """
+        Returns (a copy of) the cached page of the given kind for the given server and credentials,
+        or None if there is none that is recent enough.
+        """
+        key_id, secret = _key_id_and_secret(auth)
+        if not key_id or not secret:
+            return None
+        with self._lock:
+            entry = self._load().get(self.entry_key(kind, server, key_id))
+            if (entry is None or entry.get('cached', 0) <= time.time() - self.ttl
+                    or entry.get('secret_digest') != self.secret_digest(secret)):
+                return None
+            return json.loads(json.dumps(entry['value']))
+
+    def put(self, kind: str, server: str, auth: Union[Tuple, dict, None], value: dict) -> None:
+        """
+        Caches the page of the given kind for the given server and credentials, saving the cache.
+        """
+        key_id, secret = _key_id_and_secret(auth)
+        if not key_id or not secret:
+            return
+        with self._lock:
+            self._load()[self.entry_key(kind, server, key_id)] = {
+                'server': server.rstrip('/'), 'key_id': key_id, 'secret_digest': self.secret_digest(secret),
+                'value': value, 'cached': time.time()
+            }
+            self._save()
+
+    def invalidate(self, server: Optional[str] = None, key_id: Optional[str] = None) -> None:
+        """
+        Removes the cached pages for the given server and/or access key id, or all cached pages if neither is given.
+        """
+        with self._lock:
+            entries = self._load()
+            doomed = [key for key, entry in entries.items()
+                      if (server is None or entry.get('server') == server.rstrip('/'))
+                      and (key_id is None or entry.get('key_id') == key_id)]
+            if doomed:
+                for key in doomed:
+                    del entries[key]
+                self._save()
+
+
+_PORTAL_CACHE: Optional[PortalCache] = None
+_PORTAL_CACHE_SETTINGS = {'enabled': True, 'ttl': DEFAULT_PORTAL_CACHE_TTL, 'filename': DEFAULT_PORTAL_CACHE_FILE}
+
+
+def configure_portal_cache(enabled: Optional[bool] = None, ttl: Optional[float] = None,
+                           filename: Optional[str] = None) -> None:
+    """
+    Sets whether, where, and for how long, portal pages are cached from now on.
+
+    :param enabled: whether to use the cache at all, such as False for a --no-cache argument (default True)
+    :param ttl: how many seconds cached pages are good for, or 0 not to cache (default DEFAULT_PORTAL_CACHE_TTL)
+    :param filename: the file in which to keep the cache (default DEFAULT_PORTAL_CACHE_FILE)
+    """
+    global _PORTAL_CACHE
+    ttl = DEFAULT_PORTAL_CACHE_TTL if ttl is None else ttl
+    if ttl < 0:
+        raise ValueError(f"The portal cache TTL must not be negative: {ttl}")
+    _PORTAL_CACHE_SETTINGS['enabled'] = True if enabled is None else enabled
+    _PORTAL_CACHE_SETTINGS['ttl'] = ttl
+    _PORTAL_CACHE_SETTINGS['filename'] = filename or DEFAULT_PORTAL_CACHE_FILE
+    _PORTAL_CACHE = None
+
+
+def get_portal_cache() -> Optional[PortalCache]:
+    """
+    Returns the PortalCache shared by all portal requests, creating it on first use,
+    or None if caching is disabled or its TTL (which can be set with SUBMITR_PORTAL_CACHE_TTL) is not positive.
+    Its file is DEFAULT_PORTAL_CACHE_FILE (which can be set with SUBMITR_PORTAL_CACHE) unless otherwise configured.
+    """
+    global _PORTAL_CACHE
+    if not _PORTAL_CACHE_SETTINGS['enabled'] or _PORTAL_CACHE_SETTINGS['ttl'] <= 0:
+        return None
+    if _PORTAL_CACHE is None:
+        _PORTAL_CACHE = PortalCache(filename=_PORTAL_CACHE_SETTINGS['filename'], ttl=_PORTAL_CACHE_SETTINGS['ttl'])
+    return _PORTAL_CACHE
+
+
+def clear_portal_cache(server: Optional[str] = None, key_id: Optional[str] = None) -> None:
+    """
+    Removes cached portal pages for the given server and/or access key id (or all of them),
+    whether or not caching is currently enabled.
+    """
+    PortalCache(filename=_PORTAL_CACHE_SETTINGS['filename'], ttl=float('inf')).invalidate(server=server, key_id=key_id)
+    if _PORTAL_CACHE is not None:
+        _PORTAL_CACHE._entries = None  # noQA - so that it rereads what's left
+
+
+def add_portal_cache_arguments(parser) -> None:
+    """
+    Adds the --no-cache and --clear-cache arguments, with which a command calls configure_portal_cache(enabled=False)
+    and clear_portal_cache, respectively, to the given argparse parser.
+    """
+    parser.add_argument('--no-cache', '--no_cache', action="store_true", default=False,
+                        help="don't use cached portal pages, even if $SUBMITR_PORTAL_CACHE_TTL is set")
+    parser.add_argument('--clear-cache', '--clear_cache', action="store_true", default=False,
+                        help="first remove all cached portal pages (e.g., after your access keys have changed)")
+
+
+def invalidate_rejected_credentials(server: str, auth: Union[Tuple, dict, None]) -> None:
+    """
+    Removes any cached portal pages for the given server and credentials, which it has just rejected,
+    so that no later run trusts them (e.g., a cached user record) either.
+    """
+    key_id, _ = _key_id_and_secret(auth)
+    if key_id:
+        clear_portal_cache(server=server, key_id=key_id)
+
+
+def cached_portal_page(kind: str, server: Optional[str], auth: Union[Tuple, dict, None],
+                       fetch: Callable[[], dict]) -> dict:
+    """
+    Returns the page of the given kind for the given server and credentials from the portal cache, if it's there,
+    or else calls fetch to get it, caching the result (unless it's empty, or just describes an error,
+    as ff_utils.get_health_page returns when it cannot get the page).
+    """
+    cache = get_portal_cache() if server else None
+    page = cache.get(kind, server, auth) if cache else None
+    if page is None:
+        page = fetch()
+        if cache and page and not (isinstance(page, dict) and list(page) == ['error']):
+            cache.put(kind, server, auth, page)
+    return page
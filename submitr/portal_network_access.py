@@ -1,26 +1,294 @@
 # This file contains centralized functions for all Portal interactions used by submitr.
+#
+# Requests are sent through one pooled requests.Session per server, so that a long run of status checks,
+# metadata posts and patches pays for connection (and TLS) setup once rather than once per request.
+#
+# Requests that fail in ways that may pass (e.g., a 502 or 503 from the portal's load balancer, or a reset connection)
+# are retried, with exponential backoff, as the PortalRetryPolicy says. POSTs, which are not idempotent, are only
+# retried when the portal cannot have acted on them. How often requests to each endpoint are retried is counted
+# (see get_portal_request_counts).
 
+import json
+import os
+import random
 import requests
-from typing import Tuple
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+from urllib3.exceptions import NewConnectionError
 from dcicutils import ff_utils
+from dcicutils.misc_utils import environ_bool, ignored
 from dcicutils.trace_utils import Trace
+from .metrics import annotate_span, timed_span
+from .portal_cache import invalidate_rejected_credentials
+from .prometheus import url_endpoint
+
+
+PORTAL_POOL_SIZE_VAR = 'SUBMITR_PORTAL_POOL_SIZE'
+PORTAL_KEEP_ALIVE_VAR = 'SUBMITR_PORTAL_KEEP_ALIVE'
+
+DEFAULT_PORTAL_POOL_SIZE = int(os.environ.get(PORTAL_POOL_SIZE_VAR) or 10)
+DEFAULT_PORTAL_KEEP_ALIVE = environ_bool(PORTAL_KEEP_ALIVE_VAR, default=True)
+
+_PORTAL_SESSIONS: Dict[str, requests.Session] = {}
+_PORTAL_SESSIONS_LOCK = threading.Lock()
+_PORTAL_SESSION_SETTINGS = {'pool_size': DEFAULT_PORTAL_POOL_SIZE, 'keep_alive': DEFAULT_PORTAL_KEEP_ALIVE}
+
+
+def configure_portal_sessions(pool_size: Optional[int] = None, keep_alive: Optional[bool] = None) -> None:
+    """
+    Sets how portal sessions made from now on are set up, closing any existing sessions so that they'll be remade.
+
+    :param pool_size: the most connections to keep open to any one server (default DEFAULT_PORTAL_POOL_SIZE)
+    :param keep_alive: whether to keep connections open between requests (default DEFAULT_PORTAL_KEEP_ALIVE)
+    """
+    pool_size = DEFAULT_PORTAL_POOL_SIZE if pool_size is None else pool_size
+    if pool_size < 1:
+        raise ValueError(f"The portal connection pool size must be a positive integer: {pool_size}")
+    close_portal_sessions()
+    _PORTAL_SESSION_SETTINGS['pool_size'] = pool_size
+    _PORTAL_SESSION_SETTINGS['keep_alive'] = DEFAULT_PORTAL_KEEP_ALIVE if keep_alive is None else keep_alive
+
+
+def close_portal_sessions() -> None:
+    """
+    Closes all portal sessions (and so their connections). New ones will be made as needed.
+    """
+    with _PORTAL_SESSIONS_LOCK:
+        for session in _PORTAL_SESSIONS.values():
+            session.close()
+        _PORTAL_SESSIONS.clear()
+
+
+def get_portal_session(url: str) -> requests.Session:
+    """
+    Returns the shared session to use for requests to the server of the given url, making it if need be.
+    """
+    parsed = urlparse(url)
+    server = f"{parsed.scheme}://{parsed.netloc}"
+    with _PORTAL_SESSIONS_LOCK:
+        session = _PORTAL_SESSIONS.get(server)
+        if session is None:
+            session = requests.Session()
+            pool_size = _PORTAL_SESSION_SETTINGS['pool_size']
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if not _PORTAL_SESSION_SETTINGS['keep_alive']:
+                session.headers['Connection'] = 'close'
+            _PORTAL_SESSIONS[server] = session
+        return session
+
+
+PORTAL_RETRIES_VAR = 'SUBMITR_PORTAL_RETRIES'
+PORTAL_RETRY_MAX_ELAPSED_VAR = 'SUBMITR_PORTAL_RETRY_MAX_ELAPSED'
+
+DEFAULT_PORTAL_RETRIES = int(os.environ.get(PORTAL_RETRIES_VAR) or 5)
+DEFAULT_PORTAL_RETRY_MAX_ELAPSED = float(os.environ.get(PORTAL_RETRY_MAX_ELAPSED_VAR) or 60)  # seconds
+
+# Statuses with which the portal (or the load balancer in front of it) says to try again later.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+# Of those, the ones that mean a request was not acted on, so that even a POST can be retried.
+NOT_ACTED_ON_STATUSES = (429,)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE')
+RETRYABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+
+def request_not_sent(error: Exception) -> bool:
+    """
+    Returns True if the given error from requests means the request never reached the server
+    (because no connection could be made), so that it's safe to send again whatever it was.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], 'reason', error.args[0]), NewConnectionError)
+    return False
+
+
+class PortalRetryPolicy:
+    """
+    Says which failed portal requests to retry, and how long to wait before each retry: exponentially longer
+    (from backoff seconds, doubling each time, up to max_backoff) with full jitter, or as long as a Retry-After
+    header asks. Requests are not retried more than max_retries times, nor once max_elapsed seconds would have
+    gone by since they were first sent.
+    """
+
+    def __init__(self, max_retries: int = DEFAULT_PORTAL_RETRIES, backoff: float = 1.0, max_backoff: float = 30.0,
+                 max_elapsed: float = DEFAULT_PORTAL_RETRY_MAX_ELAPSED,
+                 retryable_statuses: Sequence[int] = RETRYABLE_STATUSES):
+        if max_retries < 0:
+            raise ValueError(f"The number of portal request retries must not be negative: {max_retries}")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_elapsed = max_elapsed
+        self.retryable_statuses = tuple(retryable_statuses)
+
+    def is_retryable(self, method: str, response: Optional[requests.models.Response] = None,
+                     error: Optional[Exception] = None) -> bool:
+        """
+        Returns True if the request, which got the given response or raised the given error, is worth retrying.
+        """
+        if error is not None:
+            if not isinstance(error, RETRYABLE_ERRORS):
+                return False
+            return method.upper() in IDEMPOTENT_METHODS or request_not_sent(error)
+        if response is None or response.status_code not in self.retryable_statuses:
+            return False
+        return method.upper() in IDEMPOTENT_METHODS or response.status_code in NOT_ACTED_ON_STATUSES
+
+    def delay(self, retry: int, response: Optional[requests.models.Response] = None) -> float:
+        """
+        Returns the seconds to wait before the given retry (0 for the first).
+        """
+        retry_after = (getattr(response, 'headers', None) or {}).get('Retry-After')
+        if retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0.0), self.max_backoff)
+            except ValueError:
+                pass  # It's an HTTP date, which we ignore.
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+
+_PORTAL_RETRY_POLICY = PortalRetryPolicy()
+
+# How many requests, retries, and requests given up on (after retries, or a failure not worth retrying),
+# by method and endpoint.
+_PORTAL_REQUEST_COUNTS: Dict[Tuple[str, str], Dict[str, int]] = {}
+_PORTAL_REQUEST_COUNTS_LOCK = threading.Lock()
+
+
+def configure_portal_retries(max_retries: Optional[int] = None, max_elapsed: Optional[float] = None) -> None:
+    """
+    Sets how failed portal requests are retried from now on.
+
+    :param max_retries: the most times to retry a request (default DEFAULT_PORTAL_RETRIES), or 0 not to retry
+    :param max_elapsed: the most seconds to go on retrying a request (default DEFAULT_PORTAL_RETRY_MAX_ELAPSED)
+    """
+    global _PORTAL_RETRY_POLICY
+    _PORTAL_RETRY_POLICY = PortalRetryPolicy(
+        max_retries=DEFAULT_PORTAL_RETRIES if max_retries is None else max_retries,
+        max_elapsed=DEFAULT_PORTAL_RETRY_MAX_ELAPSED if max_elapsed is None else max_elapsed)
+
+
+def get_portal_retry_policy() -> PortalRetryPolicy:
+    return _PORTAL_RETRY_POLICY
+
+
+def get_portal_request_counts() -> Dict[Tuple[str, str], Dict[str, int]]:
+    """
+    Returns how many 'requests', 'retries' and 'failures' (requests given up on) there have been,
+    by (method, endpoint), where the endpoint is the path of the url with any uuids replaced by <uuid>.
+    """
+    with _PORTAL_REQUEST_COUNTS_LOCK:
+        return {key: dict(counts) for key, counts in _PORTAL_REQUEST_COUNTS.items()}
+
+
+def reset_portal_request_counts() -> None:
+    with _PORTAL_REQUEST_COUNTS_LOCK:
+        _PORTAL_REQUEST_COUNTS.clear()
+
+
+def _count_request(method: str, url: str, retries: int, failed: bool) -> None:
+    with _PORTAL_REQUEST_COUNTS_LOCK:
+        counts = _PORTAL_REQUEST_COUNTS.setdefault((method, url_endpoint(url)),
+                                                   {'requests': 0, 'retries': 0, 'failures': 0})
+        counts['requests'] += 1
+        counts['retries'] += retries
+        counts['failures'] += 1 if failed else 0
+
+
+def portal_request_with_retries(method: str, url: str, **kwargs) -> requests.models.Response:
+    """
+    Sends a request in the server's portal session, retrying it as the PortalRetryPolicy says.
+    Returns the last response, whatever its status, or raises the last error if there was no response.
+    If the server rejects the credentials (401 or 403), pages cached for them are dropped from the portal cache.
+    """
+    method = method.upper()
+    policy = _PORTAL_RETRY_POLICY
+    session = get_portal_session(url)
+    started = time.monotonic()
+    retries = 0
+    while True:
+        response, error = None, None
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            error = e
+        failed = error is not None or response.status_code >= 400
+        retryable = failed and policy.is_retryable(method, response=response, error=error)
+        if not retryable or retries >= policy.max_retries:
+            break
+        delay = policy.delay(retries, response=response)
+        if time.monotonic() - started + delay > policy.max_elapsed:
+            break
+        retries += 1
+        time.sleep(delay)
+        if hasattr(kwargs.get('data'), 'seek'):
+            kwargs['data'].seek(0)  # A streamed body (e.g., a MultipartEncoder) has to be sent again from its start.
+    _count_request(method, url, retries=retries, failed=failed)
+    if retries:
+        annotate_span(retries=retries)
+    if error is not None:
+        raise error
+    if response.status_code in (401, 403):
+        parsed = urlparse(url)
+        invalidate_rejected_credentials(f"{parsed.scheme}://{parsed.netloc}", kwargs.get('auth'))
+    return response
+
+
+def _session_request_with_retries(request_fxn, url, auth, verb, **kwargs):
+    # This has the signature ff_utils.authorized_request wants for a retry_fxn, and raises the same errors as
+    # ff_utils.standard_request_with_retries, but retries as our PortalRetryPolicy says, in our session.
+    # The request_fxn it gives us, the module-level requests function for the verb, is not used.
+    ignored(request_fxn)
+    try:
+        response = portal_request_with_retries(verb, url, auth=auth, **kwargs)
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Error with {verb.upper()} request for {url}: {e}")
+    if response.status_code >= 400:
+        try:
+            reason = response.json()
+        except ValueError:
+            reason = getattr(response, 'reason', None)
+        raise Exception(f"Bad status code for {verb.upper()} request for {url}: {response.status_code}."
+                        f" Reason: {reason}")
+    return response
 
 
 @Trace()
+@timed_span('portal_post', arguments=('schema',))
 def portal_metadata_post(schema: str, data: dict, auth: Tuple) -> dict:
-    return ff_utils.post_metadata(post_item=data, schema_name=schema, key=auth)
+    # This does what ff_utils.post_metadata does, but in our session.
+    auth = ff_utils.get_authentication_with_server(auth)
+    post_url = '/'.join([auth['server'], schema])
+    response = ff_utils.authorized_request(post_url, auth=auth, verb='POST', data=json.dumps(data),
+                                           retry_fxn=_session_request_with_retries)
+    return ff_utils.get_response_json(response)
 
 
 @Trace()
+@timed_span('portal_patch', arguments=('uuid',))
 def portal_metadata_patch(uuid: str, data: dict, auth: Tuple) -> dict:
-    return ff_utils.patch_metadata(patch_item=data, obj_id=uuid, key=auth)
+    # This does what ff_utils.patch_metadata does, but in our session.
+    auth = ff_utils.get_authentication_with_server(auth)
+    patch_url = '/'.join([auth['server'], uuid.lstrip('/')])
+    response = ff_utils.authorized_request(patch_url, auth=auth, verb='PATCH', data=json.dumps(data),
+                                           retry_fxn=_session_request_with_retries)
+    return ff_utils.get_response_json(response)
 
 
 @Trace()
+@timed_span('portal_get', arguments=('url',))
 def portal_request_get(url: str, auth: Tuple, **kwargs) -> requests.models.Response:
-    return requests.get(url, auth=auth, **kwargs)
+    return portal_request_with_retries('GET', url, auth=auth, **kwargs)
 
 
 @Trace()
+@timed_span('portal_post_request', arguments=('url',))
 def portal_request_post(url: str, auth: Tuple, **kwargs) -> requests.models.Response:
-    return requests.post(url, auth=auth, **kwargs)
+    return portal_request_with_retries('POST', url, auth=auth, **kwargs)
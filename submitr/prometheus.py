@@ -0,0 +1,191 @@
+# This file contains an exporter of submitr's metrics in the Prometheus text format, written to a file that
+# node_exporter's textfile collector can pick up (e.g., when submitr is run by cron on an ingest node).
+# The metrics summarize the spans recorded by submitr.metrics, of which the exporter is a listener.
+# The file is rewritten (atomically, as the collector requires) at most every PROMETHEUS_WRITE_INTERVAL seconds
+# while spans end, and whenever a run of uploads or of checks on a submission ends.
+
+import os
+import re
+import threading
+import time
+
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+
+PROMETHEUS_FILE_VAR = 'SUBMITR_PROMETHEUS_FILE'
+DEFAULT_PROMETHEUS_FILE = os.environ.get(PROMETHEUS_FILE_VAR) or None
+
+PROMETHEUS_WRITE_INTERVAL = 15  # seconds
+
+# The upper bounds, in seconds, of the buckets of the histograms.
+UPLOAD_SECONDS_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 12 * 3600)
+PORTAL_REQUEST_SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# The spans (see submitr.metrics) of portal requests, and their HTTP methods.
+PORTAL_REQUEST_SPANS = {'portal_get': 'GET', 'portal_post': 'POST', 'portal_patch': 'PATCH',
+                        'portal_post_request': 'POST'}
+# The spans at the end of which the metrics file is always written.
+FINAL_SPANS = ['uploads', 'check_submit_ingestion', 'monitor_submit_ingestions']
+
+UUID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.IGNORECASE)
+
+
+class Histogram:
+    """
+    A Prometheus histogram: how many observations were at most each of the bucket bounds, their count, and their sum.
+    """
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: Optional[Dict[str, str]] = None) -> List[str]:
+        labels = labels or {}
+        lines = [f"{name}_bucket{format_labels(dict(labels, le=format_value(bound)))} {count}"
+                 for bound, count in zip(self.buckets, self.bucket_counts)]
+        lines.append(f"{name}_bucket{format_labels(dict(labels, le='+Inf'))} {self.count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(self.sum)}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not float(value).is_integer() else str(int(value))
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = {name: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for name, value in labels.items()}
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+def url_endpoint(url: str) -> str:
+    """
+    Returns the path of the given url, with any uuids in it replaced by <uuid> (e.g., '/ingestion-submissions/<uuid>'),
+    so that requests to the same endpoint are counted together.
+    """
+    path = urlparse(url or '').path.rstrip('/') or '/'
+    return UUID_PATTERN.sub('<uuid>', path)
+
+
+def portal_endpoint(span: dict) -> str:
+    """
+    Returns the endpoint (see url_endpoint) of the portal request timed by the given span.
+    """
+    if span['span'] == 'portal_patch':
+        return '/<uuid>'
+    if span['span'] == 'portal_post':
+        return f"/{span.get('schema')}"
+    return url_endpoint(span.get('url'))
+
+
+class PrometheusExporter:
+    """
+    A listener for spans (see submitr.metrics.MetricsRecorder) that keeps Prometheus metrics about them:
+    bytes uploaded, files whose uploads succeeded, failed or were skipped, a histogram of the seconds each file's
+    upload took, histograms of the seconds portal requests took and how many times they were retried (by method and
+    endpoint), and how many times submissions were checked on. It writes them to a file, in the Prometheus text format.
+    """
+
+    def __init__(self, filename: str, write_interval: float = PROMETHEUS_WRITE_INTERVAL):
+        self.filename = filename
+        self.write_interval = write_interval
+        self.upload_bytes = 0
+        self.upload_files = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+        self.upload_seconds = Histogram(UPLOAD_SECONDS_BUCKETS)
+        self.portal_request_seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.portal_request_retries: Dict[Tuple[str, str], int] = {}
+        self.polls = 0
+        self._lock = threading.Lock()
+        self._last_written = None
+
+    def __call__(self, span: dict) -> None:
+        name = span['span']
+        with self._lock:
+            if name == 'upload':
+                if span['status'] == 'ok':
+                    self.upload_bytes += span.get('bytes') or 0
+                self.upload_seconds.observe(span['seconds'])
+            elif name == 'upload_outcome':
+                # Files are counted by their outcomes, since an upload can fail (or be skipped) before it starts.
+                outcome = span.get('outcome')
+                self.upload_files[outcome] = self.upload_files.get(outcome, 0) + 1
+            elif name in PORTAL_REQUEST_SPANS:
+                key = (PORTAL_REQUEST_SPANS[name], portal_endpoint(span))
+                if key not in self.portal_request_seconds:
+                    self.portal_request_seconds[key] = Histogram(PORTAL_REQUEST_SECONDS_BUCKETS)
+                self.portal_request_seconds[key].observe(span['seconds'])
+                if span.get('retries'):
+                    self.portal_request_retries[key] = self.portal_request_retries.get(key, 0) + span['retries']
+            elif name == 'poll':
+                self.polls += 1
+            due = self._last_written is None or time.monotonic() - self._last_written >= self.write_interval
+        if due or name in FINAL_SPANS:
+            self.write()
+
+    def text(self) -> str:
+        """
+        Returns the metrics in the Prometheus text format.
+        """
+        with self._lock:
+            lines = [
+                "# HELP submitr_upload_bytes_total Bytes of files uploaded successfully.",
+                "# TYPE submitr_upload_bytes_total counter",
+                f"submitr_upload_bytes_total {self.upload_bytes}",
+                "# HELP submitr_upload_files_total Files (including extra files) by the outcome of their upload.",
+                "# TYPE submitr_upload_files_total counter",
+                *[f"submitr_upload_files_total{format_labels({'status': status})} {count}"
+                  for status, count in self.upload_files.items()],
+                "# HELP submitr_upload_seconds Seconds taken to upload each file.",
+                "# TYPE submitr_upload_seconds histogram",
+                *self.upload_seconds.lines('submitr_upload_seconds'),
+                "# HELP submitr_portal_request_seconds Seconds taken by portal requests, by method and endpoint.",
+                "# TYPE submitr_portal_request_seconds histogram",
+            ]
+            for (method, endpoint), histogram in sorted(self.portal_request_seconds.items()):
+                lines.extend(histogram.lines('submitr_portal_request_seconds',
+                                             {'method': method, 'endpoint': endpoint}))
+            lines.extend([
+                "# HELP submitr_portal_request_retries_total Retries of portal requests, by method and endpoint.",
+                "# TYPE submitr_portal_request_retries_total counter",
+            ])
+            for (method, endpoint), retries in sorted(self.portal_request_retries.items()):
+                lines.append(f"submitr_portal_request_retries_total"
+                             f"{format_labels({'method': method, 'endpoint': endpoint})} {retries}")
+            lines.extend([
+                "# HELP submitr_submission_polls_total Times the progress of a submission was checked.",
+                "# TYPE submitr_submission_polls_total counter",
+                f"submitr_submission_polls_total {self.polls}",
+                "# HELP submitr_metrics_updated_timestamp_seconds When these metrics were written.",
+                "# TYPE submitr_metrics_updated_timestamp_seconds gauge",
+                f"submitr_metrics_updated_timestamp_seconds {format_value(time.time())}",
+            ])
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """
+        Writes the metrics to the file, replacing it all at once, so that it's never seen half-written.
+        """
+        text = self.text()
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # The textfile collector only reads files whose names end in .prom, so it ignores this one until it's renamed.
+        temporary_filename = f"{self.filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_filename, 'w') as fp:
+            fp.write(text)
+        os.replace(temporary_filename, self.filename)
+        with self._lock:
+            self._last_written = time.monotonic()
@@ -0,0 +1,387 @@
+# This file contains the in-process S3 upload engine used by submitr for uploading data files.
+# It is used in place of spawning a separate 'aws s3 cp' process for each file, which otherwise pays
+# for interpreter startup, awscli import and credential setup over and over across a large bundle.
+
+import collections
+import datetime
+import io
+import math
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from dcicutils.misc_utils import get_error_message
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+from .bandwidth import TokenBucket, get_bandwidth_limiter
+from .upload_journal import UploadCheckpoint
+from .utils import parse_byte_size
+
+
+class UploadMode:
+    PYTHON = 'python'  # in-process, multipart upload using boto3
+    AWSCLI = 'awscli'  # a separate 'aws s3 cp' process for each file
+
+
+UPLOAD_MODES = [UploadMode.PYTHON, UploadMode.AWSCLI]
+UPLOAD_MODE_VAR = 'SUBMITR_UPLOAD_MODE'
+DEFAULT_UPLOAD_MODE = os.environ.get(UPLOAD_MODE_VAR) or UploadMode.PYTHON
+
+MIN_PART_SIZE = 5 * 1024 ** 2  # S3 rejects any part but the last that is smaller than this
+MAX_PARTS = 10000  # S3 allows no more parts than this in a multipart upload
+
+UPLOAD_PART_SIZE_VAR = 'SUBMITR_UPLOAD_PART_SIZE'
+UPLOAD_PART_CONCURRENCY_VAR = 'SUBMITR_UPLOAD_PART_CONCURRENCY'
+
+# These are the defaults unless the variables above are set, which are only read when an engine is made
+# (see configured_part_size and configured_part_concurrency), so that a bad setting doesn't break every import.
+DEFAULT_PART_SIZE = 16 * 1024 ** 2
+DEFAULT_PART_CONCURRENCY = 8
+
+# At most this many S3 clients are kept for reuse by an engine (see S3UploadEngine.get_client).
+MAX_CACHED_CLIENTS = 16
+
+# This is only for testing and benchmarking against a local S3-compatible service (e.g., submitr.benchmarks).
+S3_ENDPOINT_URL_VAR = 'SUBMITR_S3_ENDPOINT_URL'
+DEFAULT_S3_ENDPOINT_URL = os.environ.get(S3_ENDPOINT_URL_VAR) or None
+
+# Upload credentials that expire within this many seconds are refreshed (if there's a way to) before they're
+# used again. This should be comfortably longer than it takes to send a part.
+CREDENTIALS_REFRESH_MARGIN = 10 * 60
+
+# The error codes with which S3 rejects a request made with credentials that have expired.
+EXPIRED_CREDENTIALS_ERROR_CODES = ['ExpiredToken', 'ExpiredTokenException', 'TokenRefreshRequired']
+
+
+def _environ_setting(var: str, parse: Callable, default):
+    value = os.environ.get(var)
+    if not value:
+        return default
+    try:
+        return parse(value)
+    except Exception as e:
+        raise ValueError(f"The value of {var} is not valid: {value!r} ({get_error_message(e)})")
+
+
+def configured_part_size() -> int:
+    """
+    Returns the part size set by SUBMITR_UPLOAD_PART_SIZE (e.g., 64MB), or else DEFAULT_PART_SIZE.
+    """
+    return _environ_setting(UPLOAD_PART_SIZE_VAR, parse_byte_size, DEFAULT_PART_SIZE)
+
+
+def configured_part_concurrency() -> int:
+    """
+    Returns the part concurrency set by SUBMITR_UPLOAD_PART_CONCURRENCY, or else DEFAULT_PART_CONCURRENCY.
+    """
+    return _environ_setting(UPLOAD_PART_CONCURRENCY_VAR, int, DEFAULT_PART_CONCURRENCY)
+
+
+def parse_upload_url(upload_url: str) -> Tuple[str, str]:
+    """
+    Given an upload_url of the form s3://<bucket>/<key> (as found in upload_credentials), returns (bucket, key).
+    """
+    parsed = urlparse(upload_url)
+    key = parsed.path.lstrip('/')
+    if parsed.scheme != 's3' or not parsed.netloc or not key:
+        raise ValueError(f"Not a valid S3 upload URL: {upload_url!r}")
+    return parsed.netloc, key
+
+
+def error_code(error: Exception) -> Optional[str]:
+    """
+    Returns the S3 error code (e.g., 'NoSuchUpload') of an error raised by a boto3 client, or None if it has none.
+    """
+    response = getattr(error, 'response', None)
+    return response.get('Error', {}).get('Code') if isinstance(response, dict) else None
+
+
+def credentials_expiration(upload_credentials: dict) -> Optional[datetime.datetime]:
+    """
+    Returns when the given upload_credentials expire (as an aware datetime), or None if that isn't known.
+    """
+    expiration = upload_credentials.get('Expiration')
+    if not isinstance(expiration, datetime.datetime):
+        try:
+            # The portal gives this as an ISO 8601 string, which older Pythons can't parse if it ends in Z.
+            expiration = datetime.datetime.fromisoformat(str(expiration).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return expiration if expiration.tzinfo else expiration.replace(tzinfo=datetime.timezone.utc)
+
+
+def credentials_expire_soon(upload_credentials: dict, margin: float = CREDENTIALS_REFRESH_MARGIN) -> bool:
+    """
+    Returns True if the given upload_credentials expire (or have expired) within margin seconds.
+    """
+    expiration = credentials_expiration(upload_credentials)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return expiration is not None and (expiration - now).total_seconds() < margin
+
+
+class UploadClient:
+    """
+    The S3 client for one upload, shared by the threads that send its parts. If it's given a way to get fresh
+    upload credentials (e.g., by asking the portal again), it makes a new client with them when the ones it has
+    are about to expire, or have been rejected as expired, so that a long upload can carry on past the expiry
+    of the credentials it started with. (A multipart upload can be continued with any credentials for it.)
+    """
+
+    def __init__(self, engine: 'S3UploadEngine', upload_credentials: dict,
+                 refresh_credentials: Optional[Callable[[], dict]] = None):
+        self.engine = engine
+        self.upload_credentials = upload_credentials
+        self.refresh_credentials = refresh_credentials
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._client = engine.get_client(upload_credentials)
+
+    def get(self):
+        """
+        Returns the client to use, first refreshing its credentials if they're about to expire.
+        """
+        with self._lock:
+            if self.refresh_credentials and credentials_expire_soon(self.upload_credentials):
+                self._refresh()
+            return self._client
+
+    def call(self, action: Callable):
+        """
+        Returns the result of calling action with the client. If the client's credentials are rejected as expired,
+        they're refreshed (if they can be) and action is called again, so it must be safe to repeat.
+        """
+        client = self.get()
+        try:
+            return action(client)
+        except Exception as e:
+            if not self.refresh_credentials or error_code(e) not in EXPIRED_CREDENTIALS_ERROR_CODES:
+                raise
+        with self._lock:
+            if self._client is client:  # Unless another thread has already done it
+                self._refresh()
+            client = self._client
+        return action(client)
+
+    def _refresh(self):
+        upload_credentials = self.refresh_credentials()
+        upload_url, expected_upload_url = upload_credentials['upload_url'], self.upload_credentials['upload_url']
+        if parse_upload_url(upload_url) != parse_upload_url(expected_upload_url):
+            raise RuntimeError(f"Refreshed upload credentials are for {upload_url} rather than {expected_upload_url}.")
+        self.upload_credentials = upload_credentials
+        self._client = self.engine.get_client(upload_credentials)
+        self.refreshes += 1
+
+
+def sse_args(s3_encrypt_key_id: Optional[str]) -> dict:
+    """
+    Returns the extra boto3 arguments for an S3 write, equivalent to 'aws s3 cp --sse aws:kms --sse-kms-key-id ...'.
+    """
+    if s3_encrypt_key_id:
+        return {'ServerSideEncryption': 'aws:kms', 'SSEKMSKeyId': s3_encrypt_key_id}
+    return {}
+
+
+class S3UploadEngine:
+    """
+    Uploads local files to S3 in-process, using the temporary credentials the portal hands out
+    in upload_credentials. Files no larger than one part are sent with a single PUT. Larger files
+    are sent as a multipart upload whose parts are sent concurrently.
+
+    If there is a bandwidth limiter (see submitr.bandwidth), each part (or single PUT) waits for its turn within
+    the limit before it is sent. (botocore reads a body more than once, to checksum and sign it as well as to send
+    it, so charging for each read wouldn't pace the sending. Charging for each part keeps the average rate within
+    the limit over a span of a few parts.)
+    """
+
+    def __init__(self, part_size: Optional[int] = None, part_concurrency: Optional[int] = None,
+                 endpoint_url: Optional[str] = None, bandwidth_limiter: Optional[TokenBucket] = None):
+        """
+        :param part_size: the size in bytes of each part of a multipart upload (default configured_part_size())
+        :param part_concurrency: how many parts of one file may be in flight at once
+            (default configured_part_concurrency())
+        :param endpoint_url: the URL of an S3-compatible service to use instead of AWS (default DEFAULT_S3_ENDPOINT_URL)
+        :param bandwidth_limiter: a TokenBucket limiting the upload rate (default from get_bandwidth_limiter, if any)
+        """
+        self.part_size = parse_byte_size(part_size or configured_part_size())
+        self.part_concurrency = part_concurrency or configured_part_concurrency()
+        self.endpoint_url = endpoint_url or DEFAULT_S3_ENDPOINT_URL
+        self._bandwidth_limiter = bandwidth_limiter
+        self._session = None
+        self._clients = collections.OrderedDict()
+        self._clients_lock = threading.Lock()
+        if self.part_size < MIN_PART_SIZE:
+            raise ValueError(f"The upload part size must be at least {MIN_PART_SIZE} bytes: {self.part_size}")
+        if self.part_concurrency < 1:
+            raise ValueError(f"The upload part concurrency must be a positive integer: {self.part_concurrency}")
+
+    def get_client(self, upload_credentials: dict):
+        """
+        Returns a boto3 S3 client that acts with the given upload_credentials, reusing the one made earlier
+        with the same credentials, if any (e.g., for the extra files of a file, or the same upload resumed).
+        """
+        key = (upload_credentials['AccessKeyId'], upload_credentials['SecretAccessKey'],
+               upload_credentials['SessionToken'])
+        with self._clients_lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = self.make_client(upload_credentials)
+                while len(self._clients) > MAX_CACHED_CLIENTS:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(key)
+            return client
+
+    def make_client(self, upload_credentials: dict):
+        """
+        Returns a new boto3 S3 client that acts with the given upload_credentials. The clients share one boto3
+        session, so that the S3 service model, endpoint data and the like are only loaded once.
+        """
+        import boto3  # This is deferred so that merely importing this module doesn't have to pay for loading boto3.
+        from botocore.config import Config
+        if self._session is None:
+            self._session = boto3.session.Session()
+        config = Config(max_pool_connections=self.part_concurrency + 2,
+                        retries={'max_attempts': 5, 'mode': 'standard'},
+                        # A local service won't have a hostname for each bucket.
+                        s3={'addressing_style': 'path'} if self.endpoint_url else None)
+        return self._session.client('s3', config=config, endpoint_url=self.endpoint_url,
+                                    aws_access_key_id=upload_credentials['AccessKeyId'],
+                                    aws_secret_access_key=upload_credentials['SecretAccessKey'],
+                                    aws_session_token=upload_credentials['SessionToken'])
+
+    @property
+    def bandwidth_limiter(self) -> Optional[TokenBucket]:
+        # Unless one was given, this is looked up each time, since it may be configured after the engine is made.
+        return self._bandwidth_limiter or get_bandwidth_limiter()
+
+    def wait_for_bandwidth(self, n_bytes: int) -> None:
+        """
+        Waits until n_bytes can be sent within the bandwidth limit, if there is one.
+        """
+        bandwidth_limiter = self.bandwidth_limiter
+        if bandwidth_limiter:
+            bandwidth_limiter.consume(n_bytes)
+
+    def compute_part_size(self, file_size: int) -> int:
+        """
+        Returns the part size to use for a file of the given size, which is the configured part_size
+        unless that would need more than MAX_PARTS parts, in which case it is grown to fit.
+        """
+        return max(self.part_size, math.ceil(file_size / MAX_PARTS))
+
+    def upload_file(self, path: str, upload_credentials: dict, s3_encrypt_key_id: Optional[str] = None,
+                    checkpoint: Optional[UploadCheckpoint] = None,
+                    refresh_credentials: Optional[Callable[[], dict]] = None):
+        """
+        Uploads the local file at path to the upload_url named in upload_credentials.
+
+        :param path: the name of a local file to upload
+        :param upload_credentials: a dictionary containing the keys 'AccessKeyId', 'SecretAccessKey',
+            'SessionToken', and 'upload_url', and usually 'Expiration'.
+        :param s3_encrypt_key_id: a KMS key id to encrypt with, or None
+        :param checkpoint: an UploadCheckpoint in which to record progress, or None. If given, an interrupted
+            multipart upload is left in place (rather than aborted) so that a later call can resume it.
+        :param refresh_credentials: a function that returns fresh upload_credentials for the same upload_url,
+            or None. If given, it's called whenever the credentials in use are about to expire (see UploadClient).
+        """
+        bucket, key = parse_upload_url(upload_credentials['upload_url'])
+        file_size = os.path.getsize(path)
+        client = UploadClient(self, upload_credentials, refresh_credentials=refresh_credentials)
+        try:
+            if file_size <= self.part_size:
+                self.wait_for_bandwidth(file_size)
+
+                def put_object(s3):
+                    with io.open(path, 'rb') as fp:
+                        s3.put_object(Bucket=bucket, Key=key, Body=fp, **sse_args(s3_encrypt_key_id))
+
+                client.call(put_object)
+            else:
+                self._upload_multipart(client, path=path, file_size=file_size, bucket=bucket, key=key,
+                                       s3_encrypt_key_id=s3_encrypt_key_id, checkpoint=checkpoint)
+        except Exception as e:
+            if error_code(e) in EXPIRED_CREDENTIALS_ERROR_CODES:
+                raise RuntimeError(f"Upload failed because its upload credentials expired: {get_error_message(e)}")
+            raise RuntimeError(f"Upload failed: {get_error_message(e)}")
+        if checkpoint:
+            checkpoint.complete()
+
+    @staticmethod
+    def _list_parts(client, *, bucket, key, upload_id) -> Dict[int, str]:
+        parts = {}
+        kwargs = {}
+        while True:
+            response = client.list_parts(Bucket=bucket, Key=key, UploadId=upload_id, **kwargs)
+            for part in response.get('Parts', []):
+                parts[part['PartNumber']] = part['ETag']
+            if not response.get('IsTruncated'):
+                return parts
+            kwargs = {'PartNumberMarker': response['NextPartNumberMarker']}
+
+    def _resume_multipart(self, client, *, bucket, key, part_size, checkpoint) -> Optional[Tuple[str, Dict[int, str]]]:
+        resumable = checkpoint.resumable_upload(bucket=bucket, key=key, part_size=part_size) if checkpoint else None
+        if not resumable:
+            return None
+        upload_id, done_parts = resumable
+        try:
+            # S3 has the last word on which parts it has. If it has forgotten the upload, we must start again.
+            listed_parts = client.call(lambda s3: self._list_parts(s3, bucket=bucket, key=key, upload_id=upload_id))
+        except Exception as e:
+            if error_code(e) == 'NoSuchUpload':
+                return None
+            listed_parts = done_parts  # We may just not be allowed to list parts, so trust the journal.
+        return upload_id, {part_number: etag for part_number, etag in done_parts.items()
+                           if listed_parts.get(part_number) == etag}
+
+    def _upload_multipart(self, client, *, path, file_size, bucket, key, s3_encrypt_key_id, checkpoint=None):
+        part_size = self.compute_part_size(file_size)
+        resumed = self._resume_multipart(client, bucket=bucket, key=key, part_size=part_size, checkpoint=checkpoint)
+        if resumed:
+            upload_id, done_parts = resumed
+        else:
+            upload_id = client.call(lambda s3: s3.create_multipart_upload(Bucket=bucket, Key=key,
+                                                                          **sse_args(s3_encrypt_key_id)))['UploadId']
+            done_parts = {}
+            if checkpoint:
+                checkpoint.start(bucket=bucket, key=key, upload_id=upload_id, part_size=part_size)
+
+        def upload_part(part_number):
+            if part_number in done_parts:
+                return {'PartNumber': part_number, 'ETag': done_parts[part_number]}
+            offset = (part_number - 1) * part_size
+            with io.open(path, 'rb') as fp:
+                fp.seek(offset)
+                data = fp.read(min(part_size, file_size - offset))
+            self.wait_for_bandwidth(len(data))
+            response = client.call(lambda s3: s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id,
+                                                             PartNumber=part_number, Body=data))
+            if checkpoint:
+                checkpoint.record_part(part_number, response['ETag'])
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+        try:
+            try:
+                with ThreadPoolExecutor(max_workers=self.part_concurrency) as executor:
+                    futures = [executor.submit(upload_part, part_number)
+                               for part_number in range(1, math.ceil(file_size / part_size) + 1)]
+                    try:
+                        parts = [future.result() for future in futures]
+                    except Exception:
+                        for future in futures:  # Don't go on sending parts of an upload that is going to be abandoned.
+                            future.cancel()
+                        raise
+            finally:
+                if checkpoint:
+                    checkpoint.flush()  # However this ends, the parts that were sent are kept track of.
+            client.call(lambda s3: s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                                                MultipartUpload={'Parts': parts}))
+        except Exception as e:
+            if checkpoint and error_code(e) != 'NoSuchUpload':
+                raise  # Leave the upload in place to be resumed later.
+            if checkpoint:
+                checkpoint.discard()
+            try:
+                client.call(lambda s3: s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id))
+            except Exception:  # pragma: no cover - we're already reporting a failure, so this is best-effort
+                pass
+            raise
@@ -1,8 +1,14 @@
 import argparse
-from dcicutils.command_utils import script_catch_errors
 from dcicutils.common import ORCHESTRATED_APPS
-from ..base import DEFAULT_APP
-from ..submission import check_submit_ingestion
+from ..base import DEFAULT_APP, add_polling_arguments, lazy_function, polling_arguments
+from ..metrics import configure_metrics
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+check_submit_ingestion = lazy_function('submitr.submission', 'check_submit_ingestion')
+get_polling_strategy = lazy_function('submitr.submission', 'get_polling_strategy')
+monitor_submit_ingestions = lazy_function('submitr.submission', 'monitor_submit_ingestions')
 
 
 EPILOG = __doc__
@@ -15,22 +21,68 @@ def main(simulated_args_for_testing=None):
         epilog=EPILOG,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.add_argument('submission_uuid', help='uuid of previously submitted submission.')
+    parser.add_argument('submission_uuid', nargs='*',
+                        help='uuid of previously submitted submission (more than one may be given).')
+    parser.add_argument('--uuids-file', '--uuids_file', '-f', default=None,
+                        help="a file of submission uuids to check, one per line ('#' starts a comment)")
+    parser.add_argument('--json-summary', '--json_summary', default=None,
+                        help="a file to which to write the outcome of each submission as JSON ('-' for the console)")
     parser.add_argument('--app', choices=ORCHESTRATED_APPS, default=DEFAULT_APP,
                         help=f"An application (default {DEFAULT_APP!r}. Only for debugging."
                              f" Normally this should not be given.")
     parser.add_argument('--server', '-s', help="an http or https address of the server to use", default=None)
     parser.add_argument('--env', '-e', help="a portal environment name for the server to use", default=None)
+    add_polling_arguments(parser)
+    parser.add_argument('--metrics-file', '--metrics_file', default=None,
+                        help="a file to append timings of each phase of the work to, as JSON lines"
+                             " (default $SUBMITR_METRICS_FILE, if set)")
+    parser.add_argument('--prometheus-file', '--prometheus_file', default=None,
+                        help="a file (e.g., in node_exporter's textfile directory) to write Prometheus metrics"
+                             " about the checks and portal requests to (default $SUBMITR_PROMETHEUS_FILE, if set)")
     args = parser.parse_args(args=simulated_args_for_testing)
+    uuids = list(args.submission_uuid)
+    if args.uuids_file:
+        try:
+            uuids.extend(read_uuids_file(args.uuids_file))
+        except OSError as e:
+            parser.error(f"Cannot read uuids file {args.uuids_file}: {e}")
+    if not uuids:
+        parser.error("At least one submission uuid is required.")
 
     with script_catch_errors():
+        if args.metrics_file or args.prometheus_file:
+            configure_metrics(args.metrics_file, prometheus_file=args.prometheus_file)
+        polling_strategy = get_polling_strategy(**polling_arguments(args))
+        if len(uuids) > 1 or args.uuids_file or args.json_summary:
+            return monitor_submit_ingestions(
+                uuids,
+                server=args.server,
+                env=args.env,
+                app=args.app,
+                polling_strategy=polling_strategy,
+                summary_file=args.json_summary
+            )
         return check_submit_ingestion(
-                args.submission_uuid,
+                uuids[0],
                 server=args.server,
                 env=args.env,
-                app=args.app
+                app=args.app,
+                polling_strategy=polling_strategy
         )
 
 
+def read_uuids_file(filename):
+    """
+    Returns the uuids listed in the given file, one per line, ignoring blank lines and '#' comments.
+    """
+    uuids = []
+    with open(filename) as fp:
+        for line in fp:
+            uuid = line.split('#', 1)[0].strip()
+            if uuid:
+                uuids.append(uuid)
+    return uuids
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,59 @@
+import argparse
+
+from ..base import lazy_function
+from ..generation_defaults import (
+    BUNDLE_FORMATS, DEFAULT_BUNDLE_NAME, DEFAULT_READ_LENGTH, DEFAULT_READS, DEFAULT_SAMPLES,
+)
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+parse_byte_size = lazy_function('submitr.utils', 'parse_byte_size')
+show = lazy_function('submitr.utils', 'show')
+generate_bundle = lazy_function('submitr.bundle_generation', 'generate_bundle')
+ReadLengths = lazy_function('submitr.fastq_generation', 'ReadLengths')
+
+
+EPILOG = __doc__
+
+
+def main(simulated_args_for_testing=None):
+    parser = argparse.ArgumentParser(  # noqa - PyCharm wrongly thinks the formatter_class is invalid
+        description="Makes a synthetic metadata bundle of samples, with a pair of FASTQ files for each,"
+                    " e.g., for load testing submissions",
+        epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('folder', help='the folder to write the bundle and its data files into')
+    parser.add_argument('--samples', '-n', type=int, default=DEFAULT_SAMPLES,
+                        help=f'the number of samples, in families of 3 (default {DEFAULT_SAMPLES})')
+    parser.add_argument('--name', default=DEFAULT_BUNDLE_NAME,
+                        help=f'the name of the bundle, to which .xlsx or .json is added'
+                             f' (default {DEFAULT_BUNDLE_NAME})')
+    parser.add_argument('--format', choices=BUNDLE_FORMATS, action='append', default=None,
+                        help='the format of the bundle (which can be given more than once; default both)')
+    parser.add_argument('--prefix', default=None,
+                        help='what all the ids start with (default SYNTHETIC and 6 random hex digits)')
+    parser.add_argument('--reads', type=int, default=None,
+                        help=f'the number of reads in each data file (default {DEFAULT_READS},'
+                             f' or as many as --file-size takes)')
+    parser.add_argument('--file-size', '--file_size', default=None,
+                        help='make each data file at least this big, such as 1GB')
+    parser.add_argument('--length', '-l', type=int, default=DEFAULT_READ_LENGTH,
+                        help=f'the length of the reads (default {DEFAULT_READ_LENGTH})')
+    parser.add_argument('--seed', default=None,
+                        help='a seed (any string), to make the same bundle and files every time')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many worker processes to make data files with (default one per CPU)')
+    args = parser.parse_args(args=simulated_args_for_testing)
+
+    with script_catch_errors():
+        size = None if args.file_size is None else parse_byte_size(args.file_size)
+        generator = generate_bundle(args.folder, samples=args.samples, name=args.name, formats=args.format,
+                                    prefix=args.prefix, reads=args.reads, size=size,
+                                    read_lengths=ReadLengths(args.length), seed=args.seed, workers=args.workers)
+        show(generator.summary())
+
+
+if __name__ == '__main__':
+    main()
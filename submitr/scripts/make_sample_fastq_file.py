@@ -1,7 +1,18 @@
 import argparse
 
-from dcicutils.command_utils import script_catch_errors
-from dcicutils.data_utils import generate_sample_fastq_file
+from ..base import lazy_function
+from ..generation_defaults import (
+    DEFAULT_COMPRESSION_LEVEL, DEFAULT_SAMPLE_FASTQ_READ_LENGTH, DEFAULT_SAMPLE_FASTQ_READS, READ_LENGTH_DISTRIBUTIONS,
+    ReadLengthDistribution,
+)
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+parse_byte_size = lazy_function('submitr.utils', 'parse_byte_size')
+show = lazy_function('submitr.utils', 'show')
+generate_fastq_files = lazy_function('submitr.fastq_generation', 'generate_fastq_files')
+ReadLengths = lazy_function('submitr.fastq_generation', 'ReadLengths')
 
 
 EPILOG = __doc__
@@ -9,17 +20,46 @@ EPILOG = __doc__
 
 def main(simulated_args_for_testing=None):
     parser = argparse.ArgumentParser(  # noqa - PyCharm wrongly thinks the formatter_class is invalid
-        description="Submits a data bundle",
+        description="Makes a FASTQ file (or a pair of them) of (pseudo)random reads, e.g., for testing uploads",
         epilog=EPILOG,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.add_argument('filename', help='a local Excel filename that is the data bundle')
-    parser.add_argument('--number', '-n', help='number of sequences', default=10, type=int)
-    parser.add_argument('--length', '-l', help='length of sequences', default=10, type=int)
+    parser.add_argument('filename', help='the FASTQ file to make (compressed, if its name ends in .gz)')
+    parser.add_argument('--number', '-n', type=int, default=None,
+                        help=f'number of sequences (default {DEFAULT_SAMPLE_FASTQ_READS}, or as many as --size takes)')
+    parser.add_argument('--length', '-l', help='length of sequences', default=DEFAULT_SAMPLE_FASTQ_READ_LENGTH,
+                        type=int)
+    parser.add_argument('--size', default=None,
+                        help='make the file (or each file) at least this big, such as 50GB')
+    parser.add_argument('--paired', action="store_true", default=False,
+                        help='make a pair of files (named like NAME_R1.fastq.gz and NAME_R2.fastq.gz)')
+    parser.add_argument('--length-distribution', '--length_distribution', choices=READ_LENGTH_DISTRIBUTIONS,
+                        default=ReadLengthDistribution.FIXED,
+                        help=f'how the lengths of sequences vary, up to --length'
+                             f' (default {ReadLengthDistribution.FIXED})')
+    parser.add_argument('--min-length', '--min_length', type=int, default=None,
+                        help='the shortest a sequence may be, unless the distribution is fixed (default 1)')
+    parser.add_argument('--length-stddev', '--length_stddev', type=float, default=None,
+                        help='the standard deviation of a normal distribution of lengths (default a tenth of --length)')
+    parser.add_argument('--seed', default=None,
+                        help='a seed (any string), to make the same file every time')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many worker processes to make reads with (default one per CPU)')
+    parser.add_argument('--compression-level', '--compression_level', type=int, choices=range(10),
+                        default=DEFAULT_COMPRESSION_LEVEL,
+                        help=f'the gzip compression level, from 0 to 9'
+                             f' (default {DEFAULT_COMPRESSION_LEVEL}, the fastest)')
     args = parser.parse_args(args=simulated_args_for_testing)
 
     with script_catch_errors():
-        generate_sample_fastq_file(filename=args.filename, num=args.number, length=args.length)
+        size = None if args.size is None else parse_byte_size(args.size)
+        number = DEFAULT_SAMPLE_FASTQ_READS if args.number is None and size is None else args.number
+        read_lengths = ReadLengths(args.length, distribution=args.length_distribution, min_length=args.min_length,
+                                   stddev=args.length_stddev)
+        generator = generate_fastq_files(args.filename, number=number, size=size, read_lengths=read_lengths,
+                                         paired=args.paired, seed=args.seed, workers=args.workers,
+                                         compression_level=args.compression_level)
+        show(generator.summary())
 
 
 if __name__ == '__main__':
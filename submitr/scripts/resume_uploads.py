@@ -1,7 +1,15 @@
 import argparse
 
-from dcicutils.command_utils import script_catch_errors
-from ..submission import resume_uploads
+from ..base import lazy_function
+from ..bandwidth import configure_bandwidth_limit
+from ..metrics import configure_metrics
+from ..portal_cache import add_portal_cache_arguments, clear_portal_cache, configure_portal_cache
+from ..upload_scheduling import UPLOAD_ORDERS
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+resume_uploads = lazy_function('submitr.submission', 'resume_uploads')
 
 
 EPILOG = __doc__
@@ -22,12 +30,46 @@ def main(simulated_args_for_testing=None):
                         help="suppress requests for user input", default=False)
     parser.add_argument('--subfolders', '-sf', action="store_true",
                         help="search subfolders of folder for upload files", default=False)
+    parser.add_argument('--parallel_uploads', '--parallel-uploads', '-pu', type=int, default=1,
+                        help="how many files to upload at once (default 1)")
+    parser.add_argument('--upload-order', '--upload_order', choices=UPLOAD_ORDERS, default=None,
+                        help="the order in which to upload files (default $SUBMITR_UPLOAD_ORDER, or largest-first"
+                             " for parallel uploads and otherwise the order the portal lists them in)")
+    parser.add_argument('--plan', action="store_true", default=False,
+                        help="show what would be uploaded (sizes, missing files, and an estimated time),"
+                             " without uploading it")
+    parser.add_argument('--skip-existing', '--skip_existing', action="store_true", default=False,
+                        help="skip files that the portal already has (uploaded, with the same size and checksum),"
+                             " e.g., from an earlier run that didn't finish")
+    add_portal_cache_arguments(parser)
+    parser.add_argument('--max-bandwidth', '--max_bandwidth', default=None,
+                        help="the most bandwidth uploads may use, such as 400MB/s (default $SUBMITR_MAX_BANDWIDTH"
+                             " or no limit); not for uploads with the AWS CLI, which can't be limited")
+    parser.add_argument('--share-bandwidth', '--share_bandwidth', action="store_true", default=False,
+                        help="share the bandwidth limit with other submitr processes on this host,"
+                             " through $SUBMITR_BANDWIDTH_STATE_FILE (default ~/.submitr/bandwidth_state.json)")
+    parser.add_argument('--metrics-file', '--metrics_file', default=None,
+                        help="a file to append timings of each phase of the work to, as JSON lines"
+                             " (default $SUBMITR_METRICS_FILE, if set)")
+    parser.add_argument('--prometheus-file', '--prometheus_file', default=None,
+                        help="a file (e.g., in node_exporter's textfile directory) to write Prometheus metrics"
+                             " about the uploads and portal requests to (default $SUBMITR_PROMETHEUS_FILE, if set)")
     args = parser.parse_args(args=simulated_args_for_testing)
 
     with script_catch_errors():
 
+        if args.clear_cache:
+            clear_portal_cache()
+        if args.no_cache:
+            configure_portal_cache(enabled=False)
+        if args.max_bandwidth or args.share_bandwidth:
+            configure_bandwidth_limit(args.max_bandwidth, shared=args.share_bandwidth)
+        if args.metrics_file or args.prometheus_file:
+            configure_metrics(args.metrics_file, prometheus_file=args.prometheus_file)
         resume_uploads(uuid=args.uuid, server=args.server, env=args.env, bundle_filename=args.bundle_filename,
-                       upload_folder=args.upload_folder, no_query=args.no_query, subfolders=args.subfolders)
+                       upload_folder=args.upload_folder, no_query=args.no_query, subfolders=args.subfolders,
+                       parallel_uploads=args.parallel_uploads, plan=args.plan,
+                       upload_order=args.upload_order, skip_existing=args.skip_existing)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,12 @@
 import argparse
 
-from dcicutils.command_utils import script_catch_errors
 from dcicutils.common import APP_FOURFRONT, ORCHESTRATED_APPS
-from ..submission import show_upload_info
+from ..base import lazy_function
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+show_upload_info = lazy_function('submitr.submission', 'show_upload_info')
 
 
 EPILOG = __doc__
@@ -1,7 +1,12 @@
 import argparse
 
-from dcicutils.command_utils import script_catch_errors
-from ..submission import submit_any_ingestion
+from ..base import lazy_function
+from ..portal_cache import add_portal_cache_arguments, clear_portal_cache, configure_portal_cache
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+submit_any_ingestion = lazy_function('submitr.submission', 'submit_any_ingestion')
 
 
 EPILOG = __doc__
@@ -20,10 +25,15 @@ def main(simulated_args_for_testing=None):
     parser.add_argument('--env', '-e', help="a portal environment name for the server to use", default=None)
     parser.add_argument('--validate-only', '-v', action="store_true",
                         help="whether to stop after validating without submitting", default=False)
+    add_portal_cache_arguments(parser)
     args = parser.parse_args(args=simulated_args_for_testing)
 
     with script_catch_errors():
 
+        if args.clear_cache:
+            clear_portal_cache()
+        if args.no_cache:
+            configure_portal_cache(enabled=False)
         return submit_any_ingestion(
                 ingestion_filename=args.genelist_filename,
                 ingestion_type='genelist',
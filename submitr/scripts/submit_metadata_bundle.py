@@ -1,10 +1,19 @@
 import argparse
 
-from dcicutils.command_utils import script_catch_errors
-from ..base import DEFAULT_APP
-from ..submission import (
-    submit_any_ingestion, DEFAULT_INGESTION_TYPE, DEFAULT_SUBMISSION_PROTOCOL, SUBMISSION_PROTOCOLS
+from ..base import (
+    DEFAULT_APP, lazy_function, DEFAULT_INGESTION_TYPE, DEFAULT_SUBMISSION_PROTOCOL, SUBMISSION_PROTOCOLS,
+    add_polling_arguments, polling_arguments,
 )
+from ..bandwidth import configure_bandwidth_limit
+from ..metrics import configure_metrics
+from ..portal_cache import add_portal_cache_arguments, clear_portal_cache, configure_portal_cache
+from ..upload_scheduling import UPLOAD_ORDERS
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+get_polling_strategy = lazy_function('submitr.submission', 'get_polling_strategy')
+submit_any_ingestion = lazy_function('submitr.submission', 'submit_any_ingestion')
 
 
 EPILOG = __doc__
@@ -30,22 +39,71 @@ def main(simulated_args_for_testing=None):
                         help="suppress requests for user input", default=False)
     parser.add_argument('--subfolders', '-sf', action="store_true",
                         help="search subfolders of folder for upload files", default=False)
+    parser.add_argument('--parallel_uploads', '--parallel-uploads', '-pu', type=int, default=1,
+                        help="how many files to upload at once (default 1)")
+    parser.add_argument('--upload-order', '--upload_order', choices=UPLOAD_ORDERS, default=None,
+                        help="the order in which to upload files (default $SUBMITR_UPLOAD_ORDER, or largest-first"
+                             " for parallel uploads and otherwise the order the portal lists them in)")
     parser.add_argument('--app', default=DEFAULT_APP,
                         help=f"An application (default {DEFAULT_APP!r}. Only for debugging."
                              f" Normally this should not be given.")
     parser.add_argument('--submission_protocol', '--submission-protocol', '-sp',
                         choices=SUBMISSION_PROTOCOLS, default=DEFAULT_SUBMISSION_PROTOCOL,
                         help=f"the submission protocol (default {DEFAULT_SUBMISSION_PROTOCOL!r})")
+    add_polling_arguments(parser)
+    parser.add_argument('--plan', action="store_true", default=False,
+                        help="submit the bundle (its metadata is posted, as without --plan), but then, instead of"
+                             " uploading its files, show what would be uploaded (sizes, missing files, and an"
+                             " estimated time), leaving that to resume-uploads (this can't be used with"
+                             " --validate-only, which doesn't tell what's to be uploaded)")
+    add_portal_cache_arguments(parser)
+    parser.add_argument('--max-bandwidth', '--max_bandwidth', default=None,
+                        help="the most bandwidth uploads may use, such as 400MB/s (default $SUBMITR_MAX_BANDWIDTH"
+                             " or no limit); not for uploads with the AWS CLI, which can't be limited")
+    parser.add_argument('--share-bandwidth', '--share_bandwidth', action="store_true", default=False,
+                        help="share the bandwidth limit with other submitr processes on this host,"
+                             " through $SUBMITR_BANDWIDTH_STATE_FILE (default ~/.submitr/bandwidth_state.json)")
+    parser.add_argument('--metrics-file', '--metrics_file', default=None,
+                        help="a file to append timings of each phase of the work to, as JSON lines"
+                             " (default $SUBMITR_METRICS_FILE, if set)")
+    parser.add_argument('--prometheus-file', '--prometheus_file', default=None,
+                        help="a file (e.g., in node_exporter's textfile directory) to write Prometheus metrics"
+                             " about the uploads and portal requests to (default $SUBMITR_PROMETHEUS_FILE, if set)")
+    parser.add_argument('--no-local-validation', '--no_local_validation', action="store_true", default=False,
+                        help="don't check the bundle (its columns and values, and that its files are in the upload"
+                             " folder) before submitting it, leaving that to the portal")
+    parser.add_argument('--strict-local-validation', '--strict_local_validation', action="store_true",
+                        default=False,
+                        help="don't submit the bundle if checking it before submitting it finds problems"
+                             " (which are otherwise just shown, since the portal's own checks are what count)")
     args = parser.parse_args(args=simulated_args_for_testing)
+    if args.no_local_validation and args.strict_local_validation:
+        parser.error("--strict-local-validation can't be used with --no-local-validation.")
+    if args.plan and args.validate_only:
+        parser.error("--plan can't be used with --validate-only, since only a submitted bundle"
+                     " says which files it needs uploaded.")
 
     with script_catch_errors():
 
+        if args.clear_cache:
+            clear_portal_cache()
+        if args.no_cache:
+            configure_portal_cache(enabled=False)
+        if args.max_bandwidth or args.share_bandwidth:
+            configure_bandwidth_limit(args.max_bandwidth, shared=args.share_bandwidth)
+        if args.metrics_file or args.prometheus_file:
+            configure_metrics(args.metrics_file, prometheus_file=args.prometheus_file)
+        polling_strategy = get_polling_strategy(**polling_arguments(args))
         submit_any_ingestion(ingestion_filename=args.bundle_filename, ingestion_type=args.ingestion_type,
                              institution=args.institution, project=args.project,
                              server=args.server, env=args.env,
                              validate_only=args.validate_only, upload_folder=args.upload_folder,
                              no_query=args.no_query, subfolders=args.subfolders, app=args.app,
-                             submission_protocol=args.submission_protocol)
+                             submission_protocol=args.submission_protocol,
+                             parallel_uploads=args.parallel_uploads, polling_strategy=polling_strategy,
+                             plan=args.plan, upload_order=args.upload_order,
+                             local_validation=not args.no_local_validation,
+                             strict_local_validation=args.strict_local_validation)
 
 
 if __name__ == '__main__':
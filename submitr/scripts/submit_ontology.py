@@ -1,13 +1,17 @@
 import argparse
-import json
-import io
 import os
 
-from dcicutils.command_utils import script_catch_errors, ScriptFailure
 from dcicutils.common import APP_FOURFRONT, ORCHESTRATED_APPS
-from dcicutils.misc_utils import get_error_message
-from ..submission import submit_any_ingestion, SubmissionProtocol, SUBMISSION_PROTOCOLS
-from ..utils import show
+from ..base import lazy_function, SubmissionProtocol, SUBMISSION_PROTOCOLS
+from ..portal_cache import add_portal_cache_arguments, clear_portal_cache, configure_portal_cache
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+get_error_message = lazy_function('dcicutils.misc_utils', 'get_error_message')
+show = lazy_function('submitr.utils', 'show')
+check_ontology_file = lazy_function('submitr.ontology_verification', 'check_ontology_file')
+submit_any_ingestion = lazy_function('submitr.submission', 'submit_any_ingestion')
 
 
 EPILOG = __doc__
@@ -36,10 +40,15 @@ def main(simulated_args_for_testing=None):
     parser.add_argument('--submission_protocol', '--submission-protocol', '-sp',
                         choices=SUBMISSION_PROTOCOLS, default=SubmissionProtocol.S3,
                         help=f"the submission protocol (default {SubmissionProtocol.S3!r})")
+    add_portal_cache_arguments(parser)
     args = parser.parse_args(args=simulated_args_for_testing)
 
     with script_catch_errors():
 
+        if args.clear_cache:
+            clear_portal_cache()
+        if args.no_cache:
+            configure_portal_cache(enabled=False)
         verify_ontology_file(args.ontology_filename)
 
         return submit_any_ingestion(
@@ -58,15 +67,22 @@ def main(simulated_args_for_testing=None):
 
 
 def verify_ontology_file(ontology_filename: str) -> bool:
+    from dcicutils.command_utils import ScriptFailure
     if not os.path.exists(ontology_filename):
         raise ScriptFailure(f"Specified ontology file does not exist: {ontology_filename}")
     try:
-        with io.open(ontology_filename, "r") as f:
-            ontology_json = json.load(f)
-            ontology_term_count = len(ontology_json["ontology_term"])
+        # This reads the file a term at a time, since ontology files can be too big to load all at once.
+        check = check_ontology_file(ontology_filename)
     except Exception as e:
         raise ScriptFailure(f"Cannot load specified ontology (JSON) file: {ontology_filename} | {get_error_message(e)}")
-    show(f"Verified specified ontology (JSON) file: {ontology_filename} (ontology terms: {ontology_term_count})")
+    if check.problems:
+        for problem in check.problems:
+            show(problem)
+        if check.problem_count > len(check.problems):
+            show(f"... and {check.problem_count - len(check.problems)} more.")
+        raise ScriptFailure(f"Specified ontology (JSON) file has problems: {ontology_filename}"
+                            f" (ontology terms: {check.term_count}, with problems: {check.problem_count})")
+    show(f"Verified specified ontology (JSON) file: {ontology_filename} (ontology terms: {check.term_count})")
     return True
 
 
@@ -1,7 +1,14 @@
 import argparse
 
-from dcicutils.command_utils import script_catch_errors
-from ..submission import upload_item_data
+from ..base import lazy_function
+from ..bandwidth import configure_bandwidth_limit
+from ..metrics import configure_metrics
+from ..portal_cache import add_portal_cache_arguments, clear_portal_cache, configure_portal_cache
+
+
+# These are only imported when called, so that (e.g.) --help is quick.
+script_catch_errors = lazy_function('dcicutils.command_utils', 'script_catch_errors')
+upload_item_data = lazy_function('submitr.submission', 'upload_item_data')
 
 
 EPILOG = __doc__
@@ -19,10 +26,31 @@ def main(simulated_args_for_testing=None):
     parser.add_argument('--env', '-e', help="a portal environment name for the server to use", default=None)
     parser.add_argument('--no_query', '-nq', action="store_true",
                         help="suppress requests for user input", default=False)
+    add_portal_cache_arguments(parser)
+    parser.add_argument('--max-bandwidth', '--max_bandwidth', default=None,
+                        help="the most bandwidth uploads may use, such as 400MB/s (default $SUBMITR_MAX_BANDWIDTH"
+                             " or no limit); not for uploads with the AWS CLI, which can't be limited")
+    parser.add_argument('--share-bandwidth', '--share_bandwidth', action="store_true", default=False,
+                        help="share the bandwidth limit with other submitr processes on this host,"
+                             " through $SUBMITR_BANDWIDTH_STATE_FILE (default ~/.submitr/bandwidth_state.json)")
+    parser.add_argument('--metrics-file', '--metrics_file', default=None,
+                        help="a file to append timings of each phase of the work to, as JSON lines"
+                             " (default $SUBMITR_METRICS_FILE, if set)")
+    parser.add_argument('--prometheus-file', '--prometheus_file', default=None,
+                        help="a file (e.g., in node_exporter's textfile directory) to write Prometheus metrics"
+                             " about the uploads and portal requests to (default $SUBMITR_PROMETHEUS_FILE, if set)")
     args = parser.parse_args(args=simulated_args_for_testing)
 
     with script_catch_errors():
 
+        if args.clear_cache:
+            clear_portal_cache()
+        if args.no_cache:
+            configure_portal_cache(enabled=False)
+        if args.max_bandwidth or args.share_bandwidth:
+            configure_bandwidth_limit(args.max_bandwidth, shared=args.share_bandwidth)
+        if args.metrics_file or args.prometheus_file:
+            configure_metrics(args.metrics_file, prometheus_file=args.prometheus_file)
         upload_item_data(item_filename=args.part_filename, uuid=args.uuid, server=args.server,
                          env=args.env, no_query=args.no_query)
 
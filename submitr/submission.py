@@ -4,7 +4,9 @@ import json
 import os
 import re
 import subprocess
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple
 
 # get_env_real_url would rely on env_utils
@@ -16,23 +18,36 @@ from dcicutils.ff_utils import get_health_page as get_portal_health_page
 from dcicutils.lang_utils import n_of, conjoined_list, disjoined_list, there_are
 from dcicutils.misc_utils import check_true, environ_bool, PRINT, url_path_join, ignorable, remove_prefix
 from dcicutils.s3_utils import HealthPageKey
-from typing import BinaryIO, Dict, Optional
+from typing import BinaryIO, Dict, List, Optional
 from typing_extensions import Literal
 from urllib.parse import urlparse
-from .base import DEFAULT_ENV, DEFAULT_ENV_VAR, PRODUCTION_ENV, KEY_MANAGER, DEFAULT_APP
+from .base import (
+    DEFAULT_ENV, DEFAULT_ENV_VAR, PRODUCTION_ENV, KEY_MANAGER, DEFAULT_APP,
+    DEFAULT_INGESTION_TYPE, DEFAULT_SUBMISSION_PROTOCOL, SUBMISSION_PROTOCOLS, SubmissionProtocol,
+    ATTEMPTS_BEFORE_TIMEOUT, PROGRESS_CHECK_INTERVAL,
+    POLL_BACKOFF_VAR, POLL_DEADLINE_VAR, POLL_INTERVAL_VAR, POLL_JITTER_VAR, POLL_MAX_INTERVAL_VAR,
+)
+from .bandwidth import MAX_BANDWIDTH_VAR, get_bandwidth_limiter
+from .bundle_validation import BundleValidator, check_bundle
+from .checksums import CHECKSUM_PROPERTIES, checksum_properties, compute_checksums, get_file_checksummer
 from .exceptions import PortalPermissionError
+from .metrics import annotate_span, metrics_span, timed_span
+from .multipart import MultipartEncoder
+from .portal_cache import cached_portal_page, PortalCacheKind
 from .portal_network_access import portal_metadata_post, portal_metadata_patch, portal_request_get, portal_request_post
-from .utils import show, keyword_as_title, check_repeatedly
+from .s3_upload import (
+    DEFAULT_S3_ENDPOINT_URL, DEFAULT_UPLOAD_MODE, S3UploadEngine, UPLOAD_MODE_VAR, UPLOAD_MODES, UploadMode,
+    credentials_expire_soon,
+)
+from .upload_journal import get_upload_journal
+from .upload_scheduling import schedule_uploads
+from .upload_throughput import get_upload_throughput_history, measure_read_throughput
+from .utils import (
+    show, keyword_as_title, check_repeatedly, PollingStrategy, ERASE_LINE, format_byte_size, format_duration,
+)
 from dcicutils.function_cache_decorator import function_cache
 
 
-class SubmissionProtocol:
-    S3 = 's3'
-    UPLOAD = 'upload'
-
-
-SUBMISSION_PROTOCOLS = [SubmissionProtocol.S3, SubmissionProtocol.UPLOAD]
-DEFAULT_SUBMISSION_PROTOCOL = SubmissionProtocol.UPLOAD
 STANDARD_HTTP_HEADERS = {"Content-type": "application/json"}
 
 
@@ -55,6 +70,7 @@ SERVER_REGEXP = re.compile(
 
 
 # TODO: Probably should simplify this to just trust what's in the key file and ignore all other servers. -kmp 2-Aug-2023
+@timed_span('resolve_server')
 def resolve_server(server, env):
     """
     Given a server spec or a portal environment (or neither, but not both), returns a server spec.
@@ -98,17 +114,26 @@ def resolve_server(server, env):
     return server
 
 
+@timed_span('user_record')
 def get_user_record(server, auth):
     """
     Given a server and some auth info, gets the user record for the authorized user.
 
-    This works by using the /me endpoint.
+    This works by using the /me endpoint, unless the record is in the portal cache (see submitr.portal_cache).
 
     :param server: a server spec
     :param auth: auth info to be used when contacting the server
     :return: the /me page in JSON format
     """
 
+    user_record = cached_portal_page(PortalCacheKind.USER_RECORD, server=server, auth=auth,
+                                     fetch=lambda: _fetch_user_record(server, auth=auth))
+    show("The server %s recognizes you as: %s <%s>"
+         % (server, user_record['title'], user_record['contact_email']))
+    return user_record
+
+
+def _fetch_user_record(server, auth):
     user_url = server + "/me?format=json"
     user_record_response = portal_request_get(user_url, auth=auth, headers=STANDARD_HTTP_HEADERS)
     try:
@@ -123,10 +148,7 @@ def get_user_record(server, auth):
     if user_record_response.status_code in (401, 403):
         raise PortalPermissionError(server=server)
     user_record_response.raise_for_status()
-    user_record = user_record_response.json()
-    show("The server %s recognizes you as: %s <%s>"
-         % (server, user_record['title'], user_record['contact_email']))
-    return user_record
+    return user_record_response.json()
 
 
 def get_defaulted_institution(institution, user_record):
@@ -312,8 +334,46 @@ def do_app_arg_defaulting(app_args, user_record):
                 del app_args[arg]
 
 
-PROGRESS_CHECK_INTERVAL = 15  # seconds
-ATTEMPTS_BEFORE_TIMEOUT = 40
+# The POLL_..._VAR environment variables (see submitr.base) set the defaults for how check_submit_ingestion polls.
+# By default, it checks every PROGRESS_CHECK_INTERVAL seconds, giving up after ATTEMPTS_BEFORE_TIMEOUT checks.
+
+
+def get_polling_strategy(interval: Optional[int] = None, max_interval: Optional[int] = None,
+                         backoff: Optional[float] = None, jitter: Optional[float] = None,
+                         deadline: Optional[float] = None) -> PollingStrategy:
+    """
+    Returns the PollingStrategy to use for checking on an ingestion, given settings any of which may be None,
+    in which case they are taken from environment variables (e.g., SUBMITR_POLL_INTERVAL), if set.
+
+    :param interval: seconds to wait before the second check (default PROGRESS_CHECK_INTERVAL,
+        or max_interval if that's less)
+    :param max_interval: the most seconds to wait between checks (default no limit)
+    :param backoff: how much longer each wait is than the one before (default 1, meaning no change)
+    :param jitter: the fraction by which each wait is randomly varied (default 0)
+    :param deadline: seconds after which to stop checking. If this is given, there is no limit on the number
+        of checks. Otherwise, checking stops after ATTEMPTS_BEFORE_TIMEOUT checks.
+    """
+
+    def setting(value, var, converter):
+        if value is not None:
+            return value
+        env_value = os.environ.get(var)
+        return converter(env_value) if env_value else None
+
+    interval = setting(interval, POLL_INTERVAL_VAR, int)
+    max_interval = setting(max_interval, POLL_MAX_INTERVAL_VAR, int)
+    backoff = setting(backoff, POLL_BACKOFF_VAR, float)
+    jitter = setting(jitter, POLL_JITTER_VAR, float)
+    deadline = setting(deadline, POLL_DEADLINE_VAR, float)
+    if interval is None:
+        # Only an interval that was asked for is an error if it exceeds max_interval, not the default.
+        interval = PROGRESS_CHECK_INTERVAL if max_interval is None else min(PROGRESS_CHECK_INTERVAL, max_interval)
+    return PollingStrategy(initial_interval=interval,
+                           max_interval=max_interval,
+                           backoff=1.0 if backoff is None else backoff,
+                           jitter=0.0 if jitter is None else jitter,
+                           deadline=deadline,
+                           max_attempts=-1 if deadline else ATTEMPTS_BEFORE_TIMEOUT)
 
 
 def get_section(res, section):
@@ -388,6 +448,46 @@ def _post_files_data(submission_protocol, ingestion_filename) -> Dict[Literal['d
         return {"datafile": None}
 
 
+def _post_multipart(url, keypair, submission_protocol, ingestion_filename, post_data):
+    # This posts the form data, with the bundle if the protocol says to send it, streaming it (see MultipartEncoder).
+    body = MultipartEncoder(post_data, files=_post_files_data(submission_protocol=submission_protocol,
+                                                              ingestion_filename=ingestion_filename))
+    try:
+        return portal_request_post(url, auth=keypair, headers={'Content-Type': body.content_type}, data=body)
+    finally:
+        body.close()
+
+
+# The statuses with which an old server's /submit_for_ingestion rejects a post with no bundle, as a bad request,
+# and those with which a server without that endpoint answers.
+OLD_PROTOCOL_REJECTION_STATUSES = (400, 415, 422)
+OLD_PROTOCOL_ABSENT_STATUSES = (404, 405)
+
+# Whether each server has the old /submit_for_ingestion endpoint, once that's known (see _old_protocol_supported).
+_OLD_PROTOCOL_SUPPORT: Dict[str, bool] = {}
+
+
+def _old_protocol_supported(server, keypair) -> Optional[bool]:
+    """
+    Returns whether the server has the old /submit_for_ingestion endpoint, by posting to it without a body,
+    which an old server rejects as a bad request (without doing anything) but a new one answers with a 404,
+    so that the bundle need only be sent once. Any other answer (e.g., a 403 or a 503) says neither,
+    so None is returned, and the bundle itself must be tried. A definite answer is remembered for the server.
+    """
+    server = server.rstrip('/')
+    if server not in _OLD_PROTOCOL_SUPPORT:
+        response = portal_request_post(url_path_join(server, "submit_for_ingestion"), auth=keypair, headers=None,
+                                       data=b'')
+        if response.status_code in OLD_PROTOCOL_REJECTION_STATUSES:
+            _OLD_PROTOCOL_SUPPORT[server] = True
+        elif response.status_code in OLD_PROTOCOL_ABSENT_STATUSES:
+            _OLD_PROTOCOL_SUPPORT[server] = False
+        else:
+            return None
+    return _OLD_PROTOCOL_SUPPORT[server]
+
+
+@timed_span('ingestion_submission_post', arguments=('submission_protocol',))
 def _post_submission(server, keypair, ingestion_filename, creation_post_data, submission_post_data,
                      submission_protocol=DEFAULT_SUBMISSION_PROTOCOL):
     """ This takes care of managing the compatibility step of using either the old or new ingestion protocol.
@@ -396,6 +496,8 @@ def _post_submission(server, keypair, ingestion_filename, creation_post_data, su
 
     NEW PROTOCOL: Create an IngestionSubmission and then use /ingestion-submissions/<guid>/submit_for_ingestion
 
+    Which to use is found out by a cheap probe (see _old_protocol_supported) before the bundle is sent.
+
     :param server: the name of the server as a URL
     :param keypair: a tuple which is a keypair (key_id, secret_key)
     :param ingestion_filename: the bundle filename to be submitted
@@ -406,27 +508,23 @@ def _post_submission(server, keypair, ingestion_filename, creation_post_data, su
 
     if submission_protocol == SubmissionProtocol.UPLOAD and TRY_OLD_PROTOCOL:
 
-        old_style_submission_url = url_path_join(server, "submit_for_ingestion")
-        old_style_post_data = dict(creation_post_data, **submission_post_data)
+        old_protocol_supported = _old_protocol_supported(server, keypair)
 
-        response = portal_request_post(old_style_submission_url,
-                                       auth=keypair,
-                                       headers=None,
-                                       data=old_style_post_data,
-                                       files=_post_files_data(submission_protocol=submission_protocol,
-                                                              ingestion_filename=ingestion_filename))
-
-        if response.status_code != 404:
+        if old_protocol_supported is not False:
 
             if DEBUG_PROTOCOL:  # pragma: no cover
-                PRINT("Old style protocol worked.")
+                PRINT("Using old style protocol." if old_protocol_supported else "Trying old style protocol.")
 
-            return response
+            old_style_submission_url = url_path_join(server, "submit_for_ingestion")
+            old_style_post_data = dict(creation_post_data, **submission_post_data)
+            response = _post_multipart(old_style_submission_url, keypair, submission_protocol=submission_protocol,
+                                       ingestion_filename=ingestion_filename, post_data=old_style_post_data)
+            if old_protocol_supported or response.status_code != 404:
+                return response
+            _OLD_PROTOCOL_SUPPORT[server.rstrip('/')] = False  # The probe didn't tell, but this 404 does.
 
-        else:  # on 404, try new protocol ...
-
-            if DEBUG_PROTOCOL:  # pragma: no cover
-                PRINT("Retrying with new protocol.")
+        if DEBUG_PROTOCOL:  # pragma: no cover
+            PRINT("Using new protocol.")
 
     creation_post_url = url_path_join(server, "IngestionSubmission")
     if DEBUG_PROTOCOL:  # pragma: no cover
@@ -449,16 +547,9 @@ def _post_submission(server, keypair, ingestion_filename, creation_post_data, su
     if DEBUG_PROTOCOL:  # pragma: no cover
         show(f"Created IngestionSubmission (bundle) type object: {submission.get('uuid', 'not-found')}")
     new_style_submission_url = url_path_join(server, submission_id, "submit_for_ingestion")
-    response = portal_request_post(new_style_submission_url,
-                                   auth=keypair,
-                                   headers=None,
-                                   data=submission_post_data,
-                                   files=_post_files_data(submission_protocol=submission_protocol,
-                                                          ingestion_filename=ingestion_filename))
-    return response
-
+    return _post_multipart(new_style_submission_url, keypair, submission_protocol=submission_protocol,
+                           ingestion_filename=ingestion_filename, post_data=submission_post_data)
 
-DEFAULT_INGESTION_TYPE = 'metadata_bundle'
 
 GENERIC_SCHEMA_TYPE = 'FileOther'
 
@@ -504,12 +595,15 @@ def _resolve_app_args(institution, project, lab, award, app, consortium, submiss
     return app_args
 
 
+@timed_span('submit_any_ingestion', arguments=('ingestion_filename', 'ingestion_type', 'validate_only'))
 def submit_any_ingestion(ingestion_filename, *, ingestion_type, server, env, validate_only,
                          institution=None, project=None, lab=None, award=None,
                          consortium=None, submission_center=None,
                          app: OrchestratedApp = None,
                          upload_folder=None, no_query=False, subfolders=False,
-                         submission_protocol=DEFAULT_SUBMISSION_PROTOCOL):
+                         submission_protocol=DEFAULT_SUBMISSION_PROTOCOL, parallel_uploads=1,
+                         polling_strategy: Optional[PollingStrategy] = None, plan=False, upload_order=None,
+                         local_validation=True, strict_local_validation=False):
     """
     Does the core action of submitting a metadata bundle.
 
@@ -529,6 +623,17 @@ def submit_any_ingestion(ingestion_filename, *, ingestion_type, server, env, val
     :param no_query: bool to suppress requests for user input
     :param subfolders: bool to search subdirectories within upload_folder for files
     :param submission_protocol: which submission protocol to use (default: 's3')
+    :param parallel_uploads: how many files to upload at once (default 1, meaning one at a time)
+    :param polling_strategy: how to check for the ingestion to be done (default from get_polling_strategy)
+    :param plan: whether, once the bundle is processed, just to show what would be uploaded (see plan_uploads)
+        rather than uploading it, leaving that to be done later by resume-uploads. The bundle is still submitted
+        (and its metadata posted), since that's what says which files need uploading.
+    :param upload_order: the order in which to upload files (see submitr.upload_scheduling)
+    :param local_validation: whether to check the bundle (see validate_bundle_locally) before submitting it,
+        showing any problems it probably has (default True)
+    :param strict_local_validation: whether to exit without submitting the bundle if local_validation finds problems
+        with it, rather than just showing them (default False, since its rules are only an approximation of the
+        portal's)
     """
 
     if app is None:  # Better to pass explicitly, but some legacy situations might require this to default
@@ -541,14 +646,30 @@ def submit_any_ingestion(ingestion_filename, *, ingestion_type, server, env, val
                                         institution=institution, project=project, lab=lab, award=award, app=app,
                                         consortium=consortium, submission_center=submission_center,
                                         upload_folder=upload_folder, no_query=no_query, subfolders=subfolders,
-                                        submission_protocol=submission_protocol)
+                                        submission_protocol=submission_protocol, parallel_uploads=parallel_uploads,
+                                        polling_strategy=polling_strategy, plan=plan, upload_order=upload_order,
+                                        local_validation=local_validation,
+                                        strict_local_validation=strict_local_validation)
 
     app_args = _resolve_app_args(institution=institution, project=project, lab=lab, award=award, app=app,
                                  consortium=consortium, submission_center=submission_center)
 
+    # This is done before anything is sent, so that problems the portal would find are reported in seconds.
+    validator = _check_bundle_locally(ingestion_filename, ingestion_type=ingestion_type, upload_folder=upload_folder,
+                                      subfolders=subfolders, local_validation=local_validation)
+    if validator is not None:
+        if validator.problems:
+            show_bundle_problems(ingestion_filename, validator.problems, strict=strict_local_validation)
+            if strict_local_validation:
+                exit(1)
+        if validator.sheets_skipped:
+            show(f"Sheets not checked before submitting (so left to the portal): {', '.join(validator.sheets_skipped)}")
+
     server = resolve_server(server=server, env=env)
 
-    validation_qualifier = " (for validation only)" if validate_only else ""
+    validation_qualifier = (" (for validation only)" if validate_only
+                            else " (uploading no files, just planning their uploads)" if plan
+                            else "")
 
     maybe_ingestion_type = ''
     if ingestion_type != DEFAULT_INGESTION_TYPE:
@@ -561,6 +682,40 @@ def submit_any_ingestion(ingestion_filename, *, ingestion_type, server, env, val
             exit(1)
 
     keydict = KEY_MANAGER.get_keydict_for_server(server)
+
+    uuid = _submit_bundle(ingestion_filename, ingestion_type=ingestion_type, server=server, keydict=keydict,
+                          app_args=app_args, validate_only=validate_only, submission_protocol=submission_protocol)
+
+    check_done, check_status, check_response = check_submit_ingestion(uuid, server, env, app,
+                                                                      polling_strategy=polling_strategy)
+
+    if validate_only:
+        exit(0)
+
+    if check_status == "success":
+        do_any_uploads(check_response, keydict=keydict, ingestion_filename=ingestion_filename,
+                       upload_folder=upload_folder, no_query=no_query,
+                       subfolders=subfolders, parallel_uploads=parallel_uploads, plan=plan,
+                       upload_order=upload_order)
+        if plan:
+            show(f"Nothing was uploaded. To upload these files, use: resume-uploads {uuid} --server {server}")
+
+    exit(0)
+
+
+def _check_bundle_locally(ingestion_filename, *, ingestion_type, upload_folder, subfolders,
+                          local_validation) -> Optional[BundleValidator]:
+    # How submit_any_ingestion (or its asyncio counterpart) checks a bundle before sending anything,
+    # if it's asked to look, and the bundle is a (local) metadata bundle. Otherwise, this returns None.
+    if local_validation and ingestion_type == DEFAULT_INGESTION_TYPE and os.path.exists(ingestion_filename):
+        return check_bundle_locally(ingestion_filename, upload_folder=upload_folder, subfolders=subfolders)
+    return None
+
+
+def _submit_bundle(ingestion_filename, *, ingestion_type, server, keydict, app_args, validate_only,
+                   submission_protocol) -> str:
+    # This is the part of submit_any_ingestion (and its asyncio counterpart) that creates the IngestionSubmission
+    # and sends the bundle, once the server is known, returning the uuid of the IngestionSubmission.
     keypair = KEY_MANAGER.keydict_to_keypair(keydict)
 
     metadata_bundles_bucket = get_metadata_bundles_bucket_from_health_path(key=keydict)
@@ -580,19 +735,91 @@ def submit_any_ingestion(ingestion_filename, *, ingestion_type, server, env, val
         **app_args,  # institution & project or lab & award
     }
 
+    submission_post_data = _compute_submission_post_data(ingestion_filename, submission_protocol=submission_protocol,
+                                                         validate_only=validate_only, keydict=keydict,
+                                                         app_args=app_args)
+
+    response = _post_submission(server=server, keypair=keypair,
+                                ingestion_filename=ingestion_filename,
+                                creation_post_data=creation_post_data,
+                                submission_post_data=submission_post_data,
+                                submission_protocol=submission_protocol)
+
+    res = _get_submission_result(response)
+
+    uuid = res['submission_id']
+
+    if DEBUG_PROTOCOL:  # pragma: no cover
+        show(f"Created IngestionSubmission object: s3://{metadata_bundles_bucket}/{uuid}", with_time=True)
+    show(f"Bundle uploaded to bucket {metadata_bundles_bucket}, assigned uuid {uuid} for tracking."
+         f" Awaiting processing...",
+         with_time=True)
+
+    return uuid
+
+
+@timed_span('local_validation', arguments=('ingestion_filename',))
+def check_bundle_locally(ingestion_filename, upload_folder=None, subfolders=False) -> BundleValidator:
+    """
+    Checks a metadata bundle for problems the portal would probably reject it for (see submitr.bundle_validation),
+    including data files missing from the upload folder (looked for as do_uploads would look for them),
+    without sending anything anywhere.
+
+    :param ingestion_filename: the name of the bundle file
+    :param upload_folder: folder in which to find files to upload (default: same as ingestion_filename)
+    :param subfolders: bool to search subdirectories within upload_folder for files
+    :return: the BundleValidator, with the problems found, and the sheets it didn't check
+    """
+    folder = upload_folder or os.path.dirname(ingestion_filename) or os.path.curdir
+    if subfolders:
+        folder = os.path.join(folder, '**')
+    folder_index = UploadFolderIndex(folder, recursive=subfolders)
+
+    def find_file(file_name):
+        return search_for_file(folder, file_name, recursive=subfolders, folder_index=folder_index)
+
+    validator = check_bundle(ingestion_filename, find_file=find_file)
+    annotate_span(problems=len(validator.problems), sheets_skipped=len(validator.sheets_skipped))
+    return validator
+
+
+def validate_bundle_locally(ingestion_filename, upload_folder=None, subfolders=False) -> List[str]:
+    """
+    Checks a metadata bundle as check_bundle_locally does, and returns a list of the problems found
+    (empty if there are none).
+    """
+    return check_bundle_locally(ingestion_filename, upload_folder=upload_folder, subfolders=subfolders).problems
+
+
+def show_bundle_problems(ingestion_filename, problems, strict=False):
+    if strict:
+        show(f"{ingestion_filename} was not submitted, because of {n_of(problems, 'problem')} with it:")
+    else:
+        show(f"{ingestion_filename} probably has {n_of(problems, 'problem')} the portal will reject it for:")
+    for problem in problems:
+        show(f" - {problem}")
+    if strict:
+        show("Fix these and submit it again (or, to leave checking it to the portal,"
+             " leave out --strict-local-validation).")
+    else:
+        show("(To stop before submitting a bundle with problems like these, use --strict-local-validation.)")
+
+
+def _compute_submission_post_data(ingestion_filename, *, submission_protocol, validate_only, keydict, app_args):
+    # For the s3 protocol, this uploads the bundle, to be referred to by the submission.
     if submission_protocol == SubmissionProtocol.S3:
 
         upload_result = upload_file_to_new_uuid(filename=ingestion_filename, schema_name=GENERIC_SCHEMA_TYPE,
                                                 auth=keydict, **app_args)
 
-        submission_post_data = compute_s3_submission_post_data(ingestion_filename=ingestion_filename,
-                                                               ingestion_post_result=upload_result,
-                                                               # The rest of this is other_args to pass through...
-                                                               validate_only=validate_only, **app_args)
+        return compute_s3_submission_post_data(ingestion_filename=ingestion_filename,
+                                               ingestion_post_result=upload_result,
+                                               # The rest of this is other_args to pass through...
+                                               validate_only=validate_only, **app_args)
 
     elif submission_protocol == SubmissionProtocol.UPLOAD:
 
-        submission_post_data = {
+        return {
             'validate_only': validate_only,
         }
 
@@ -601,12 +828,9 @@ def submit_any_ingestion(ingestion_filename, *, ingestion_type, server, env, val
         raise InvalidParameterError(parameter='submission_protocol', value=submission_protocol,
                                     options=SUBMISSION_PROTOCOLS)
 
-    response = _post_submission(server=server, keypair=keypair,
-                                ingestion_filename=ingestion_filename,
-                                creation_post_data=creation_post_data,
-                                submission_post_data=submission_post_data,
-                                submission_protocol=submission_protocol)
 
+def _get_submission_result(response) -> dict:
+    # Returns the JSON body of the response to a submission post, or raises an error if the post failed.
     try:
         # This can fail if the body doesn't contain JSON
         res = response.json()
@@ -645,27 +869,10 @@ def submit_any_ingestion(ingestion_filename, *, ingestion_type, server, env, val
         # It does not require careful unit test coverage. -kmp 23-Feb-2022
         raise Exception("Bad JSON body in %s submission result." % response.status_code)
 
-    uuid = res['submission_id']
-
-    if DEBUG_PROTOCOL:  # pragma: no cover
-        show(f"Created IngestionSubmission object: s3://{metadata_bundles_bucket}/{uuid}", with_time=True)
-    show(f"Bundle uploaded to bucket {metadata_bundles_bucket}, assigned uuid {uuid} for tracking."
-         f" Awaiting processing...",
-         with_time=True)
-
-    check_done, check_status, check_response = check_submit_ingestion(uuid, server, env, app)
-
-    if validate_only:
-        exit(0)
-
-    if check_status == "success":
-        do_any_uploads(check_response, keydict=keydict, ingestion_filename=ingestion_filename,
-                       upload_folder=upload_folder, no_query=no_query,
-                       subfolders=subfolders)
-
-    exit(0)
+    return res
 
 
+@timed_span('poll', arguments=('uuid',))
 def _check_ingestion_progress(uuid, *, keypair, server) -> Tuple[bool, str, dict]:
     """
     Calls endpoint to get this status of the IngestionSubmission uuid (in outer scope);
@@ -678,6 +885,7 @@ def _check_ingestion_progress(uuid, *, keypair, server) -> Tuple[bool, str, dict
     # FYI this processing_status and its state, progress, outcome properties were ultimately set
     # from within the ingester process, from within types.ingestion.SubmissionFolio.processing_status.
     status = response.get("processing_status", {})
+    annotate_span(state=status.get("state"), progress=status.get("progress"), outcome=status.get("outcome"))
     if status.get("state") == "done":
         outcome = status.get("outcome")
         return True, outcome, response
@@ -686,14 +894,16 @@ def _check_ingestion_progress(uuid, *, keypair, server) -> Tuple[bool, str, dict
         return False, progress, response
 
 
+@timed_span('check_submit_ingestion', arguments=('uuid',))
 def check_submit_ingestion(uuid: str, server: str, env: str,
-                           app: Optional[OrchestratedApp] = None) -> Tuple[bool, str, dict]:
+                           app: Optional[OrchestratedApp] = None,
+                           polling_strategy: Optional[PollingStrategy] = None) -> Tuple[bool, str, dict]:
 
     if app is None:  # Better to pass explicitly, but some legacy situations might require this to default
         app = DEFAULT_APP
     if KEY_MANAGER.selected_app != app:
         with KEY_MANAGER.locally_selected_app(app):
-            return check_submit_ingestion(uuid, server, env, app)
+            return check_submit_ingestion(uuid, server, env, app, polling_strategy=polling_strategy)
 
     server = resolve_server(server=server, env=env if not server else None)
     keydict = KEY_MANAGER.get_keydict_for_server(server)
@@ -704,12 +914,11 @@ def check_submit_ingestion(uuid: str, server: str, env: str,
     def check_ingestion_progress():
         return _check_ingestion_progress(uuid, keypair=keypair, server=server)
 
-    # Check the ingestion processing repeatedly, up to ATTEMPTS_BEFORE_TIMEOUT times,
+    # Check the ingestion processing repeatedly, by default up to ATTEMPTS_BEFORE_TIMEOUT times,
     # and waiting PROGRESS_CHECK_INTERVAL seconds between each check.
     [check_done, check_status, check_response] = (
         check_repeatedly(check_ingestion_progress,
-                         wait_seconds=PROGRESS_CHECK_INTERVAL,
-                         repeat_count=ATTEMPTS_BEFORE_TIMEOUT)
+                         polling_strategy=polling_strategy or get_polling_strategy())
     )
 
     if not check_done:
@@ -742,6 +951,110 @@ def summarize_submission(uuid: str, app: str, server: Optional[str] = None, env:
     return command_summary
 
 
+MAX_MONITOR_THREADS = 8  # the most submissions to check on at the same time
+
+
+@timed_span('monitor_submit_ingestions')
+def monitor_submit_ingestions(uuids: List[str], server: str, env: str,
+                              app: Optional[OrchestratedApp] = None,
+                              polling_strategy: Optional[PollingStrategy] = None,
+                              summary_file: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Checks on the progress of many IngestionSubmissions together, showing a compact table of their statuses
+    after each round of checks, until all of them are done or the polling strategy gives up, and then shows
+    a summary of their outcomes. Exits with status 1 if any did not finish.
+
+    :param uuids: the uuids of the IngestionSubmissions to check
+    :param server: the server the submissions were made to
+    :param env: the portal environment the submissions were made to
+    :param app: an orchestrated app name
+    :param polling_strategy: how often to check, and when to give up (default from get_polling_strategy)
+    :param summary_file: a file to which to also write the outcomes as JSON ('-' meaning standard output)
+    :return: a dictionary mapping each uuid to a dictionary with keys 'done', 'status', 'checks', and 'response'
+    """
+
+    if app is None:  # Better to pass explicitly, but some legacy situations might require this to default
+        app = DEFAULT_APP
+    if KEY_MANAGER.selected_app != app:
+        with KEY_MANAGER.locally_selected_app(app):
+            return monitor_submit_ingestions(uuids, server, env, app, polling_strategy=polling_strategy,
+                                             summary_file=summary_file)
+
+    server = resolve_server(server=server, env=env if not server else None)
+    keydict = KEY_MANAGER.get_keydict_for_server(server)
+    keypair = KEY_MANAGER.keydict_to_keypair(keydict)
+    polling_strategy = polling_strategy or get_polling_strategy()
+    uuids = list(dict.fromkeys(uuids))  # Each only once, but in the order given
+    results = {uuid: {'done': False, 'status': None, 'checks': 0, 'response': None} for uuid in uuids}
+
+    def check_ingestion_progress(uuid):
+        try:
+            return _check_ingestion_progress(uuid, keypair=keypair, server=server)
+        except Exception as e:  # Just a failure to check this time, so we'll try again next time.
+            return False, f"unreachable ({e.__class__.__name__})", None
+
+    show("Checking ingestion process for %s ..." % n_of(uuids, "IngestionSubmission"), with_time=True)
+    started = time.monotonic()
+    rounds = 0
+    table_height = 0
+    # All checks share a pooled connection to the server, whichever thread they're made from.
+    with ThreadPoolExecutor(max_workers=max(min(len(uuids), MAX_MONITOR_THREADS), 1)) as executor:
+        while True:
+            pending = [uuid for uuid in uuids if not results[uuid]['done']]
+            for uuid, (done, status, response) in zip(pending, executor.map(check_ingestion_progress, pending)):
+                result = results[uuid]
+                result['checks'] += 1
+                result['done'] = done
+                result['status'] = status
+                if response is not None:
+                    result['response'] = response
+            rounds += 1
+            table_height = _show_monitor_table(results, previous_height=table_height)
+            if all(result['done'] for result in results.values()):
+                break
+            elapsed = time.monotonic() - started
+            if polling_strategy.exhausted(rounds, elapsed):
+                break
+            time.sleep(polling_strategy.wait_seconds(rounds, elapsed))
+
+    show("Final statuses:", with_time=True)
+    for uuid, result in results.items():
+        show(f"{uuid}: {_monitor_status_title(result)}")
+    if summary_file:
+        summary = [{'uuid': uuid, 'done': result['done'], 'status': result['status'], 'checks': result['checks']}
+                   for uuid, result in results.items()]
+        if summary_file == '-':
+            PRINT(json.dumps(summary, indent=2))
+        else:
+            with io.open(summary_file, 'w') as fp:
+                json.dump(summary, fp, indent=2)
+    unfinished = [uuid for uuid, result in results.items() if not result['done']]
+    if unfinished:
+        show(f"Exiting after check processing timeout with {n_of(unfinished, 'submission')} not done.")
+        exit(1)
+    return results
+
+
+def _monitor_status_title(result: dict) -> str:
+    status = (result['status'] or "not done yet").title()
+    return status if result['done'] else f"Not Done ({status})"
+
+
+def _show_monitor_table(results: Dict[str, dict], previous_height: int = 0) -> int:
+    # Shows a line for each submission, redrawing the previous table in place if output is to a terminal.
+    # Returns the number of lines shown, to be given back as previous_height next time.
+    erase = ""
+    if sys.stdout.isatty():
+        erase = ERASE_LINE
+        if previous_height:
+            PRINT(f"\033[{previous_height}A", end="")
+    n_done = len([result for result in results.values() if result['done']])
+    show(f"{erase}{n_done} of {n_of(len(results), 'submission')} done", with_time=True)
+    for uuid, result in results.items():
+        show(f"{erase}  {uuid}  {_monitor_status_title(result):<28}  {n_of(result['checks'], 'check')}")
+    return len(results) + 1
+
+
 def compute_s3_submission_post_data(ingestion_filename, ingestion_post_result, **other_args):
     uuid = ingestion_post_result['uuid']
     at_id = ingestion_post_result['@id']
@@ -849,23 +1162,31 @@ def show_upload_result(result,
             show(datafile_url)
 
 
-def do_any_uploads(res, keydict, upload_folder=None, ingestion_filename=None, no_query=False, subfolders=False):
+def do_any_uploads(res, keydict, upload_folder=None, ingestion_filename=None, no_query=False, subfolders=False,
+                   parallel_uploads=1, plan=False, upload_order=None, skip_existing=False):
     upload_info = get_section(res, 'upload_info')
     folder = upload_folder or (os.path.dirname(ingestion_filename) if ingestion_filename else None)
-    if upload_info:
+    if plan:
+        show_upload_plan(plan_uploads(upload_info or [], auth=keydict, folder=folder, subfolders=subfolders),
+                         parallel_uploads=parallel_uploads)
+    elif upload_info:
         if no_query:
             do_uploads(upload_info, auth=keydict, no_query=no_query, folder=folder,
-                       subfolders=subfolders)
+                       subfolders=subfolders, parallel_uploads=parallel_uploads, upload_order=upload_order,
+                       skip_existing=skip_existing)
         else:
             if yes_or_no("Upload %s?" % n_of(len(upload_info), "file")):
                 do_uploads(upload_info, auth=keydict, no_query=no_query, folder=folder,
-                           subfolders=subfolders)
+                           subfolders=subfolders, parallel_uploads=parallel_uploads, upload_order=upload_order,
+                           skip_existing=skip_existing)
             else:
                 show("No uploads attempted.")
 
 
+@timed_span('resume_uploads', arguments=('uuid',))
 def resume_uploads(uuid, server=None, env=None, bundle_filename=None, keydict=None,
-                   upload_folder=None, no_query=False, subfolders=False):
+                   upload_folder=None, no_query=False, subfolders=False, parallel_uploads=1, plan=False,
+                   upload_order=None, skip_existing=False):
     """
     Uploads the files associated with a given ingestion submission. This is useful if you answered "no" to the query
     about uploading your data and then later are ready to do that upload.
@@ -878,27 +1199,41 @@ def resume_uploads(uuid, server=None, env=None, bundle_filename=None, keydict=No
     :param upload_folder: folder in which to find files to upload (default: same as ingestion_filename)
     :param no_query: bool to suppress requests for user input
     :param subfolders: bool to search subdirectories within upload_folder for files
+    :param parallel_uploads: how many files to upload at once (default 1, meaning one at a time)
+    :param plan: whether just to show what would be uploaded (see plan_uploads), without uploading anything
+    :param upload_order: the order in which to upload files (see submitr.upload_scheduling)
+    :param skip_existing: whether to skip files that the portal already has (see file_already_uploaded)
     """
 
     server = resolve_server(server=server, env=env)
     keydict = keydict or KEY_MANAGER.get_keydict_for_server(server)
-    url = ingestion_submission_item_url(server, uuid)
-    keypair = KEY_MANAGER.keydict_to_keypair(keydict)
-    response = portal_request_get(url, auth=keypair, headers=STANDARD_HTTP_HEADERS)
-    response.raise_for_status()
-    do_any_uploads(response.json(),
+    do_any_uploads(_get_ingestion_submission(uuid, server=server, keydict=keydict),
                    keydict=keydict,
                    ingestion_filename=bundle_filename,
                    upload_folder=upload_folder,
                    no_query=no_query,
-                   subfolders=subfolders)
+                   subfolders=subfolders,
+                   parallel_uploads=parallel_uploads,
+                   plan=plan,
+                   upload_order=upload_order,
+                   skip_existing=skip_existing)
+
+
+def _get_ingestion_submission(uuid, *, server, keydict) -> dict:
+    # The IngestionSubmission (e.g., for its upload_info) that resume_uploads (or its asyncio counterpart) resumes.
+    url = ingestion_submission_item_url(server, uuid)
+    response = portal_request_get(url, auth=KEY_MANAGER.keydict_to_keypair(keydict), headers=STANDARD_HTTP_HEADERS)
+    response.raise_for_status()
+    return response.json()
 
 
 @function_cache(serialize_key=True)
 def get_health_page(key: dict) -> dict:
-    return get_portal_health_page(key=key)
+    return cached_portal_page(PortalCacheKind.HEALTH_PAGE, server=key.get('server'), auth=key,
+                              fetch=lambda: get_portal_health_page(key=key))
 
 
+@timed_span('health_page')
 def get_metadata_bundles_bucket_from_health_path(key: dict) -> str:
     return get_health_page(key=key).get("metadata_bundles_bucket")
 
@@ -929,7 +1264,9 @@ def get_s3_encrypt_key_id(*, upload_credentials, auth):
     return s3_encrypt_key_id
 
 
-def execute_prearranged_upload(path, upload_credentials, auth=None):
+@timed_span('upload', arguments=('path', 'uuid'))
+def execute_prearranged_upload(path, upload_credentials, auth=None, upload_mode=None, uuid=None,
+                               refresh_credentials=None):
     """
     This performs a file upload using special credentials received from ff_utils.patch_metadata.
 
@@ -938,10 +1275,24 @@ def execute_prearranged_upload(path, upload_credentials, auth=None):
         containing the keys 'AccessKeyId', 'SecretAccessKey', 'SessionToken', and 'upload_url'.
     :param auth: auth info in the form of a dictionary containing 'key', 'secret', and 'server',
         and possibly other useful information such as an encryption key id.
+    :param upload_mode: one of UPLOAD_MODES, saying whether to upload in-process ('python')
+        or with a separate 'aws s3 cp' process ('awscli'). The default is DEFAULT_UPLOAD_MODE.
+    :param uuid: the uuid of the item the upload is for, if known. In-process uploads for a known item
+        are recorded in the upload journal, so that an interrupted upload can later be resumed.
+    :param refresh_credentials: a function that gets fresh upload_credentials for the same upload, or None.
+        If given, it's used whenever the upload_credentials are about to expire: before an upload with
+        the AWS CLI, or at any point during an in-process upload (see submitr.s3_upload.UploadClient).
     """
 
+    upload_mode = upload_mode or DEFAULT_UPLOAD_MODE
+    if upload_mode not in UPLOAD_MODES:
+        raise InvalidParameterError(parameter='upload_mode', value=upload_mode, options=UPLOAD_MODES)
+
     if DEBUG_PROTOCOL:  # pragma: no cover
         PRINT(f"Upload credentials contain {conjoined_list(list(upload_credentials.keys()))}.")
+    if refresh_credentials and upload_mode == UploadMode.AWSCLI and credentials_expire_soon(upload_credentials):
+        # The AWS CLI can't be given new credentials once it has started, so it had better start with fresh ones.
+        upload_credentials = refresh_credentials()
     try:
         s3_encrypt_key_id = get_s3_encrypt_key_id(upload_credentials=upload_credentials, auth=auth)
         extra_env = dict(AWS_ACCESS_KEY_ID=upload_credentials['AccessKeyId'],
@@ -951,27 +1302,68 @@ def execute_prearranged_upload(path, upload_credentials, auth=None):
     except Exception as e:
         raise ValueError("Upload specification is not in good form. %s: %s" % (e.__class__.__name__, e))
 
+    if upload_mode == UploadMode.AWSCLI:
+        check_bandwidth_limit_supported(upload_mode)
     start = time.time()
-    try:
-        source = path
-        target = upload_credentials['upload_url']
-        show("Uploading local file %s directly (via AWS CLI) to: %s" % (source, target))
-        command = ['aws', 's3', 'cp']
-        if s3_encrypt_key_id:
-            command = command + ['--sse', 'aws:kms', '--sse-kms-key-id', s3_encrypt_key_id]
-        command = command + ['--only-show-errors', source, target]
-        options = {}
-        if running_on_windows_native():
-            options = {"shell": True}
-        if DEBUG_PROTOCOL:  # pragma: no cover
-            PRINT(f"DEBUG CLI: {' '.join(command)} | ENV INCLUDES: {conjoined_list(list(extra_env.keys()))}")
-        subprocess.check_call(command, env=env, **options)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError("Upload failed with exit code %d" % e.returncode)
+    source = path
+    target = upload_credentials['upload_url']
+    annotate_span(upload_mode=upload_mode, bytes=_file_size(source))
+    if upload_mode == UploadMode.PYTHON:
+        show("Uploading local file %s directly to: %s" % (source, target))
+        checkpoint = get_upload_journal().checkpoint(uuid=uuid, path=source) if uuid else None
+        get_upload_engine().upload_file(source, upload_credentials=upload_credentials,
+                                        s3_encrypt_key_id=s3_encrypt_key_id, checkpoint=checkpoint,
+                                        refresh_credentials=refresh_credentials)
     else:
-        end = time.time()
-        duration = end - start
-        show("Upload duration: %.2f seconds" % duration)
+        try:
+            show("Uploading local file %s directly (via AWS CLI) to: %s" % (source, target))
+            command = ['aws', 's3', 'cp']
+            if DEFAULT_S3_ENDPOINT_URL:
+                command = command + ['--endpoint-url', DEFAULT_S3_ENDPOINT_URL]
+            if s3_encrypt_key_id:
+                command = command + ['--sse', 'aws:kms', '--sse-kms-key-id', s3_encrypt_key_id]
+            command = command + ['--only-show-errors', source, target]
+            options = {}
+            if running_on_windows_native():
+                options = {"shell": True}
+            if DEBUG_PROTOCOL:  # pragma: no cover
+                PRINT(f"DEBUG CLI: {' '.join(command)} | ENV INCLUDES: {conjoined_list(list(extra_env.keys()))}")
+            subprocess.check_call(command, env=env, **options)
+        except subprocess.CalledProcessError as e:
+            if credentials_expire_soon(upload_credentials, margin=0):
+                raise RuntimeError("Upload failed with exit code %d, after its upload credentials expired (at %s)."
+                                   % (e.returncode, upload_credentials['Expiration']))
+            raise RuntimeError("Upload failed with exit code %d" % e.returncode)
+    end = time.time()
+    duration = end - start
+    show("Upload duration: %.2f seconds" % duration)
+
+
+def check_bandwidth_limit_supported(upload_mode=None):
+    """
+    Raises a ValueError if uploads are to be made in the given upload_mode (default DEFAULT_UPLOAD_MODE) with the
+    AWS CLI, and their bandwidth is limited (see submitr.bandwidth). The AWS CLI can't be throttled from here, so
+    each file would go at full speed, saturating the link, which is what the limit is for.
+    """
+    if (upload_mode or DEFAULT_UPLOAD_MODE) == UploadMode.AWSCLI and get_bandwidth_limiter():
+        raise ValueError(f"Uploads with the AWS CLI ({UPLOAD_MODE_VAR}={UploadMode.AWSCLI}) can't be kept within"
+                         f" a bandwidth limit (--max-bandwidth or {MAX_BANDWIDTH_VAR}), since each file would"
+                         f" still be sent at full speed. Either upload in-process (the default upload mode),"
+                         f" or don't limit the bandwidth.")
+
+
+_UPLOAD_ENGINE = None
+
+
+def get_upload_engine() -> S3UploadEngine:
+    """
+    Returns the S3UploadEngine shared by all in-process uploads, creating it on first use.
+    Its part size and part concurrency come from SUBMITR_UPLOAD_PART_SIZE and SUBMITR_UPLOAD_PART_CONCURRENCY.
+    """
+    global _UPLOAD_ENGINE
+    if _UPLOAD_ENGINE is None:
+        _UPLOAD_ENGINE = S3UploadEngine()
+    return _UPLOAD_ENGINE
 
 
 def running_on_windows_native():
@@ -989,6 +1381,7 @@ def compute_file_post_data(filename, context_attributes):
     }
 
 
+@timed_span('bundle_file_upload', arguments=('filename', 'schema_name'))
 def upload_file_to_new_uuid(filename, schema_name, auth, **context_attributes):
     """
     Upload file to a target environment.
@@ -1029,8 +1422,13 @@ def upload_file_to_uuid(filename, uuid, auth):
     metadata = None
     ignorable(metadata)  # PyCharm might need this if it worries it isn't set below
 
-    # filename here should not include path
-    patch_data = {'filename': os.path.basename(filename)}
+    # filename here should not include path. The checksums were probably precomputed by do_uploads, or are quick
+    # to compute, but if not, they're computed while the file is uploaded, and patched afterward.
+    checksummer = get_file_checksummer()
+    checksums = checksummer.ready_checksums(filename)
+    if checksums is None:
+        checksummer.compute_in_background(filename)
+    patch_data = {'filename': os.path.basename(filename), **checksum_properties(checksums or {})}
 
     response = portal_metadata_patch(uuid=uuid, data=patch_data, auth=auth)
 
@@ -1038,7 +1436,20 @@ def upload_file_to_uuid(filename, uuid, auth):
                                                                            method='PATCH', uuid=uuid,
                                                                            filename=filename, payload_data=patch_data)
 
-    execute_prearranged_upload(filename, upload_credentials=upload_credentials, auth=auth)
+    def refresh_credentials():
+        # The portal hands out fresh credentials for the same upload whenever the filename is patched again.
+        show(f"Getting fresh upload credentials for {filename} ...", with_time=True)
+        refresh_data = {'filename': patch_data['filename']}
+        _, fresh_upload_credentials = extract_metadata_and_upload_credentials(
+            portal_metadata_patch(uuid=uuid, data=refresh_data, auth=auth),
+            method='PATCH', uuid=uuid, filename=filename, payload_data=refresh_data)
+        return fresh_upload_credentials
+
+    execute_prearranged_upload(filename, upload_credentials=upload_credentials, auth=auth, uuid=uuid,
+                               refresh_credentials=refresh_credentials)
+
+    if checksums is None:
+        portal_metadata_patch(uuid=uuid, data=checksum_properties(checksummer.checksums(filename)), auth=auth)
 
     return metadata
 
@@ -1065,7 +1476,9 @@ def extract_metadata_and_upload_credentials(response, filename, method, payload_
 SUBMITR_SELECTIVE_UPLOADS = environ_bool("SUBMITR_SELECTIVE_UPLOADS")
 
 
-def do_uploads(upload_spec_list, auth, folder=None, no_query=False, subfolders=False):
+@timed_span('uploads', arguments=('parallel_uploads',))
+def do_uploads(upload_spec_list, auth, folder=None, no_query=False, subfolders=False, parallel_uploads=1,
+               upload_order=None, skip_existing=False):
     """
     Uploads the files mentioned in the give upload_spec_list.
 
@@ -1078,50 +1491,433 @@ def do_uploads(upload_spec_list, auth, folder=None, no_query=False, subfolders=F
     :param folder: a string naming a folder in which to find the filenames to be uploaded.
     :param no_query: bool to suppress requests for user input
     :param subfolders: bool to search subdirectories within upload_folder for files
+    :param parallel_uploads: how many files to upload at once (default 1, meaning one at a time)
+    :param upload_order: the order in which to upload the files, as the name of one of UPLOAD_ORDERS or an upload
+        scheduler (default largest first when uploading in parallel, and otherwise as listed; see resolve_upload_order)
+    :param skip_existing: whether to skip files that the portal already has, with the same size and checksum,
+        e.g., from an earlier run that didn't finish (see file_already_uploaded)
     :return: None
     """
+    UploadBatch(upload_spec_list, auth=auth, folder=folder, no_query=no_query, subfolders=subfolders,
+                parallel_uploads=parallel_uploads, upload_order=upload_order, skip_existing=skip_existing).run()
+
+
+class UploadBatch:
+    """
+    The uploads of the files (and their extra files) mentioned in an upload_spec_list, which do_uploads runs
+    one at a time or several at once (see run), and the asyncio do_uploads in submitr.async_submission runs in
+    its own executor. Either way, the files are found, any that can't be uploaded are reported, each of the
+    others is uploaded with upload, and the outcomes are collected here, in the order the files were found.
+    """
+
+    def __init__(self, upload_spec_list, *, auth, folder=None, no_query=False, subfolders=False, parallel_uploads=1,
+                 upload_order=None, skip_existing=False):
+        """
+        The arguments are as for do_uploads. Making an UploadBatch looks for the files (and so may take a while),
+        and may ask which to upload (see SUBMITR_SELECTIVE_UPLOADS), but uploads nothing.
+        """
+        check_bandwidth_limit_supported()  # before anything is looked for, let alone uploaded
+        self.auth = auth
+        self.subfolders = subfolders
+        self.parallel_uploads = parallel_uploads
+        self.skip_existing = skip_existing
+        self.folder, self.folder_index, self.found_files = _find_files_to_upload(
+            upload_spec_list, folder=folder, subfolders=subfolders, upload_order=upload_order,
+            parallel_uploads=parallel_uploads)
+        # Any selective upload queries for parallel uploads are asked up front, since answers can't sensibly be
+        # collected from several uploads at once, and so the uploads themselves mustn't ask.
+        ask_up_front = parallel_uploads > 1
+        self.uploads = []  # a (file_path, uploader_wrapper) for each file to upload
+        self._results = []  # for each file, the outcome of not uploading it, or the wrapper with which it's uploaded
+        for upload_spec, file_path, error_msg in self.found_files:
+            uuid = upload_spec['uuid']
+            if error_msg:
+                show(error_msg)
+                self._results.append(UploadMessageWrapper.make_outcome(upload_spec["filename"], uuid=uuid,
+                                                                       status=UploadStatus.SKIPPED,
+                                                                       error="multiple copies found"))
+            elif ask_up_front and not no_query and SUBMITR_SELECTIVE_UPLOADS and not yes_or_no(f"Upload {file_path}?"):
+                show("OK, not uploading it.")
+                self._results.append(UploadMessageWrapper.make_outcome(file_path, uuid=uuid,
+                                                                       status=UploadStatus.SKIPPED))
+            else:
+                uploader_wrapper = UploadMessageWrapper(uuid, no_query=no_query or ask_up_front)
+                self.uploads.append((file_path, uploader_wrapper))
+                self._results.append(uploader_wrapper)
+        self._checksummer = None
+        self._start = None
+
+    @property
+    def outcomes(self):
+        """
+        The outcomes of the uploads so far (see UploadMessageWrapper.make_outcome), including those not attempted.
+        """
+        outcomes = []
+        for result in self._results:
+            outcomes.extend([result] if isinstance(result, dict) else result.outcomes)
+        return outcomes
+
+    def start(self):
+        """
+        Starts computing the checksums of the files to be uploaded (see submitr.checksums), in other processes,
+        so that they're likely to be ready by the time each file's turn comes.
+        """
+        self._start = time.perf_counter()
+        record_upload_outcomes([result for result in self._results if isinstance(result, dict)])
+        self._checksummer = get_file_checksummer().precompute(_paths_to_checksum(self.found_files))
+
+    def upload(self, file_path, uploader_wrapper):
+        """
+        Uploads one of the files (and its extra files), as listed in uploads, recording the outcomes in its wrapper.
+        """
+        try:
+            _upload_file_and_extra_files(file_path, uuid=uploader_wrapper.uuid, uploader_wrapper=uploader_wrapper,
+                                         folder=self.folder, auth=self.auth, subfolders=self.subfolders,
+                                         folder_index=self.folder_index, skip_existing=self.skip_existing)
+        finally:
+            record_upload_outcomes(uploader_wrapper.outcomes)
+
+    def stop(self):
+        """
+        Waits for (or cancels) any checksums still being computed.
+        """
+        if self._checksummer:
+            self._checksummer.__exit__(None, None, None)
+            self._checksummer = None
+
+    def finish(self):
+        """
+        Records how quickly the files were uploaded (see plan_uploads), and, if they were uploaded several at once,
+        shows a summary table of the outcomes, which it returns.
+        """
+        outcomes = self.outcomes
+        if self.parallel_uploads > 1:
+            show_upload_summary(outcomes)
+        _record_upload_throughput(outcomes, seconds=time.perf_counter() - self._start,
+                                  parallel_uploads=self.parallel_uploads)
+        return outcomes
+
+    def run(self):
+        """
+        Uploads the files, one at a time or, if parallel_uploads > 1, with a pool of that many worker threads,
+        each of which uploads one file (and then its extra files) at a time, and returns the outcomes.
+        """
+        self.start()
+        try:
+            if self.parallel_uploads > 1:
+                with ThreadPoolExecutor(max_workers=self.parallel_uploads) as executor:
+                    futures = [executor.submit(self.upload, file_path, uploader_wrapper)
+                               for file_path, uploader_wrapper in self.uploads]
+                    for future in futures:
+                        future.result()
+            else:
+                for file_path, uploader_wrapper in self.uploads:
+                    self.upload(file_path, uploader_wrapper)
+        finally:
+            self.stop()
+        return self.finish()
+
+
+def _find_files_to_upload(upload_spec_list, *, folder, subfolders, upload_order, parallel_uploads):
+    """
+    Returns the folder to search (ending in '**' when searching subfolders too), an index of it, and the found files,
+    a list of (upload_spec, file_path, error_msg) tuples, for each upload_spec, in the order to upload them.
+    """
     folder = folder or os.path.curdir
     if subfolders:
         folder = os.path.join(folder, '**')
+    folder_index = UploadFolderIndex(folder, recursive=subfolders)
+    found_files = []
     for upload_spec in upload_spec_list:
-        file_name = upload_spec["filename"]
-        file_path, error_msg = search_for_file(folder, file_name, recursive=subfolders)
-        if error_msg:
-            show(error_msg)
-            continue
-        uuid = upload_spec['uuid']
-        uploader_wrapper = UploadMessageWrapper(uuid, no_query=no_query)
-        wrapped_upload_file_to_uuid = uploader_wrapper.wrap_upload_function(
-            upload_file_to_uuid, file_path,
-        )
-        file_metadata = wrapped_upload_file_to_uuid(
-            filename=file_path, uuid=uuid, auth=auth,
-        )
-        if file_metadata:
-            extra_files_credentials = file_metadata.get("extra_files_creds", [])
-            if extra_files_credentials:
-                upload_extra_files(
-                    extra_files_credentials,
-                    uploader_wrapper,
-                    folder,
-                    auth,
-                    recursive=subfolders,
-                )
-
-
-def search_for_file(directory, file_name, recursive=False):
+        file_path, error_msg = search_for_file(folder, upload_spec["filename"], recursive=subfolders,
+                                               folder_index=folder_index)
+        found_files.append((upload_spec, file_path, error_msg))
+    found_files = schedule_uploads(found_files, upload_order=upload_order, parallel_uploads=parallel_uploads)
+    return folder, folder_index, found_files
+
+
+def _paths_to_checksum(found_files):
+    upload_journal = get_upload_journal()
+    return [file_path for upload_spec, file_path, error_msg in found_files
+            if not error_msg and not upload_journal.is_finished(uuid=upload_spec['uuid'], path=file_path)]
+
+
+def _record_upload_throughput(outcomes, *, seconds, parallel_uploads):
+    # So that upload plans (see plan_uploads) can estimate how long uploads will take.
+    get_upload_throughput_history().record(sum(_file_size(outcome['file']) for outcome in outcomes
+                                               if outcome['status'] == UploadStatus.SUCCEEDED),
+                                           seconds=seconds, parallel_uploads=parallel_uploads)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+@timed_span('file', arguments=('file_path', 'uuid'))
+def _upload_file_and_extra_files(file_path, *, uuid, uploader_wrapper, folder, auth, subfolders, folder_index=None,
+                                 skip_existing=False):
+    upload_journal = get_upload_journal()
+    if upload_journal.is_finished(uuid=uuid, path=file_path):
+        show("Upload of %s to item %s was already done." % (file_path, uuid))
+        uploader_wrapper.outcomes.append(UploadMessageWrapper.make_outcome(file_path, uuid=uuid,
+                                                                           status=UploadStatus.SKIPPED,
+                                                                           error="already uploaded"))
+        return
+    if skip_existing and file_already_uploaded(file_path, uuid=uuid, auth=auth, folder=folder, subfolders=subfolders,
+                                               folder_index=folder_index):
+        show("Upload of %s to item %s was already done (the portal has the same file)." % (file_path, uuid))
+        uploader_wrapper.outcomes.append(UploadMessageWrapper.make_outcome(file_path, uuid=uuid,
+                                                                           status=UploadStatus.SKIPPED,
+                                                                           error="already on the portal"))
+        # So that it needn't be looked up again (unless the file changes).
+        upload_journal.checkpoint(uuid=uuid, path=file_path).complete()
+        upload_journal.mark_finished(uuid=uuid, path=file_path)
+        return
+    wrapped_upload_file_to_uuid = uploader_wrapper.wrap_upload_function(
+        upload_file_to_uuid, file_path,
+    )
+    file_metadata = wrapped_upload_file_to_uuid(
+        filename=file_path, uuid=uuid, auth=auth,
+    )
+    if file_metadata:
+        extra_files_credentials = file_metadata.get("extra_files_creds", [])
+        if extra_files_credentials:
+            upload_extra_files(
+                extra_files_credentials,
+                uploader_wrapper,
+                folder,
+                auth,
+                recursive=subfolders,
+                folder_index=folder_index,
+            )
+        if all(outcome['status'] == UploadStatus.SUCCEEDED for outcome in uploader_wrapper.outcomes):
+            # So that, if this all has to be done again (e.g., by resume-uploads), these can be skipped.
+            upload_journal.mark_finished(uuid=uuid, path=file_path)
+
+
+def show_upload_summary(outcomes):
+    """
+    Shows a table summarizing the outcomes recorded by UploadMessageWrapper for a set of uploads.
+
+    :param outcomes: a list of outcome dictionaries as made by UploadMessageWrapper.make_outcome
+    """
+    show("----- Upload Summary -----")
+    for outcome in outcomes:
+        duration = outcome['duration']
+        show("%-9s %10s  %s%s" % (outcome['status'].upper(),
+                                  "" if duration is None else "%.2fs" % duration,
+                                  outcome['file'],
+                                  f" ({outcome['error']})" if outcome['error'] else ""))
+    counts = {status: len([outcome for outcome in outcomes if outcome['status'] == status])
+              for status in UPLOAD_STATUSES}
+    show(f"{n_of(counts[UploadStatus.SUCCEEDED], 'upload')} succeeded,"
+         f" {counts[UploadStatus.FAILED]} failed, {counts[UploadStatus.SKIPPED]} skipped.")
+
+
+MAX_PLAN_THREADS = 8  # the most File items to look up the extra files of at the same time
+PLAN_LARGEST_FILES = 5  # how many of the largest files an upload plan shows
+
+
+def plan_uploads(upload_spec_list, auth=None, folder=None, subfolders=False):
+    """
+    Works out what do_uploads would upload, finding each file (and each of its extra files) as do_uploads would,
+    but without uploading anything, or changing anything on the portal.
+
+    :param upload_spec_list: a list of upload_spec dictionaries, each of the form {'filename': ..., 'uuid': ...}
+    :param auth: a dictionary-form auth spec, used (if given) to look up the extra files of each File item
+    :param folder: a string naming a folder in which to find the filenames to be uploaded
+    :param subfolders: bool to search subdirectories within folder for files
+    :return: a dictionary whose 'files' are those to upload, 'already_uploaded' are those the upload journal says
+        are done, 'missing' are those not found, and 'duplicates' are those found more than once, each a dictionary
+        of its 'filename', 'uuid', and 'path' and 'size' (or, for duplicates, 'paths'), and whose
+        'unchecked_extra_files' are the uuids of items whose extra files couldn't be looked up
+    """
+    folder = folder or os.path.curdir
+    if subfolders:
+        folder = os.path.join(folder, '**')
+    folder_index = UploadFolderIndex(folder, recursive=subfolders)
+    upload_journal = get_upload_journal()
+    plan = {'files': [], 'already_uploaded': [], 'missing': [], 'duplicates': [], 'unchecked_extra_files': []}
+
+    def add_file(file_name, uuid, extra_file=False):
+        file_paths = find_file_paths(folder, file_name, recursive=subfolders, folder_index=folder_index)
+        entry = {'filename': file_name, 'uuid': uuid, 'extra_file': extra_file}
+        if len(file_paths) > 1:
+            plan['duplicates'].append(dict(entry, paths=file_paths))
+            return False
+        file_path = file_paths[0] if file_paths else os.path.join(folder, file_name)
+        if not os.path.isfile(file_path):
+            plan['missing'].append(dict(entry, path=file_path))
+            return False
+        entry = dict(entry, path=file_path, size=os.path.getsize(file_path))
+        if not extra_file and upload_journal.is_finished(uuid=uuid, path=file_path):
+            plan['already_uploaded'].append(entry)
+            return False
+        plan['files'].append(entry)
+        return True
+
+    uuids_to_upload = [upload_spec['uuid'] for upload_spec in upload_spec_list
+                       if add_file(upload_spec['filename'], upload_spec['uuid'])]
+    if auth and uuids_to_upload:
+        with ThreadPoolExecutor(max_workers=min(MAX_PLAN_THREADS, len(uuids_to_upload))) as executor:
+            extra_file_names = list(executor.map(lambda uuid: _get_extra_file_names(uuid, auth=auth),
+                                                 uuids_to_upload))
+        for uuid, file_names in zip(uuids_to_upload, extra_file_names):
+            if file_names is None:
+                plan['unchecked_extra_files'].append(uuid)
+                continue
+            for file_name in file_names:
+                add_file(file_name, uuid, extra_file=True)
+    return plan
+
+
+# The statuses of File items whose data has been uploaded (rather than, e.g., 'uploading' or 'upload failed').
+UPLOADED_FILE_STATUSES = ['uploaded', 'released', 'current', 'in review', 'restricted', 'public', 'archived']
+
+
+@timed_span('existing_file_check', arguments=('uuid',))
+def file_already_uploaded(file_path, uuid, auth, folder=None, subfolders=False, folder_index=None):
+    """
+    Returns whether the File item with the given uuid already has the data of the local file at file_path
+    (e.g., from an earlier run of resume-uploads that didn't finish), and so needn't be uploaded again.
+
+    That's so if the portal says the item (and any extra files of it) has been uploaded, and it has the same
+    file_size as the local file, and the same checksums (as sent with uploads; see submitr.checksums), where
+    it has them, and each of its extra files has the same file_size as the local one (found in folder, as
+    upload_extra_files would find it). Checksums are taken from the local checksum cache where it has them,
+    and otherwise just one of them is computed, so that a file is hashed at most once, and only if need be.
+    If the portal has neither a file_size nor any of those checksums, or can't be asked, it's not known to have it.
+    """
+    try:
+        response = portal_request_get(f"{auth['server'].rstrip('/')}/{uuid}?frame=object",
+                                      auth=KEY_MANAGER.keydict_to_keypair(auth), headers=STANDARD_HTTP_HEADERS)
+        response.raise_for_status()
+        metadata = response.json()
+    except Exception:
+        return False
+    if metadata.get('status') not in UPLOADED_FILE_STATUSES or not os.path.isfile(file_path):
+        return False
+    if not _extra_files_already_uploaded(metadata.get('extra_files') or [],
+                                         folder=folder or os.path.dirname(file_path) or os.path.curdir,
+                                         subfolders=subfolders, folder_index=folder_index):
+        return False
+    compared = False
+    if metadata.get('file_size') is not None:
+        if metadata['file_size'] != _file_size(file_path):
+            return False
+        compared = True
+    algorithms = [algorithm for algorithm, checksum_property in CHECKSUM_PROPERTIES.items()
+                  if metadata.get(checksum_property)]
+    if algorithms:
+        checksummer = get_file_checksummer()
+        checksums = {}
+        for algorithm in algorithms:
+            checksums.update(checksummer.cache.get(file_path, [algorithm]) or {})
+        if not checksums:  # One checksum is enough to go on, so no more are computed than that.
+            checksums = compute_checksums(file_path, algorithms[:1])
+            checksummer.cache.put(file_path, checksums)
+            checksummer.cache.save()
+        for checksum_property, checksum in checksum_properties(checksums).items():
+            if metadata[checksum_property] != checksum:
+                return False
+        compared = True
+    annotate_span(already_uploaded=compared)
+    return compared
+
+
+def _extra_files_already_uploaded(extra_files, *, folder, subfolders, folder_index):
+    # Whether each of a File item's extra_files has been uploaded, and is the size of the local file of its name.
+    for extra_file in extra_files:
+        if not isinstance(extra_file, dict) or extra_file.get('status') not in UPLOADED_FILE_STATUSES:
+            return False
+        if not extra_file.get('filename') or extra_file.get('file_size') is None:
+            return False
+        extra_file_path, error_msg = search_for_file(folder, extra_file['filename'], recursive=subfolders,
+                                                     folder_index=folder_index)
+        if error_msg or not extra_file_path or not os.path.isfile(extra_file_path):
+            return False
+        if extra_file['file_size'] != _file_size(extra_file_path):
+            return False
+    return True
+
+
+def _get_extra_file_names(uuid, auth):
+    """
+    Returns the names of the extra files of the File item with the given uuid, or None if they can't be found out.
+    """
+    try:
+        response = portal_request_get(f"{auth['server'].rstrip('/')}/{uuid}?frame=object",
+                                      auth=KEY_MANAGER.keydict_to_keypair(auth), headers=STANDARD_HTTP_HEADERS)
+        response.raise_for_status()
+        return [extra_file['filename'] for extra_file in response.json().get('extra_files') or []
+                if isinstance(extra_file, dict) and extra_file.get('filename')]
+    except Exception:
+        return None
+
+
+def show_upload_plan(plan, parallel_uploads=1):
+    """
+    Shows a description of an upload plan as made by plan_uploads, including an estimate of how long the uploads
+    will take, based on how quickly recent uploads went, or, if there have been none, how quickly the files can be read.
+
+    :param plan: an upload plan dictionary as made by plan_uploads
+    :param parallel_uploads: how many files would be uploaded at once
+    """
+    files = plan['files']
+    total_bytes = sum(file['size'] for file in files)
+    n_extra_files = len([file for file in files if file['extra_file']])
+    show("----- Upload Plan -----")
+    show(f"{n_of(len(files), 'file')} to upload"
+         f"{' (including %s)' % n_of(n_extra_files, 'extra file') if n_extra_files else ''},"
+         f" {format_byte_size(total_bytes)} in total.")
+    if plan['already_uploaded']:
+        show(f"{n_of(plan['already_uploaded'], 'file')} already uploaded, which will be skipped.")
+    if files:
+        show("Largest files:")
+        for file in sorted(files, key=lambda file: file['size'], reverse=True)[:PLAN_LARGEST_FILES]:
+            show("%10s  %s" % (format_byte_size(file['size']), file['path']))
+    if plan['missing']:
+        show(f"Missing files ({len(plan['missing'])}), which will not be uploaded:")
+        for file in plan['missing']:
+            show(f"  {file['filename']} (for item {file['uuid']})")
+    if plan['duplicates']:
+        show(f"Files found more than once ({len(plan['duplicates'])}), which will not be uploaded:")
+        for file in plan['duplicates']:
+            show(f"  {file['filename']} (for item {file['uuid']}): {', '.join(file['paths'])}")
+    if plan['unchecked_extra_files']:
+        show(f"The extra files of {n_of(plan['unchecked_extra_files'], 'item')} could not be looked up.")
+    if not total_bytes:
+        return
+    history = get_upload_throughput_history().throughput(parallel_uploads=parallel_uploads)
+    if history:
+        throughput, n_samples = history
+        basis = f"as measured over {n_of(n_samples, 'recent upload run')}"
+    else:
+        throughput = measure_read_throughput([file['path'] for file in files])
+        basis = "the speed at which the files can be read, so it will probably take longer"
+    if throughput:
+        show(f"Estimated upload time: {format_duration(total_bytes / throughput)}"
+             f" at {format_byte_size(int(throughput))}/s ({basis}).")
+
+
+def search_for_file(directory, file_name, recursive=False, folder_index=None):
     """Search for file within directory.
 
     :param directory: Directory path
     :param file_name: Name of file to find
     :param recursive: Whether to search subdirectories of given
         directory
+    :param folder_index: An UploadFolderIndex for the same directory
+        and recursive setting, if one is available
     :returns: (Path to file or None, Error message or None)
     """
     file_path_found = None
     msg = None
     file_path = os.path.join(directory, file_name)
-    file_search = glob.glob(file_path, recursive=recursive)
+    file_search = find_file_paths(directory, file_name, recursive=recursive, folder_index=folder_index)
     if len(file_search) == 1:
         [file_path_found] = file_search
     elif len(file_search) > 1:
@@ -1135,9 +1931,98 @@ def search_for_file(directory, file_name, recursive=False):
     return file_path_found, msg
 
 
+def find_file_paths(directory, file_name, recursive=False, folder_index=None):
+    """Find all the paths of files with the given name within directory.
+
+    :param directory: Directory path
+    :param file_name: Name of file to find
+    :param recursive: Whether to search subdirectories of given
+        directory
+    :param folder_index: An UploadFolderIndex for the same directory
+        and recursive setting, if one is available
+    :returns: List of paths (possibly empty)
+    """
+    file_paths = folder_index.lookup(file_name) if folder_index is not None else None
+    if file_paths is None:
+        file_paths = glob.glob(os.path.join(directory, file_name), recursive=recursive)
+    return file_paths
+
+
+_GLOB_MAGIC = re.compile('[*?[]')
+
+
+class UploadFolderIndex:
+    """An index of the files in an upload folder, mapping each file name
+    to the paths found for it, in the same order glob would find them.
+
+    The folder (and, if recursive, its subfolders) is walked just once,
+    the first time a file is looked up, rather than once for every file.
+    """
+
+    def __init__(self, directory, recursive=False):
+        """Initialize instance for given directory
+
+        :param directory: Directory path, as given to search_for_file
+            (so ending in '**' if subfolders are to be searched)
+        :param recursive: Whether to search subdirectories of given
+            directory
+        """
+        self.directory = os.fspath(directory)
+        self.recursive = recursive
+        self._paths_by_name = None
+        parent, last = os.path.split(self.directory)
+        self._walk_subfolders = recursive and last == '**'
+        self._root = parent if self._walk_subfolders else self.directory
+        # We only handle what glob would treat literally, apart from a final '**', and otherwise defer to glob.
+        self._indexable = not _GLOB_MAGIC.search(self._root)
+
+    def lookup(self, file_name):
+        """Look up the paths of files with the given name.
+
+        :param file_name: Name of file to find
+        :returns: List of paths (possibly empty), or None if this index
+            can't answer for file_name, which must then be globbed for
+        """
+        if not self._indexable or os.sep in file_name or '/' in file_name or _GLOB_MAGIC.search(file_name):
+            return None
+        if self._paths_by_name is None:
+            self._paths_by_name = {}
+            self._index_folder(self._root)
+        return self._paths_by_name.get(file_name, [])
+
+    def _index_folder(self, folder):
+        try:
+            with os.scandir(folder or os.curdir) as entries:
+                entries = list(entries)
+        except OSError:  # Missing or unreadable folders are just empty, as they would be for glob.
+            return
+        subfolders = []
+        for entry in entries:
+            self._paths_by_name.setdefault(entry.name, []).append(os.path.join(folder, entry.name))
+            if self._walk_subfolders and not entry.name.startswith('.'):
+                try:
+                    if entry.is_dir():
+                        subfolders.append(os.path.join(folder, entry.name))
+                except OSError:
+                    pass
+        for subfolder in subfolders:
+            self._index_folder(subfolder)
+
+
+class UploadStatus:
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+
+
+UPLOAD_STATUSES = [UploadStatus.SUCCEEDED, UploadStatus.FAILED, UploadStatus.SKIPPED]
+
+
 class UploadMessageWrapper:
     """Class to provide consistent queries/messages to user when
     uploading file(s) to given File UUID.
+
+    The outcome of each wrapped upload is also recorded, in order, in the outcomes attribute.
     """
 
     def __init__(self, uuid, no_query=False):
@@ -1149,6 +2034,20 @@ class UploadMessageWrapper:
         """
         self.uuid = uuid
         self.no_query = no_query
+        self.outcomes = []
+
+    @staticmethod
+    def make_outcome(file_name, uuid, status, duration=None, error=None):
+        """Make a dictionary describing the outcome of an upload.
+
+        :param file_name: File that was (or was to be) uploaded
+        :param uuid: UUID of File item for the upload
+        :param status: One of UPLOAD_STATUSES
+        :param duration: Seconds taken by the upload, or None
+        :param error: Description of any error, or None
+        :returns: Outcome dictionary
+        """
+        return {'file': file_name, 'uuid': uuid, 'status': status, 'duration': duration, 'error': error}
 
     def wrap_upload_function(self, function, file_name):
         """Wrap upload given function with messages conerning upload.
@@ -1168,6 +2067,7 @@ class UploadMessageWrapper:
                     show("OK, not uploading it.")
                     perform_upload = False
             if perform_upload:
+                start = time.perf_counter()
                 try:
                     show("Uploading %s to item %s ..." % (file_name, self.uuid))
                     result = function(*args, **kwargs)
@@ -1175,14 +2075,36 @@ class UploadMessageWrapper:
                         "Upload of %s to item %s was successful."
                         % (file_name, self.uuid)
                     )
+                    self.outcomes.append(self.make_outcome(file_name, uuid=self.uuid,
+                                                           status=UploadStatus.SUCCEEDED,
+                                                           duration=time.perf_counter() - start))
                 except Exception as e:
                     show("%s: %s" % (e.__class__.__name__, e))
+                    self.outcomes.append(self.make_outcome(file_name, uuid=self.uuid,
+                                                           status=UploadStatus.FAILED,
+                                                           duration=time.perf_counter() - start,
+                                                           error="%s: %s" % (e.__class__.__name__, e)))
+            else:
+                self.outcomes.append(self.make_outcome(file_name, uuid=self.uuid, status=UploadStatus.SKIPPED))
             return result
         return wrapper
 
 
+def record_upload_outcomes(outcomes):
+    """
+    Records each of the given upload outcomes (see UploadMessageWrapper.make_outcome) as an 'upload_outcome' span
+    (see submitr.metrics), so that every file is counted, including those whose uploads failed before they began
+    (e.g., when getting their upload credentials) or that weren't uploaded at all.
+    """
+    for outcome in outcomes:
+        with metrics_span('upload_outcome', file=outcome['file'], uuid=outcome['uuid'], outcome=outcome['status'],
+                          error=outcome['error']):
+            pass
+
+
+@timed_span('extra_files')
 def upload_extra_files(
-    credentials, uploader_wrapper, folder, auth, recursive=False
+    credentials, uploader_wrapper, folder, auth, recursive=False, folder_index=None
 ):
     """Attempt upload of all extra files.
 
@@ -1197,6 +2119,8 @@ def upload_extra_files(
     :param folder: Directory to search for files
     :param auth: a portal authorization tuple
     :param recursive: Whether to search subdirectories for file
+    :param folder_index: An UploadFolderIndex for the folder, if one
+        is available
     """
     for extra_file_item in credentials:
         extra_file_name = extra_file_item.get("filename")
@@ -1204,7 +2128,7 @@ def upload_extra_files(
         if not extra_file_name or not extra_file_credentials:
             continue
         extra_file_path, error_msg = search_for_file(
-            folder, extra_file_name, recursive=recursive
+            folder, extra_file_name, recursive=recursive, folder_index=folder_index
         )
         if error_msg:
             show(error_msg)
@@ -1212,7 +2136,8 @@ def upload_extra_files(
         wrapped_execute_prearranged_upload = uploader_wrapper.wrap_upload_function(
             execute_prearranged_upload, extra_file_path
         )
-        wrapped_execute_prearranged_upload(extra_file_path, extra_file_credentials, auth=auth)
+        wrapped_execute_prearranged_upload(extra_file_path, extra_file_credentials, auth=auth,
+                                           uuid=uploader_wrapper.uuid)
 
 
 def upload_item_data(item_filename, uuid, server, env, no_query=False):
@@ -1240,4 +2165,13 @@ def upload_item_data(item_filename, uuid, server, env, no_query=False):
             show("Aborting submission.")
             exit(1)
 
-    upload_file_to_uuid(filename=item_filename, uuid=uuid, auth=keydict)
+    start = time.perf_counter()
+    try:
+        upload_file_to_uuid(filename=item_filename, uuid=uuid, auth=keydict)
+    except Exception as e:
+        record_upload_outcomes([UploadMessageWrapper.make_outcome(item_filename, uuid=uuid, status=UploadStatus.FAILED,
+                                                                  duration=time.perf_counter() - start,
+                                                                  error="%s: %s" % (e.__class__.__name__, e))])
+        raise
+    record_upload_outcomes([UploadMessageWrapper.make_outcome(item_filename, uuid=uuid, status=UploadStatus.SUCCEEDED,
+                                                              duration=time.perf_counter() - start)])
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+
+from dcicutils.misc_utils import ignored, local_attrs, override_environ
+from unittest import mock
+
+from .. import async_submission as async_submission_module
+from .. import submission as submission_module
+from ..async_submission import check_submit_ingestion, do_uploads, resume_uploads
+from ..base import KEY_MANAGER
+from ..submission import UploadStatus
+from ..utils import FakeResponse, PollingStrategy
+from .test_utils import shown_output
+
+
+SOME_SERVER = 'http://localhost:7777'
+SOME_KEYDICT = {'key': 'some-key', 'secret': 'some-secret', 'server': SOME_SERVER}
+SOME_KEYPAIR = ('some-key', 'some-secret')
+
+
+def test_check_submit_ingestion_many_at_once():
+
+    # uuid-a finishes on its second check, uuid-b on its third, and uuid-c never does.
+    finish_after = {'uuid-a': 2, 'uuid-b': 3, 'uuid-c': None}
+    checks = []
+
+    def mocked_check_ingestion_progress(uuid, *, keypair, server):
+        assert keypair == SOME_KEYPAIR and server == SOME_SERVER
+        checks.append(uuid)
+        if finish_after[uuid] == checks.count(uuid):
+            return True, 'success', {'uuid': uuid}
+        return False, 'validating', {'uuid': uuid}
+
+    async def check_all():
+        polling_strategy = PollingStrategy(initial_interval=0, max_attempts=4)
+        return await asyncio.gather(*[check_submit_ingestion(uuid, server=SOME_SERVER,
+                                                             polling_strategy=polling_strategy)
+                                      for uuid in finish_after])
+
+    with mock.patch.object(async_submission_module, "_check_ingestion_progress", mocked_check_ingestion_progress):
+        with mock.patch.object(KEY_MANAGER, "get_keydict_for_server", return_value=SOME_KEYDICT):
+            results = asyncio.run(check_all())
+    assert results == [(True, 'success', {'uuid': 'uuid-a'}),
+                       (True, 'success', {'uuid': 'uuid-b'}),
+                       # Rather than exiting when it gives up, it says it's not done.
+                       (False, 'validating', {'uuid': 'uuid-c'})]
+    assert {uuid: checks.count(uuid) for uuid in finish_after} == {'uuid-a': 2, 'uuid-b': 3, 'uuid-c': 4}
+
+
+def test_do_uploads_concurrently(tmp_path):
+
+    names = ['one', 'two', 'three', 'four', 'five']
+    for name in names:
+        (tmp_path / f"{name}.fastq").write_bytes(b"x" * 10)
+    lock = threading.Lock()
+    uploading = []
+    most_at_once = [0]
+
+    def mocked_upload_file(filename, uuid, auth):
+        ignored(filename)
+        assert auth == SOME_KEYDICT
+        with lock:
+            uploading.append(uuid)
+            most_at_once[0] = max(most_at_once[0], len(uploading))
+        time.sleep(0.05)
+        with lock:
+            uploading.remove(uuid)
+        if uuid == 'three':
+            raise RuntimeError("Upload failed.")
+
+    with mock.patch.object(submission_module, "upload_file_to_uuid", mocked_upload_file):
+        with shown_output() as shown:
+            outcomes = asyncio.run(do_uploads([{'uuid': name, 'filename': f"{name}.fastq"} for name in names],
+                                              auth=SOME_KEYDICT, folder=str(tmp_path), parallel_uploads=2))
+    assert most_at_once[0] == 2
+    assert {outcome['uuid']: outcome['status'] for outcome in outcomes} == {
+        'one': UploadStatus.SUCCEEDED, 'two': UploadStatus.SUCCEEDED, 'three': UploadStatus.FAILED,
+        'four': UploadStatus.SUCCEEDED, 'five': UploadStatus.SUCCEEDED,
+    }
+    assert "4 uploads succeeded, 1 failed, 0 skipped." in shown.lines
+
+
+def test_resume_uploads(tmp_path):
+
+    (tmp_path / "one.fastq").write_bytes(b"x" * 10)
+    uploaded = []
+
+    def mocked_portal_get(url, auth, headers):
+        ignored(headers)
+        assert url == f"{SOME_SERVER}/ingestion-submissions/some-uuid?format=json"
+        assert auth == SOME_KEYPAIR
+        return FakeResponse(200, json={'additional_data': {'upload_info': [{'uuid': 'one-uuid',
+                                                                            'filename': 'one.fastq'}]}})
+
+    def mocked_upload_file(filename, uuid, auth):
+        ignored(auth)
+        uploaded.append((filename, uuid))
+
+    with mock.patch.object(submission_module, "portal_request_get", mocked_portal_get):
+        with mock.patch.object(submission_module, "upload_file_to_uuid", mocked_upload_file):
+            with shown_output():
+                outcomes = asyncio.run(resume_uploads('some-uuid', server=SOME_SERVER, keydict=SOME_KEYDICT,
+                                                      upload_folder=str(tmp_path)))
+    assert uploaded == [(str(tmp_path / "one.fastq"), 'one-uuid')]
+    assert [outcome['status'] for outcome in outcomes] == [UploadStatus.SUCCEEDED]
+
+
+def test_uploads_dont_hold_up_polls(tmp_path):
+
+    names = ['one', 'two', 'three']
+    for name in names:
+        (tmp_path / f"{name}.fastq").write_bytes(b"x" * 10)
+    polled = threading.Event()
+    threads = {'upload': set(), 'poll': set()}
+
+    def mocked_upload_file(filename, uuid, auth):
+        ignored(filename, uuid, auth)
+        threads['upload'].add(threading.current_thread().name)
+        assert polled.wait(timeout=5), "The uploads held up the poll."
+
+    def mocked_check_ingestion_progress(uuid, *, keypair, server):
+        ignored(keypair, server)
+        threads['poll'].add(threading.current_thread().name)
+        return True, 'success', {'uuid': uuid}
+
+    async def upload_and_poll():
+        uploads = asyncio.ensure_future(do_uploads([{'uuid': name, 'filename': f"{name}.fastq"} for name in names],
+                                                   auth=SOME_KEYDICT, folder=str(tmp_path), parallel_uploads=3))
+        await asyncio.sleep(0.1)  # So that the uploads have taken every upload thread.
+        result = await check_submit_ingestion('some-uuid', server=SOME_SERVER,
+                                              polling_strategy=PollingStrategy(initial_interval=0, max_attempts=1))
+        polled.set()
+        return result, await uploads
+
+    # Uploads and portal requests have thread pools of their own, of a fixed size.
+    with local_attrs(async_submission_module, _EXECUTORS={}):
+        with override_environ(SUBMITR_ASYNC_UPLOAD_THREADS='2', SUBMITR_ASYNC_PORTAL_THREADS='1'):
+            with mock.patch.object(async_submission_module, "_check_ingestion_progress",
+                                   mocked_check_ingestion_progress):
+                with mock.patch.object(KEY_MANAGER, "get_keydict_for_server", return_value=SOME_KEYDICT):
+                    with mock.patch.object(submission_module, "upload_file_to_uuid", mocked_upload_file):
+                        with shown_output():
+                            result, outcomes = asyncio.run(upload_and_poll())
+                            async_submission_module.shutdown_executors()
+    assert result == (True, 'success', {'uuid': 'some-uuid'})
+    assert [outcome['status'] for outcome in outcomes] == [UploadStatus.SUCCEEDED] * 3
+    assert len(threads['upload']) == 2
+    assert all(name.startswith('submitr-async-upload') for name in threads['upload'])
+    assert [name.split('_')[0] for name in threads['poll']] == ['submitr-async-portal']
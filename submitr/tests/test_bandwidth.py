@@ -0,0 +1,102 @@
+import json
+import pytest
+
+from dcicutils.misc_utils import local_attrs
+from dcicutils.qa_utils import raises_regexp
+
+from .. import bandwidth as bandwidth_module
+from ..bandwidth import (
+    SharedTokenBucket, TokenBucket, configure_bandwidth_limit, get_bandwidth_limiter, parse_bandwidth,
+)
+from .testing_helpers import FakeClock
+
+
+def test_parse_bandwidth():
+
+    assert parse_bandwidth('400MB/s') == 400 * 1024 ** 2
+    assert parse_bandwidth('400MB') == 400 * 1024 ** 2
+    assert parse_bandwidth('1.5G/s') == 1.5 * 1024 ** 3
+    assert parse_bandwidth(1048576) == 1048576.0
+
+    with raises_regexp(ValueError, "must be positive"):
+        parse_bandwidth(0)
+
+
+def test_token_bucket():
+
+    clock = FakeClock()
+    with clock.patched():
+        bucket = TokenBucket(1000)
+        assert bucket.burst == 1000
+        bucket.consume(600)
+        bucket.consume(400)  # A second's worth can go at once.
+        assert clock.sleeps == []
+        bucket.consume(500)  # After that, it's at the rate.
+        assert clock.sleeps == [0.5]
+        bucket.consume(0)
+        assert clock.sleeps == [0.5]
+        clock.now += 10  # Idle time refills the bucket, but only up to the burst.
+        bucket.consume(1500)
+        assert clock.sleeps == [0.5, 0.5]
+
+
+def test_token_bucket_waits_in_turn():
+
+    clock = FakeClock()
+    with clock.patched():
+        bucket = TokenBucket(100, burst=100)
+        # Consumers that ask at the same time are each given a later turn.
+        assert [bucket._reserve(100) for _ in range(3)] == [0.0, 1.0, 2.0]
+
+
+def test_shared_token_bucket(tmp_path):
+
+    state_file = str(tmp_path / "state" / "bandwidth_state.json")
+    clock = FakeClock()
+    with clock.patched():
+        with local_attrs(bandwidth_module, SHARED_BANDWIDTH_QUANTUM=100):
+            one = SharedTokenBucket(1000, state_file=state_file)
+            another = SharedTokenBucket(1000, state_file=state_file)
+            assert one.quantum == 100
+            one.consume(600)
+            another.consume(400)
+            assert clock.sleeps == []
+            assert json.load(open(state_file)) == {'tokens': 0.0, 'updated': clock.now}
+            # The two share one budget, so the other one has to wait, now.
+            another.consume(250)
+            assert clock.sleeps == [0.25]
+            # Small amounts come out of what was taken from the file, in quanta, without going back to it.
+            one.consume(10)
+            assert clock.sleeps == [0.25, 0.1]  # Its quantum waits behind the other's 250.
+            assert one._allowance == 90
+            assert json.load(open(state_file))['tokens'] == -100
+            one.consume(90)
+            assert json.load(open(state_file))['tokens'] == -100
+
+            # A damaged state file is treated as a full bucket.
+            with open(state_file, 'w') as fp:
+                fp.write("not json")
+            SharedTokenBucket(1000, state_file=state_file).consume(1000)
+            assert clock.sleeps == [0.25, 0.1]
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_configure_bandwidth_limit(tmp_path, shared):
+
+    with local_attrs(bandwidth_module, _BANDWIDTH_LIMITER=None, _BANDWIDTH_LIMITER_CONFIGURED=False,
+                     DEFAULT_MAX_BANDWIDTH=None, DEFAULT_BANDWIDTH_STATE_FILE=str(tmp_path / "state.json")):
+        assert get_bandwidth_limiter() is None
+        configure_bandwidth_limit('2MB/s', shared=shared)
+        limiter = get_bandwidth_limiter()
+        assert limiter.rate == 2 * 1024 ** 2
+        assert isinstance(limiter, SharedTokenBucket if shared else TokenBucket)
+        if shared:
+            assert limiter.state_file == str(tmp_path / "state.json")
+        assert get_bandwidth_limiter() is limiter
+        configure_bandwidth_limit()
+        assert get_bandwidth_limiter() is None
+
+    # By default, the limit is given by SUBMITR_MAX_BANDWIDTH.
+    with local_attrs(bandwidth_module, _BANDWIDTH_LIMITER=None, _BANDWIDTH_LIMITER_CONFIGURED=False,
+                     DEFAULT_MAX_BANDWIDTH='1KB/s'):
+        assert get_bandwidth_limiter().rate == 1024
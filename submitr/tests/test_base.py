@@ -1,3 +1,4 @@
+import argparse
 import contextlib
 import pytest
 import re
@@ -7,7 +8,7 @@ from dcicutils.creds_utils import FourfrontKeyManager, SMaHTKeyManager, KeyManag
 from dcicutils.misc_utils import override_environ
 from unittest import mock
 from .. import base as base_module
-from ..base import DEFAULT_APP
+from ..base import DEFAULT_APP, add_polling_arguments, polling_arguments
 
 
 # The SUBMITCGAP_ENV environment variable is used at application startup to compute a value of DEFAULT_ENV
@@ -92,3 +93,22 @@ def test_generic_key_manager():
         assert res == mocked_keydict
 
     assert manager.keys_file == key_manager(manager).keys_file
+
+    original_keys_file = manager.keys_file
+    with manager.locally_using_keys_file('some-keys-file.json'):
+        assert manager.keys_file == 'some-keys-file.json'
+    assert manager.keys_file == original_keys_file
+
+
+def test_polling_arguments():
+
+    parser = argparse.ArgumentParser()
+    add_polling_arguments(parser)
+    assert polling_arguments(parser.parse_args([])) == {
+        'interval': None, 'max_interval': None, 'backoff': None, 'jitter': None, 'deadline': None
+    }
+    assert polling_arguments(parser.parse_args(['--poll-interval', '5', '--poll_max_interval', '60',
+                                                '--poll-backoff', '2', '--poll-jitter', '0.1',
+                                                '--poll-deadline', '3600'])) == {
+        'interval': 5, 'max_interval': 60, 'backoff': 2.0, 'jitter': 0.1, 'deadline': 3600.0
+    }
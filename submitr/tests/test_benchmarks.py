@@ -0,0 +1,90 @@
+import json
+import pytest
+
+from dcicutils.misc_utils import local_attrs
+from dcicutils.qa_utils import raises_regexp
+from .. import metrics as metrics_module
+from ..benchmarks.benchmark import main as benchmark_main, percentile, run_benchmark
+from ..benchmarks.fake_portal import FakePortal
+from ..metrics import MetricsRecorder
+from ..s3_upload import MIN_PART_SIZE
+from .testing_helpers import system_exit_expected
+
+
+def test_percentile():
+
+    assert percentile([], 50) is None
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.0
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile(list(range(1, 101)), 100) == 100
+
+
+@pytest.mark.parametrize("scenario", ['submit', 'async-submit', 'uploads', 'resume'])
+def test_run_benchmark(scenario):
+
+    result = run_benchmark(scenario, file_count=3, file_size=1000, parallel_uploads=2)
+    assert result['scenario'] == scenario
+    assert result['files'] == 3
+    assert result['failed'] == 0
+    assert result['megabytes'] == 3000 / 1024 ** 2
+    assert result['files_per_second'] > 0
+    assert 0 < result['p50_seconds'] <= result['p99_seconds']
+    assert result['requests']['/<uuid> (PATCH)'] == 3
+    assert result['requests']['S3 PutObject'] == 3
+    if scenario in ['submit', 'async-submit']:
+        assert result['requests']['/submit_for_ingestion'] == 1
+        assert result['requests']['/submit_for_ingestion (rejected)'] == 1  # The probe for the old protocol
+    elif scenario == 'resume':
+        assert result['requests']['/ingestion-submissions/<uuid>'] == 1
+
+
+def test_run_benchmark_multipart():
+
+    result = run_benchmark('uploads', file_count=1, file_size=MIN_PART_SIZE * 2 + 1, part_size=MIN_PART_SIZE)
+    assert result['files'] == 1
+    assert result['failed'] == 0
+    assert result['requests']['S3 UploadPart'] == 3
+    assert result['requests']['S3 CompleteMultipartUpload'] == 1
+
+
+def test_run_benchmark_metrics(tmp_path):
+
+    metrics_file = str(tmp_path / "metrics.jsonl")
+    with local_attrs(metrics_module, _METRICS_RECORDER=MetricsRecorder(metrics_file), _METRICS_CONFIGURED=True):
+        run_benchmark('submit', file_count=2, file_size=1000, parallel_uploads=2)
+    with open(metrics_file) as fp:
+        spans = [json.loads(line) for line in fp]
+    # Every phase of a submission is timed.
+    assert {span['span'] for span in spans} >= {
+        'submit_any_ingestion', 'resolve_server', 'health_page', 'user_record', 'ingestion_submission_post',
+        'poll', 'uploads', 'file', 'portal_patch', 'upload',
+    }
+    [submission] = [span for span in spans if span['span'] == 'submit_any_ingestion']
+    assert submission['status'] == 'ok'
+    assert sorted(span['bytes'] for span in spans if span['span'] == 'upload') == [1000, 1000]
+
+
+def test_fake_portal_unknown_paths():
+
+    import requests
+    with FakePortal() as portal:
+        assert requests.get(portal.server + '/no-such-page').status_code == 404
+        assert requests.post(portal.server + '/NoSuchType', json={}).status_code == 404
+
+
+def test_benchmark_script(tmp_path):
+
+    json_file = str(tmp_path / "results.json")
+    with system_exit_expected(exit_code=0):
+        benchmark_main(['uploads', '--files', '2', '--file-size', '1KB', '--json', json_file])
+    with open(json_file) as fp:
+        [result] = json.load(fp)
+    assert result['scenario'] == 'uploads'
+    assert result['files'] == 2
+
+    with system_exit_expected(exit_code=2):
+        benchmark_main(['no-such-scenario'])
+
+    with raises_regexp(ValueError, "Unknown benchmark scenario"):
+        run_benchmark('no-such-scenario', file_count=1, file_size=1)
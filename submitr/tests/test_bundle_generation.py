@@ -0,0 +1,94 @@
+import gzip
+import json
+import os
+import pytest
+import random
+import zipfile
+
+from ..bundle_generation import (
+    BUNDLE_HEADER, BUNDLE_SHEET_NAME, bundle_rows, column_letters, generate_bundle, write_xlsx,
+)
+from ..bundle_validation import xlsx_sheets
+from ..fastq_generation import ReadLengths
+from ..submission import validate_bundle_locally
+
+
+@pytest.mark.parametrize("index, expected", [(0, 'A'), (25, 'Z'), (26, 'AA'), (701, 'ZZ'), (702, 'AAA')])
+def test_column_letters(index, expected):
+
+    assert column_letters(index) == expected
+
+
+def test_write_xlsx(tmp_path):
+
+    filename = str(tmp_path / "workbook.xlsx")
+    write_xlsx(filename, {'First': [['a', 1, None, 'x < y & z'], [], ['  spaced  ']], 'Second': iter([['b']])})
+    sheets = xlsx_sheets(filename)
+    assert [(name, list(rows)) for name, rows in sheets] == [
+        ('First', [(1, ['a', '1', None, 'x < y & z']), (2, []), (3, ['  spaced  '])]),
+        ('Second', [(1, ['b'])]),
+    ]
+    with zipfile.ZipFile(filename) as workbook:
+        # These are needed by spreadsheet programs (though not by xlsx_sheets).
+        assert {'[Content_Types].xml', '_rels/.rels'} <= set(workbook.namelist())
+
+
+def test_bundle_rows():
+
+    rows = bundle_rows(4, 'TEST', random.Random(1))
+    assert [list(row) for row in rows] == [BUNDLE_HEADER] * 4
+    assert [row['Relation to Proband*'] for row in rows] == ['Proband', 'Mother', 'Father', 'Proband']
+    assert [row['Report Required*'] for row in rows] == ['Y', 'N', 'N', 'Y']
+    assert [row['Sex*'] for row in rows][1:3] == ['F', 'M']
+    assert [row['Family ID'] for row in rows] == ['TEST-FAMILY000001'] * 3 + ['TEST-FAMILY000002']
+    assert [row['Analysis ID*'] for row in rows] == ['TEST-ANALYSIS000001'] * 3 + ['TEST-ANALYSIS000002']
+    assert rows[0]['Birth Year'] > rows[1]['Birth Year'] and rows[0]['Birth Year'] > rows[2]['Birth Year']
+    assert rows[3]['Individual ID*'] == 'TEST-INDIVIDUAL000004'
+    assert rows[3]['Specimen ID*'] == 'TEST-SPECIMEN000004'
+    assert rows[3]['Files'] == 'TEST-SPECIMEN000004_R1.fastq.gz, TEST-SPECIMEN000004_R2.fastq.gz'
+
+
+def test_generate_bundle(tmp_path):
+
+    folder = str(tmp_path / "bundle")
+    generator = generate_bundle(folder, samples=5, reads=7, read_lengths=ReadLengths(20), seed='some seed', workers=2)
+    assert generator.bundle_filenames == [os.path.join(folder, "sample-bundle.xlsx"),
+                                          os.path.join(folder, "sample-bundle.json")]
+    assert len(generator.data_filenames) == 10
+    assert sorted(os.listdir(folder)) == sorted(os.path.basename(f)
+                                                for f in generator.bundle_filenames + generator.data_filenames)
+    with gzip.open(generator.data_filenames[0], 'rt') as fp:
+        assert len(fp.read().splitlines()) == 4 * 7
+
+    # Both bundles have the same rows, and can be submitted as they are (with the folder as the upload folder).
+    for filename in generator.bundle_filenames:
+        assert validate_bundle_locally(filename, upload_folder=folder) == []
+    with open(generator.bundle_filenames[1]) as fp:
+        items = json.load(fp)[BUNDLE_SHEET_NAME]
+    [(_, rows)] = [(name, list(rows)) for name, rows in xlsx_sheets(generator.bundle_filenames[0])]
+    assert [[str(item[column.rstrip('*')]) for column in BUNDLE_HEADER] for item in items] == [
+        values for _, values in rows[1:]
+    ]
+    # Bundles are in CGAP's accessioning format, so must be submitted to CGAP, which isn't the default app.
+    assert (f"To submit it, do:\n    submit-metadata-bundle {generator.bundle_filenames[0]} --app cgap"
+            f" --upload_folder {folder}") in generator.summary()
+
+    # With a seed, the ids are the same every time (though with none, they'd be new each time).
+    assert generate_bundle(folder, samples=1, reads=1, seed='some seed').prefix == generator.prefix
+    assert generate_bundle(folder, samples=1, reads=1, formats=['json']).prefix != generator.prefix
+    generator = generate_bundle(folder, samples=1, reads=1, prefix='MINE')
+    assert generator.rows[0]['Individual ID*'] == 'MINE-INDIVIDUAL000001'
+
+    with pytest.raises(ValueError, match="Bundle formats must be xlsx or json: csv"):
+        generate_bundle(folder, formats=['csv'])
+
+
+def test_generate_bundle_problems_found(tmp_path):
+
+    # If a data file goes missing, the bundle is no longer fit to submit.
+    folder = str(tmp_path / "bundle")
+    generator = generate_bundle(folder, samples=1, reads=1, formats=['xlsx'], prefix='MINE')
+    os.remove(generator.data_filenames[1])
+    assert validate_bundle_locally(generator.bundle_filenames[0], upload_folder=folder) == [
+        f"Sheet '{BUNDLE_SHEET_NAME}', row 2: The file MINE-SPECIMEN000001_R2.fastq.gz is not in the upload folder.",
+    ]
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import os
+import pytest
+import shutil
+import zipfile
+
+from unittest import mock
+from xml.sax.saxutils import escape
+
+from .. import async_submission as async_submission_module, submission as submission_module
+from ..async_submission import submit_any_ingestion as async_submit_any_ingestion
+from ..bundle_validation import BundleValidator, check_bundle, validate_bundle, xlsx_sheets
+from ..exceptions import BundleValidationError
+from ..submission import submit_any_ingestion, validate_bundle_locally
+from .test_utils import shown_output
+from .testing_helpers import system_exit_expected
+
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+HEADER = ['Individual ID*', 'Sex*', 'Relation to Proband*', 'Report Required*', 'Analysis ID*', 'Specimen ID*',
+          'Specimen Type*', 'Workup Type*', 'Birth Year', 'Files']
+
+
+def specimen_row(n, **overrides):
+    # A row of values for the columns in HEADER, of which any can be overridden (e.g., birth_year='1960').
+    values = {'individual_id': f'indiv{n}', 'sex': 'M', 'relation_to_proband': 'Proband', 'report_required': 'Y',
+              'analysis_id': '123', 'specimen_id': f'specimen{n}', 'specimen_type': 'Peripheral Blood',
+              'workup_type': 'WGS', 'birth_year': '1991', 'files': f'f{n}_R1.fastq.gz, f{n}_R2.fastq.gz'}
+    values.update(overrides)
+    return list(values.values())
+
+
+def write_xlsx(path, rows, sheet_name='Sheet1'):
+    # Writes a minimal workbook, with one sheet of the given rows, in which each value is an inline string.
+
+    def cell_xml(row_number, column_index, value):
+        letters = ''
+        column_index += 1
+        while column_index:
+            column_index, remainder = divmod(column_index - 1, 26)
+            letters = chr(ord('A') + remainder) + letters
+        return f'<c r="{letters}{row_number}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+    rows_xml = ''.join(f'<row r="{row_number}">'
+                       + ''.join(cell_xml(row_number, i, value) for i, value in enumerate(row) if value is not None)
+                       + '</row>'
+                       for row_number, row in enumerate(rows, start=1))
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr('xl/workbook.xml',
+                          f'<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+                          f' xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                          f'<sheets><sheet name="{sheet_name}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        workbook.writestr('xl/_rels/workbook.xml.rels',
+                          '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                          '<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="http://schemas.openxml'
+                          'formats.org/officeDocument/2006/relationships/worksheet"/></Relationships>')
+        workbook.writestr('xl/worksheets/sheet1.xml',
+                          f'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                          f'<sheetData>{rows_xml}</sheetData></worksheet>')
+    return str(path)
+
+
+def test_xlsx_sheets():
+
+    sheets = xlsx_sheets(os.path.join(TEST_DATA_DIR, "submission_test.xlsx"))
+    sheet_name, rows = next(sheets)
+    rows = list(rows)  # The rows of each sheet are read while the workbook is still open.
+    assert sheet_name == 'Accession data'
+    assert [row_number for row_number, _ in rows] == [1, 2, 3, 4, 5, 6]
+    row_number, values = rows[3]
+    assert values[:3] == ['456', '333', None]  # Shared strings are looked up, and empty cells are None.
+    assert values[39] == 'f1_R1.fastq.gz, f1_R2.fastq.gz'  # in column AN
+    assert list(sheets) == []
+
+
+@pytest.mark.parametrize("filename, expected_problems", [
+    ("submission_simple.xlsx", []),
+    ("submission_simple2.xlsx", []),
+    ("submission_test.xlsx", []),  # Its second row after the header describes the columns, and isn't checked.
+    ("submission_test_with_errors.xlsx",
+     ["Sheet 'Accession data', row 5: 'Birth Year' is '19613', but should be a four-digit year."]),
+])
+def test_validate_bundle_test_data(filename, expected_problems):
+
+    assert validate_bundle(os.path.join(TEST_DATA_DIR, filename)) == expected_problems
+
+
+def test_validate_bundle_rows(tmp_path):
+
+    bundle = write_xlsx(tmp_path / "bundle.xlsx", [
+        ['Accessioning'],  # The header row needn't be first.
+        HEADER,
+        specimen_row(1),
+        ['# A comment'],
+        [],
+        specimen_row(2, sex='X', report_required=''),
+        specimen_row(3, birth_year='91', specimen_id='specimen1'),
+    ])
+    assert validate_bundle(bundle) == [
+        "Sheet 'Sheet1', row 6: 'Report Required' is required, but is empty.",
+        "Sheet 'Sheet1', row 6: 'Sex' is 'X', but should be one of M, F, U, Male, Female, Unknown.",
+        "Sheet 'Sheet1', row 7: 'Birth Year' is '91', but should be a four-digit year.",
+        "Sheet 'Sheet1', row 7: The specimen id 'specimen1' was already used (sheet 'sheet1', row 3).",
+    ]
+
+    # Validation stops once it's found enough problems.
+    assert validate_bundle(bundle, max_problems=2) == [
+        "Sheet 'Sheet1', row 6: 'Report Required' is required, but is empty.",
+        "Sheet 'Sheet1', row 6: 'Sex' is 'X', but should be one of M, F, U, Male, Female, Unknown.",
+        "Stopped checking after 2 problems.",
+    ]
+
+
+def test_validate_bundle_columns(tmp_path):
+
+    header, row = zip(*[(column, value) for column, value in zip(HEADER, specimen_row(1)) if column != 'Workup Type*'])
+    bundle = write_xlsx(tmp_path / "bundle.xlsx", [list(header) + ['Sex'], list(row) + ['M']])
+    assert validate_bundle(bundle) == [
+        "Sheet 'Sheet1', row 1: There is more than one 'Sex' column.",
+        "Sheet 'Sheet1': The required column 'Workup Type' is missing.",
+    ]
+
+    # Sheets that aren't sheets of specimens (with an Individual ID column) are left to the portal, and listed.
+    bundle = write_xlsx(tmp_path / "other.xlsx", [['Gene', 'Notes'], ['BRCA1', 'something']])
+    validator = check_bundle(bundle)
+    assert validator.problems == []
+    assert validator.sheets_skipped == ['Sheet1']
+
+
+def test_validate_bundle_other_formats(tmp_path):
+
+    bundle = tmp_path / "bundle.json"
+    bundle.write_text(json.dumps({'Specimens': [
+        dict(zip(HEADER, specimen_row(1)), Files=['f1_R1.fastq.gz']),
+        dict(zip(HEADER, specimen_row(2, sex='Q'))),
+    ]}))
+    assert validate_bundle(str(bundle)) == [
+        "Sheet 'Specimens', item 2: 'Sex' is 'Q', but should be one of M, F, U, Male, Female, Unknown.",
+    ]
+
+    # Keys are compared as headers are, whether their words are separated by spaces or by underscores,
+    # and values that aren't lists of objects (as in the results of a submission) aren't sheets.
+    keys = [column.rstrip('*').lower().replace(' ', '_') for column in HEADER]
+    bundle.write_text(json.dumps({'success': True, 'validation_output': ['Some validation stuff'], 'upload_info': {},
+                                  'specimens': [dict(zip(keys, specimen_row(1, sex='Q')), files=['f1_R1.fastq.gz'])]}))
+    assert validate_bundle(str(bundle)) == [
+        "Sheet 'specimens', item 1: 'Sex' is 'Q', but should be one of M, F, U, Male, Female, Unknown.",
+    ]
+    validator = check_bundle(os.path.join(TEST_DATA_DIR, "simulated_bundle.json"))
+    assert validator.problems == validator.sheets_skipped == []
+
+    bundle.write_text("{not json")
+    [problem] = validate_bundle(str(bundle))
+    assert problem.startswith(f"{bundle} is not readable as JSON")
+
+    not_a_workbook = tmp_path / "bundle.xlsx"
+    not_a_workbook.write_text("Individual ID,Sex\n")
+    [problem] = validate_bundle(str(not_a_workbook))
+    assert problem.startswith(f"{not_a_workbook} is not a readable .xlsx workbook")
+
+    # Other formats (e.g., old .xls workbooks) are left to the portal.
+    validator = check_bundle(os.path.join(TEST_DATA_DIR, "submission_test.xls"))
+    assert validator.problems == []
+    assert validator.sheets_skipped == []
+
+
+def test_validate_bundle_identifiers(tmp_path):
+
+    # Columns of identifiers are checked in every sheet whose first row names any, and their values
+    # (each of the aliases in a list of them) can be used only once in the whole bundle.
+    bundle = tmp_path / "bundle.json"
+    bundle.write_text(json.dumps({
+        'Sample': [{'submitted_id': 'LAB_SAMPLE_1', 'aliases': ['lab:one', 'lab:two']},
+                   {'submitted_id': 'LAB_SAMPLE_1', 'aliases': ['lab:three']}],
+        'Donor': [{'submitted_id': 'LAB_DONOR_1', 'aliases': ['lab:two'], 'uuid': 'some-uuid'}],
+        'Notes': [{'note': 'something'}],
+    }))
+    validator = check_bundle(str(bundle))
+    assert validator.problems == [
+        "Sheet 'Sample', item 2: The submitted id 'LAB_SAMPLE_1' was already used (sheet 'sample', item 1).",
+        "Sheet 'Donor', item 1: The alias 'lab:two' was already used (sheet 'sample', item 1).",
+    ]
+    assert validator.sheets_skipped == ['Notes']
+
+    bundle = write_xlsx(tmp_path / "bundle.xlsx", [
+        ['Aliases', 'Description'],
+        ['# A comment', 'lab:one'],
+        ['lab:one, lab:two', 'something'],
+        ['lab:three, lab:one', 'something else'],
+    ])
+    assert validate_bundle(bundle) == [
+        "Sheet 'Sheet1', row 4: The alias 'lab:one' was already used (sheet 'sheet1', row 3).",
+    ]
+
+
+def test_validate_bundle_locally(tmp_path):
+
+    bundle = tmp_path / "submission_test.xlsx"
+    shutil.copy(os.path.join(TEST_DATA_DIR, "submission_test.xlsx"), bundle)
+    for name in ['f1_R1.fastq.gz', 'f1_R2.fastq.gz', 'f2_R1.fastq.gz']:
+        (tmp_path / name).write_text("some data")
+    assert validate_bundle_locally(str(bundle)) == [
+        "Sheet 'Accession data', row 5: The file f2_R2.fastq.gz is not in the upload folder.",
+    ]
+
+    # Files are looked for as they are for uploads, including in subfolders, where there might be more than one.
+    for subfolder in ['one', 'two']:
+        (tmp_path / "files" / subfolder).mkdir(parents=True)
+        (tmp_path / "files" / subfolder / 'f2_R2.fastq.gz').write_text("some data")
+    assert validate_bundle_locally(str(bundle), upload_folder=str(tmp_path / "files" / "one")) == [
+        f"Sheet 'Accession data', row 4: The file {name} is not in the upload folder."
+        for name in ['f1_R1.fastq.gz', 'f1_R2.fastq.gz']
+    ] + ["Sheet 'Accession data', row 5: The file f2_R1.fastq.gz is not in the upload folder."]
+    [problem] = validate_bundle_locally(str(bundle), subfolders=True)
+    assert problem.startswith("Sheet 'Accession data', row 5: No upload attempted for file f2_R2.fastq.gz"
+                              " because multiple copies were found")
+
+
+def test_validate_bundle_large(tmp_path):
+
+    # Workbooks are read a row at a time, and each data file is looked for only once.
+    n = 20000
+    bundle = write_xlsx(tmp_path / "bundle.xlsx",
+                        [HEADER] + [specimen_row(i, files='same_R1.fastq.gz, same_R2.fastq.gz') for i in range(n)])
+    validator = BundleValidator(find_file=lambda file_name: (str(tmp_path / file_name), None))
+    assert validator.check_sheets(xlsx_sheets(bundle)) == [
+        f"Sheet 'Sheet1', row 2: The file {name} is not in the upload folder."
+        for name in ['same_R1.fastq.gz', 'same_R2.fastq.gz']
+    ]
+    assert validator.sheets_checked == 1
+    assert validator.rows_checked == n
+
+
+def test_submit_any_ingestion_validates_locally(tmp_path):
+
+    bundle = write_xlsx(tmp_path / "bundle.xlsx", [HEADER, specimen_row(1, sex='X')])
+    problems = [
+        "Sheet 'Sheet1', row 2: 'Sex' is 'X', but should be one of M, F, U, Male, Female, Unknown.",
+        "Sheet 'Sheet1', row 2: The file f1_R1.fastq.gz is not in the upload folder.",
+        "Sheet 'Sheet1', row 2: The file f1_R2.fastq.gz is not in the upload folder.",
+    ]
+    with mock.patch.object(submission_module, "resolve_server") as mock_resolve_server:
+
+        # Problems are shown, but the portal is still asked to check the bundle (as its rules are what count) ...
+        with mock.patch.object(submission_module, "yes_or_no", return_value=False):
+            with shown_output() as shown:
+                with system_exit_expected(exit_code=1):
+                    submit_any_ingestion(bundle, ingestion_type='metadata_bundle', server=None, env=None,
+                                         validate_only=True, app='cgap')
+                assert shown.lines == [f"{bundle} probably has 3 problems the portal will reject it for:"] + [
+                    f" - {problem}" for problem in problems
+                ] + [
+                    "(To stop before submitting a bundle with problems like these, use --strict-local-validation.)",
+                    "Aborting submission.",
+                ]
+
+            # Sheets that weren't checked are listed.
+            other_bundle = tmp_path / "other.json"
+            other_bundle.write_text(json.dumps({'Genes': [{'gene': 'BRCA1'}], 'Notes': [{'note': 'something'}]}))
+            with shown_output() as shown:
+                with system_exit_expected(exit_code=1):
+                    submit_any_ingestion(str(other_bundle), ingestion_type='metadata_bundle', server=None, env=None,
+                                         validate_only=True, app='cgap')
+                assert shown.lines == [
+                    "Sheets not checked before submitting (so left to the portal): Genes, Notes",
+                    "Aborting submission.",
+                ]
+        mock_resolve_server.reset_mock()
+
+        # ... unless they're to stop it being submitted.
+        with shown_output() as shown:
+            with system_exit_expected(exit_code=1):
+                submit_any_ingestion(bundle, ingestion_type='metadata_bundle', server=None, env=None,
+                                     validate_only=True, no_query=True, app='cgap', strict_local_validation=True)
+            assert shown.lines == [f"{bundle} was not submitted, because of 3 problems with it:"] + [
+                f" - {problem}" for problem in problems
+            ] + [
+                "Fix these and submit it again (or, to leave checking it to the portal,"
+                " leave out --strict-local-validation).",
+            ]
+        mock_resolve_server.assert_not_called()  # Nothing was sent.
+
+        with pytest.raises(BundleValidationError) as exc_info:
+            asyncio.run(async_submit_any_ingestion(bundle, app='cgap', strict_local_validation=True))
+        assert exc_info.value.problems == problems
+        mock_resolve_server.assert_not_called()
+
+    # Without strict_local_validation, the asyncio submit_any_ingestion returns the problems with its result.
+    with mock.patch.object(async_submission_module, "_resolve_server_and_keydict",
+                           return_value=("http://some.server", {'key': 'some-key', 'secret': 'some-secret'})):
+        with mock.patch.object(async_submission_module, "_submit_bundle", return_value='some-uuid'):
+            with mock.patch.object(async_submission_module, "_check_ingestion_progress",
+                                   return_value=(True, 'error', {'processing_status': {'outcome': 'error'}})):
+                result = asyncio.run(async_submit_any_ingestion(bundle, app='cgap'))
+    assert result['uuid'] == 'some-uuid'
+    assert result['status'] == 'error'
+    assert result['bundle_problems'] == problems
+    assert result['sheets_skipped'] == []
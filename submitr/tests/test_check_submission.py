@@ -63,3 +63,28 @@ def test_check_submission_script():
                 'server': None,
                 'env': sample_env,
             })
+
+
+def test_check_submission_script_with_many_uuids(tmp_path):
+
+    other_guid = '2a299b61-e7a1-4c2a-9599-cfc64f51dab8'
+    uuids_file = tmp_path / "uuids.txt"
+    uuids_file.write_text(f"# Submitted yesterday\n{other_guid}\n\n{SAMPLE_GUID}  # again\n")
+
+    def test_it(args_in, expect_uuids, expect_summary_file=None):
+        with mock.patch.object(check_submission_module, "check_submit_ingestion") as mock_check_submit_ingestion:
+            with mock.patch.object(check_submission_module, "monitor_submit_ingestions") as mock_monitor:
+                with system_exit_expected(exit_code=0):
+                    check_submission_main(args_in)
+                    raise AssertionError("check_submission_main should not exit normally.")  # pragma: no cover
+                mock_check_submit_ingestion.assert_not_called()
+                [uuids], kwargs = mock_monitor.call_args
+                assert uuids == expect_uuids
+                assert kwargs['summary_file'] == expect_summary_file
+
+    test_it(args_in=[SAMPLE_GUID, other_guid], expect_uuids=[SAMPLE_GUID, other_guid])
+    test_it(args_in=['--uuids-file', str(uuids_file)], expect_uuids=[other_guid, SAMPLE_GUID])
+    test_it(args_in=[SAMPLE_GUID, '--json-summary', '-'], expect_uuids=[SAMPLE_GUID], expect_summary_file='-')
+
+    with system_exit_expected(exit_code=2):
+        check_submission_main(['--uuids-file', str(tmp_path / "no-such-file.txt")])
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import mmap
+import os
+
+from dcicutils.misc_utils import local_attrs
+from dcicutils.qa_utils import raises_regexp
+from unittest import mock
+
+from .. import checksums as checksums_module
+from ..checksums import (
+    ChecksumCache, FileChecksummer, checksum_properties, compute_checksums, file_cache_key, parse_checksum_algorithms,
+)
+
+
+SOME_CONTENT = b"ACGT" * 100000
+
+
+def test_parse_checksum_algorithms():
+
+    assert parse_checksum_algorithms('md5') == ['md5']
+    assert parse_checksum_algorithms('MD5, sha256,md5') == ['md5', 'sha256']
+    assert parse_checksum_algorithms('none') == []
+    assert parse_checksum_algorithms('') == []
+
+    with raises_regexp(ValueError, "Unknown checksum algorithm: 'sha1'"):
+        parse_checksum_algorithms('md5,sha1')
+
+    with mock.patch.object(checksums_module, "crc32c_module", None):
+        with raises_regexp(ValueError, "needs the crc32c package"):
+            parse_checksum_algorithms('crc32c')
+
+
+def test_compute_checksums(tmp_path):
+
+    path = tmp_path / "some-file.fastq"
+    path.write_bytes(SOME_CONTENT)
+    expected = {'md5': hashlib.md5(SOME_CONTENT).hexdigest(), 'sha256': hashlib.sha256(SOME_CONTENT).hexdigest()}
+    assert compute_checksums(str(path), ['md5', 'sha256']) == expected
+    # The same, a window at a time.
+    assert compute_checksums(str(path), ['md5', 'sha256'], chunk_size=mmap.ALLOCATIONGRANULARITY) == expected
+
+    path.write_bytes(b"")
+    assert compute_checksums(str(path), ['md5']) == {'md5': hashlib.md5(b"").hexdigest()}
+
+    assert checksum_properties(expected) == {'md5sum': expected['md5'], 'sha256sum': expected['sha256']}
+
+
+def test_checksum_cache(tmp_path):
+
+    path = tmp_path / "some-file.fastq"
+    path.write_bytes(SOME_CONTENT)
+    path = str(path)
+    cache_file = str(tmp_path / "cache" / "checksum_cache.json")
+    key = file_cache_key(path)
+    assert key.endswith(f":{len(SOME_CONTENT)}:{os.stat(path).st_mtime_ns}")
+    assert file_cache_key(str(tmp_path / "no-such-file")) is None
+
+    cache = ChecksumCache(cache_file)
+    assert cache.get(path, ['md5']) is None
+    cache.put(path, {'md5': 'some-md5'})
+    cache.put(path, {'sha256': 'some-sha256'})
+    assert cache.get(path, ['md5']) == {'md5': 'some-md5'}
+    assert cache.get(path, ['md5', 'sha256']) == {'md5': 'some-md5', 'sha256': 'some-sha256'}
+    assert not os.path.exists(cache_file)  # Nothing is written until it's saved.
+    cache.save()
+    assert list(json.load(open(cache_file))) == [key]
+    assert ChecksumCache(cache_file).get(path, ['md5', 'sha256']) == {'md5': 'some-md5', 'sha256': 'some-sha256'}
+
+    # Changing the file invalidates what the cache knows about it.
+    with open(path, 'ab') as fp:
+        fp.write(b"more")
+    assert ChecksumCache(cache_file).get(path, ['md5']) is None
+
+
+def test_file_checksummer(tmp_path):
+
+    small_path = tmp_path / "small.fastq"
+    small_path.write_bytes(SOME_CONTENT[:100])
+    large_path = tmp_path / "large.fastq"
+    large_path.write_bytes(SOME_CONTENT)
+    small_path, large_path = str(small_path), str(large_path)
+    cache = ChecksumCache(str(tmp_path / "checksum_cache.json"))
+
+    checksummer = FileChecksummer(algorithms=['md5'], workers=2, cache=cache)
+    with local_attrs(checksums_module, MIN_PRECOMPUTE_SIZE=1000):
+        with checksummer.precompute([small_path, large_path, str(tmp_path / "no-such-file")]):
+            assert checksummer.checksums(large_path) == {'md5': hashlib.md5(SOME_CONTENT).hexdigest()}
+    # The large file was hashed in a worker process, and only the small one is left to do when it's needed.
+    assert cache.get(large_path, ['md5']) is not None
+    assert cache.get(small_path, ['md5']) is None
+    assert checksummer.checksums(small_path) == {'md5': hashlib.md5(SOME_CONTENT[:100]).hexdigest()}
+    assert ChecksumCache(cache.filename).get(small_path, ['md5']) is not None
+    assert checksummer.checksums(str(tmp_path / "no-such-file")) == {}
+
+    # Cached checksums aren't computed again.
+    with mock.patch.object(checksums_module, "compute_checksums") as mock_compute_checksums:
+        assert checksummer.checksums(large_path) == {'md5': hashlib.md5(SOME_CONTENT).hexdigest()}
+        mock_compute_checksums.assert_not_called()
+
+    assert FileChecksummer(algorithms=[], cache=cache).checksums(large_path) == {}
+
+    with raises_regexp(ValueError, "must be a positive integer"):
+        FileChecksummer(workers=-1, cache=cache)
+
+
+def test_file_checksummer_in_background(tmp_path):
+
+    small_path = tmp_path / "small.fastq"
+    small_path.write_bytes(SOME_CONTENT[:100])
+    large_path = tmp_path / "large.fastq"
+    large_path.write_bytes(SOME_CONTENT)
+    small_path, large_path = str(small_path), str(large_path)
+    cache = ChecksumCache(str(tmp_path / "checksum_cache.json"))
+    checksummer = FileChecksummer(algorithms=['md5'], workers=2, cache=cache)
+
+    with local_attrs(checksums_module, MIN_PRECOMPUTE_SIZE=1000):
+        # Small files are quick to hash, and missing files have no checksums, but large ones aren't ready yet.
+        assert checksummer.ready_checksums(small_path) == {'md5': hashlib.md5(SOME_CONTENT[:100]).hexdigest()}
+        assert checksummer.ready_checksums(str(tmp_path / "no-such-file")) == {}
+        assert checksummer.ready_checksums(large_path) is None
+        checksummer.compute_in_background(large_path)
+        checksummer.compute_in_background(large_path)  # This is already going, so it's not started again.
+        assert len(checksummer._pending) == 1  # noQA - protected member
+        assert checksummer.checksums(large_path) == {'md5': hashlib.md5(SOME_CONTENT).hexdigest()}
+        assert checksummer.ready_checksums(large_path) == {'md5': hashlib.md5(SOME_CONTENT).hexdigest()}
+    assert ChecksumCache(cache.filename).get(large_path, ['md5']) is not None
+
+    assert FileChecksummer(algorithms=[], cache=cache).ready_checksums(large_path) == {}
@@ -0,0 +1,132 @@
+import gzip
+import os
+import pytest
+import random
+import struct
+
+from unittest import mock
+
+from .. import fastq_generation as fastq_generation_module
+from ..fastq_generation import (
+    BGZF_EOF, ReadLengths, bgzf_compress, fastq_records, generate_fastq_files, paired_fastq_filenames,
+)
+
+
+def read_fastq(filename, opener=gzip.open):
+    # Returns the records of a FASTQ file, each as a list of its 4 lines.
+    with opener(filename, 'rt') as fp:
+        lines = fp.read().splitlines()
+    assert len(lines) % 4 == 0
+    return [lines[i:i + 4] for i in range(0, len(lines), 4)]
+
+
+@pytest.mark.parametrize("filename, expected", [
+    ("sample.fastq.gz", ("sample_R1.fastq.gz", "sample_R2.fastq.gz")),
+    ("dir/sample.fq", ("dir/sample_R1.fq", "dir/sample_R2.fq")),
+    ("sample.gz", ("sample_R1.gz", "sample_R2.gz")),
+    ("sample", ("sample_R1", "sample_R2")),
+])
+def test_paired_fastq_filenames(filename, expected):
+
+    assert paired_fastq_filenames(filename) == expected
+
+
+def test_read_lengths():
+
+    rng = random.Random(1)
+    assert ReadLengths(20).sample(rng, 3) == [20, 20, 20]
+    assert ReadLengths(20, min_length=5).min_length == 20  # A fixed distribution has no other lengths.
+    lengths = ReadLengths(20, 'uniform', min_length=5).sample(rng, 1000)
+    assert min(lengths) == 5 and max(lengths) == 20
+    lengths = ReadLengths(100, 'normal', min_length=90, stddev=5).sample(rng, 1000)
+    assert min(lengths) == 90 and max(lengths) == 100
+    assert 400 < lengths.count(100) < 600  # About half would be longer, and are trimmed to the length.
+
+    with pytest.raises(ValueError, match="must be one of fixed, uniform, normal"):
+        ReadLengths(20, 'lognormal')
+    with pytest.raises(ValueError, match="must be from 1 to 20, but the minimum is 30"):
+        ReadLengths(20, 'uniform', min_length=30)
+
+
+def test_fastq_records():
+
+    records = fastq_records(7, 2, [3, 5], os.urandom).decode('ascii').splitlines()
+    assert records[0::4] == ['@SYNTHETIC.7 2:N:0:1', '@SYNTHETIC.8 2:N:0:1']
+    assert records[2::4] == ['+', '+']
+    assert [len(line) for line in records[1::4]] == [3, 5]
+    assert set(''.join(records[1::4])) <= set('ACGT')
+    assert [len(line) for line in records[3::4]] == [3, 5]
+    assert set(''.join(records[3::4])) <= set('F:,#')
+
+
+def test_bgzf_compress():
+
+    data = bytes(range(256)) * 1000  # which takes 4 blocks
+    compressed = bgzf_compress(data)
+    assert gzip.decompress(compressed + BGZF_EOF) == data
+    assert gzip.decompress(BGZF_EOF) == b''
+    # Each block has the size of the whole block (less 1) in its header, which readers use to find the next one.
+    offset, blocks = 0, 0
+    while offset < len(compressed):
+        assert compressed[offset:offset + 4] == b'\x1f\x8b\x08\x04'
+        assert compressed[offset + 12:offset + 16] == b'BC\x02\x00'
+        offset += struct.unpack_from('<H', compressed, offset + 16)[0] + 1
+        blocks += 1
+    assert offset == len(compressed)
+    assert blocks == 4
+
+    # Data that doesn't compress is stored, so that each block still fits in 64KB.
+    data = os.urandom(200000)
+    assert gzip.decompress(bgzf_compress(data, level=9)) == data
+
+
+def test_generate_fastq_files(tmp_path):
+
+    filename = str(tmp_path / "sample.fastq.gz")
+    generator = generate_fastq_files(filename, number=25, paired=True, seed='some seed',
+                                     read_lengths=ReadLengths(30, 'uniform', min_length=10))
+    r1_filename, r2_filename = generator.filenames
+    assert generator.reads == 25
+    r1_records, r2_records = read_fastq(r1_filename), read_fastq(r2_filename)
+    assert [r[0] for r in r1_records] == [f"@SYNTHETIC.{i} 1:N:0:1" for i in range(25)]
+    assert [r[0] for r in r2_records] == [f"@SYNTHETIC.{i} 2:N:0:1" for i in range(25)]
+    # The reads of a pair are as long as each other, but not the same.
+    assert [len(r[1]) for r in r1_records] == [len(r[1]) for r in r2_records]
+    assert [r[1] for r in r1_records] != [r[1] for r in r2_records]
+    with open(r1_filename, 'rb') as fp:
+        r1_data = fp.read()
+    assert r1_data.endswith(BGZF_EOF)
+    assert generator.bytes_written[0] == len(r1_data)
+    assert "Wrote 25 reads to" in generator.summary()
+
+    # With the same seed, the same files are made, however many workers make them.
+    made = []
+    for workers in [1, 3]:
+        with mock.patch.object(fastq_generation_module, "FASTQ_BATCH_SIZE", 1000):
+            generator = generate_fastq_files(filename, number=25, paired=True, seed='some seed', workers=workers,
+                                             read_lengths=ReadLengths(30, 'uniform', min_length=10))
+        assert generator.reads_per_batch < 25
+        made.append([read_fastq(name) for name in generator.filenames])
+    assert made[0] == made[1]
+    assert made[0][0] != r1_records  # The reads depend on how many there are in each batch, though.
+
+    # Files not named .gz are not compressed.
+    generator = generate_fastq_files(str(tmp_path / "sample.fq"), number=3, read_lengths=ReadLengths(10))
+    assert generator.filenames == [str(tmp_path / "sample.fq")]
+    assert [len(r[1]) for r in read_fastq(generator.filenames[0], opener=open)] == [10, 10, 10]
+
+
+def test_generate_fastq_files_size(tmp_path):
+
+    with mock.patch.object(fastq_generation_module, "FASTQ_BATCH_SIZE", 10000):
+        generator = generate_fastq_files(str(tmp_path / "sample.fastq.gz"), size=50000, workers=2)
+    # It stops after the batch with which the file reached the size.
+    assert 50000 <= generator.bytes_written[0] < 50000 + 10000
+    assert generator.reads == len(read_fastq(generator.filenames[0]))
+    assert generator.reads % generator.reads_per_batch == 0
+    assert generator.fastq_bytes > generator.bytes_written[0]
+
+    with pytest.raises(ValueError, match="Either a number of reads or a size"):
+        generate_fastq_files(str(tmp_path / "sample.fastq.gz"))
+    with pytest.raises(ValueError, match="The number of workers must be a positive integer"):
+        generate_fastq_files(str(tmp_path / "sample.fastq.gz"), number=3, workers=-1)
@@ -0,0 +1,57 @@
+import io
+import json
+import pytest
+
+from dcicutils.qa_utils import raises_regexp
+
+from ..json_streaming import JsonItem, JsonObjectStream, JsonStreamError
+
+
+SOME_DATA = {
+    'ontology': [{'ontology_name': 'Some Ontology'}],
+    'version': 12345678901234,
+    'ontology_term': [{'term_id': f'T:{i}', 'term_name': f'term {i} (café)', 'parents': ['T:0']} for i in range(100)],
+    'empty': [],
+    'more': {'nested': [1, 2]},
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000, 1024 * 1024])
+def test_json_object_stream(chunk_size):
+
+    text = json.dumps(SOME_DATA, indent=2)
+    stream = JsonObjectStream(io.StringIO(text), chunk_size=chunk_size)
+    items = list(stream.items())
+    assert stream.keys == [('ontology', True), ('version', False), ('ontology_term', True), ('empty', True),
+                           ('more', False)]
+    assert [item.value for item in items if item.key == 'ontology_term'] == SOME_DATA['ontology_term']
+    assert items[1] == JsonItem('version', offset=text.index('1234'), value=12345678901234, in_array=False)
+    # The offsets are in bytes (not characters), and are where each item starts.
+    encoded = text.encode('utf-8')
+    for item in items:
+        assert json.JSONDecoder().raw_decode(encoded[item.offset:].decode('utf-8'))[0] == item.value
+
+
+def test_json_object_stream_numbers():
+
+    # Wherever a chunk ends in a number (e.g., after the '.' of '123.45', or the 'e' of '2e-07'), it's read whole.
+    data = {'version': 123.45, 'values': [2e-07, -0.5, 1.5E+300, 10, 0.001, 6.02e23, 7], 'last': -1.25e-3}
+    text = json.dumps(data)
+    for chunk_size in range(1, len(text) + 1):
+        items = list(JsonObjectStream(io.StringIO(text), chunk_size=chunk_size).items())
+        assert [item.value for item in items] == [data['version']] + data['values'] + [data['last']]
+
+
+@pytest.mark.parametrize("text, message", [
+    ('', "Expected '{' but the file ended at byte 0"),
+    ('[1]', "Expected '{' but found '\\[' at byte 0"),
+    ('{"a": [1, 2', "Expected ',' or '\\]' but the file ended at byte 11"),
+    ('{"a": [1 2]}', "Expected ',' or '\\]' but found '2' at byte 9"),
+    ('{"é": tru}', "Expecting value at byte 7"),
+    ('{1: 2}', "Expected a key at byte 1"),
+    ('{"a": 1} x', "Expected the end of the file at byte 9"),
+])
+def test_json_object_stream_errors(text, message):
+
+    with raises_regexp(JsonStreamError, message):
+        list(JsonObjectStream(io.StringIO(text), chunk_size=3).items())
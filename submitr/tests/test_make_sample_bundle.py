@@ -0,0 +1,34 @@
+from unittest import mock
+
+from ..scripts.make_sample_bundle import main as make_sample_bundle_main
+from ..scripts import make_sample_bundle as make_sample_bundle_module
+from .test_utils import shown_output
+from .testing_helpers import system_exit_expected
+
+
+def test_make_sample_bundle_script():
+
+    def test_it(args_in, expect_exit_code, expect_call_args=None):
+        with mock.patch.object(make_sample_bundle_module, "generate_bundle") as mock_generate_bundle:
+            mock_generate_bundle.return_value.summary.return_value = "Wrote a bundle."
+            with shown_output() as shown:
+                with system_exit_expected(exit_code=expect_exit_code):
+                    make_sample_bundle_main(args_in)
+                    raise AssertionError("make_sample_bundle_main should not exit normally.")  # pragma: no cover
+            if expect_call_args is None:
+                assert mock_generate_bundle.call_count == 0
+            else:
+                assert shown.lines == ["Wrote a bundle."]
+                [folder], kwargs = mock_generate_bundle.call_args
+                assert kwargs.pop('read_lengths').length == expect_call_args.pop('length')
+                assert dict(kwargs, folder=folder) == expect_call_args
+
+    defaults = {'samples': 3, 'name': 'sample-bundle', 'formats': None, 'prefix': None, 'reads': None, 'size': None,
+                'length': 150, 'seed': None, 'workers': None}
+    test_it(args_in=[], expect_exit_code=2)  # Missing args
+    test_it(args_in=['some-folder'], expect_exit_code=0, expect_call_args=dict(defaults, folder='some-folder'))
+    test_it(args_in=['some-folder', '-n', '3000', '--format', 'json', '--file-size', '1GB', '--length', '100',
+                     '--prefix', 'LOAD1', '--seed', 'abc', '--workers', '4'],
+            expect_exit_code=0,
+            expect_call_args=dict(defaults, folder='some-folder', samples=3000, formats=['json'], size=1024 ** 3,
+                                  length=100, prefix='LOAD1', seed='abc', workers=4))
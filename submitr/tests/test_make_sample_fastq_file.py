@@ -1,33 +1,41 @@
 from unittest import mock
 
-from dcicutils.misc_utils import ignored
 from ..scripts.make_sample_fastq_file import main as make_sample_fastq_file_main
 from ..scripts import make_sample_fastq_file as make_sample_fastq_file_module
+from .test_utils import shown_output
 from .testing_helpers import system_exit_expected
 
 
 def test_make_sample_fastq_file_script():
 
     def test_it(args_in, expect_exit_code, expect_called, expect_call_args=None):
-        ignored(expect_call_args)
-        with mock.patch.object(make_sample_fastq_file_module,
-                               "generate_sample_fastq_file") as mock_generate_sample_fastq_file:
-            with system_exit_expected(exit_code=expect_exit_code):
-                make_sample_fastq_file_main(args_in)
-                raise AssertionError("make_sample_fastq_file_main should not exit normally.")  # pragma: no cover
-            assert mock_generate_sample_fastq_file.call_count == (1 if expect_called else 0)
+        with mock.patch.object(make_sample_fastq_file_module, "generate_fastq_files") as mock_generate_fastq_files:
+            mock_generate_fastq_files.return_value.summary.return_value = "Wrote some reads."
+            with shown_output() as shown:
+                with system_exit_expected(exit_code=expect_exit_code):
+                    make_sample_fastq_file_main(args_in)
+                    raise AssertionError("make_sample_fastq_file_main should not exit normally.")  # pragma: no cover
+            assert mock_generate_fastq_files.call_count == (1 if expect_called else 0)
+            if expect_called:
+                assert shown.lines == ["Wrote some reads."]
+                [filename], kwargs = mock_generate_fastq_files.call_args
+                read_lengths = kwargs.pop('read_lengths')
+                assert dict(kwargs, filename=filename, length=read_lengths.length,
+                            distribution=read_lengths.distribution) == expect_call_args
 
+    defaults = {'size': None, 'paired': False, 'seed': None, 'workers': None, 'compression_level': 1,
+                'distribution': 'fixed'}
     test_it(args_in=[], expect_exit_code=2, expect_called=False)  # Missing args
-    test_it(args_in=['some.file'], expect_exit_code=0, expect_called=True, expect_call_args={
+    test_it(args_in=['some.file'], expect_exit_code=0, expect_called=True, expect_call_args=dict(defaults, **{
         'filename': 'some.file',
-        'num': 10,
+        'number': 10,
         'length': 10,
-    })
-    expect_call_args = {
+    }))
+    expect_call_args = dict(defaults, **{
         'filename': 'some.file',
-        'num': 4,
+        'number': 4,
         'length': 9,
-    }
+    })
     test_it(args_in=['-n', '4', '-l', '9', 'some.file'],
             expect_exit_code=0,
             expect_called=True,
@@ -36,3 +44,17 @@ def test_make_sample_fastq_file_script():
             expect_exit_code=0,
             expect_called=True,
             expect_call_args=expect_call_args)
+    test_it(args_in=['some.fastq.gz', '--size', '50GB', '--paired', '--length', '150', '--length-distribution',
+                     'normal', '--seed', 'abc', '--workers', '8'],
+            expect_exit_code=0,
+            expect_called=True,
+            expect_call_args=dict(defaults, **{
+                'filename': 'some.fastq.gz',
+                'number': None,  # As many as it takes to make the files 50GB.
+                'size': 50 * 1024 ** 3,
+                'length': 150,
+                'distribution': 'normal',
+                'paired': True,
+                'seed': 'abc',
+                'workers': 8,
+            }))
@@ -0,0 +1,90 @@
+import json
+import pytest
+
+from dcicutils.misc_utils import local_attrs
+from dcicutils.qa_utils import raises_regexp
+
+from .. import metrics as metrics_module
+from ..metrics import (
+    MetricsRecorder, annotate_span, configure_metrics, get_metrics_recorder, metrics_span, timed_span,
+)
+
+
+def read_spans(filename):
+    with open(filename) as fp:
+        return [json.loads(line) for line in fp]
+
+
+@pytest.fixture
+def metrics_file(tmp_path):
+    filename = str(tmp_path / "metrics" / "metrics.jsonl")
+    with local_attrs(metrics_module, _METRICS_RECORDER=MetricsRecorder(filename), _METRICS_CONFIGURED=True):
+        yield filename
+
+
+def test_metrics_span(metrics_file):
+
+    with metrics_span('outer', uuid='some-uuid') as outer:
+        outer['files'] = 2
+        with metrics_span('inner'):
+            annotate_span(bytes=1000)
+    with raises_regexp(ValueError, "ouch"):
+        with metrics_span('failing'):
+            raise ValueError("ouch")
+    with pytest.raises(SystemExit):
+        with metrics_span('exiting'):
+            exit(0)
+
+    inner, outer, failing, exiting = read_spans(metrics_file)
+    # Spans are written as they end, so an inner span comes before the one it's in.
+    assert inner['span'] == 'inner'
+    assert inner['parent'] == outer['id']
+    assert inner['bytes'] == 1000
+    assert outer['span'] == 'outer'
+    assert outer['parent'] is None
+    assert outer['uuid'] == 'some-uuid'
+    assert outer['files'] == 2
+    assert outer['seconds'] >= inner['seconds'] >= 0
+    assert outer['start'] <= inner['start']
+    assert outer['status'] == inner['status'] == 'ok'
+    assert outer['thread'] == 'MainThread'
+    assert failing['status'] == 'error'
+    assert failing['error'] == "ValueError: ouch"
+    assert exiting['status'] == 'ok'  # exit(0) isn't an error
+    assert len({span['run'] for span in [inner, outer, failing, exiting]}) == 1
+    assert len({span['id'] for span in [inner, outer, failing, exiting]}) == 4
+
+
+def test_timed_span(metrics_file):
+
+    @timed_span('some_phase', arguments=('uuid', 'mode'))
+    def some_phase(uuid, auth, mode='fast'):
+        annotate_span(result=len(auth))
+        return uuid
+
+    assert some_phase('some-uuid', ('key', 'secret')) == 'some-uuid'
+    [span] = read_spans(metrics_file)
+    assert span['span'] == 'some_phase'
+    assert span['uuid'] == 'some-uuid'
+    assert span['mode'] is None  # Defaults aren't filled in.
+    assert span['result'] == 2
+    assert 'auth' not in span  # Only the named arguments are recorded.
+
+
+def test_metrics_disabled(tmp_path):
+
+    with local_attrs(metrics_module, _METRICS_RECORDER=None, _METRICS_CONFIGURED=False, DEFAULT_METRICS_FILE=None):
+        assert get_metrics_recorder() is None
+        with metrics_span('ignored') as attributes:
+            attributes['more'] = 1
+            annotate_span(bytes=1000)
+        assert timed_span('ignored')(lambda x: x * 2)(3) == 6
+
+        # By default, spans are written to SUBMITR_METRICS_FILE, if it's set.
+        with local_attrs(metrics_module, _METRICS_CONFIGURED=False, DEFAULT_METRICS_FILE=str(tmp_path / "m.jsonl")):
+            assert get_metrics_recorder().filename == str(tmp_path / "m.jsonl")
+        configure_metrics(str(tmp_path / "other.jsonl"))
+        with metrics_span('recorded'):
+            pass
+        [span] = read_spans(str(tmp_path / "other.jsonl"))
+        assert span['span'] == 'recorded'
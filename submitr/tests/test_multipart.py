@@ -0,0 +1,78 @@
+import io
+import pytest
+import requests
+import urllib3.filepost
+
+from dcicutils.qa_utils import raises_regexp
+from unittest import mock
+
+from ..multipart import MultipartEncoder
+
+
+SOME_DATA = {'validate_only': False, 'ingestion_type': 'metadata_bundle', 'consortia': ['smaht', 'other'],
+             'processing_status': {'state': 'submitted'}, 'lab': None}
+SOME_CONTENT = b'PK' + bytes(range(256)) * 100
+
+
+def requests_encoding(data, files, boundary):
+    # How requests itself encodes the same thing, given the same boundary.
+    with mock.patch.object(urllib3.filepost, "choose_boundary", return_value=boundary):
+        return requests.models.RequestEncodingMixin._encode_files(files, data)
+
+
+@pytest.mark.parametrize("with_file", [True, False])
+def test_multipart_encoder_matches_requests(tmp_path, with_file):
+
+    bundle = tmp_path / "bundle.xlsx"
+    bundle.write_bytes(SOME_CONTENT)
+
+    def files():
+        return {'datafile': open(bundle, 'rb') if with_file else None}
+
+    body, content_type = requests_encoding(SOME_DATA, files(), boundary='some-boundary')
+    encoder = MultipartEncoder(SOME_DATA, files=files(), boundary='some-boundary')
+    assert encoder.content_type == content_type
+    assert len(encoder) == len(body)
+    assert encoder.read() == body
+    assert encoder.read() == b''
+    assert (b'filename="bundle.xlsx"' in body) == with_file
+    encoder.close()
+
+
+def test_multipart_encoder_streams():
+
+    datafile = io.BytesIO(SOME_CONTENT)
+    body, _ = requests_encoding(SOME_DATA, {'datafile': io.BytesIO(SOME_CONTENT)}, boundary='some-boundary')
+    encoder = MultipartEncoder(SOME_DATA, files={'datafile': datafile}, boundary='some-boundary')
+    # A file without a name is sent under the name of its field, as requests does.
+    assert b'filename="datafile"' in body
+    chunks = list(iter(lambda: encoder.read(1000), b''))
+    assert b''.join(chunks) == body
+    assert {len(chunk) for chunk in chunks[:-1]} == {1000}
+    assert encoder.tell() == len(body)
+
+    # It can be rewound and sent again (e.g., on a retry).
+    assert encoder.seek(0) == 0
+    assert b''.join(encoder) == body
+    with raises_regexp(ValueError, "only be rewound to its start"):
+        encoder.seek(10)
+
+    # requests sends it as it's read, with a Content-Length.
+    encoder.seek(0)
+    prepared = requests.Request('POST', 'http://localhost:7777/submit_for_ingestion', data=encoder,
+                                headers={'Content-Type': encoder.content_type}).prepare()
+    assert prepared.body is encoder
+    assert prepared.headers['Content-Length'] == str(len(body))
+    assert 'Transfer-Encoding' not in prepared.headers
+
+    encoder.close()
+    assert datafile.closed
+
+
+def test_multipart_encoder_file_shrinks():
+
+    datafile = io.BytesIO(SOME_CONTENT)
+    encoder = MultipartEncoder({}, files={'datafile': datafile})
+    datafile.truncate(10)
+    with raises_regexp(IOError, "got shorter"):
+        encoder.read()
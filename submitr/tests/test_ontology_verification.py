@@ -0,0 +1,54 @@
+import json
+
+from dcicutils.qa_utils import raises_regexp
+
+from ..json_streaming import JsonStreamError
+from ..ontology_verification import FingerprintSet, check_ontology_file
+
+
+def test_fingerprint_set():
+
+    strings = FingerprintSet(capacity=4)
+    assert all(strings.add(f"T:{i}") for i in range(1000))  # It grows as it needs to.
+    assert len(strings) == 1000
+    assert not strings.add("T:500")
+    assert strings.add("T:1000")
+    assert len(strings) == 1001
+    assert len(strings._table) == 2048  # never more than half full
+
+
+def test_check_ontology_file(tmp_path):
+
+    ontology_file = tmp_path / "ontology.json"
+    terms = [{'term_id': f"T:{i}", 'term_name': f"term {i}", 'parents': [f"T:{i - 1}"] if i else []}
+             for i in range(100)]
+    ontology_file.write_text(json.dumps({'ontology': [{'ontology_name': 'Some Ontology'}], 'ontology_term': terms}))
+    check = check_ontology_file(str(ontology_file))
+    assert check.term_count == 100
+    assert check.problems == []
+
+    text = json.dumps({'ontology_term': [{'term_id': 'T:1', 'term_name': 'one'},
+                                         {'term_name': 'nameless'},
+                                         {'term_id': 'T:2', 'parents': 'T:1'},
+                                         {'term_id': 'T:1', 'term_name': 'one again'},
+                                         "T:3"]})
+    ontology_file.write_text(text)
+    check = check_ontology_file(str(ontology_file), max_problems=3)
+    assert check.term_count == 5
+    assert check.problem_count == 4
+    nameless_offset = text.index('{"term_name"')
+    t2_offset = text.index('{"term_id": "T:2"')
+    again_offset = text.index('{"term_id": "T:1", "term_name": "one again"')
+    assert check.problems == [
+        f"The ontology term at byte {nameless_offset} has no term_id.",
+        f"The ontology term at byte {t2_offset} (T:2) has parents that are not a list of term ids.",
+        f"The ontology term at byte {again_offset} has the same term_id (T:1) as one before it.",
+    ]
+
+    ontology_file.write_text(json.dumps({'ontology': []}))
+    with raises_regexp(ValueError, "There is no ontology_term list"):
+        check_ontology_file(str(ontology_file))
+
+    ontology_file.write_text('{"ontology_term": [{"term_id": "T:1"},')
+    with raises_regexp(JsonStreamError, "Expecting value at byte 38"):
+        check_ontology_file(str(ontology_file))
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import pytest
+import time
+
+from dcicutils.qa_utils import raises_regexp
+from unittest import mock
+
+from .. import portal_cache as portal_cache_module
+from ..portal_cache import (
+    PortalCache, PortalCacheKind, add_portal_cache_arguments, cached_portal_page, clear_portal_cache,
+    configure_portal_cache, get_portal_cache, invalidate_rejected_credentials,
+)
+
+
+SOME_SERVER = 'https://portal.example.org'
+SOME_OTHER_SERVER = 'http://localhost:8000'
+SOME_AUTH = ('some-key', 'some-secret')
+SOME_KEYDICT = {'key': 'some-key', 'secret': 'some-secret', 'server': SOME_SERVER}
+SOME_USER_RECORD = {'title': 'J Doe', 'contact_email': 'jdoe@example.org'}
+
+
+@pytest.fixture(autouse=True)
+def default_portal_cache():
+    configure_portal_cache()
+    yield
+    configure_portal_cache()
+
+
+def test_portal_cache(tmp_path):
+
+    cache_file = str(tmp_path / "cache" / "portal_cache.json")
+    cache = PortalCache(cache_file, ttl=60)
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH) is None
+    cache.put(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH, SOME_USER_RECORD)
+    cache.put(PortalCacheKind.HEALTH_PAGE, SOME_OTHER_SERVER, SOME_KEYDICT, {'beanstalk_env': 'some-env'})
+    assert oct(os.stat(cache_file).st_mode & 0o777) == oct(0o600)
+    assert 'some-secret' not in open(cache_file).read()
+
+    # A later run (with a fresh cache object) sees the same pages, for the same server and credentials.
+    cache = PortalCache(cache_file, ttl=60)
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER + '/', SOME_KEYDICT) == SOME_USER_RECORD
+    assert cache.get(PortalCacheKind.HEALTH_PAGE, SOME_SERVER, SOME_AUTH) is None
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_OTHER_SERVER, SOME_AUTH) is None
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, ('some-key', 'other-secret')) is None
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, None) is None
+
+    # Pages expire after the TTL.
+    with mock.patch.object(time, "time", return_value=time.time() + 61):
+        assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH) is None
+        assert PortalCache(cache_file, ttl=60).get(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH) is None
+
+    cache.invalidate(server=SOME_SERVER)
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH) is None
+    assert list(json.loads(open(cache_file).read())) == [
+        PortalCache.entry_key(PortalCacheKind.HEALTH_PAGE, SOME_OTHER_SERVER, 'some-key')
+    ]
+    cache.invalidate(key_id='some-key')
+    assert json.loads(open(cache_file).read()) == {}
+
+
+def test_configure_portal_cache(tmp_path):
+
+    assert portal_cache_module.DEFAULT_PORTAL_CACHE_TTL == 0  # The cache is only used if asked for.
+    assert get_portal_cache() is None
+
+    cache_file = str(tmp_path / "portal_cache.json")
+    configure_portal_cache(ttl=60, filename=cache_file)
+    cache = get_portal_cache()
+    assert cache.filename == cache_file and cache.ttl == 60
+    assert get_portal_cache() is cache
+
+    configure_portal_cache(enabled=False, ttl=60, filename=cache_file)  # As for --no-cache
+    assert get_portal_cache() is None
+
+    with raises_regexp(ValueError, "TTL must not be negative"):
+        configure_portal_cache(ttl=-1)
+
+
+def test_cached_portal_page(tmp_path):
+
+    fetch = mock.Mock(return_value=SOME_USER_RECORD)
+
+    # With no cache, the page is fetched every time.
+    for _ in range(2):
+        assert cached_portal_page(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH, fetch) == SOME_USER_RECORD
+    assert fetch.call_count == 2
+
+    fetch.reset_mock()
+    configure_portal_cache(ttl=60, filename=str(tmp_path / "portal_cache.json"))
+    for _ in range(2):
+        assert cached_portal_page(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH, fetch) == SOME_USER_RECORD
+    assert fetch.call_count == 1
+
+    clear_portal_cache(server=SOME_SERVER)
+    assert cached_portal_page(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH, fetch) == SOME_USER_RECORD
+    assert fetch.call_count == 2
+
+    # Nothing is cached if fetching fails, or gets nothing.
+    clear_portal_cache()
+    with raises_regexp(RuntimeError, "portal is down"):
+        cached_portal_page(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH,
+                           mock.Mock(side_effect=RuntimeError("The portal is down.")))
+    assert cached_portal_page(PortalCacheKind.HEALTH_PAGE, SOME_SERVER, SOME_AUTH, mock.Mock(return_value={})) == {}
+    some_error = {'error': 'Bad status code for GET request: 502.'}
+    assert cached_portal_page(PortalCacheKind.HEALTH_PAGE, SOME_SERVER, SOME_AUTH,
+                              mock.Mock(return_value=some_error)) == some_error
+    assert get_portal_cache().get(PortalCacheKind.HEALTH_PAGE, SOME_SERVER, SOME_AUTH) is None
+
+
+def test_invalidate_rejected_credentials(tmp_path):
+
+    configure_portal_cache(ttl=60, filename=str(tmp_path / "portal_cache.json"))
+    cache = get_portal_cache()
+    cache.put(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH, SOME_USER_RECORD)
+    cache.put(PortalCacheKind.USER_RECORD, SOME_SERVER, ('other-key', 'other-secret'), SOME_USER_RECORD)
+    cache.put(PortalCacheKind.USER_RECORD, SOME_OTHER_SERVER, SOME_AUTH, SOME_USER_RECORD)
+
+    invalidate_rejected_credentials(SOME_SERVER, None)  # With no key id, there's nothing to drop.
+    invalidate_rejected_credentials(SOME_SERVER, SOME_KEYDICT)
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, SOME_AUTH) is None
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, ('other-key', 'other-secret')) == SOME_USER_RECORD
+    assert cache.get(PortalCacheKind.USER_RECORD, SOME_OTHER_SERVER, SOME_AUTH) == SOME_USER_RECORD
+
+
+def test_add_portal_cache_arguments():
+
+    parser = argparse.ArgumentParser()
+    add_portal_cache_arguments(parser)
+    args = parser.parse_args([])
+    assert (args.no_cache, args.clear_cache) == (False, False)
+    args = parser.parse_args(['--no_cache', '--clear-cache'])
+    assert (args.no_cache, args.clear_cache) == (True, True)
@@ -0,0 +1,255 @@
+import io
+import json
+import pytest
+import requests
+
+from dcicutils.qa_utils import raises_regexp
+from unittest import mock
+
+from .. import portal_network_access as portal_network_access_module
+from ..portal_cache import PortalCacheKind, configure_portal_cache, get_portal_cache
+from ..portal_network_access import (
+    PortalRetryPolicy, close_portal_sessions, configure_portal_retries, configure_portal_sessions,
+    get_portal_request_counts, get_portal_session, portal_metadata_patch, portal_metadata_post,
+    portal_request_get, portal_request_post, request_not_sent, reset_portal_request_counts,
+)
+from ..multipart import MultipartEncoder
+from ..utils import FakeResponse
+from .testing_helpers import FakeClock
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+
+SOME_SERVER = 'https://portal.example.org'
+SOME_AUTH = {'key': 'some-key', 'secret': 'some-secret', 'server': SOME_SERVER}
+
+
+@pytest.fixture(autouse=True)
+def fresh_portal_sessions():
+    configure_portal_sessions()
+    configure_portal_retries()
+    reset_portal_request_counts()
+    yield
+    configure_portal_sessions()
+    configure_portal_retries()
+    reset_portal_request_counts()
+
+
+def test_get_portal_session():
+
+    session = get_portal_session(SOME_SERVER + '/me?format=json')
+    assert isinstance(session, requests.Session)
+    # The same session is shared by all requests to the same server, but not with other servers.
+    assert get_portal_session(SOME_SERVER + '/ingestion-submissions/some-uuid') is session
+    assert get_portal_session('http://localhost:8000/me') is not session
+    adapter = session.get_adapter(SOME_SERVER)
+    assert adapter._pool_maxsize == portal_network_access_module.DEFAULT_PORTAL_POOL_SIZE  # noQA - protected member
+    assert session.headers['Connection'] == 'keep-alive'
+
+    close_portal_sessions()
+    assert get_portal_session(SOME_SERVER) is not session
+
+
+def test_configure_portal_sessions():
+
+    session = get_portal_session(SOME_SERVER)
+    configure_portal_sessions(pool_size=3, keep_alive=False)
+    new_session = get_portal_session(SOME_SERVER)
+    assert new_session is not session
+    assert new_session.get_adapter(SOME_SERVER)._pool_maxsize == 3  # noQA - protected member
+    assert new_session.headers['Connection'] == 'close'
+
+    with raises_regexp(ValueError, "pool size must be a positive integer"):
+        configure_portal_sessions(pool_size=0)
+
+
+def test_portal_requests_use_session():
+
+    some_keypair = ('some-key', 'some-secret')
+    with mock.patch.object(requests.Session, "request", return_value=FakeResponse(200, json={})) as mock_request:
+        portal_request_get(SOME_SERVER + '/me', auth=some_keypair, headers={'a': 'b'})
+        [verb, url], kwargs = mock_request.call_args
+        assert (verb, url, kwargs['auth'], kwargs['headers']) == ('GET', SOME_SERVER + '/me', some_keypair, {'a': 'b'})
+        portal_request_post(SOME_SERVER + '/submit_for_ingestion', auth=some_keypair, data={})
+        [verb, url], kwargs = mock_request.call_args
+        assert (verb, url, kwargs['auth']) == ('POST', SOME_SERVER + '/submit_for_ingestion', some_keypair)
+    with mock.patch("requests.get") as mock_get:
+        with mock.patch.object(requests.Session, "request", return_value=FakeResponse(200, json={})):
+            portal_request_get(SOME_SERVER + '/me', auth=('some-key', 'some-secret'))
+        mock_get.assert_not_called()
+
+
+def test_portal_request_rejected_credentials(tmp_path):
+
+    configure_portal_cache(ttl=60, filename=str(tmp_path / "portal_cache.json"))
+    try:
+        cache = get_portal_cache()
+        some_keypair = ('some-key', 'some-secret')
+        cache.put(PortalCacheKind.USER_RECORD, SOME_SERVER, some_keypair, {'title': 'J Doe'})
+        cache.put(PortalCacheKind.HEALTH_PAGE, SOME_SERVER, some_keypair, {'beanstalk_env': 'some-env'})
+        with mock.patch.object(requests.Session, "request", return_value=FakeResponse(404)):
+            portal_request_get(SOME_SERVER + '/health?format=json', auth=some_keypair)
+        assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, some_keypair) == {'title': 'J Doe'}
+        # Once the server rejects the credentials, nothing cached for them is trusted.
+        with mock.patch.object(requests.Session, "request", return_value=FakeResponse(403)):
+            portal_request_get(SOME_SERVER + '/ingestion-submissions/some-uuid', auth=some_keypair)
+        assert cache.get(PortalCacheKind.USER_RECORD, SOME_SERVER, some_keypair) is None
+        assert cache.get(PortalCacheKind.HEALTH_PAGE, SOME_SERVER, some_keypair) is None
+    finally:
+        configure_portal_cache()
+
+
+def test_portal_metadata_post_and_patch():
+
+    some_item = {'filename': 'foo.fastq.gz'}
+    some_result = {'status': 'success', '@graph': [some_item]}
+
+    some_response = FakeResponse(200, json=some_result)
+    with mock.patch.object(requests.Session, "request", return_value=some_response) as mock_request:
+
+        assert portal_metadata_post(schema='FileOther', data=some_item, auth=SOME_AUTH) == some_result
+        [verb, url], kwargs = mock_request.call_args
+        assert verb == 'POST'
+        assert url == SOME_SERVER + '/FileOther'
+        assert json.loads(kwargs['data']) == some_item
+        assert kwargs['auth'] == ('some-key', 'some-secret')
+
+        assert portal_metadata_patch(uuid='some-uuid', data=some_item, auth=SOME_AUTH) == some_result
+        [verb, url], kwargs = mock_request.call_args
+        assert verb == 'PATCH'
+        assert url == SOME_SERVER + '/some-uuid'
+        assert json.loads(kwargs['data']) == some_item
+
+    with mock.patch.object(requests.Session, "request", return_value=FakeResponse(403, json={'status': 'error'})):
+        with raises_regexp(Exception, "Bad status code for PATCH request"):
+            portal_metadata_patch(uuid='some-uuid', data=some_item, auth=SOME_AUTH)
+
+
+def connection_refused():
+    return requests.exceptions.ConnectionError(MaxRetryError(None, SOME_SERVER, NewConnectionError(None, "refused")))
+
+
+def connection_reset():
+    return requests.exceptions.ConnectionError(ConnectionResetError(104, "Connection reset by peer"))
+
+
+def test_request_not_sent():
+
+    assert request_not_sent(connection_refused())
+    assert request_not_sent(requests.exceptions.ConnectTimeout("timed out"))
+    assert not request_not_sent(connection_reset())
+    assert not request_not_sent(requests.exceptions.ReadTimeout("timed out"))
+
+
+def test_portal_retry_policy():
+
+    policy = PortalRetryPolicy()
+    assert policy.is_retryable('GET', response=FakeResponse(503))
+    assert policy.is_retryable('PATCH', response=FakeResponse(502))
+    assert policy.is_retryable('patch', error=connection_reset())
+    assert not policy.is_retryable('GET', response=FakeResponse(404))
+    assert not policy.is_retryable('GET', error=ValueError("not a network error"))
+    # POSTs are retried only if the portal can't have acted on them.
+    assert not policy.is_retryable('POST', response=FakeResponse(502))
+    assert not policy.is_retryable('POST', error=connection_reset())
+    assert policy.is_retryable('POST', response=FakeResponse(429))
+    assert policy.is_retryable('POST', error=connection_refused())
+
+    with mock.patch.object(portal_network_access_module.random, "uniform", side_effect=lambda low, high: high):
+        assert [policy.delay(retry) for retry in range(7)] == [1, 2, 4, 8, 16, 30, 30]
+    response = FakeResponse(503)
+    response.headers = {'Retry-After': '7'}
+    assert policy.delay(0, response=response) == 7
+
+    with raises_regexp(ValueError, "must not be negative"):
+        PortalRetryPolicy(max_retries=-1)
+
+
+def test_portal_request_get_retries():
+
+    responses = [connection_reset(), FakeResponse(503), FakeResponse(200, json={'status': 'ok'})]
+
+    def fake_request(method, url, **kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    with mock.patch.object(requests.Session, "request", side_effect=fake_request) as mock_request:
+        with mock.patch.object(portal_network_access_module.time, "sleep") as mock_sleep:
+            response = portal_request_get(SOME_SERVER + '/ingestion-submissions/0123abcd-0123-4567-89ab-0123456789ab',
+                                          auth=('some-key', 'some-secret'))
+    assert response.json() == {'status': 'ok'}
+    assert mock_request.call_count == 3
+    assert mock_sleep.call_count == 2
+    assert get_portal_request_counts() == {
+        ('GET', '/ingestion-submissions/<uuid>'): {'requests': 1, 'retries': 2, 'failures': 0}
+    }
+
+
+def test_portal_request_retries_give_up():
+
+    configure_portal_retries(max_retries=2)
+    with mock.patch.object(requests.Session, "request", return_value=FakeResponse(502)) as mock_request:
+        with mock.patch.object(portal_network_access_module.time, "sleep"):
+            # After its retries, the last response is returned, for the caller to deal with.
+            assert portal_request_get(SOME_SERVER + '/me', auth=('some-key', 'some-secret')).status_code == 502
+            assert mock_request.call_count == 3
+            mock_request.reset_mock()
+            # A POST isn't retried, since the portal may have acted on it.
+            assert portal_request_post(SOME_SERVER + '/submit_for_ingestion', auth=('k', 's')).status_code == 502
+            assert mock_request.call_count == 1
+    assert get_portal_request_counts() == {
+        ('GET', '/me'): {'requests': 1, 'retries': 2, 'failures': 1},
+        ('POST', '/submit_for_ingestion'): {'requests': 1, 'retries': 0, 'failures': 1},
+    }
+
+    # Nor are requests retried once the time allowed for them would be up.
+    configure_portal_retries(max_elapsed=0.5)
+    clock = FakeClock()
+    with mock.patch.object(requests.Session, "request", side_effect=connection_refused()) as mock_request:
+        with mock.patch.object(portal_network_access_module.random, "uniform", return_value=0.4):
+            with clock.patched():
+                with raises_regexp(requests.exceptions.ConnectionError, "refused"):
+                    portal_request_post(SOME_SERVER + '/submit_for_ingestion', auth=('k', 's'))
+    assert mock_request.call_count == 2
+    assert clock.sleeps == [0.4]
+
+
+def test_portal_metadata_patch_retries():
+
+    some_item = {'filename': 'foo.fastq.gz'}
+    some_result = {'status': 'success', '@graph': [some_item]}
+    responses = [connection_reset(), FakeResponse(200, json=some_result)]
+
+    def fake_request(method, url, **kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    with mock.patch.object(requests.Session, "request", side_effect=fake_request):
+        with mock.patch.object(portal_network_access_module.time, "sleep"):
+            assert portal_metadata_patch(uuid='some-uuid', data=some_item, auth=SOME_AUTH) == some_result
+    assert get_portal_request_counts()[('PATCH', '/some-uuid')] == {'requests': 1, 'retries': 1, 'failures': 0}
+
+    configure_portal_retries(max_retries=0)
+    with mock.patch.object(requests.Session, "request", side_effect=connection_reset()):
+        with raises_regexp(Exception, "Error with PATCH request for .*/some-uuid: .*reset"):
+            portal_metadata_patch(uuid='some-uuid', data=some_item, auth=SOME_AUTH)
+
+
+def test_portal_request_retries_rewind_body():
+
+    bodies = []
+    responses = [FakeResponse(429), FakeResponse(200, json={'submission_id': 'some-uuid'})]
+
+    def fake_request(method, url, data, **kwargs):
+        bodies.append(data.read())
+        return responses.pop(0)
+
+    body = MultipartEncoder({'validate_only': False}, files={'datafile': io.BytesIO(b"some bundle")})
+    with mock.patch.object(requests.Session, "request", side_effect=fake_request):
+        with mock.patch.object(portal_network_access_module.time, "sleep"):
+            response = portal_request_post(SOME_SERVER + '/submit_for_ingestion', auth=('k', 's'), data=body)
+    assert response.json() == {'submission_id': 'some-uuid'}
+    assert len(bodies) == 2 and bodies[0] == bodies[1] and b"some bundle" in bodies[0]
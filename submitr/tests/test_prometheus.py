@@ -0,0 +1,104 @@
+import os
+
+from dcicutils.misc_utils import local_attrs
+
+from .. import metrics as metrics_module
+from ..metrics import configure_metrics, get_metrics_recorder
+from ..prometheus import Histogram, PrometheusExporter, format_labels, portal_endpoint
+
+
+SOME_UUID = '0123abcd-0123-4567-89ab-0123456789ab'
+
+
+def some_span(name, seconds=0.5, status='ok', **attributes):
+    return dict({'run': 'some-run', 'span': name, 'id': 1, 'parent': None, 'start': 0.0, 'seconds': seconds,
+                 'status': status, 'thread': 'MainThread'}, **attributes)
+
+
+def test_histogram():
+
+    histogram = Histogram([1, 2.5])
+    for value in [0.5, 1, 2, 10]:
+        histogram.observe(value)
+    assert histogram.lines('some_seconds', {'method': 'GET'}) == [
+        'some_seconds_bucket{method="GET",le="1"} 2',
+        'some_seconds_bucket{method="GET",le="2.5"} 3',
+        'some_seconds_bucket{method="GET",le="+Inf"} 4',
+        'some_seconds_sum{method="GET"} 13.5',
+        'some_seconds_count{method="GET"} 4',
+    ]
+
+
+def test_format_labels():
+
+    assert format_labels({}) == ""
+    assert format_labels({'endpoint': '/a"b\\c\nd'}) == '{endpoint="/a\\"b\\\\c\\nd"}'
+
+
+def test_portal_endpoint():
+
+    assert portal_endpoint(some_span('portal_get', url='http://server/me?format=json')) == '/me'
+    assert portal_endpoint(some_span('portal_get', url=f'http://server/ingestion-submissions/{SOME_UUID}/')) == (
+        '/ingestion-submissions/<uuid>'
+    )
+    assert portal_endpoint(some_span('portal_post_request', url='http://server')) == '/'
+    assert portal_endpoint(some_span('portal_post', schema='FileOther')) == '/FileOther'
+    assert portal_endpoint(some_span('portal_patch', uuid=SOME_UUID)) == '/<uuid>'
+
+
+def test_prometheus_exporter(tmp_path):
+
+    filename = str(tmp_path / "textfile" / "submitr.prom")
+    exporter = PrometheusExporter(filename, write_interval=3600)
+    exporter(some_span('upload', seconds=3, bytes=1000))
+    exporter(some_span('upload', seconds=30, status='error', bytes=2000))
+    exporter(some_span('upload_outcome', outcome='succeeded'))
+    exporter(some_span('upload_outcome', outcome='failed'))
+    exporter(some_span('upload_outcome', outcome='failed'))  # E.g., a file that couldn't get upload credentials
+    exporter(some_span('portal_patch', seconds=0.2, uuid=SOME_UUID))
+    exporter(some_span('portal_get', seconds=0.2, url=f'http://server/ingestion-submissions/{SOME_UUID}', retries=2))
+    exporter(some_span('poll'))
+    exporter(some_span('poll'))
+    exporter(some_span('resolve_server'))  # This isn't counted in any metric.
+    lines = exporter.text().splitlines()
+    assert 'submitr_upload_bytes_total 1000' in lines
+    assert 'submitr_upload_files_total{status="succeeded"} 1' in lines
+    assert 'submitr_upload_files_total{status="failed"} 2' in lines
+    assert 'submitr_upload_files_total{status="skipped"} 0' in lines
+    assert 'submitr_upload_seconds_bucket{le="5"} 1' in lines
+    assert 'submitr_upload_seconds_bucket{le="60"} 2' in lines
+    assert 'submitr_upload_seconds_sum 33' in lines
+    assert 'submitr_portal_request_seconds_count{method="PATCH",endpoint="/<uuid>"} 1' in lines
+    assert 'submitr_portal_request_seconds_count{method="GET",endpoint="/ingestion-submissions/<uuid>"} 1' in lines
+    assert 'submitr_portal_request_retries_total{method="GET",endpoint="/ingestion-submissions/<uuid>"} 2' in lines
+    assert 'submitr_submission_polls_total 2' in lines
+    assert '# TYPE submitr_upload_seconds histogram' in lines
+
+    # The file was written when the first span ended, but not again until the write interval is up...
+    with open(filename) as fp:
+        assert 'submitr_upload_bytes_total 1000' in fp.read().splitlines()
+    with open(filename) as fp:
+        assert 'submitr_submission_polls_total 0' in fp.read().splitlines()
+    # ... or a run of uploads (or of checks on a submission) ends.
+    exporter(some_span('uploads', seconds=40))
+    with open(filename) as fp:
+        assert 'submitr_submission_polls_total 2' in fp.read().splitlines()
+    assert os.listdir(str(tmp_path / "textfile")) == ["submitr.prom"]  # No temporary files are left behind.
+
+
+def test_configure_metrics_prometheus_file(tmp_path):
+
+    with local_attrs(metrics_module, _METRICS_RECORDER=None, _METRICS_CONFIGURED=False,
+                     DEFAULT_METRICS_FILE=None, DEFAULT_PROMETHEUS_FILE=None):
+        configure_metrics(prometheus_file=str(tmp_path / "submitr.prom"))
+        recorder = get_metrics_recorder()
+        assert recorder.filename is None  # Spans aren't written as JSON lines.
+        [exporter] = recorder.listeners
+        assert isinstance(exporter, PrometheusExporter)
+        assert exporter.filename == str(tmp_path / "submitr.prom")
+        with metrics_module.metrics_span('poll'):
+            pass
+        assert exporter.polls == 1
+        assert os.path.exists(str(tmp_path / "submitr.prom"))
+        configure_metrics()
+        assert get_metrics_recorder() is None
@@ -173,7 +173,7 @@ def test_c4_383_regression_action():
             with mock.patch.object(os.path, "curdir", current_dir):
                 with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                     with mock.patch.object(submission_module, "upload_file_to_uuid") as mock_upload_file_to_uuid:
-                        with mock.patch("requests.get") as mock_requests_get:
+                        with mock.patch.object(submission_module, "portal_request_get") as mock_requests_get:
 
                             def mocked_requests_get(url, *args, **kwargs):
                                 ignored(args, kwargs)
@@ -207,3 +207,94 @@ def test_c4_383_regression_action():
                                                                             filename=joined_filename,
                                                                             uuid=SAMPLE_UPLOAD_INFO[-1]['uuid'])
                                 assert output == []
+
+
+def test_resume_uploads_script_no_cache():
+
+    with mock.patch.object(resume_uploads_module, "resume_uploads"):
+        with mock.patch.object(resume_uploads_module, "configure_portal_cache") as mock_configure_portal_cache:
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid'])
+            mock_configure_portal_cache.assert_not_called()
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid', '--no-cache'])
+            mock_configure_portal_cache.assert_called_once_with(enabled=False)
+
+
+def test_resume_uploads_script_clear_cache():
+
+    with mock.patch.object(resume_uploads_module, "resume_uploads") as mock_resume_uploads:
+        with mock.patch.object(resume_uploads_module, "clear_portal_cache") as mock_clear_portal_cache:
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid'])
+            mock_clear_portal_cache.assert_not_called()
+            mock_resume_uploads.reset_mock()
+            # The cache is cleared before anything uses it.
+            mock_clear_portal_cache.side_effect = lambda: mock_resume_uploads.assert_not_called()
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid', '--clear-cache'])
+            mock_clear_portal_cache.assert_called_once_with()
+
+
+def test_resume_uploads_script_plan():
+
+    with mock.patch.object(resume_uploads_module, "resume_uploads") as mock_resume_uploads:
+        with system_exit_expected(exit_code=0):
+            resume_uploads_main(['some-guid', '--plan'])
+        assert mock_resume_uploads.call_args.kwargs['plan'] is True
+
+
+def test_resume_uploads_script_skip_existing():
+
+    with mock.patch.object(resume_uploads_module, "resume_uploads") as mock_resume_uploads:
+        with system_exit_expected(exit_code=0):
+            resume_uploads_main(['some-guid'])
+        assert mock_resume_uploads.call_args.kwargs['skip_existing'] is False
+        with system_exit_expected(exit_code=0):
+            resume_uploads_main(['some-guid', '--skip-existing'])
+        assert mock_resume_uploads.call_args.kwargs['skip_existing'] is True
+
+
+def test_resume_uploads_script_max_bandwidth():
+
+    with mock.patch.object(resume_uploads_module, "resume_uploads"):
+        with mock.patch.object(resume_uploads_module, "configure_bandwidth_limit") as mock_configure_bandwidth_limit:
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid'])
+            mock_configure_bandwidth_limit.assert_not_called()
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid', '--max-bandwidth', '400MB/s'])
+            mock_configure_bandwidth_limit.assert_called_once_with('400MB/s', shared=False)
+            mock_configure_bandwidth_limit.reset_mock()
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid', '--max-bandwidth', '1GB/s', '--share-bandwidth'])
+            mock_configure_bandwidth_limit.assert_called_once_with('1GB/s', shared=True)
+
+
+def test_resume_uploads_script_upload_order():
+
+    with mock.patch.object(resume_uploads_module, "resume_uploads") as mock_resume_uploads:
+        with system_exit_expected(exit_code=0):
+            resume_uploads_main(['some-guid'])
+        assert mock_resume_uploads.call_args.kwargs['upload_order'] is None
+        with system_exit_expected(exit_code=0):
+            resume_uploads_main(['some-guid', '--upload-order', 'smallest-first'])
+        assert mock_resume_uploads.call_args.kwargs['upload_order'] == 'smallest-first'
+        with system_exit_expected(exit_code=2):
+            resume_uploads_main(['some-guid', '--upload-order', 'random'])
+
+
+def test_resume_uploads_script_metrics_file():
+
+    with mock.patch.object(resume_uploads_module, "resume_uploads"):
+        with mock.patch.object(resume_uploads_module, "configure_metrics") as mock_configure_metrics:
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid'])
+            mock_configure_metrics.assert_not_called()
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid', '--metrics-file', 'metrics.jsonl'])
+            mock_configure_metrics.assert_called_once_with('metrics.jsonl', prometheus_file=None)
+            mock_configure_metrics.reset_mock()
+            with system_exit_expected(exit_code=0):
+                resume_uploads_main(['some-guid', '--prometheus-file', 'submitr.prom'])
+            mock_configure_metrics.assert_called_once_with(None, prometheus_file='submitr.prom')
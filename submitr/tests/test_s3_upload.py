@@ -0,0 +1,353 @@
+import datetime
+import pytest
+
+from dcicutils.qa_utils import raises_regexp
+from unittest import mock
+
+from .. import s3_upload as s3_upload_module
+from ..s3_upload import (
+    MAX_PARTS, MIN_PART_SIZE, S3UploadEngine, UploadClient, credentials_expiration, credentials_expire_soon,
+    error_code, parse_upload_url, sse_args,
+)
+from ..upload_journal import UploadJournal
+
+
+SOME_BUCKET = 'some-bucket'
+SOME_KEY = 'some-uuid/some-file.fastq.gz'
+SOME_UPLOAD_CREDENTIALS = {
+    'AccessKeyId': 'some-access-key',
+    'SecretAccessKey': 'some-secret',
+    'SessionToken': 'some-session-token',
+    'upload_url': f's3://{SOME_BUCKET}/{SOME_KEY}',
+}
+SOME_S3_ENCRYPT_KEY_ID = 'some/encrypt/key'
+
+
+class NoSuchUploadError(Exception):
+    """Like the botocore ClientError S3 gives for a multipart upload it has no record of."""
+    response = {'Error': {'Code': 'NoSuchUpload'}}
+
+
+class ExpiredTokenError(Exception):
+    """Like the botocore ClientError S3 gives for a request made with credentials that have expired."""
+    response = {'Error': {'Code': 'ExpiredToken'}}
+
+
+class FakeS3Client:
+    """Records the S3 calls an S3UploadEngine makes, storing uploaded content so it can be checked."""
+
+    def __init__(self, fail_on_part=None, parts=None, forgotten_uploads=False, expire_on_part=None):
+        self.fail_on_part = fail_on_part
+        self.expire_on_part = expire_on_part
+        self.forgotten_uploads = forgotten_uploads
+        self.objects = {}
+        self.parts = dict(parts or {})
+        self.calls = []
+        self.sent_parts = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):  # noQA - argument names are dictated by boto3
+        self.calls.append(('put_object', kwargs))
+        self.objects[(Bucket, Key)] = Body.read()
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):  # noQA - argument names are dictated by boto3
+        self.calls.append(('create_multipart_upload', kwargs))
+        return {'UploadId': 'some-upload-id'}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):  # noQA - argument names are dictated by boto3
+        assert UploadId == 'some-upload-id'
+        if PartNumber == self.fail_on_part:
+            raise ConnectionResetError("Simulated network failure.")
+        if self.expire_on_part and PartNumber >= self.expire_on_part:
+            raise ExpiredTokenError("The provided token has expired.")
+        self.sent_parts.append(PartNumber)
+        self.parts[PartNumber] = Body
+        return {'ETag': f'"etag-{PartNumber}"'}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):  # noQA - argument names are dictated by boto3
+        if self.forgotten_uploads:
+            raise NoSuchUploadError()
+        part_numbers = [n for n in sorted(self.parts) if n > PartNumberMarker]
+        # Just one part per page, to exercise paging
+        return {'Parts': [{'PartNumber': n, 'ETag': f'"etag-{n}"'} for n in part_numbers[:1]],
+                'IsTruncated': len(part_numbers) > 1,
+                'NextPartNumberMarker': part_numbers[0] if part_numbers else None}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):  # noQA - names dictated by boto3
+        parts = MultipartUpload['Parts']
+        assert [part['PartNumber'] for part in parts] == sorted(self.parts)
+        assert all(part['ETag'] == f'"etag-{part["PartNumber"]}"' for part in parts)
+        self.calls.append(('complete_multipart_upload', UploadId))
+        self.objects[(Bucket, Key)] = b"".join(self.parts[n] for n in sorted(self.parts))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):  # noQA - argument names are dictated by boto3
+        self.calls.append(('abort_multipart_upload', UploadId))
+
+
+def test_parse_upload_url():
+
+    assert parse_upload_url('s3://some-bucket/some/key.txt') == ('some-bucket', 'some/key.txt')
+
+    for bad_url in ['some-url', 'https://some-bucket/some/key.txt', 's3://some-bucket', 's3:///some/key.txt']:
+        with raises_regexp(ValueError, "Not a valid S3 upload URL"):
+            parse_upload_url(bad_url)
+
+
+def test_error_code():
+
+    assert error_code(NoSuchUploadError()) == 'NoSuchUpload'
+    assert error_code(RuntimeError("no response")) is None
+
+
+def test_sse_args():
+
+    assert sse_args(None) == {}
+    assert sse_args('') == {}
+    assert sse_args(SOME_S3_ENCRYPT_KEY_ID) == {'ServerSideEncryption': 'aws:kms',
+                                                'SSEKMSKeyId': SOME_S3_ENCRYPT_KEY_ID}
+
+
+def test_s3_upload_engine_settings():
+
+    engine = S3UploadEngine(part_size='8MB', part_concurrency=3)
+    assert engine.part_size == 8 * 1024 ** 2
+    assert engine.part_concurrency == 3
+
+    # Small files use the configured part size, but enormous ones grow it to stay within MAX_PARTS.
+    assert engine.compute_part_size(1) == engine.part_size
+    assert engine.compute_part_size(engine.part_size * MAX_PARTS) == engine.part_size
+    assert engine.compute_part_size(engine.part_size * MAX_PARTS + 1) == engine.part_size + 1
+
+    with raises_regexp(ValueError, "part size must be at least"):
+        S3UploadEngine(part_size=MIN_PART_SIZE - 1)
+
+    with raises_regexp(ValueError, "part concurrency must be a positive integer"):
+        S3UploadEngine(part_concurrency=-1)
+
+    # A local S3-compatible service is addressed by path, since it has no hostname for each bucket.
+    engine = S3UploadEngine(endpoint_url='http://127.0.0.1:9000')
+    client = engine.make_client(SOME_UPLOAD_CREDENTIALS)
+    assert client.meta.endpoint_url == 'http://127.0.0.1:9000'
+    assert client.meta.config.s3['addressing_style'] == 'path'
+
+
+def test_s3_upload_engine_environment_settings():
+
+    with mock.patch.dict("os.environ", {'SUBMITR_UPLOAD_PART_SIZE': '64MB', 'SUBMITR_UPLOAD_PART_CONCURRENCY': '3'}):
+        engine = S3UploadEngine()
+    assert engine.part_size == 64 * 1024 ** 2
+    assert engine.part_concurrency == 3
+
+    # A bad setting is only noticed (and named) when an engine is made, not when the module is imported.
+    with mock.patch.dict("os.environ", {'SUBMITR_UPLOAD_PART_SIZE': 'lots'}):
+        with raises_regexp(ValueError, "The value of SUBMITR_UPLOAD_PART_SIZE is not valid: 'lots'"):
+            S3UploadEngine()
+    with mock.patch.dict("os.environ", {'SUBMITR_UPLOAD_PART_CONCURRENCY': 'many'}):
+        with raises_regexp(ValueError, "The value of SUBMITR_UPLOAD_PART_CONCURRENCY is not valid: 'many'"):
+            S3UploadEngine()
+
+
+def test_s3_upload_engine_get_client():
+
+    engine = S3UploadEngine()
+    other_credentials = dict(SOME_UPLOAD_CREDENTIALS, SessionToken='some-other-session-token')
+    client = engine.get_client(SOME_UPLOAD_CREDENTIALS)
+    assert engine.get_client(dict(SOME_UPLOAD_CREDENTIALS, upload_url='s3://some-bucket/other-key')) is client
+    assert engine.get_client(other_credentials) is not client
+    assert client._request_signer._credentials.token == 'some-session-token'  # noQA - a protected member
+
+    # Only so many clients are kept.
+    with mock.patch.object(s3_upload_module, "MAX_CACHED_CLIENTS", 1):
+        with mock.patch.object(engine, "make_client", side_effect=lambda credentials: object()):
+            engine.get_client(dict(SOME_UPLOAD_CREDENTIALS, SessionToken='yet-another-session-token'))
+            assert engine.get_client(SOME_UPLOAD_CREDENTIALS) is not client
+
+
+@pytest.mark.parametrize("s3_encrypt_key_id", [None, SOME_S3_ENCRYPT_KEY_ID])
+def test_s3_upload_engine_small_file(tmp_path, s3_encrypt_key_id):
+
+    path = tmp_path / "small.fastq"
+    path.write_bytes(b"@read1\nACGT\n+\nIIII\n")
+    client = FakeS3Client()
+    engine = S3UploadEngine()
+    with mock.patch.object(engine, "make_client", return_value=client):
+        engine.upload_file(str(path), upload_credentials=SOME_UPLOAD_CREDENTIALS, s3_encrypt_key_id=s3_encrypt_key_id)
+    assert client.objects == {(SOME_BUCKET, SOME_KEY): path.read_bytes()}
+    assert client.calls == [('put_object', sse_args(s3_encrypt_key_id))]
+
+
+@pytest.mark.parametrize("part_concurrency", [1, 4])
+def test_s3_upload_engine_multipart(tmp_path, part_concurrency):
+
+    path = tmp_path / "large.bam"
+    content = bytes(range(256)) * (MIN_PART_SIZE * 2 // 256 + 7)  # Just over 2 parts, so 3 in all
+    path.write_bytes(content)
+    client = FakeS3Client()
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=part_concurrency)
+    with mock.patch.object(engine, "make_client", return_value=client):
+        engine.upload_file(str(path), upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                           s3_encrypt_key_id=SOME_S3_ENCRYPT_KEY_ID)
+    assert sorted(client.parts) == [1, 2, 3]
+    assert client.objects == {(SOME_BUCKET, SOME_KEY): content}
+    assert client.calls == [('create_multipart_upload', sse_args(SOME_S3_ENCRYPT_KEY_ID)),
+                            ('complete_multipart_upload', 'some-upload-id')]
+
+
+def test_s3_upload_engine_bandwidth_limit(tmp_path):
+
+    path = tmp_path / "large.bam"
+    content = b"x" * (MIN_PART_SIZE * 2 + 7)
+    path.write_bytes(content)
+    bandwidth_limiter = mock.MagicMock()
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, bandwidth_limiter=bandwidth_limiter)
+    assert engine.bandwidth_limiter is bandwidth_limiter
+    with mock.patch.object(engine, "make_client", return_value=FakeS3Client()):
+        engine.upload_file(str(path), upload_credentials=SOME_UPLOAD_CREDENTIALS)
+    # Each part is paid for once, however often botocore reads it.
+    assert sorted(c.args[0] for c in bandwidth_limiter.consume.call_args_list) == [7, MIN_PART_SIZE, MIN_PART_SIZE]
+
+    # Without a limiter of its own, the engine uses the shared one, if any.
+    with mock.patch.object(s3_upload_module, "get_bandwidth_limiter", return_value=None):
+        assert S3UploadEngine().bandwidth_limiter is None
+        with mock.patch.object(S3UploadEngine, "make_client", return_value=FakeS3Client()):
+            S3UploadEngine().upload_file(str(path), upload_credentials=SOME_UPLOAD_CREDENTIALS)  # No limit, no waiting
+
+
+def test_s3_upload_engine_multipart_failure(tmp_path):
+
+    path = tmp_path / "large.bam"
+    path.write_bytes(b"x" * (MIN_PART_SIZE * 2 + 1))
+    client = FakeS3Client(fail_on_part=2)
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=1)
+    with mock.patch.object(engine, "make_client", return_value=client):
+        with raises_regexp(RuntimeError, "Upload failed: ConnectionResetError: Simulated network failure."):
+            engine.upload_file(str(path), upload_credentials=SOME_UPLOAD_CREDENTIALS)
+    assert client.objects == {}
+    assert client.calls == [('create_multipart_upload', {}),
+                            ('abort_multipart_upload', 'some-upload-id')]
+
+
+def test_s3_upload_engine_multipart_resume(tmp_path):
+
+    path = tmp_path / "large.bam"
+    content = bytes(range(256)) * (MIN_PART_SIZE * 3 // 256 + 7)  # Just over 3 parts, so 4 in all
+    path.write_bytes(content)
+    path = str(path)
+    journal = UploadJournal(str(tmp_path / "upload_journal.json"))
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=1)
+
+    # The first attempt fails part way through, but its progress is kept rather than aborted.
+    client = FakeS3Client(fail_on_part=3)
+    with mock.patch.object(engine, "make_client", return_value=client):
+        with raises_regexp(RuntimeError, "Upload failed"):
+            engine.upload_file(path, upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                               checkpoint=journal.checkpoint(uuid='some-uuid', path=path))
+    assert client.calls == [('create_multipart_upload', {})]
+    assert client.sent_parts[:2] == [1, 2]
+    already_sent = set(client.sent_parts)  # Part 4 may or may not have been sent before the failure was noticed.
+
+    # The next attempt (even in a later run) sends only the missing parts.
+    journal = UploadJournal(journal.filename)
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=1)
+    client = FakeS3Client(parts=client.parts)
+    with mock.patch.object(engine, "make_client", return_value=client):
+        engine.upload_file(path, upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                           checkpoint=journal.checkpoint(uuid='some-uuid', path=path))
+    assert client.calls == [('complete_multipart_upload', 'some-upload-id')]
+    assert sorted(client.sent_parts) == sorted({1, 2, 3, 4} - already_sent)
+    assert client.objects == {(SOME_BUCKET, SOME_KEY): content}
+    assert journal.get_entry(uuid='some-uuid', path=path)['completed'] is True
+
+    # Once complete, uploading again starts afresh.
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=1)
+    client = FakeS3Client()
+    with mock.patch.object(engine, "make_client", return_value=client):
+        engine.upload_file(path, upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                           checkpoint=journal.checkpoint(uuid='some-uuid', path=path))
+    assert client.calls[0] == ('create_multipart_upload', {})
+
+
+def test_s3_upload_engine_multipart_resume_forgotten(tmp_path):
+
+    path = tmp_path / "large.bam"
+    path.write_bytes(b"x" * (MIN_PART_SIZE * 2 + 1))
+    path = str(path)
+    journal = UploadJournal(str(tmp_path / "upload_journal.json"))
+    checkpoint = journal.checkpoint(uuid='some-uuid', path=path)
+    checkpoint.start(bucket=SOME_BUCKET, key=SOME_KEY, upload_id='some-old-upload-id', part_size=MIN_PART_SIZE)
+    checkpoint.record_part(1, '"etag-1"')
+
+    # If S3 no longer knows about the journaled upload, a new one is started.
+    client = FakeS3Client(forgotten_uploads=True)
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=1)
+    with mock.patch.object(engine, "make_client", return_value=client):
+        engine.upload_file(path, upload_credentials=SOME_UPLOAD_CREDENTIALS, checkpoint=checkpoint)
+    assert client.calls == [('create_multipart_upload', {}), ('complete_multipart_upload', 'some-upload-id')]
+    assert client.sent_parts == [1, 2, 3]
+
+
+def test_credentials_expiration():
+
+    expected = datetime.datetime(2030, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+    assert credentials_expiration({'Expiration': '2030-01-02T03:04:05Z'}) == expected
+    assert credentials_expiration({'Expiration': '2030-01-02T03:04:05+00:00'}) == expected
+    assert credentials_expiration({'Expiration': '2030-01-02 03:04:05'}) == expected  # Naive times are UTC.
+    assert credentials_expiration({'Expiration': expected}) == expected
+    assert credentials_expiration({'Expiration': 'soon'}) is None
+    assert credentials_expiration({}) is None
+
+    in_a_minute = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=1)
+    assert credentials_expire_soon({'Expiration': in_a_minute.isoformat()})
+    assert not credentials_expire_soon({'Expiration': in_a_minute.isoformat()}, margin=0)
+    assert credentials_expire_soon({'Expiration': '2000-01-01T00:00:00Z'}, margin=0)
+    assert not credentials_expire_soon({})
+
+
+def test_upload_client_refreshes_expiring_credentials():
+
+    engine = S3UploadEngine()
+    in_a_minute = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=1)
+    expiring_credentials = dict(SOME_UPLOAD_CREDENTIALS, Expiration=in_a_minute.isoformat())
+    fresh_credentials = dict(SOME_UPLOAD_CREDENTIALS, SessionToken='some-fresh-token', Expiration='2999-01-01T00:00Z')
+    with mock.patch.object(engine, "make_client", side_effect=lambda credentials: credentials['SessionToken']):
+        # Without a way to refresh them, the credentials are used until they're rejected.
+        assert UploadClient(engine, expiring_credentials).get() == 'some-session-token'
+        # Otherwise, they're refreshed before they expire, and then only when the fresh ones are about to.
+        refresh_credentials = mock.MagicMock(return_value=fresh_credentials)
+        client = UploadClient(engine, expiring_credentials, refresh_credentials=refresh_credentials)
+        assert client.get() == 'some-fresh-token'
+        assert client.get() == 'some-fresh-token'
+        assert client.refreshes == 1
+        assert client.upload_credentials == fresh_credentials
+
+        client = UploadClient(engine, expiring_credentials,
+                              refresh_credentials=lambda: dict(fresh_credentials, upload_url='s3://other-bucket/key'))
+        with raises_regexp(RuntimeError, "Refreshed upload credentials are for s3://other-bucket/key"):
+            client.get()
+
+
+def test_s3_upload_engine_multipart_refresh_credentials(tmp_path):
+
+    path = tmp_path / "large.bam"
+    content = bytes(range(256)) * (MIN_PART_SIZE * 2 // 256 + 7)  # Just over 2 parts, so 3 in all
+    path.write_bytes(content)
+    stale_client = FakeS3Client(expire_on_part=2)
+    fresh_client = FakeS3Client()
+    fresh_client.parts = stale_client.parts  # The same upload, with other credentials
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=1)
+    refresh_credentials = mock.MagicMock(return_value=dict(SOME_UPLOAD_CREDENTIALS, SessionToken='some-fresh-token'))
+    with mock.patch.object(engine, "make_client", side_effect=[stale_client, fresh_client]):
+        engine.upload_file(str(path), upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                           refresh_credentials=refresh_credentials)
+    refresh_credentials.assert_called_once_with()
+    # The upload carried on, rather than starting again.
+    assert stale_client.sent_parts == [1]
+    assert fresh_client.sent_parts == [2, 3]
+    assert stale_client.calls == [('create_multipart_upload', {})]
+    assert fresh_client.calls == [('complete_multipart_upload', 'some-upload-id')]
+    assert fresh_client.objects == {(SOME_BUCKET, SOME_KEY): content}
+
+    # Without a way to refresh them, expired credentials are reported as such.
+    engine = S3UploadEngine(part_size=MIN_PART_SIZE, part_concurrency=1)
+    with mock.patch.object(engine, "make_client", return_value=FakeS3Client(expire_on_part=2)):
+        with raises_regexp(RuntimeError, "Upload failed because its upload credentials expired"):
+            engine.upload_file(str(path), upload_credentials=SOME_UPLOAD_CREDENTIALS)
@@ -0,0 +1,115 @@
+import json
+import os
+import pytest
+import re
+import subprocess
+import sys
+
+from .. import scripts as scripts_module
+
+
+SCRIPT_NAMES = sorted(os.path.splitext(filename)[0]
+                      for filename in os.listdir(os.path.dirname(scripts_module.__file__))
+                      if filename.endswith('.py') and not filename.startswith('_'))
+
+# None of these should be imported just to start a command (or show its --help).
+SLOW_MODULES = [
+    'boto3', 'botocore', 'openpyxl', 'requests',
+    'dcicutils.command_utils', 'dcicutils.creds_utils', 'dcicutils.ff_utils', 'dcicutils.misc_utils',
+    'dcicutils.s3_utils',
+    'submitr.s3_upload', 'submitr.submission', 'submitr.utils',
+]
+
+# This prints the modules imported by running the given code in a fresh interpreter, even if it exits.
+LIST_MODULES = """
+import json, sys
+try:
+    {code}
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)))
+"""
+
+# This runs the given code, as LIST_MODULES does, and then imports submitr.submission, which is slow to import,
+# so that how long the code takes to import things can be compared with that (see startup_import_fraction).
+IMPORT_SUBMISSION_AFTER = """
+import sys
+try:
+    {code}
+except SystemExit:
+    pass
+import submitr.submission
+"""
+
+# The most that starting a command (or showing its --help) may take to import, as a fraction of how long
+# importing submitr.submission takes in the same process. This is generous, since a command only imports
+# submitr.base and a few other quick modules, and it's a fraction so that it's the same on slow machines.
+STARTUP_IMPORT_FRACTION = 0.5
+
+# A line of python -X importtime output: the microseconds taken by the module itself, and with what it imported,
+# then (indented by how deeply it was imported) its name.
+IMPORT_TIME_LINE = re.compile(r'^import time:\s*([0-9]+) [|]\s*([0-9]+) [|] ( *)(\S+)$')
+
+
+def modules_imported(code):
+    """
+    Runs the given (one-line) Python code in a fresh python process, returning the names of all the modules imported.
+    """
+    result = subprocess.run([sys.executable, '-c', LIST_MODULES.format(code=code)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.dirname(scripts_module.__file__))))
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def startup_import_fraction(code):
+    """
+    Runs the given (one-line) Python code in a fresh python process with python -X importtime, and then imports
+    submitr.submission, returning how long the code took to import things, as a fraction of how long importing
+    submitr.submission took after that.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_SUBMISSION_AFTER.format(code=code)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.dirname(scripts_module.__file__))))
+    # Only the modules imported directly (rather than by other modules) count, since the others are included
+    # in their cumulative times. Those imported before site (and site itself) are imported by python itself.
+    top_level = []
+    for line in result.stderr.splitlines():
+        matched = IMPORT_TIME_LINE.match(line)
+        if matched and not matched.group(3):
+            top_level.append((matched.group(4), int(matched.group(2))))
+    names = [name for name, _ in top_level]
+    start = names.index('site') + 1 if 'site' in names else 0
+    end = names.index('submitr.submission')
+    return sum(cumulative for _, cumulative in top_level[start:end]) / top_level[end][1]
+
+
+def test_script_names():
+
+    assert 'check_submission' in SCRIPT_NAMES
+    assert 'submit_metadata_bundle' in SCRIPT_NAMES
+
+
+@pytest.mark.static
+@pytest.mark.parametrize("script_name", SCRIPT_NAMES)
+def test_script_imports(script_name):
+
+    module_name = f"submitr.scripts.{script_name}"
+    modules = modules_imported(f"import {module_name}")
+    assert module_name in modules
+    slow_modules_imported = [module for module in SLOW_MODULES if module in modules]
+    assert slow_modules_imported == [], f"{module_name} should not import {slow_modules_imported} when imported."
+    fraction = startup_import_fraction(f"import {module_name}")
+    assert fraction < STARTUP_IMPORT_FRACTION, (f"{module_name} took {fraction:.0%} as long to import"
+                                                f" as submitr.submission.")
+
+
+def test_script_help_imports():
+
+    modules = modules_imported("import runpy; sys.argv = ['check-submission', '--help'];"
+                               " runpy.run_module('submitr.scripts.check_submission', run_name='__main__')")
+    assert 'submitr.base' in modules  # The script itself runs as __main__.
+    assert [module for module in SLOW_MODULES if module in modules] == []
+    fraction = startup_import_fraction("import runpy; sys.argv = ['check-submission', '--help'];"
+                                       " runpy.run_module('submitr.scripts.check_submission', run_name='__main__')")
+    assert fraction < STARTUP_IMPORT_FRACTION, (f"check-submission --help took {fraction:.0%} as long to import"
+                                                f" as submitr.submission.")
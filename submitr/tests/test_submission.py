@@ -1,24 +1,41 @@
 import contextlib
 import datetime
+import hashlib
 import io
+import json
 import os
 import platform
 import pytest
 import re
 
+from concurrent.futures import ThreadPoolExecutor
+
 from dcicutils import command_utils as command_utils_module
 from dcicutils.common import APP_CGAP, APP_FOURFRONT, APP_SMAHT
+from dcicutils.exceptions import InvalidParameterError
 from dcicutils.misc_utils import ignored, ignorable, local_attrs, override_environ, NamedObject
 from dcicutils.qa_utils import ControlledTime, MockFileSystem, raises_regexp, printed_output
 from dcicutils.s3_utils import HealthPageKey
 from typing import List, Dict
 from unittest import mock
 
+from .testing_helpers import system_exit_expected
 from .test_utils import shown_output
 from .test_upload_item_data import TEST_ENCRYPT_KEY
 from .. import submission as submission_module
+from .. import checksums as checksums_module
+from .. import metrics as metrics_module
+from .. import upload_scheduling as upload_scheduling_module
+from ..bandwidth import TokenBucket
 from ..base import PRODUCTION_ENV, PRODUCTION_SERVER, KEY_MANAGER, DEFAULT_ENV_VAR
+from ..checksums import ChecksumCache, FileChecksummer
 from ..exceptions import PortalPermissionError
+from ..metrics import MetricsRecorder
+from ..multipart import MultipartEncoder
+from ..portal_cache import configure_portal_cache
+from ..s3_upload import UploadMode
+from ..upload_journal import UploadJournal
+from ..upload_throughput import UploadThroughputHistory
 from ..submission import (
     SERVER_REGEXP, PROGRESS_CHECK_INTERVAL, ATTEMPTS_BEFORE_TIMEOUT,
     get_defaulted_institution, get_defaulted_project, do_any_uploads, do_uploads, show_upload_info, show_upload_result,
@@ -26,15 +43,18 @@ from ..submission import (
     resolve_server, resume_uploads, show_section, submit_any_ingestion,
     upload_file_to_uuid, upload_item_data,
     get_s3_encrypt_key_id, get_s3_encrypt_key_id_from_health_page, running_on_windows_native,
-    search_for_file, UploadMessageWrapper, upload_extra_files,
+    search_for_file, UploadMessageWrapper, upload_extra_files, UploadStatus, UploadFolderIndex,
     _resolve_app_args,  # noQA - yes, a protected member, but we still need to test it
     _post_files_data,  # noQA - again, testing a protected member
     _check_ingestion_progress,  # noQA - again, testing a protected member
+    _old_protocol_supported, _post_submission,  # noQA - again, testing protected members
     get_defaulted_lab, get_defaulted_award, SubmissionProtocol, compute_file_post_data,
     upload_file_to_new_uuid, compute_s3_submission_post_data, GENERIC_SCHEMA_TYPE, DEFAULT_APP, summarize_submission,
     get_defaulted_submission_centers, get_defaulted_consortia, do_app_arg_defaulting, check_submit_ingestion,
+    get_polling_strategy, monitor_submit_ingestions, plan_uploads, show_upload_plan, file_already_uploaded,
+    UploadBatch, check_bandwidth_limit_supported,
 )
-from ..utils import FakeResponse
+from ..utils import FakeResponse, PollingStrategy
 
 
 SOME_INGESTION_TYPE = 'metadata_bundle'
@@ -174,6 +194,13 @@ def script_dont_catch_errors():
     yield
 
 
+@pytest.fixture(autouse=True)
+def no_known_protocols():
+    # Which servers have the old submission protocol is remembered, but each test has its own (fake) servers.
+    with mock.patch.dict(submission_module._OLD_PROTOCOL_SUPPORT, clear=True):  # noQA - protected member
+        yield
+
+
 def test_script_dont_catch_errors():  # test that errors pass through dont_catch_errors
     with pytest.raises(AssertionError):
         with script_dont_catch_errors():
@@ -292,6 +319,16 @@ def test_resolve_server():
                                     resolve_server(server=orchestrated_server, env=None))  # non-fourfront environments
 
 
+def portal_get(*args, **kwargs):
+    """Patches the portal GET requests made by the submission module."""
+    return mock.patch.object(submission_module, "portal_request_get", *args, **kwargs)
+
+
+def portal_post(*args, **kwargs):
+    """Patches the portal POST requests made by the submission module."""
+    return mock.patch.object(submission_module, "portal_request_post", *args, **kwargs)
+
+
 def make_user_record(title=SOME_USER_TITLE,
                      contact_email=SOME_USER_EMAIL,
                      **kwargs):
@@ -314,26 +351,45 @@ def test_get_user_record():
             return FakeResponse(status_code=200, json={'title': SOME_USER_TITLE, 'contact_email': SOME_USER_EMAIL})
         return mocked_get
 
-    with mock.patch("requests.get", return_value=FakeResponse(401, content='["not dictionary"]')):
+    with portal_get(return_value=FakeResponse(401, content='["not dictionary"]')):
         with pytest.raises(PortalPermissionError):
             get_user_record(server="http://localhost:12345", auth=None)
 
-    with mock.patch("requests.get", make_mocked_get(auth_failure_code=401)):
+    with portal_get(make_mocked_get(auth_failure_code=401)):
         with pytest.raises(PortalPermissionError):
             get_user_record(server="http://localhost:12345", auth=None)
 
-    with mock.patch("requests.get", make_mocked_get(auth_failure_code=403)):
+    with portal_get(make_mocked_get(auth_failure_code=403)):
         with pytest.raises(PortalPermissionError):
             get_user_record(server="http://localhost:12345", auth=None)
 
-    with mock.patch("requests.get", make_mocked_get()):
+    with portal_get(make_mocked_get()):
         get_user_record(server="http://localhost:12345", auth=SOME_AUTH)
 
-    with mock.patch("requests.get", lambda *x, **y: FakeResponse(status_code=400)):
+    with portal_get(lambda *x, **y: FakeResponse(status_code=400)):
         with pytest.raises(Exception):  # Body is not JSON
             get_user_record(server="http://localhost:12345", auth=SOME_AUTH)
 
 
+def test_get_user_record_cached(tmp_path):
+
+    configure_portal_cache(ttl=60, filename=str(tmp_path / "portal_cache.json"))
+    try:
+        some_user_record = {'title': SOME_USER_TITLE, 'contact_email': SOME_USER_EMAIL}
+        with portal_get(return_value=FakeResponse(status_code=200, json=some_user_record)) as mock_get:
+            for _ in range(2):
+                with shown_output() as shown:
+                    assert get_user_record(server="http://localhost:12345", auth=SOME_AUTH) == some_user_record
+                    assert shown.lines == [f"The server http://localhost:12345 recognizes you as:"
+                                           f" {SOME_USER_TITLE} <{SOME_USER_EMAIL}>"]
+            assert mock_get.call_count == 1
+        with portal_get(return_value=FakeResponse(401, json={'Title': 'Not logged in.'})):
+            with pytest.raises(PortalPermissionError):  # Other credentials aren't vouched for by the cache
+                get_user_record(server="http://localhost:12345", auth=('my-key-id', 'other-secret'))
+    finally:
+        configure_portal_cache()
+
+
 def test_get_defaulted_institution():
 
     assert get_defaulted_institution(institution=SOME_INSTITUTION, user_record='does-not-matter') == SOME_INSTITUTION
@@ -417,6 +473,43 @@ def test_attempts_before_timeout():
     assert isinstance(ATTEMPTS_BEFORE_TIMEOUT, int) and ATTEMPTS_BEFORE_TIMEOUT > 0
 
 
+def test_get_polling_strategy():
+
+    with override_environ(**{submission_module.POLL_INTERVAL_VAR: None, submission_module.POLL_DEADLINE_VAR: None,
+                             submission_module.POLL_BACKOFF_VAR: None, submission_module.POLL_JITTER_VAR: None,
+                             submission_module.POLL_MAX_INTERVAL_VAR: None}):
+
+        # By default, polling is done as it always has been.
+        strategy = get_polling_strategy()
+        assert strategy.initial_interval == PROGRESS_CHECK_INTERVAL
+        assert strategy.max_attempts == ATTEMPTS_BEFORE_TIMEOUT
+        assert (strategy.backoff, strategy.jitter, strategy.max_interval, strategy.deadline) == (1, 0, None, None)
+
+        # A deadline replaces the limit on attempts.
+        strategy = get_polling_strategy(interval=2, backoff=2, max_interval=60, jitter=0.2, deadline=3600)
+        assert (strategy.initial_interval, strategy.backoff, strategy.max_interval, strategy.jitter,
+                strategy.deadline, strategy.max_attempts) == (2, 2, 60, 0.2, 3600, -1)
+
+        with override_environ(**{submission_module.POLL_INTERVAL_VAR: '3', submission_module.POLL_DEADLINE_VAR: '600',
+                                 submission_module.POLL_BACKOFF_VAR: '1.5'}):
+            strategy = get_polling_strategy()
+            assert (strategy.initial_interval, strategy.backoff, strategy.deadline) == (3, 1.5, 600)
+            strategy = get_polling_strategy(interval=5)  # Explicit settings override the environment
+            assert (strategy.initial_interval, strategy.backoff, strategy.deadline) == (5, 1.5, 600)
+
+        # A maximum interval below the default first interval lowers it, rather than being an error ...
+        strategy = get_polling_strategy(max_interval=PROGRESS_CHECK_INTERVAL - 5)
+        assert (strategy.initial_interval, strategy.max_interval) == ((PROGRESS_CHECK_INTERVAL - 5,) * 2)
+        with override_environ(**{submission_module.POLL_MAX_INTERVAL_VAR: '2'}):
+            strategy = get_polling_strategy()
+            assert (strategy.initial_interval, strategy.max_interval) == (2, 2)
+            # ... but asking for a first interval longer than the maximum is.
+            with pytest.raises(ValueError):
+                get_polling_strategy(interval=3)
+        with pytest.raises(ValueError):
+            get_polling_strategy(interval=10, max_interval=5)
+
+
 def test_ingestion_submission_item_url():
 
     assert ingestion_submission_item_url(
@@ -436,7 +529,7 @@ def test_show_upload_info():
         return FakeResponse(200, json=json_result)
 
     with mock.patch.object(command_utils_module, "script_catch_errors", script_dont_catch_errors):
-        with mock.patch("requests.get", mocked_get):
+        with portal_get(mocked_get):
 
             json_result = {}
             with shown_output() as shown:
@@ -466,7 +559,7 @@ def test_show_upload_info_with_app():
         raise TestFinished
 
     with mock.patch.object(command_utils_module, "script_catch_errors", script_dont_catch_errors):
-        with mock.patch("requests.get") as mock_get:
+        with portal_get() as mock_get:
             mock_get.side_effect = mocked_get
             with mock.patch.object(submission_module, "show_upload_result"):
                 assert mock_get.call_count == 0
@@ -715,7 +808,10 @@ def test_do_any_uploads():
                     auth=SOME_KEYDICT,
                     folder=SOME_BUNDLE_FILENAME_FOLDER,  # the folder part of given SOME_BUNDLE_FILENAME
                     no_query=False,
-                    subfolders=False
+                    subfolders=False,
+                    parallel_uploads=1,
+                    upload_order=None,
+                    skip_existing=False
                 )
                 assert shown.lines == []
 
@@ -731,7 +827,10 @@ def test_do_any_uploads():
                     auth=SOME_KEYDICT,
                     folder=SOME_OTHER_BUNDLE_FOLDER,  # passed straight through
                     no_query=False,
-                    subfolders=False
+                    subfolders=False,
+                    parallel_uploads=1,
+                    upload_order=None,
+                    skip_existing=False
                 )
                 assert shown.lines == []
 
@@ -747,7 +846,10 @@ def test_do_any_uploads():
                     auth=SOME_KEYDICT,
                     folder=None,  # No folder
                     no_query=False,
-                    subfolders=False
+                    subfolders=False,
+                    parallel_uploads=1,
+                    upload_order=None,
+                    skip_existing=False
                 )
                 assert shown.lines == []
 
@@ -764,7 +866,10 @@ def test_do_any_uploads():
                     auth=SOME_KEYDICT,
                     folder=SOME_BUNDLE_FILENAME_FOLDER,  # the folder part of given SOME_BUNDLE_FILENAME
                     no_query=False,
-                    subfolders=True
+                    subfolders=True,
+                    parallel_uploads=1,
+                    upload_order=None,
+                    skip_existing=False
                 )
                 assert shown.lines == []
 
@@ -784,7 +889,10 @@ def test_do_any_uploads():
                 auth=SOME_KEYDICT,
                 folder=SOME_BUNDLE_FILENAME_FOLDER,  # the folder part of given SOME_BUNDLE_FILENAME
                 no_query=True,
-                subfolders=False
+                subfolders=False,
+                parallel_uploads=1,
+                upload_order=None,
+                skip_existing=False
             )
             assert shown.lines == []
 
@@ -795,7 +903,7 @@ def test_resume_uploads():
         with mock.patch.object(submission_module, "resolve_server", return_value=SOME_SERVER):
             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server", return_value=SOME_KEYDICT):
                 some_response_json = {'some': 'json'}
-                with mock.patch("requests.get", return_value=FakeResponse(200, json=some_response_json)):
+                with portal_get(return_value=FakeResponse(200, json=some_response_json)):
                     with mock.patch.object(submission_module, "do_any_uploads") as mock_do_any_uploads:
                         resume_uploads(SOME_UUID, server=SOME_SERVER, env=None, bundle_filename=SOME_BUNDLE_FILENAME,
                                        keydict=SOME_KEYDICT)
@@ -805,13 +913,17 @@ def test_resume_uploads():
                             ingestion_filename=SOME_BUNDLE_FILENAME,
                             upload_folder=None,
                             no_query=False,
-                            subfolders=False
+                            subfolders=False,
+                            parallel_uploads=1,
+                            plan=False,
+                            upload_order=None,
+                            skip_existing=False
                         )
 
     with mock.patch.object(command_utils_module, "script_catch_errors", script_dont_catch_errors):
         with mock.patch.object(submission_module, "resolve_server", return_value=SOME_SERVER):
             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server", return_value=SOME_KEYDICT):
-                with mock.patch("requests.get", return_value=FakeResponse(401, json=SOME_BAD_RESULT)):
+                with portal_get(return_value=FakeResponse(401, json=SOME_BAD_RESULT)):
                     with mock.patch.object(submission_module, "do_any_uploads") as mock_do_any_uploads:
                         with pytest.raises(Exception):
                             resume_uploads(SOME_UUID, server=SOME_SERVER, env=None,
@@ -874,7 +986,8 @@ def test_execute_prearranged_upload(os_simulation_mode: str):
             with shown_output() as shown:
                 with mock.patch("time.time", MockTime().time):
                     with mock.patch("subprocess.call", return_value=0) as mock_aws_call:
-                        execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_UPLOAD_CREDENTIALS)
+                        execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                                                   upload_mode=UploadMode.AWSCLI)
                         mock_aws_call.assert_called_with(
                             ['aws', 's3', 'cp', '--only-show-errors', SOME_FILENAME, SOME_UPLOAD_URL],
                             env=SOME_ENVIRON_WITH_CREDS,
@@ -891,7 +1004,8 @@ def test_execute_prearranged_upload(os_simulation_mode: str):
                 with mock.patch("time.time", MockTime().time):
                     with mock.patch("subprocess.call", return_value=0) as mock_aws_call:
                         execute_prearranged_upload(path=SOME_FILENAME,
-                                                   upload_credentials=SOME_EXTENDED_UPLOAD_CREDENTIALS)
+                                                   upload_credentials=SOME_EXTENDED_UPLOAD_CREDENTIALS,
+                                                   upload_mode=UploadMode.AWSCLI)
                         mock_aws_call.assert_called_with(
                             ['aws', 's3', 'cp',
                              '--sse', 'aws:kms', '--sse-kms-key-id', SOME_S3_ENCRYPT_KEY_ID,
@@ -910,7 +1024,8 @@ def test_execute_prearranged_upload(os_simulation_mode: str):
                 with mock.patch("time.time", MockTime().time):
                     with mock.patch("subprocess.call", return_value=17) as mock_aws_call:
                         with raises_regexp(RuntimeError, "Upload failed with exit code 17"):
-                            execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_UPLOAD_CREDENTIALS)
+                            execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                                                       upload_mode=UploadMode.AWSCLI)
                         mock_aws_call.assert_called_with(
                             ['aws', 's3', 'cp', '--only-show-errors', SOME_FILENAME, SOME_UPLOAD_URL],
                             env=SOME_ENVIRON_WITH_CREDS,
@@ -921,6 +1036,71 @@ def test_execute_prearranged_upload(os_simulation_mode: str):
                         ]
 
 
+def test_execute_prearranged_upload_in_process():
+
+    with mock.patch.object(submission_module, "get_upload_engine") as mock_get_upload_engine:
+        mock_engine = mock_get_upload_engine.return_value
+        with shown_output() as shown:
+            with mock.patch("time.time", MockTime().time):
+                with mock.patch("subprocess.call") as mock_aws_call:
+                    execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_EXTENDED_UPLOAD_CREDENTIALS,
+                                               upload_mode=UploadMode.PYTHON)
+                    assert mock_aws_call.call_count == 0
+                    mock_engine.upload_file.assert_called_with(SOME_FILENAME,
+                                                               upload_credentials=SOME_EXTENDED_UPLOAD_CREDENTIALS,
+                                                               s3_encrypt_key_id=SOME_S3_ENCRYPT_KEY_ID,
+                                                               checkpoint=None, refresh_credentials=None)
+                    assert shown.lines == [
+                        "Uploading local file some-filename directly to: some-url",
+                        "Upload duration: 1.00 seconds"
+                    ]
+
+        # Uploads for a known item are checkpointed in the upload journal, so they can be resumed.
+        with mock.patch.object(submission_module, "get_upload_journal") as mock_get_upload_journal:
+            mock_journal = mock_get_upload_journal.return_value
+            with shown_output():
+                execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_EXTENDED_UPLOAD_CREDENTIALS,
+                                           upload_mode=UploadMode.PYTHON, uuid=SOME_UUID)
+            mock_journal.checkpoint.assert_called_with(uuid=SOME_UUID, path=SOME_FILENAME)
+            mock_engine.upload_file.assert_called_with(SOME_FILENAME,
+                                                       upload_credentials=SOME_EXTENDED_UPLOAD_CREDENTIALS,
+                                                       s3_encrypt_key_id=SOME_S3_ENCRYPT_KEY_ID,
+                                                       checkpoint=mock_journal.checkpoint.return_value,
+                                                       refresh_credentials=None)
+
+        mock_engine.upload_file.side_effect = RuntimeError("Upload failed: ouch")
+        with shown_output() as shown:
+            with raises_regexp(RuntimeError, "Upload failed: ouch"):
+                execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_EXTENDED_UPLOAD_CREDENTIALS,
+                                           upload_mode=UploadMode.PYTHON)
+            assert shown.lines == ["Uploading local file some-filename directly to: some-url"]
+
+    with raises_regexp(InvalidParameterError, "upload_mode"):
+        execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                                   upload_mode='carrier-pigeon')
+
+
+def test_execute_prearranged_upload_awscli_bandwidth_limit(tmp_path):
+
+    # The AWS CLI can't be throttled, so it isn't used (nor are any files looked for) if the bandwidth is limited.
+    with mock.patch.object(submission_module, "get_bandwidth_limiter", return_value=TokenBucket(1000)):
+        with mock.patch("subprocess.check_call", return_value=0) as mock_aws_call:
+            with raises_regexp(ValueError, "Uploads with the AWS CLI .* can't be kept within a bandwidth limit"):
+                execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=SOME_UPLOAD_CREDENTIALS,
+                                           upload_mode=UploadMode.AWSCLI)
+            mock_aws_call.assert_not_called()
+            with mock.patch.object(submission_module, "DEFAULT_UPLOAD_MODE", UploadMode.AWSCLI):
+                with mock.patch.object(submission_module, "_find_files_to_upload") as mock_find_files_to_upload:
+                    with raises_regexp(ValueError, "can't be kept within a bandwidth limit"):
+                        UploadBatch([{'uuid': '1234', 'filename': 'foo.fastq.gz'}], auth=SOME_KEYDICT,
+                                    folder=str(tmp_path), no_query=True)
+                    mock_find_files_to_upload.assert_not_called()
+            # In-process uploads are fine.
+            check_bandwidth_limit_supported(UploadMode.PYTHON)
+        with mock.patch.object(submission_module, "get_bandwidth_limiter", return_value=None):
+            check_bandwidth_limit_supported(UploadMode.AWSCLI)
+
+
 @pytest.mark.parametrize('debug_protocol', [False, True])
 def test_get_s3_encrypt_key_id(debug_protocol):
 
@@ -980,14 +1160,15 @@ def test_get_s3_encrypt_key_id_from_health_page(mocked_s3_encrypt_key_id):
 
 def test_upload_file_to_uuid():
 
-    with mock.patch("dcicutils.ff_utils.patch_metadata", return_value=SOME_UPLOAD_CREDENTIALS_RESULT):
+    with mock.patch.object(submission_module, "portal_metadata_patch", return_value=SOME_UPLOAD_CREDENTIALS_RESULT):
         with mock.patch.object(submission_module, "execute_prearranged_upload") as mocked_upload:
             metadata = upload_file_to_uuid(filename=SOME_FILENAME, uuid=SOME_UUID, auth=SOME_AUTH)
             assert metadata == SOME_FILE_METADATA
             mocked_upload.assert_called_with(SOME_FILENAME, auth=SOME_AUTH,
-                                             upload_credentials=SOME_UPLOAD_CREDENTIALS)
+                                             upload_credentials=SOME_UPLOAD_CREDENTIALS, uuid=SOME_UUID,
+                                             refresh_credentials=mock.ANY)
 
-    with mock.patch("dcicutils.ff_utils.patch_metadata", return_value=SOME_BAD_RESULT):
+    with mock.patch.object(submission_module, "portal_metadata_patch", return_value=SOME_BAD_RESULT):
         with mock.patch.object(submission_module, "execute_prearranged_upload") as mocked_upload:
             try:
                 upload_file_to_uuid(filename=SOME_FILENAME, uuid=SOME_UUID, auth=SOME_AUTH)
@@ -998,6 +1179,92 @@ def test_upload_file_to_uuid():
             assert mocked_upload.call_count == 0
 
 
+def test_upload_file_to_uuid_with_checksums(tmp_path):
+
+    path = tmp_path / "some-file.fastq.gz"
+    path.write_bytes(b"some content")
+    checksummer = FileChecksummer(algorithms=['md5', 'sha256'], cache=ChecksumCache(str(tmp_path / "cache.json")))
+    with mock.patch.object(checksums_module, "_FILE_CHECKSUMMER", checksummer):
+        with mock.patch.object(submission_module, "portal_metadata_patch",
+                               return_value=SOME_UPLOAD_CREDENTIALS_RESULT) as mock_patch:
+            with mock.patch.object(submission_module, "execute_prearranged_upload"):
+                upload_file_to_uuid(filename=str(path), uuid=SOME_UUID, auth=SOME_AUTH)
+                mock_patch.assert_called_with(uuid=SOME_UUID, auth=SOME_AUTH,
+                                              data={'filename': 'some-file.fastq.gz',
+                                                    'md5sum': hashlib.md5(b"some content").hexdigest(),
+                                                    'sha256sum': hashlib.sha256(b"some content").hexdigest()})
+
+
+def test_upload_file_to_uuid_with_checksums_in_background(tmp_path):
+
+    path = tmp_path / "some-file.fastq.gz"
+    path.write_bytes(b"some content")
+    checksummer = FileChecksummer(algorithms=['md5'], cache=ChecksumCache(str(tmp_path / "cache.json")))
+    events = []
+
+    def fake_patch(uuid, data, auth):
+        ignored(uuid, auth)
+        events.append(('patch', data))
+        return SOME_UPLOAD_CREDENTIALS_RESULT
+
+    def fake_upload(filename, **kwargs):
+        ignored(kwargs)
+        events.append(('upload', os.path.basename(filename)))
+
+    # A file that isn't small is hashed while it's uploaded, rather than before, and its checksums patched after.
+    with local_attrs(checksums_module, MIN_PRECOMPUTE_SIZE=10):
+        with mock.patch.object(checksums_module, "_FILE_CHECKSUMMER", checksummer):
+            with mock.patch.object(submission_module, "portal_metadata_patch", side_effect=fake_patch):
+                with mock.patch.object(submission_module, "execute_prearranged_upload", side_effect=fake_upload):
+                    with mock.patch.object(checksummer, "compute_in_background",
+                                           wraps=checksummer.compute_in_background) as mock_compute_in_background:
+                        assert upload_file_to_uuid(filename=str(path), uuid=SOME_UUID,
+                                                   auth=SOME_AUTH) == SOME_FILE_METADATA
+                        mock_compute_in_background.assert_called_once_with(str(path))
+    assert events == [('patch', {'filename': 'some-file.fastq.gz'}),
+                      ('upload', 'some-file.fastq.gz'),
+                      ('patch', {'md5sum': hashlib.md5(b"some content").hexdigest()})]
+
+
+def test_upload_file_to_uuid_refresh_credentials():
+
+    fresh_upload_credentials = dict(SOME_UPLOAD_CREDENTIALS, SessionToken='some-fresh-token')
+    fresh_result = {'@graph': [dict(SOME_FILE_METADATA, upload_credentials=fresh_upload_credentials)]}
+    with mock.patch.object(submission_module, "portal_metadata_patch",
+                           side_effect=[SOME_UPLOAD_CREDENTIALS_RESULT, fresh_result]) as mock_patch:
+        with mock.patch.object(submission_module, "execute_prearranged_upload") as mocked_upload:
+            upload_file_to_uuid(filename=SOME_FILENAME, uuid=SOME_UUID, auth=SOME_AUTH)
+            refresh_credentials = mocked_upload.call_args.kwargs['refresh_credentials']
+            with shown_output() as shown:
+                assert refresh_credentials() == fresh_upload_credentials
+            assert shown.lines[0].endswith(f"Getting fresh upload credentials for {SOME_FILENAME} ...")
+            # Fresh credentials come from patching the filename again.
+            mock_patch.assert_called_with(uuid=SOME_UUID, auth=SOME_AUTH, data={'filename': SOME_FILENAME})
+
+
+def test_execute_prearranged_upload_awscli_refresh_credentials():
+
+    expired_upload_credentials = dict(SOME_UPLOAD_CREDENTIALS, Expiration='2000-01-01T00:00:00Z')
+    refresh_credentials = mock.MagicMock(return_value=dict(SOME_UPLOAD_CREDENTIALS, SessionToken='some-fresh-token'))
+    with mock.patch.object(os, "environ", SOME_ENVIRON.copy()):
+        with mock.patch("subprocess.call", return_value=0) as mock_aws_call:
+            with shown_output():
+                execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=expired_upload_credentials,
+                                           upload_mode=UploadMode.AWSCLI, refresh_credentials=refresh_credentials)
+    # The AWS CLI is started with the fresh credentials.
+    refresh_credentials.assert_called_once_with()
+    assert mock_aws_call.call_args.kwargs['env']['AWS_SECURITY_TOKEN'] == 'some-fresh-token'
+
+    # Without a way to refresh them, a failure says that they had expired.
+    with mock.patch.object(os, "environ", SOME_ENVIRON.copy()):
+        with mock.patch("subprocess.call", return_value=255):
+            with shown_output():
+                with raises_regexp(RuntimeError, "Upload failed with exit code 255, after its upload credentials"
+                                                 " expired [(]at 2000-01-01T00:00:00Z[)]"):
+                    execute_prearranged_upload(path=SOME_FILENAME, upload_credentials=expired_upload_credentials,
+                                               upload_mode=UploadMode.AWSCLI)
+
+
 def make_alternator(*values):
 
     class Alternatives:
@@ -1235,10 +1502,386 @@ def test_do_uploads(tmp_path):
                         mocked_instance,
                         folder,
                         SOME_AUTH,
-                        recursive=False
+                        recursive=False,
+                        folder_index=mock.ANY,
                     )
 
 
+def test_do_uploads_in_parallel():
+
+    some_uploads_to_do = [
+        {'uuid': '1234', 'filename': 'foo.fastq.gz'},
+        {'uuid': '2345', 'filename': 'bar.fastq.gz'},
+        {'uuid': '3456', 'filename': 'baz.fastq.gz'}
+    ]
+
+    uploaded = {}
+
+    def mocked_upload_file(filename, uuid, auth):
+        ignored(auth)
+        if uuid == '2345':
+            raise Exception("Bad upload")
+        uploaded[uuid] = filename
+
+    def summary_without_durations(lines):
+        return [" ".join(re.sub(r"[0-9]+[.][0-9]+s ", "", line).split()) for line in lines]
+
+    with mock.patch.object(submission_module, "upload_file_to_uuid", mocked_upload_file):
+        with shown_output() as shown:
+            do_uploads(upload_spec_list=some_uploads_to_do, auth=SOME_AUTH, no_query=True, parallel_uploads=2)
+            assert uploaded == {'1234': './foo.fastq.gz', '3456': './baz.fastq.gz'}
+            # The per-file messages may interleave, but each file gets its usual ones, and then a summary follows.
+            assert sorted(shown.lines[:6]) == sorted([
+                'Uploading ./foo.fastq.gz to item 1234 ...',
+                'Upload of ./foo.fastq.gz to item 1234 was successful.',
+                'Uploading ./bar.fastq.gz to item 2345 ...',
+                'Exception: Bad upload',
+                'Uploading ./baz.fastq.gz to item 3456 ...',
+                'Upload of ./baz.fastq.gz to item 3456 was successful.',
+            ])
+            assert summary_without_durations(shown.lines[6:]) == [
+                '----- Upload Summary -----',
+                'SUCCEEDED ./foo.fastq.gz',
+                'FAILED ./bar.fastq.gz (Exception: Bad upload)',
+                'SUCCEEDED ./baz.fastq.gz',
+                '2 uploads succeeded, 1 failed, 0 skipped.',
+            ]
+
+    uploaded = {}
+    with local_attrs(submission_module, SUBMITR_SELECTIVE_UPLOADS=True):
+        with mock.patch.object(submission_module, "yes_or_no", make_alternator(True, False)):
+            with mock.patch.object(submission_module, "upload_file_to_uuid", mocked_upload_file):
+                with shown_output() as shown:
+                    do_uploads(upload_spec_list=some_uploads_to_do, auth=SOME_AUTH, folder='/x/yy/zzz/',
+                               parallel_uploads=3)
+                    # Queries are all asked up front, before any uploading starts.
+                    assert shown.lines[0] == 'OK, not uploading it.'
+                    assert uploaded == {'1234': '/x/yy/zzz/foo.fastq.gz', '3456': '/x/yy/zzz/baz.fastq.gz'}
+                    assert summary_without_durations(shown.lines[5:]) == [
+                        '----- Upload Summary -----',
+                        'SUCCEEDED /x/yy/zzz/foo.fastq.gz',
+                        'SKIPPED /x/yy/zzz/bar.fastq.gz',
+                        'SUCCEEDED /x/yy/zzz/baz.fastq.gz',
+                        '2 uploads succeeded, 0 failed, 1 skipped.',
+                    ]
+
+
+def test_upload_batch(tmp_path):
+
+    folder = tmp_path / "to_upload"
+    (folder / "sub").mkdir(parents=True)
+    for path in ["foo.fastq.gz", "twice.fastq.gz", "sub/twice.fastq.gz", "bar.fastq.gz"]:
+        (folder / path).write_text(path)
+    upload_spec_list = [{'uuid': '1234', 'filename': 'foo.fastq.gz'}, {'uuid': '2345', 'filename': 'twice.fastq.gz'},
+                        {'uuid': '3456', 'filename': 'bar.fastq.gz'}]
+
+    # However the files are uploaded, their outcomes (including those of files not uploaded) are in the same order.
+    for parallel_uploads in [1, 2]:
+        with mock.patch.object(submission_module, "upload_file_to_uuid") as mock_upload:
+            with mock.patch.object(submission_module, "get_upload_journal",
+                                   return_value=UploadJournal(str(tmp_path / f"journal{parallel_uploads}.json"))):
+                with shown_output():
+                    batch = UploadBatch(upload_spec_list, auth=SOME_AUTH, folder=str(folder), no_query=True,
+                                        subfolders=True, parallel_uploads=parallel_uploads, upload_order='portal')
+                    assert [uploader_wrapper.uuid for _, uploader_wrapper in batch.uploads] == ['1234', '3456']
+                    outcomes = batch.run()
+            assert mock_upload.call_count == 2
+        assert [(outcome['uuid'], outcome['status'], outcome['error']) for outcome in outcomes] == [
+            ('1234', UploadStatus.SUCCEEDED, None),
+            ('2345', UploadStatus.SKIPPED, "multiple copies found"),
+            ('3456', UploadStatus.SUCCEEDED, None),
+        ]
+
+
+def test_upload_batch_records_outcomes(tmp_path):
+
+    folder = tmp_path / "to_upload"
+    (folder / "sub").mkdir(parents=True)
+    for path in ["foo.fastq.gz", "twice.fastq.gz", "sub/twice.fastq.gz", "bar.fastq.gz"]:
+        (folder / path).write_text(path)
+    upload_spec_list = [{'uuid': '1234', 'filename': 'foo.fastq.gz'}, {'uuid': '2345', 'filename': 'twice.fastq.gz'},
+                        {'uuid': '3456', 'filename': 'bar.fastq.gz'}]
+    spans = []
+
+    def mocked_upload_file(filename, uuid, auth):
+        ignored(filename, auth)
+        if uuid == '3456':
+            # Failing before anything is sent to S3 (e.g., when patching the File item) is counted as well.
+            raise RuntimeError(f"Unable to obtain upload credentials for file {filename}.")
+
+    with local_attrs(metrics_module, _METRICS_RECORDER=MetricsRecorder(listeners=[spans.append]),
+                     _METRICS_CONFIGURED=True):
+        with mock.patch.object(submission_module, "upload_file_to_uuid", side_effect=mocked_upload_file):
+            with mock.patch.object(submission_module, "get_upload_journal",
+                                   return_value=UploadJournal(str(tmp_path / "journal.json"))):
+                with shown_output():
+                    UploadBatch(upload_spec_list, auth=SOME_AUTH, folder=str(folder), no_query=True,
+                                subfolders=True, upload_order='portal').run()
+    assert sorted((span['uuid'], span['outcome']) for span in spans if span['span'] == 'upload_outcome') == [
+        ('1234', UploadStatus.SUCCEEDED), ('2345', UploadStatus.SKIPPED), ('3456', UploadStatus.FAILED),
+    ]
+
+
+@pytest.mark.parametrize("upload_order, parallel_uploads, expected_order", [
+    (None, 1, ['small', 'large', 'medium']),  # Sequential uploads are done as listed, unless otherwise asked.
+    ('largest-first', 1, ['large', 'medium', 'small']),
+    ('smallest-first', 1, ['small', 'medium', 'large']),
+    (None, 2, ['large', 'medium', 'small']),  # Parallel uploads start with the largest, by default.
+])
+def test_do_uploads_in_order(tmp_path, upload_order, parallel_uploads, expected_order):
+
+    for name, size in [('small', 10), ('large', 1000), ('medium', 100)]:
+        (tmp_path / f"{name}.fastq").write_bytes(b"x" * size)
+    uploaded = []
+
+    def mocked_upload_file(filename, uuid, auth):
+        ignored(filename, auth)
+        uploaded.append(uuid)
+
+    with local_attrs(upload_scheduling_module, DEFAULT_UPLOAD_ORDER=None):
+        with mock.patch.object(submission_module, "upload_file_to_uuid", mocked_upload_file):
+            with shown_output():
+                # With a single worker, the order in which uploads start is the order in which they're done.
+                with mock.patch.object(submission_module, "ThreadPoolExecutor",
+                                       lambda max_workers: ThreadPoolExecutor(max_workers=1)):
+                    do_uploads([{'uuid': name, 'filename': f"{name}.fastq"} for name in ['small', 'large', 'medium']],
+                               auth=SOME_AUTH, folder=str(tmp_path), no_query=True,
+                               parallel_uploads=parallel_uploads, upload_order=upload_order)
+    assert uploaded == expected_order
+
+
+def test_plan_uploads(tmp_path):
+
+    folder = tmp_path / "to_upload"
+    (folder / "sub1").mkdir(parents=True)
+    (folder / "sub2").mkdir()
+    (folder / "big.bam").write_bytes(b"x" * 3000)
+    (folder / "big.bam.bai").write_bytes(b"x" * 100)
+    (folder / "done.fastq.gz").write_bytes(b"x" * 10)
+    (folder / "sub1" / "twice.fastq.gz").write_bytes(b"x")
+    (folder / "sub2" / "twice.fastq.gz").write_bytes(b"x")
+    folder = folder.as_posix()
+    journal = UploadJournal(str(tmp_path / "upload_journal.json"))
+    journal.checkpoint(uuid='3456', path=f"{folder}/done.fastq.gz").complete()
+    journal.mark_finished(uuid='3456', path=f"{folder}/done.fastq.gz")
+    upload_spec_list = [{'uuid': '1234', 'filename': 'big.bam'}, {'uuid': '2345', 'filename': 'missing.fastq.gz'},
+                        {'uuid': '3456', 'filename': 'done.fastq.gz'}, {'uuid': '4567', 'filename': 'twice.fastq.gz'}]
+
+    def mocked_portal_get(url, **kwargs):
+        ignored(kwargs)
+        assert url == f"{SOME_KEYDICT['server']}/1234?frame=object"
+        return FakeResponse(200, json={'extra_files': [{'filename': 'big.bam.bai', 'file_format': 'bai'}]})
+
+    with mock.patch.object(submission_module, "get_upload_journal", return_value=journal):
+        with portal_get(side_effect=mocked_portal_get):
+            plan = plan_uploads(upload_spec_list, auth=SOME_KEYDICT, folder=folder, subfolders=True)
+    assert [(file['path'], file['size'], file['extra_file']) for file in plan['files']] == [
+        (f"{folder}/big.bam", 3000, False), (f"{folder}/big.bam.bai", 100, True)
+    ]
+    assert [file['uuid'] for file in plan['already_uploaded']] == ['3456']
+    assert [file['filename'] for file in plan['missing']] == ['missing.fastq.gz']
+    assert [sorted(file['paths']) for file in plan['duplicates']] == [[f"{folder}/sub1/twice.fastq.gz",
+                                                                       f"{folder}/sub2/twice.fastq.gz"]]
+    assert plan['unchecked_extra_files'] == []
+
+    history = UploadThroughputHistory(str(tmp_path / "upload_throughput.json"))
+    history.record(100 * 1024 ** 2, seconds=10)
+    with mock.patch.object(submission_module, "get_upload_throughput_history", return_value=history):
+        with shown_output() as shown:
+            show_upload_plan(plan)
+        assert shown.lines == [
+            "----- Upload Plan -----",
+            "2 files to upload (including 1 extra file), 3.0KB in total.",
+            "1 file already uploaded, which will be skipped.",
+            "Largest files:",
+            f"     2.9KB  {folder}/big.bam",
+            f" 100 bytes  {folder}/big.bam.bai",
+            "Missing files (1), which will not be uploaded:",
+            "  missing.fastq.gz (for item 2345)",
+            "Files found more than once (1), which will not be uploaded:",
+            f"  twice.fastq.gz (for item 4567): {', '.join(plan['duplicates'][0]['paths'])}",
+            "Estimated upload time: 1s at 10.0MB/s (as measured over 1 recent upload run).",
+        ]
+
+    # Nothing is uploaded when planning, and any extra files that can't be looked up are mentioned.
+    with mock.patch.object(submission_module, "do_uploads") as mock_do_uploads:
+        with portal_get(return_value=FakeResponse(404, json={})):
+            with shown_output() as shown:
+                do_any_uploads({'additional_data': {'upload_info': upload_spec_list[:1]}}, keydict=SOME_KEYDICT,
+                               upload_folder=folder, plan=True)
+        mock_do_uploads.assert_not_called()
+        assert shown.lines[:2] == ["----- Upload Plan -----", "1 file to upload, 2.9KB in total."]
+        assert "The extra files of 1 item could not be looked up." in shown.lines
+        assert shown.lines[-1].startswith("Estimated upload time: ")
+
+
+def test_do_uploads_skips_finished_uploads(tmp_path):
+
+    folder = tmp_path / "to_upload"
+    folder.mkdir()
+    (folder / "foo.fastq.gz").write_text("foo")
+    (folder / "bar.fastq.gz").write_text("bar")
+    folder = folder.as_posix()
+    journal = UploadJournal(str(tmp_path / "upload_journal.json"))
+    upload_spec_list = [{'uuid': '1234', 'filename': 'foo.fastq.gz'}, {'uuid': '2345', 'filename': 'bar.fastq.gz'}]
+
+    def mocked_upload_file(filename, uuid, auth):
+        ignored(auth)
+        journal.checkpoint(uuid=uuid, path=filename).complete()  # as the upload engine would
+        return {'uuid': uuid, 'filename': os.path.basename(filename)}
+
+    with mock.patch.object(submission_module, "get_upload_journal", return_value=journal):
+        with mock.patch.object(submission_module, "upload_file_to_uuid", side_effect=mocked_upload_file) as mock_upload:
+            with shown_output():
+                do_uploads(upload_spec_list, auth=SOME_AUTH, folder=folder, no_query=True)
+            assert mock_upload.call_count == 2
+            assert journal.is_finished(uuid='1234', path=f"{folder}/foo.fastq.gz")
+
+            # Running again (e.g., from resume-uploads) doesn't upload anything that's already done, ...
+            journal.forget(uuid='2345', path=f"{folder}/bar.fastq.gz")
+            mock_upload.reset_mock()
+            with shown_output() as shown:
+                do_uploads(upload_spec_list, auth=SOME_AUTH, folder=folder, no_query=True)
+            mock_upload.assert_called_once_with(filename=f"{folder}/bar.fastq.gz", uuid='2345', auth=SOME_AUTH)
+            assert shown.lines == [
+                f"Upload of {folder}/foo.fastq.gz to item 1234 was already done.",
+                f"Uploading {folder}/bar.fastq.gz to item 2345 ...",
+                f"Upload of {folder}/bar.fastq.gz to item 2345 was successful.",
+            ]
+
+            # ... unless the file has changed since.
+            (tmp_path / "to_upload" / "foo.fastq.gz").write_text("new foo")
+            mock_upload.reset_mock()
+            with shown_output():
+                do_uploads(upload_spec_list, auth=SOME_AUTH, folder=folder, no_query=True)
+            mock_upload.assert_called_once_with(filename=f"{folder}/foo.fastq.gz", uuid='1234', auth=SOME_AUTH)
+
+
+def test_file_already_uploaded(tmp_path):
+
+    path = tmp_path / "foo.fastq.gz"
+    path.write_text("foo")
+    (tmp_path / "foo.fastq.gz.bai").write_text("index")
+    path = str(path)
+    md5sum = hashlib.md5(b"foo").hexdigest()
+    checksummer = FileChecksummer(algorithms=['md5'], cache=ChecksumCache(str(tmp_path / "cache.json")))
+
+    def already_uploaded(metadata, status_code=200):
+        with portal_get(return_value=FakeResponse(status_code, json=metadata)) as mock_get:
+            result = file_already_uploaded(path, uuid='1234', auth=SOME_KEYDICT)
+        assert mock_get.call_args[0][0] == f"{SOME_KEYDICT['server']}/1234?frame=object"
+        return result
+
+    with mock.patch.object(checksums_module, "_FILE_CHECKSUMMER", checksummer):
+        assert already_uploaded({'status': 'uploaded', 'file_size': 3, 'md5sum': md5sum}) is True
+        assert already_uploaded({'status': 'released', 'md5sum': md5sum}) is True
+        assert already_uploaded({'status': 'uploaded', 'file_size': 3}) is True
+        assert already_uploaded({'status': 'uploaded', 'file_size': 3, 'md5sum': md5sum,
+                                 'extra_files': [{'filename': 'foo.fastq.gz.bai', 'status': 'uploaded',
+                                                  'file_size': 5}]}) is True
+        # Not if the portal's file (or any extra file) is different, or not (all) uploaded yet, ...
+        assert already_uploaded({'status': 'uploaded', 'file_size': 4, 'md5sum': md5sum}) is False
+        assert already_uploaded({'status': 'uploaded', 'file_size': 3, 'md5sum': 'a' * 32}) is False
+        assert already_uploaded({'status': 'uploading', 'file_size': 3, 'md5sum': md5sum}) is False
+        for extra_file in [{'filename': 'foo.fastq.gz.bai', 'status': 'uploading', 'file_size': 5},
+                           {'filename': 'foo.fastq.gz.bai', 'status': 'uploaded', 'file_size': 6},
+                           {'filename': 'foo.fastq.gz.bai', 'status': 'uploaded'},
+                           {'filename': 'foo.fastq.gz.tbi', 'status': 'uploaded', 'file_size': 5}]:
+            assert already_uploaded({'status': 'uploaded', 'file_size': 3, 'md5sum': md5sum,
+                                     'extra_files': [extra_file]}) is False
+        # ... or if there's nothing to compare, or the portal can't be asked.
+        assert already_uploaded({'status': 'uploaded'}) is False
+        assert already_uploaded({'status': 'error'}, status_code=404) is False
+
+
+def test_file_already_uploaded_hashes_only_if_need_be(tmp_path):
+
+    path = tmp_path / "foo.fastq.gz"
+    path.write_text("foo")
+    path = str(path)
+    md5sum = hashlib.md5(b"foo").hexdigest()
+    sha256sum = hashlib.sha256(b"foo").hexdigest()
+    checksummer = FileChecksummer(algorithms=['md5', 'sha256'], cache=ChecksumCache(str(tmp_path / "cache.json")))
+
+    def already_uploaded(metadata):
+        with portal_get(return_value=FakeResponse(200, json=metadata)):
+            return file_already_uploaded(path, uuid='1234', auth=SOME_KEYDICT)
+
+    with mock.patch.object(checksums_module, "_FILE_CHECKSUMMER", checksummer):
+        with mock.patch.object(submission_module, "compute_checksums",
+                               wraps=checksums_module.compute_checksums) as mock_compute_checksums:
+            # The file isn't hashed if the portal has no checksums, or the sizes differ, ...
+            assert already_uploaded({'status': 'uploaded', 'file_size': 3}) is True
+            assert already_uploaded({'status': 'uploaded', 'file_size': 4, 'sha256sum': sha256sum}) is False
+            mock_compute_checksums.assert_not_called()
+            # ... and, otherwise, just for one of the checksums the portal has, ...
+            assert already_uploaded({'status': 'uploaded', 'file_size': 3, 'sha256sum': sha256sum,
+                                     'md5sum': md5sum}) is True
+            mock_compute_checksums.assert_called_once_with(path, ['md5'])
+            # ... and only once, since the checksum is cached.
+            assert already_uploaded({'status': 'uploaded', 'md5sum': md5sum}) is True
+            assert already_uploaded({'status': 'uploaded', 'md5sum': 'a' * 32}) is False
+            mock_compute_checksums.assert_called_once()
+    assert checksummer.cache.get(path, ['md5']) == {'md5': md5sum}
+
+
+def test_do_uploads_skip_existing(tmp_path):
+
+    folder = tmp_path / "to_upload"
+    folder.mkdir()
+    (folder / "foo.fastq.gz").write_text("foo")
+    (folder / "bar.fastq.gz").write_text("bar")
+    folder = folder.as_posix()
+    journal = UploadJournal(str(tmp_path / "upload_journal.json"))
+    upload_spec_list = [{'uuid': '1234', 'filename': 'foo.fastq.gz'}, {'uuid': '2345', 'filename': 'bar.fastq.gz'}]
+
+    def mocked_file_already_uploaded(file_path, uuid, auth, **kwargs):
+        ignored(file_path, auth, kwargs)
+        return uuid == '1234'
+
+    with mock.patch.object(submission_module, "get_upload_journal", return_value=journal):
+        with mock.patch.object(submission_module, "file_already_uploaded",
+                               side_effect=mocked_file_already_uploaded) as mock_already_uploaded:
+            with mock.patch.object(submission_module, "upload_file_to_uuid") as mock_upload:
+                # The portal isn't asked unless asked to skip what it has.
+                with shown_output():
+                    do_uploads(upload_spec_list, auth=SOME_KEYDICT, folder=folder, no_query=True)
+                mock_already_uploaded.assert_not_called()
+                assert mock_upload.call_count == 2
+
+                journal.forget(uuid='1234', path=f"{folder}/foo.fastq.gz")
+                journal.forget(uuid='2345', path=f"{folder}/bar.fastq.gz")
+                mock_upload.reset_mock()
+                with shown_output() as shown:
+                    do_uploads(upload_spec_list, auth=SOME_KEYDICT, folder=folder, no_query=True, skip_existing=True)
+                mock_upload.assert_called_once_with(filename=f"{folder}/bar.fastq.gz", uuid='2345',
+                                                    auth=SOME_KEYDICT)
+                assert shown.lines[0] == (f"Upload of {folder}/foo.fastq.gz to item 1234 was already done"
+                                          f" (the portal has the same file).")
+                # What's skipped is journaled as done, so it isn't looked up again.
+                assert journal.is_finished(uuid='1234', path=f"{folder}/foo.fastq.gz")
+
+
+def test_upload_message_wrapper_outcomes():
+
+    wrapper = UploadMessageWrapper('1234', no_query=True)
+
+    def failing_upload():
+        raise RuntimeError("Upload failed.")
+
+    with shown_output():
+        wrapper.wrap_upload_function(lambda: 'some-metadata', 'foo.fastq.gz')()
+        wrapper.wrap_upload_function(failing_upload, 'foo.fastq.gz.bai')()
+    [succeeded, failed] = wrapper.outcomes
+    assert succeeded['status'] == UploadStatus.SUCCEEDED
+    assert succeeded['file'] == 'foo.fastq.gz'
+    assert succeeded['uuid'] == '1234'
+    assert succeeded['error'] is None
+    assert failed['status'] == UploadStatus.FAILED
+    assert failed['error'] == 'RuntimeError: Upload failed.'
+    assert failed['duration'] >= 0
+
+
 def test_upload_item_data():
 
     with mock.patch.object(submission_module, "resolve_server", return_value=SOME_SERVER) as mock_resolve:
@@ -1286,6 +1929,27 @@ def test_upload_item_data():
                 mock_upload.assert_called_with(filename=SOME_FILENAME, uuid=SOME_UUID, auth=SOME_KEYDICT)
 
 
+def test_upload_item_data_records_outcome():
+
+    spans = []
+    with local_attrs(metrics_module, _METRICS_RECORDER=MetricsRecorder(listeners=[spans.append]),
+                     _METRICS_CONFIGURED=True):
+        with mock.patch.object(submission_module, "resolve_server", return_value=SOME_SERVER):
+            with mock.patch.object(KEY_MANAGER, "get_keydict_for_server", return_value=SOME_KEYDICT):
+                with mock.patch.object(submission_module, "upload_file_to_uuid"):
+                    upload_item_data(item_filename=SOME_FILENAME, uuid=SOME_UUID, server=SOME_SERVER, env=None,
+                                     no_query=True)
+                with mock.patch.object(submission_module, "upload_file_to_uuid",
+                                       side_effect=RuntimeError("Unable to obtain upload credentials")):
+                    with raises_regexp(RuntimeError, "Unable to obtain upload credentials"):
+                        upload_item_data(item_filename=SOME_FILENAME, uuid=SOME_UUID, server=SOME_SERVER, env=None,
+                                         no_query=True)
+    assert [(span['file'], span['outcome'], span['error']) for span in spans if span['span'] == 'upload_outcome'] == [
+        (SOME_FILENAME, UploadStatus.SUCCEEDED, None),
+        (SOME_FILENAME, UploadStatus.FAILED, "RuntimeError: Unable to obtain upload credentials"),
+    ]
+
+
 def get_today_datetime_for_time(time_to_use):
     today = datetime.date.today()
     time = datetime.time.fromisoformat(time_to_use)
@@ -1426,6 +2090,55 @@ class Scenario:
         return result
 
 
+def test_old_protocol_supported():
+
+    def probe(status_code, server=SOME_SERVER):
+        with portal_post(return_value=FakeResponse(status_code, json={})) as mock_post:
+            result = _old_protocol_supported(server, SOME_AUTH)
+        return result, mock_post.call_count
+
+    # Only a bad request says the endpoint is there, and only a 404 (or 405) that it isn't, ...
+    assert probe(503) == (None, 1)
+    assert probe(403) == (None, 1)
+    assert probe(200) == (None, 1)
+    assert probe(400) == (True, 1)
+    # ... and once that's known, the server isn't asked again.
+    assert probe(404) == (True, 0)
+    assert probe(404, server='http://localhost:8888') == (False, 1)
+    assert probe(415, server='http://localhost:8888/') == (False, 0)
+
+
+def test_post_submission_inconclusive_probe():
+
+    posted = []
+
+    def mocked_post(url, auth, data=None, headers=None, **kwargs):
+        ignored(auth, headers, kwargs)
+        posted.append((url[len(SOME_SERVER):], 'bundle' if isinstance(data, MultipartEncoder) else data))
+        if url.endswith('/IngestionSubmission'):
+            return FakeResponse(201, json={'@graph': [{'@id': f'/ingestion-submissions/{SOME_UUID}/'}]})
+        elif url == SOME_SERVER + '/submit_for_ingestion':
+            # The probe gets a 503 (even after retries), and the bundle a 404, from a new server.
+            return FakeResponse(404 if isinstance(data, MultipartEncoder) else 503, json={})
+        return FakeResponse(201, json={'submission_id': SOME_UUID})
+
+    def post_submission():
+        with mock.patch("io.open", side_effect=lambda *args, **kwargs: io.BytesIO(b"Data would go here.")):
+            return _post_submission(SOME_SERVER, SOME_AUTH, SOME_BUNDLE_FILENAME, creation_post_data={},
+                                    submission_post_data={}, submission_protocol=SubmissionProtocol.UPLOAD)
+
+    with portal_post(side_effect=mocked_post):
+        assert post_submission().json() == {'submission_id': SOME_UUID}
+        # Since the probe didn't tell, the bundle was tried on the old endpoint first, which did tell.
+        assert posted == [('/submit_for_ingestion', b''), ('/submit_for_ingestion', 'bundle'),
+                          ('/IngestionSubmission', None),
+                          (f'/ingestion-submissions/{SOME_UUID}/submit_for_ingestion', 'bundle')]
+        posted.clear()
+        assert post_submission().json() == {'submission_id': SOME_UUID}
+        assert posted == [('/IngestionSubmission', None),
+                          (f'/ingestion-submissions/{SOME_UUID}/submit_for_ingestion', 'bundle')]
+
+
 @mock.patch.object(submission_module, "get_health_page")
 @mock.patch.object(submission_module, "DEBUG_PROTOCOL", False)
 def test_submit_any_ingestion_old_protocol(mock_get_health_page):
@@ -1456,16 +2169,20 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
 
                     assert shown.lines == ["Aborting submission."]
 
-    def mocked_post(url, auth, data, headers, files, **kwargs):
+    def mocked_post(url, auth, data, headers, **kwargs):
         assert not kwargs, "The mock named mocked_post did not expect keyword arguments."
         # We only expect requests.post to be called on one particular URL, so this definition is very specialized,
         # mostly just to check that we're being called on what we think, so we can return something highly specific
         # with some degree of confidence. -kmp 6-Sep-2020
         assert url.endswith('/submit_for_ingestion')
         assert auth == SOME_AUTH
-        ignored(data)
-        assert isinstance(files, dict) and 'datafile' in files and isinstance(files['datafile'], io.BytesIO)
-        assert not headers or headers == {'Content-type': 'application/json'}
+        if not isinstance(data, MultipartEncoder):
+            # The probe for the old protocol, which an old server rejects without a bundle.
+            assert data == b'' and headers is None
+            return FakeResponse(400, json={'status': 'error'})
+        [datafile] = data.files
+        assert isinstance(datafile, io.BytesIO)
+        assert headers == {'Content-Type': data.content_type}
         return FakeResponse(201, json={'submission_id': SOME_UUID})
 
     partial_res = {
@@ -1547,8 +2264,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                                                return_value=SOME_KEYDICT):
                             with mock.patch.object(submission_module, "resolve_server", return_value=SOME_SERVER):
                                 with mock.patch.object(submission_module, "yes_or_no", return_value=True):
-                                    with mock.patch("requests.post", mocked_post):
-                                        with mock.patch("requests.get", make_mocked_get(done_after_n_tries=3)):
+                                    with portal_post(mocked_post):
+                                        with portal_get(make_mocked_get(done_after_n_tries=3)):
                                             try:
                                                 submit_any_ingestion(SOME_BUNDLE_FILENAME,
                                                                      ingestion_type='metadata_bundle',
@@ -1582,8 +2299,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -1612,7 +2329,10 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                                                             keydict=SOME_KEYDICT,
                                                             upload_folder=None,
                                                             no_query=False,
-                                                            subfolders=False
+                                                            subfolders=False,
+                                                            parallel_uploads=1,
+                                                            plan=False,
+                                                            upload_order=None
                                                         )
         assert shown.lines == Scenario.make_successful_submission_lines(get_request_attempts)
 
@@ -1639,8 +2359,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                                                                                  f" to {SOME_SERVER}?")):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -1669,7 +2389,10 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                                                             keydict=SOME_KEYDICT,
                                                             upload_folder=None,
                                                             no_query=False,
-                                                            subfolders=False
+                                                            subfolders=False,
+                                                            parallel_uploads=1,
+                                                            plan=False,
+                                                            upload_order=None
                                                         )
         assert shown.lines == Scenario.make_successful_submission_lines(get_request_attempts)
 
@@ -1686,8 +2409,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                     with mock.patch.object(submission_module, "resolve_server", return_value=SOME_SERVER):
                         with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                return_value=SOME_KEYDICT):
-                            with mock.patch("requests.post", mocked_post):
-                                with mock.patch("requests.get",
+                            with portal_post(mocked_post):
+                                with portal_get(
                                                 make_mocked_get(done_after_n_tries=get_request_attempts)):
                                     with mock.patch("datetime.datetime", dt):
                                         with mock.patch("time.sleep", dt.sleep):
@@ -1716,7 +2439,10 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                                                         keydict=SOME_KEYDICT,
                                                         upload_folder=None,
                                                         no_query=True,
-                                                        subfolders=False
+                                                        subfolders=False,
+                                                        parallel_uploads=1,
+                                                        plan=False,
+                                                        upload_order=None
                                                     )
         assert shown.lines == Scenario.make_successful_submission_lines(get_request_attempts)
 
@@ -1743,8 +2469,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", unsupported_media_type):
-                                    with mock.patch("requests.get",
+                                with portal_post(unsupported_media_type):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts,
                                                                     success=False)):
                                         with mock.patch("datetime.datetime", dt):
@@ -1798,8 +2524,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mysterious_error):
-                                    with mock.patch("requests.get",
+                                with portal_post(mysterious_error):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts,
                                                                     success=False)):
                                         with mock.patch("datetime.datetime", dt):
@@ -1844,8 +2570,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts,
                                                                     success=False)):
                                         with mock.patch("datetime.datetime", dt):
@@ -1886,8 +2612,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -1927,8 +2653,8 @@ def test_submit_any_ingestion_old_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=ATTEMPTS_BEFORE_TIMEOUT + 1)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -1989,10 +2715,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
     def mocked_post(url, auth, data=None, json=None, files=None, headers=None, **kwargs):
         assert not kwargs, "The mock named mocked_post did not expect keyword arguments."
         ignored(data, json)
-        content_type = headers and headers.get('Content-type')
-        if content_type:
-            assert content_type == 'application/json'
         if url.endswith("/IngestionSubmission"):
+            assert headers == {'Content-type': 'application/json'}
             return FakeResponse(201,
                                 json={
                                     "status": "success",
@@ -2025,13 +2749,17 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
             if m:
                 assert m.group(1) == SOME_UUID
                 assert auth == SOME_AUTH
+                assert isinstance(data, MultipartEncoder) and headers == {'Content-Type': data.content_type}
+                assert files is None
                 if expect_datafile_for_mocked_post:
-                    assert isinstance(files, dict) and 'datafile' in files and isinstance(files['datafile'], io.BytesIO)
+                    [datafile] = data.files
+                    assert isinstance(datafile, io.BytesIO)
                 else:
-                    assert files == {'datafile': None}
+                    assert data.files == []
                 return FakeResponse(201, json={'submission_id': SOME_UUID})
             else:
-                # Old protocol used
+                # The probe for the old protocol, which this server doesn't support
+                assert data == b'' and files is None
                 return FakeResponse(404, json={})
 
     partial_res = {
@@ -2114,8 +2842,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                                                return_value=SOME_KEYDICT):
                             with mock.patch.object(submission_module, "resolve_server", return_value=SOME_SERVER):
                                 with mock.patch.object(submission_module, "yes_or_no", return_value=True):
-                                    with mock.patch("requests.post", mocked_post):
-                                        with mock.patch("requests.get",
+                                    with portal_post(mocked_post):
+                                        with portal_get(
                                                         make_mocked_get(done_after_n_tries=get_request_attempts)):
                                             try:
                                                 submit_any_ingestion(SOME_BUNDLE_FILENAME,
@@ -2149,8 +2877,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -2179,7 +2907,10 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                                                             keydict=SOME_KEYDICT,
                                                             upload_folder=None,
                                                             no_query=False,
-                                                            subfolders=False)
+                                                            subfolders=False,
+                                                            parallel_uploads=1,
+                                                            plan=False,
+                                                            upload_order=None)
         assert shown.lines == Scenario.make_successful_submission_lines(get_request_attempts)
 
     dt.reset_datetime()
@@ -2198,8 +2929,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -2252,7 +2983,10 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                                                                 keydict=SOME_KEYDICT,
                                                                 upload_folder=None,
                                                                 no_query=False,
-                                                                subfolders=False)
+                                                                subfolders=False,
+                                                                parallel_uploads=1,
+                                                                plan=False,
+                                                                upload_order=None)
         assert shown.lines == Scenario.make_successful_submission_lines(get_request_attempts)
 
     dt.reset_datetime()
@@ -2272,8 +3006,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -2306,6 +3040,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
 
     # This tests the normal case with validate_only=False and a post error due to multipart/form-data unsupported,
     # a symptom of the metadata bundle submission protocol being unsupported.
+    # This server acts differently than the one above, so what was learned of that one's protocol is forgotten.
+    submission_module._OLD_PROTOCOL_SUPPORT.clear()  # noQA - protected member
 
     def unsupported_media_type(*args, **kwargs):
         ignored(args, kwargs)
@@ -2325,8 +3061,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", unsupported_media_type):
-                                    with mock.patch("requests.get",
+                                with portal_post(unsupported_media_type):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts,
                                                                     success=False)):
                                         with mock.patch("datetime.datetime", dt):
@@ -2381,8 +3117,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mysterious_error):
-                                    with mock.patch("requests.get",
+                                with portal_post(mysterious_error):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts,
                                                                     success=False)):
                                         with mock.patch("datetime.datetime", dt):
@@ -2417,6 +3153,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
     dt.reset_datetime()
 
     # This tests the normal case with validate_only=False and an error result.
+    # The server is a new one again, unlike those just above.
+    submission_module._OLD_PROTOCOL_SUPPORT.clear()  # noQA - protected member
 
     with shown_output() as shown:
         with mock.patch("os.path.exists", mfs.exists):
@@ -2428,8 +3166,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts,
                                                                     success=False)):
                                         with mock.patch("datetime.datetime", dt):
@@ -2470,8 +3208,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch("requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                                     make_mocked_get(done_after_n_tries=get_request_attempts)):
                                         with mock.patch("datetime.datetime", dt):
                                             with mock.patch("time.sleep", dt.sleep):
@@ -2511,9 +3249,8 @@ def test_submit_any_ingestion_new_protocol(mock_get_health_page):
                         with mock.patch.object(submission_module, "yes_or_no", return_value=True):
                             with mock.patch.object(KEY_MANAGER, "get_keydict_for_server",
                                                    return_value=SOME_KEYDICT):
-                                with mock.patch("requests.post", mocked_post):
-                                    with mock.patch(
-                                        "requests.get",
+                                with portal_post(mocked_post):
+                                    with portal_get(
                                         make_mocked_get(done_after_n_tries=ATTEMPTS_BEFORE_TIMEOUT + 1)
                                     ):
                                         with mock.patch("datetime.datetime", dt):
@@ -2577,6 +3314,36 @@ def test_search_for_file(
             assert not error_msg, "Error message found when not expected"
 
 
+def test_upload_folder_index(tmp_path):
+
+    folder = tmp_path / "to_upload"
+    for relative_path in ["foo.fastq.gz", "bar.fastq.gz", "files/foo.fastq.gz", "files/more/baz.fastq.gz",
+                          "files/.hidden/qux.fastq.gz", ".hidden_file.fastq.gz"]:
+        path = folder / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+    folder = folder.as_posix()
+    file_names = ["foo.fastq.gz", "bar.fastq.gz", "baz.fastq.gz", "qux.fastq.gz", ".hidden_file.fastq.gz",
+                  "missing.fastq.gz", "files/foo.fastq.gz", "*.fastq.gz"]
+
+    for directory, recursive in [(folder, False), (folder + "/**", True), (folder + "/files", False),
+                                 (folder + "/no-such-folder/**", True), (folder + "/*", False)]:
+        folder_index = UploadFolderIndex(directory, recursive=recursive)
+        for file_name in file_names:
+            # The index gets exactly the same results (and error messages) as globbing does.
+            assert (search_for_file(directory, file_name, recursive=recursive, folder_index=folder_index)
+                    == search_for_file(directory, file_name, recursive=recursive))
+
+    folder_index = UploadFolderIndex(folder + "/**", recursive=True)
+    with mock.patch.object(os, "scandir", wraps=os.scandir) as mock_scandir:
+        for file_name in file_names:
+            folder_index.lookup(file_name)
+        assert mock_scandir.call_count == 3  # Just once for each (non-hidden) folder, not once per file
+    assert folder_index.lookup("foo.fastq.gz") == [folder + "/foo.fastq.gz", folder + "/files/foo.fastq.gz"]
+    assert folder_index.lookup("qux.fastq.gz") == []
+    assert folder_index.lookup("files/foo.fastq.gz") is None  # Left to glob
+
+
 @pytest.mark.parametrize(
     "no_query,submitr_selective_uploads,yes_or_no_result,error_raised,expected_result",
     [
@@ -3032,10 +3799,10 @@ def test_upload_file_to_new_uuid():
 
     def test_it(schema_name, auth, expected_post_item, **context_attributes):
 
-        def mocked_post_metadata(post_item, schema_name, key):
-            assert post_item == expected_post_item
-            assert schema_name == expected_schema_name
-            assert key == mocked_good_auth, "Simulated authorization failure"
+        def mocked_portal_metadata_post(schema, data, auth):
+            assert data == expected_post_item
+            assert schema == expected_schema_name
+            assert auth == mocked_good_auth, "Simulated authorization failure"
             return {
                 '@graph': [
                     mocked_good_file_metadata
@@ -3043,8 +3810,8 @@ def test_upload_file_to_new_uuid():
             }
 
         # Note: compute_file_post_data is allowed to run without mocking
-        with mock.patch("dcicutils.ff_utils.post_metadata") as mock_post_metadata:
-            mock_post_metadata.side_effect = mocked_post_metadata
+        with mock.patch.object(submission_module, "portal_metadata_post") as mock_portal_metadata_post:
+            mock_portal_metadata_post.side_effect = mocked_portal_metadata_post
             with mock.patch.object(submission_module, "execute_prearranged_upload") as mock_execute_prearranged_upload:
                 mock_execute_prearranged_upload.side_effect = mocked_execute_prearranged_upload
                 res = upload_file_to_new_uuid(mocked_good_filename, schema_name=schema_name, auth=auth,
@@ -3190,6 +3957,54 @@ def test_check_submit_ingestion_with_app_None():
         assert KEY_MANAGER.selected_app == DEFAULT_APP
 
 
+def test_monitor_submit_ingestions(tmp_path):
+
+    # uuid-a finishes on its second check, uuid-b on its third, and uuid-c never does.
+    finish_after = {'uuid-a': 2, 'uuid-b': 3, 'uuid-c': None}
+    checks = []
+
+    def mocked_check_ingestion_progress(uuid, *, keypair, server):
+        assert keypair == SOME_AUTH and server == SOME_SERVER
+        checks.append(uuid)
+        if uuid == 'uuid-c' and checks.count(uuid) == 2:
+            raise ConnectionError("The portal hiccuped.")
+        if finish_after[uuid] == checks.count(uuid):
+            return True, 'success', {'uuid': uuid}
+        return False, 'validating', {'uuid': uuid}
+
+    def monitor(uuids, polling_strategy, summary_file=None):
+        checks.clear()
+        with mock.patch.object(submission_module, "_check_ingestion_progress", mocked_check_ingestion_progress):
+            with mock.patch.object(KEY_MANAGER, "get_keydict_for_server", return_value=SOME_KEYDICT):
+                with mock.patch.object(submission_module.time, "sleep") as mock_sleep:
+                    with shown_output() as shown:
+                        result = monitor_submit_ingestions(uuids, server=SOME_SERVER, env=None,
+                                                           polling_strategy=polling_strategy,
+                                                           summary_file=summary_file)
+                        return result, shown.lines, mock_sleep.call_count
+
+    summary_file = str(tmp_path / "summary.json")
+    results, lines, n_sleeps = monitor(['uuid-a', 'uuid-b', 'uuid-a'], PollingStrategy(initial_interval=5),
+                                       summary_file=summary_file)
+    assert checks == ['uuid-a', 'uuid-b', 'uuid-a', 'uuid-b', 'uuid-b']  # Once per round, while not done
+    assert n_sleeps == 2
+    assert {uuid: (result['done'], result['status'], result['checks']) for uuid, result in results.items()} == {
+        'uuid-a': (True, 'success', 2),
+        'uuid-b': (True, 'success', 3),
+    }
+    assert lines[-3].endswith(" Final statuses:")
+    assert lines[-2:] == ["uuid-a: Success", "uuid-b: Success"]
+    assert json.loads(open(summary_file).read()) == [
+        {'uuid': 'uuid-a', 'done': True, 'status': 'success', 'checks': 2},
+        {'uuid': 'uuid-b', 'done': True, 'status': 'success', 'checks': 3},
+    ]
+
+    # When the polling strategy gives up on something not done, that's reported and we exit with status 1.
+    with system_exit_expected(exit_code=1):
+        monitor(['uuid-c', 'uuid-a'], PollingStrategy(initial_interval=5, max_attempts=3))
+    assert checks == ['uuid-c', 'uuid-a', 'uuid-c', 'uuid-a', 'uuid-c']
+
+
 def test_summarize_submission():
 
     # env supplied
@@ -3211,7 +4026,7 @@ def test_summarize_submission():
 
 def test_check_ingestion_progress():
 
-    with mock.patch.object(submission_module, "portal_request_get") as mock_portal_request_get:
+    with portal_get() as mock_portal_request_get:
 
         def test_it(data, *, expect_done, expect_short_status):
             api_response = FakeResponse(status_code=200, json=data)
@@ -158,3 +158,38 @@ def test_submit_metadata_bundle_script(keyfile):
             expect_exit_code=0,
             expect_called=True,
             expect_call_args=expect_call_args)
+
+
+@pytest.mark.parametrize("args_in, local_validation, strict_local_validation", [
+    (['some-file'], True, False),
+    (['some-file', '--no-local-validation'], False, False),
+    (['some-file', '--strict-local-validation'], True, True),
+])
+def test_submit_metadata_bundle_script_local_validation(args_in, local_validation, strict_local_validation):
+
+    with mock.patch.object(submit_metadata_bundle_module, "submit_any_ingestion") as mock_submit_any_ingestion:
+        with system_exit_expected(exit_code=0):
+            submit_metadata_bundle_main(args_in)
+        assert mock_submit_any_ingestion.call_args.kwargs['local_validation'] is local_validation
+        assert mock_submit_any_ingestion.call_args.kwargs['strict_local_validation'] is strict_local_validation
+        mock_submit_any_ingestion.reset_mock()
+
+        with argparse_errors_muffled():
+            with system_exit_expected(exit_code=2):
+                submit_metadata_bundle_main(['some-file', '--no-local-validation', '--strict-local-validation'])
+        mock_submit_any_ingestion.assert_not_called()
+
+
+def test_submit_metadata_bundle_script_plan():
+
+    with mock.patch.object(submit_metadata_bundle_module, "submit_any_ingestion") as mock_submit_any_ingestion:
+        with system_exit_expected(exit_code=0):
+            submit_metadata_bundle_main(['some-file', '--plan'])
+        assert mock_submit_any_ingestion.call_args.kwargs['plan'] is True
+        assert mock_submit_any_ingestion.call_args.kwargs['validate_only'] is False
+        mock_submit_any_ingestion.reset_mock()
+        # A plan needs the bundle to be submitted, so it can't be just validated.
+        with argparse_errors_muffled():
+            with system_exit_expected(exit_code=2):
+                submit_metadata_bundle_main(['some-file', '--plan', '--validate-only'])
+        mock_submit_any_ingestion.assert_not_called()
@@ -1,9 +1,13 @@
+import json
 import pytest
+
+from dcicutils.command_utils import ScriptFailure
+from dcicutils.qa_utils import raises_regexp
 from unittest import mock
 from .. import submission as submission_module
 from ..base import DefaultKeyManager
 from ..scripts import submit_ontology as submit_ontology_module
-from ..scripts.submit_ontology import main as submit_ontology_main
+from ..scripts.submit_ontology import main as submit_ontology_main, verify_ontology_file
 from .testing_helpers import system_exit_expected, argparse_errors_muffled, temporary_json_file
 
 
@@ -71,3 +75,28 @@ def test_submit_ontology_script(keyfile):
                 expect_exit_code=0,
                 expect_called=True,
                 expect_call_args=expect_call_args)
+
+
+def test_verify_ontology_file(tmp_path):
+
+    ontology_file = tmp_path / "ontology.json"
+    terms = [{'term_id': 'T:1'}, {'term_id': 'T:2', 'parents': ['T:1']}]
+    ontology_file.write_text(json.dumps({'ontology_term': terms}))
+    with mock.patch.object(submit_ontology_module, "show") as mock_show:
+        assert verify_ontology_file(str(ontology_file)) is True
+        mock_show.assert_called_with(f"Verified specified ontology (JSON) file: {ontology_file} (ontology terms: 2)")
+
+    ontology_file.write_text(json.dumps({'ontology_term': [{'term_id': 'T:1'}, {'term_id': 'T:1'}, {}]}))
+    with mock.patch.object(submit_ontology_module, "show") as mock_show:
+        with raises_regexp(ScriptFailure, "Specified ontology \\(JSON\\) file has problems: .*"
+                                          " \\(ontology terms: 3, with problems: 2\\)"):
+            verify_ontology_file(str(ontology_file))
+        assert [c.args[0] for c in mock_show.call_args_list] == [
+            "The ontology term at byte 39 has the same term_id (T:1) as one before it.",
+            "The ontology term at byte 59 has no term_id.",
+        ]
+
+    ontology_file.write_text('{"ontology_term": [')
+    with raises_regexp(ScriptFailure, "Cannot load specified ontology \\(JSON\\) file: .*"
+                                      " \\| .*Expecting value at byte 19"):
+        verify_ontology_file(str(ontology_file))
@@ -0,0 +1,162 @@
+import json
+import os
+import time
+
+from unittest import mock
+
+from .. import upload_journal as upload_journal_module
+from ..upload_journal import UploadJournal, file_identity
+
+
+SOME_UUID = 'some-uuid'
+SOME_BUCKET = 'some-bucket'
+SOME_KEY = 'some-uuid/some-file.bam'
+SOME_PART_SIZE = 5 * 1024 ** 2
+
+
+def test_file_identity(tmp_path):
+
+    path = tmp_path / "some-file.bam"
+    assert file_identity(str(path)) is None
+    path.write_bytes(b"1234")
+    identity = file_identity(str(path))
+    assert identity['size'] == 4
+    assert identity['mtime'] == os.stat(path).st_mtime_ns
+
+
+def test_upload_journal_checkpoints(tmp_path):
+
+    path = tmp_path / "some-file.bam"
+    path.write_bytes(b"x" * 100)
+    path = str(path)
+    journal_file = str(tmp_path / "journal" / "upload_journal.json")
+
+    journal = UploadJournal(journal_file)
+    checkpoint = journal.checkpoint(uuid=SOME_UUID, path=path)
+    assert checkpoint.resumable_upload(bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE) is None
+    checkpoint.start(bucket=SOME_BUCKET, key=SOME_KEY, upload_id='some-upload-id', part_size=SOME_PART_SIZE)
+    checkpoint.record_part(1, '"etag-1"')
+    checkpoint.record_part(3, '"etag-3"')
+    checkpoint.flush()  # as the engine does when it stops sending parts
+
+    # A later run (with a fresh journal object) sees the same progress, as long as the file is unchanged.
+    journal = UploadJournal(journal_file)
+    checkpoint = journal.checkpoint(uuid=SOME_UUID, path=path)
+    assert (checkpoint.resumable_upload(bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE)
+            == ('some-upload-id', {1: '"etag-1"', 3: '"etag-3"'}))
+    # ... and only for the same destination and part size.
+    assert checkpoint.resumable_upload(bucket=SOME_BUCKET, key='other-key', part_size=SOME_PART_SIZE) is None
+    assert checkpoint.resumable_upload(bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE * 2) is None
+    assert journal.checkpoint(uuid='other-uuid', path=path).resumable_upload(
+        bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE) is None
+
+    assert not journal.is_finished(uuid=SOME_UUID, path=path)
+    journal.mark_finished(uuid=SOME_UUID, path=path)  # Does nothing, since the upload hasn't completed.
+    assert not journal.is_finished(uuid=SOME_UUID, path=path)
+
+    checkpoint.complete()
+    assert checkpoint.resumable_upload(bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE) is None
+    assert not journal.is_finished(uuid=SOME_UUID, path=path)
+    journal.mark_finished(uuid=SOME_UUID, path=path)
+    assert journal.is_finished(uuid=SOME_UUID, path=path)
+    assert UploadJournal(journal_file).is_finished(uuid=SOME_UUID, path=path)
+
+    # Changing the file invalidates what the journal knows about it.
+    with open(path, 'ab') as fp:
+        fp.write(b"more")
+    assert not UploadJournal(journal_file).is_finished(uuid=SOME_UUID, path=path)
+
+    checkpoint.start(bucket=SOME_BUCKET, key=SOME_KEY, upload_id='another-upload-id', part_size=SOME_PART_SIZE)
+    checkpoint.discard()
+    assert checkpoint.resumable_upload(bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE) is None
+
+
+def test_upload_journal_robustness(tmp_path):
+
+    path = tmp_path / "some-file.bam"
+    path.write_bytes(b"x")
+    path = str(path)
+    journal_file = tmp_path / "upload_journal.json"
+
+    journal_file.write_text("not json")
+    journal = UploadJournal(str(journal_file))
+    assert not journal.is_finished(uuid=SOME_UUID, path=path)
+    journal.checkpoint(uuid=SOME_UUID, path=path).complete()
+    assert journal.get_entry(uuid=SOME_UUID, path=path)['completed'] is True
+    assert list(json.loads(journal_file.read_text())) == [UploadJournal.entry_key(SOME_UUID, path)]
+
+    # Old entries are dropped.
+    later = time.time() + upload_journal_module.UPLOAD_JOURNAL_EXPIRATION_SECONDS + 1
+    with mock.patch.object(time, "time", return_value=later):
+        assert UploadJournal(str(journal_file)).get_entry(uuid=SOME_UUID, path=path) is None
+
+
+def test_upload_journal_parts_log(tmp_path):
+
+    path = tmp_path / "some-file.bam"
+    path.write_bytes(b"x" * 100)
+    path = str(path)
+    journal_file = tmp_path / "upload_journal.json"
+    journal = UploadJournal(str(journal_file))
+    checkpoint = journal.checkpoint(uuid=SOME_UUID, path=path)
+    checkpoint.start(bucket=SOME_BUCKET, key=SOME_KEY, upload_id='some-upload-id', part_size=SOME_PART_SIZE)
+    journal_text = journal_file.read_text()
+
+    def logged_parts():
+        return UploadJournal(str(journal_file)).checkpoint(uuid=SOME_UUID, path=path).resumable_upload(
+            bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE)[1]
+
+    # Parts are logged a batch at a time, to a log of their own, rather than the journal being saved for each.
+    with mock.patch.object(upload_journal_module, "PARTS_LOG_BATCH_SIZE", 2):
+        checkpoint.record_part(1, '"etag-1"')
+        assert logged_parts() == {}
+        assert checkpoint.resumable_upload(bucket=SOME_BUCKET, key=SOME_KEY, part_size=SOME_PART_SIZE)[1] == {
+            1: '"etag-1"'}  # This run knows about the parts it hasn't logged yet, though.
+        checkpoint.record_part(2, '"etag-2"')
+        assert logged_parts() == {1: '"etag-1"', 2: '"etag-2"'}
+        checkpoint.record_part(3, '"etag-3"')
+        with mock.patch.object(time, "monotonic", return_value=time.monotonic() + 60):
+            checkpoint.record_part(4, '"etag-4"')  # A batch is also logged once it's been waiting a while.
+        assert logged_parts() == {1: '"etag-1"', 2: '"etag-2"', 3: '"etag-3"', 4: '"etag-4"'}
+    assert journal_file.read_text() == journal_text
+    parts_log = journal.parts_log(uuid=SOME_UUID, path=path)
+    assert len(open(parts_log).readlines()) == 4
+
+    # A line left unfinished by an interruption, or from another upload, is ignored.
+    with open(parts_log, 'a') as fp:
+        fp.write('other-upload-id 5 "etag-5"\nsome-upload-id 6 "et')
+    assert sorted(logged_parts()) == [1, 2, 3, 4]
+
+    # Starting again, or completing the upload, forgets the parts.
+    checkpoint.start(bucket=SOME_BUCKET, key=SOME_KEY, upload_id='new-upload-id', part_size=SOME_PART_SIZE)
+    assert not os.path.exists(parts_log)
+    checkpoint.record_part(1, '"new-etag-1"')
+    checkpoint.flush()
+    assert os.path.exists(parts_log)
+    checkpoint.complete()
+    assert not os.path.exists(parts_log)
+
+
+def test_upload_journal_shared(tmp_path):
+
+    paths = []
+    for name in ["one.bam", "two.bam"]:
+        (tmp_path / name).write_bytes(b"x")
+        paths.append(str(tmp_path / name))
+    journal_file = str(tmp_path / "upload_journal.json")
+
+    # Journals in different processes, sharing a file, each reread it before saving, so neither undoes the other.
+    journal, other_journal = UploadJournal(journal_file), UploadJournal(journal_file)
+    assert not journal.is_finished(uuid=SOME_UUID, path=paths[0])
+    assert not other_journal.is_finished(uuid=SOME_UUID, path=paths[1])
+    journal.checkpoint(uuid=SOME_UUID, path=paths[0]).complete()
+    other_journal.checkpoint(uuid=SOME_UUID, path=paths[1]).complete()
+    journal.mark_finished(uuid=SOME_UUID, path=paths[0])
+    other_journal.mark_finished(uuid=SOME_UUID, path=paths[1])
+    for path in paths:
+        assert journal.is_finished(uuid=SOME_UUID, path=path)
+        assert other_journal.is_finished(uuid=SOME_UUID, path=path)
+        assert UploadJournal(journal_file).is_finished(uuid=SOME_UUID, path=path)
+    other_journal.forget(uuid=SOME_UUID, path=paths[0])
+    assert not journal.is_finished(uuid=SOME_UUID, path=paths[0])
+    assert journal.is_finished(uuid=SOME_UUID, path=paths[1])
@@ -0,0 +1,65 @@
+import pytest
+
+from dcicutils.misc_utils import local_attrs
+from dcicutils.qa_utils import raises_regexp
+
+from .. import upload_scheduling as upload_scheduling_module
+from ..upload_scheduling import (
+    UPLOAD_ORDERS, UPLOAD_SCHEDULERS, UploadOrder, register_upload_scheduler, resolve_upload_order, schedule_uploads,
+)
+
+
+@pytest.fixture
+def found_files(tmp_path):
+    found = []
+    for uuid, size in [('small', 10), ('large', 1000), ('medium', 100), ('same-medium', 100)]:
+        path = tmp_path / f"{uuid}.fastq"
+        path.write_bytes(b"x" * size)
+        found.append(({'uuid': uuid, 'filename': path.name}, str(path), None))
+    found.append(({'uuid': 'missing', 'filename': 'missing.fastq'}, None, "No upload file found: missing.fastq"))
+    return found
+
+
+def uuids(found_files):
+    return [upload_spec['uuid'] for upload_spec, file_path, error_msg in found_files]
+
+
+def test_schedule_uploads(found_files):
+
+    assert uuids(schedule_uploads(found_files, UploadOrder.PORTAL)) == uuids(found_files)
+    # Files that weren't found come first, and files of the same size stay in portal order.
+    assert uuids(schedule_uploads(found_files, UploadOrder.LARGEST_FIRST)) == [
+        'missing', 'large', 'medium', 'same-medium', 'small'
+    ]
+    assert uuids(schedule_uploads(found_files, UploadOrder.SMALLEST_FIRST)) == [
+        'missing', 'small', 'medium', 'same-medium', 'large'
+    ]
+    # A scheduler can also be given directly.
+    assert uuids(schedule_uploads(found_files, lambda files: files[::-1])) == uuids(found_files)[::-1]
+
+
+def test_resolve_upload_order():
+
+    with local_attrs(upload_scheduling_module, DEFAULT_UPLOAD_ORDER=None):
+        assert resolve_upload_order(parallel_uploads=1) is UPLOAD_SCHEDULERS[UploadOrder.PORTAL]
+        assert resolve_upload_order(parallel_uploads=4) is UPLOAD_SCHEDULERS[UploadOrder.LARGEST_FIRST]
+        assert resolve_upload_order('smallest-first', parallel_uploads=4) is UPLOAD_SCHEDULERS['smallest-first']
+
+    with local_attrs(upload_scheduling_module, DEFAULT_UPLOAD_ORDER='smallest-first'):
+        assert resolve_upload_order(parallel_uploads=4) is UPLOAD_SCHEDULERS[UploadOrder.SMALLEST_FIRST]
+
+    with raises_regexp(ValueError, "Unknown upload order: 'random'"):
+        resolve_upload_order('random')
+
+
+def test_register_upload_scheduler(found_files):
+
+    def reversed_scheduler(files):
+        return files[::-1]
+
+    with local_attrs(upload_scheduling_module, UPLOAD_SCHEDULERS=dict(UPLOAD_SCHEDULERS),
+                     UPLOAD_ORDERS=list(UPLOAD_ORDERS)):
+        register_upload_scheduler('reversed', reversed_scheduler)
+        assert upload_scheduling_module.UPLOAD_ORDERS[-1] == 'reversed'
+        assert uuids(schedule_uploads(found_files, 'reversed')) == uuids(found_files)[::-1]
+    assert 'reversed' not in UPLOAD_ORDERS
@@ -0,0 +1,43 @@
+import json
+
+from ..upload_throughput import MAX_THROUGHPUT_SAMPLES, UploadThroughputHistory, measure_read_throughput
+
+
+SOME_MEGABYTES = 100 * 1024 ** 2
+
+
+def test_upload_throughput_history(tmp_path):
+
+    history_file = tmp_path / "history" / "upload_throughput.json"
+    history = UploadThroughputHistory(str(history_file))
+    assert history.throughput() is None
+
+    history.record(SOME_MEGABYTES, seconds=10)
+    history.record(SOME_MEGABYTES, seconds=30)
+    history.record(10, seconds=1)  # Too small to count.
+    history.record(SOME_MEGABYTES, seconds=0)  # Nonsense
+    assert history.throughput() == (SOME_MEGABYTES / 20, 2)
+
+    # Samples with the same parallelism are preferred, if there are any.
+    history.record(SOME_MEGABYTES, seconds=1, parallel_uploads=4)
+    assert history.throughput(parallel_uploads=4) == (SOME_MEGABYTES, 1)
+    assert history.throughput(parallel_uploads=1) == (SOME_MEGABYTES / 20, 2)
+    assert history.throughput(parallel_uploads=2) == (SOME_MEGABYTES * 3 / 41, 3)
+
+    # Only recent samples are kept.
+    for _ in range(MAX_THROUGHPUT_SAMPLES):
+        history.record(SOME_MEGABYTES, seconds=5)
+    assert history.throughput() == (SOME_MEGABYTES / 5, MAX_THROUGHPUT_SAMPLES)
+
+    history_file.write_text("not json")
+    assert UploadThroughputHistory(str(history_file)).throughput() is None
+    history_file.write_text(json.dumps({'not': 'a list'}))
+    assert UploadThroughputHistory(str(history_file)).throughput() is None
+
+
+def test_measure_read_throughput(tmp_path):
+
+    path = tmp_path / "some-file.fastq"
+    path.write_bytes(b"x" * 1000)
+    assert measure_read_throughput([str(tmp_path / "no-such-file"), str(path)]) > 0
+    assert measure_read_throughput([str(tmp_path / "no-such-file")]) is None
@@ -1,11 +1,17 @@
+import asyncio
 import contextlib
 import pytest
 import re
 
+from collections.abc import Mapping
 from unittest import mock
 
 from .. import utils as utils_module
-from ..utils import show, keyword_as_title, FakeResponse, ERASE_LINE, TIMESTAMP_REGEXP
+from dcicutils.qa_utils import raises_regexp
+from ..utils import (
+    show, keyword_as_title, parse_byte_size, check_repeatedly, check_repeatedly_async, FakeResponse, PollingStrategy,
+    ERASE_LINE, TIMESTAMP_REGEXP, format_byte_size, format_duration,
+)
 
 
 @contextlib.contextmanager
@@ -138,3 +144,159 @@ def test_fake_response():
 
     with pytest.raises(Exception):
         error_response.raise_for_status()
+
+
+def test_parse_byte_size():
+
+    assert parse_byte_size(17) == 17
+    assert parse_byte_size('17') == 17
+    assert parse_byte_size('1K') == 1024
+    assert parse_byte_size('64MB') == 64 * 1024 ** 2
+    assert parse_byte_size('64 mib') == 64 * 1024 ** 2
+    assert parse_byte_size('1.5G') == 3 * 1024 ** 3 // 2
+    assert parse_byte_size('2TB') == 2 * 1024 ** 4
+
+    for bad_size in ['', 'MB', 'lots', '-1MB', '64XB']:
+        with pytest.raises(ValueError):
+            parse_byte_size(bad_size)
+
+
+def test_format_byte_size():
+
+    assert format_byte_size(0) == '0 bytes'
+    assert format_byte_size(1) == '1 byte'
+    assert format_byte_size(1023) == '1023 bytes'
+    assert format_byte_size(1536) == '1.5KB'
+    assert format_byte_size(64 * 1024 ** 2) == '64.0MB'
+    assert format_byte_size(3 * 1024 ** 4) == '3.0TB'
+    assert parse_byte_size(format_byte_size(1536)) == 1536
+
+
+class UnreversibleDict(Mapping):
+    # A mapping that, like a dict before Python 3.8, can't be given to reversed().
+
+    def __init__(self, items):
+        self._dict = dict(items)
+
+    def __getitem__(self, key):
+        return self._dict[key]
+
+    def __iter__(self):
+        return iter(self._dict)
+
+    def __len__(self):
+        return len(self._dict)
+
+
+def test_format_byte_size_without_reversible_dicts():
+
+    units = UnreversibleDict(utils_module.BYTE_SIZE_UNITS)
+    with pytest.raises(TypeError):
+        reversed(units)
+    with mock.patch.object(utils_module, "BYTE_SIZE_UNITS", units):
+        assert format_byte_size(1023) == '1023 bytes'
+        assert format_byte_size(1536) == '1.5KB'
+        assert format_byte_size(3 * 1024 ** 4) == '3.0TB'
+
+
+def test_format_duration():
+
+    assert format_duration(0) == '0s'
+    assert format_duration(41.2) == '42s'
+    assert format_duration(125) == '2m 05s'
+    assert format_duration(7500) == '2h 05m'
+
+
+def test_polling_strategy():
+
+    # The default is to wait the same interval every time, forever.
+    strategy = PollingStrategy(initial_interval=15)
+    assert [strategy.interval(n) for n in range(1, 5)] == [15, 15, 15, 15]
+    assert not strategy.exhausted(attempts=1000, elapsed=10 ** 6)
+
+    strategy = PollingStrategy(initial_interval=2, backoff=2, max_interval=20, max_attempts=6)
+    assert [strategy.interval(n) for n in range(1, 7)] == [2, 4, 8, 16, 20, 20]
+    assert not strategy.exhausted(attempts=5, elapsed=10 ** 6)
+    assert strategy.exhausted(attempts=6, elapsed=0)
+
+    strategy = PollingStrategy(initial_interval=2, backoff=2, deadline=30)
+    assert not strategy.exhausted(attempts=1000, elapsed=29.5)
+    assert strategy.exhausted(attempts=1, elapsed=30)
+    assert strategy.wait_seconds(attempts=4, elapsed=10) == 16
+    assert strategy.wait_seconds(attempts=4, elapsed=25) == 5  # Don't wait past the deadline
+    assert strategy.wait_seconds(attempts=4, elapsed=29.9) == 1
+
+    strategy = PollingStrategy(initial_interval=100, jitter=0.1)
+    waits = {strategy.interval(1) for _ in range(200)}
+    assert min(waits) >= 90 and max(waits) <= 110 and len(waits) > 1
+
+    assert PollingStrategy(initial_interval=0).interval(1) == 0
+
+    for bad_args, message in [({'initial_interval': -1}, "must not be negative"),
+                              ({'initial_interval': 10, 'max_interval': 5}, "must not be less than"),
+                              ({'backoff': 0.5}, "backoff must be at least 1"),
+                              ({'jitter': 1}, "jitter must be at least 0 and less than 1"),
+                              ({'deadline': 0}, "deadline must be a positive")]:
+        with raises_regexp(ValueError, message):
+            PollingStrategy(**bad_args)
+
+
+def test_check_repeatedly_with_polling_strategy():
+
+    now = [0]
+    waits = []
+
+    def mocked_sleep(seconds):
+        now[0] += seconds
+        waits.append(seconds)
+
+    checks = []
+
+    def check_function():
+        checks.append(now[0])
+        return len(checks) >= 4, "some status", "some response"
+
+    with mock.patch.object(utils_module.time, "sleep", mocked_sleep):
+        with mock.patch.object(utils_module.time, "monotonic", lambda: now[0]):
+
+            result = check_repeatedly(check_function, messages=False,
+                                      polling_strategy=PollingStrategy(initial_interval=1, backoff=3))
+            assert result == (True, "some status", "some response")
+            assert checks == [0, 1, 4, 13]  # Waits of 1, 3 and 9 seconds
+            assert set(waits) == {1}  # ... each done a second at a time
+
+            checks.clear()
+            now[0] = 0
+            result = check_repeatedly(check_function, messages=False,
+                                      polling_strategy=PollingStrategy(initial_interval=1, backoff=3, deadline=3))
+            assert result == (False, "some status", "some response")
+            assert checks == [0, 1, 3]  # The second wait is cut short by the deadline, after which it gives up.
+            assert now[0] == 3
+
+
+def test_check_repeatedly_async():
+
+    now = [0]
+    checks = []
+
+    async def mocked_sleep(seconds):
+        now[0] += seconds
+
+    async def check_function():
+        checks.append(now[0])
+        return len(checks) >= 3, "some status", "some response"
+
+    with mock.patch.object(utils_module.asyncio, "sleep", mocked_sleep):
+        with mock.patch.object(utils_module.time, "monotonic", lambda: now[0]):
+
+            polling_strategy = PollingStrategy(initial_interval=2, backoff=2)
+            result = asyncio.run(check_repeatedly_async(check_function, polling_strategy=polling_strategy))
+            assert result == (True, "some status", "some response")
+            assert checks == [0, 2, 6]
+
+            checks.clear()
+            now[0] = 0
+            polling_strategy = PollingStrategy(initial_interval=2, max_attempts=2)
+            result = asyncio.run(check_repeatedly_async(check_function, polling_strategy=polling_strategy))
+            assert result == (False, "some status", "some response")
+            assert checks == [0, 2]
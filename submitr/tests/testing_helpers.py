@@ -3,6 +3,7 @@ import contextlib
 import json
 import os
 import tempfile
+import time
 from typing import Any, Generator
 from unittest import mock
 
@@ -41,3 +42,23 @@ def temporary_json_file(data: dict) -> Generator[Any, None, None]:
                 os.remove(filename)
             except Exception:  # perhaps someone else already removed it
                 pass
+
+
+class FakeClock:
+    """
+    Stands in for time.monotonic, time.time and time.sleep, so that waiting takes no real time.
+    """
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def patched(self):
+        return mock.patch.multiple(time, monotonic=self.time, time=self.time, sleep=self.sleep)
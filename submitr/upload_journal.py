@@ -0,0 +1,319 @@
+# This file contains the upload journal, a local record of the progress of in-process uploads.
+# It lets a later run (e.g., resume-uploads) continue a multipart upload from its last completed part,
+# and skip files whose uploads already finished, rather than sending every file again from byte zero.
+#
+# The journal itself (one entry for each upload) is a JSON file, which is only rewritten when an upload starts,
+# completes or is forgotten, holding a lock file while it's reread, merged and saved, so that several submitr
+# processes on a host can share it. The parts of each multipart upload are appended, a batch at a time,
+# to a log of their own, so that recording a part costs the same however many parts there are.
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+from typing import Dict, List, Optional, Tuple
+from .base import SUBMITR_DIR
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - e.g., on Windows
+    fcntl = None
+
+
+UPLOAD_JOURNAL_VAR = 'SUBMITR_UPLOAD_JOURNAL'
+DEFAULT_UPLOAD_JOURNAL_FILE = os.environ.get(UPLOAD_JOURNAL_VAR) or os.path.join(SUBMITR_DIR, 'upload_journal.json')
+
+# Entries not touched for this long are dropped, since the multipart uploads they describe will be long gone.
+UPLOAD_JOURNAL_EXPIRATION_SECONDS = 30 * 24 * 60 * 60
+
+# Completed parts are added to an upload's parts log in batches of this many, or of however many there are
+# once this many seconds have passed since the first of them (and whenever the engine stops sending parts).
+# Parts recorded since the last batch are just sent again by a later run if this one is killed.
+PARTS_LOG_BATCH_SIZE = 16
+PARTS_LOG_BATCH_SECONDS = 5
+
+
+def file_identity(path: str) -> Optional[dict]:
+    """
+    Returns a dictionary identifying the current content of the file at path by its size and modification time,
+    or None if there is no such file.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+class UploadJournal:
+    """
+    A journal, kept in a JSON file, of uploads in progress or done, keyed by item uuid and local file.
+
+    An entry only counts for as long as the file's identity (its size and modification time) is unchanged,
+    so a file that is edited or replaced is always uploaded afresh.
+    """
+
+    def __init__(self, filename: str = DEFAULT_UPLOAD_JOURNAL_FILE):
+        self.filename = filename
+        self.parts_directory = f"{filename}.parts"
+        self._lock = threading.RLock()
+        self._entries: Optional[Dict[str, dict]] = None
+        self._entries_identity: Optional[dict] = None  # the file_identity of the journal file when last read
+
+    @staticmethod
+    def entry_key(uuid: str, path: str) -> str:
+        return f"{uuid}:{os.path.abspath(path)}"
+
+    def _load(self) -> Dict[str, dict]:
+        # The journal is reread whenever it has changed since it was last read (e.g., saved by another process).
+        identity = file_identity(self.filename)
+        if self._entries is None or identity != self._entries_identity:
+            try:
+                with open(self.filename) as fp:
+                    entries = json.load(fp)
+            except (OSError, ValueError):  # A missing or damaged journal is just an empty one.
+                entries = {}
+            expired = time.time() - UPLOAD_JOURNAL_EXPIRATION_SECONDS
+            self._entries = {key: entry for key, entry in entries.items()
+                             if isinstance(entry, dict) and entry.get('updated', 0) > expired}
+            self._entries_identity = identity
+            for key in set(entries) - set(self._entries):
+                self._remove_parts_log(key)
+        return self._entries
+
+    def _save(self) -> None:
+        temporary_filename = f"{self.filename}.{os.getpid()}.tmp"
+        with open(temporary_filename, 'w') as fp:
+            json.dump(self._entries, fp, indent=1)
+        os.replace(temporary_filename, self.filename)  # So that an interruption can't leave a half-written journal
+        self._entries_identity = file_identity(self.filename)
+
+    @contextlib.contextmanager
+    def _updating(self):
+        # Holds the journal's lock file (where there's a way to lock it) while yielding its entries as they are now,
+        # to be updated, and then saves them, so that processes sharing the journal don't undo each other's updates.
+        with self._lock:
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if fcntl is None:  # pragma: no cover - e.g., on Windows
+                yield self._load()
+                self._save()
+                return
+            with io.open(os.open(f"{self.filename}.lock", os.O_RDWR | os.O_CREAT, 0o644), 'r+') as fp:
+                fcntl.flock(fp, fcntl.LOCK_EX)
+                try:
+                    yield self._load()
+                    self._save()
+                finally:
+                    fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def get_entry(self, uuid: str, path: str) -> Optional[dict]:
+        """
+        Returns (a copy of) the journal entry for uploading path to the item uuid,
+        or None if there is none for the file as it is now.
+        """
+        with self._lock:
+            entry = self._load().get(self.entry_key(uuid, path))
+            if entry is None or entry.get('file') != file_identity(path):
+                return None
+            return json.loads(json.dumps(entry))
+
+    def update_entry(self, uuid: str, path: str, **updates) -> None:
+        """
+        Updates (or creates) the journal entry for uploading path to the item uuid, saving the journal.
+        """
+        with self._updating() as entries:
+            key = self.entry_key(uuid, path)
+            identity = file_identity(path)
+            entry = entries.get(key)
+            if entry is None or entry.get('file') != identity:
+                entry = entries[key] = {'file': identity}
+            entry.update(updates, updated=time.time())
+
+    def forget(self, uuid: str, path: str) -> None:
+        """
+        Removes any journal entry (and parts log) for uploading path to the item uuid.
+        """
+        with self._lock:
+            self.forget_parts(uuid, path)
+            if self.entry_key(uuid, path) in self._load():
+                with self._updating() as entries:
+                    entries.pop(self.entry_key(uuid, path), None)
+
+    def _parts_log(self, key: str) -> str:
+        return os.path.join(self.parts_directory, hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.log')
+
+    def _remove_parts_log(self, key: str) -> None:
+        try:
+            os.remove(self._parts_log(key))
+        except OSError:
+            pass
+
+    def parts_log(self, uuid: str, path: str) -> str:
+        """
+        Returns the name of the file in which the parts of a multipart upload of path to the item uuid are logged.
+        """
+        return self._parts_log(self.entry_key(uuid, path))
+
+    def log_parts(self, uuid: str, path: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        """
+        Appends the given (part_number, etag) parts of the multipart upload upload_id of path to the item uuid
+        to its parts log.
+        """
+        if parts:
+            os.makedirs(self.parts_directory, exist_ok=True)
+            # A single write of whole lines, appended, so that processes logging parts at once can't mix them up.
+            with open(self.parts_log(uuid, path), 'a') as fp:
+                fp.write(''.join(f"{upload_id} {part_number} {etag}\n" for part_number, etag in parts))
+
+    def logged_parts(self, uuid: str, path: str, upload_id: str) -> Dict[int, str]:
+        """
+        Returns the parts logged for the multipart upload upload_id of path to the item uuid,
+        as a dictionary mapping part numbers to ETags.
+        """
+        parts = {}
+        try:
+            with open(self.parts_log(uuid, path)) as fp:
+                for line in fp:
+                    fields = line.split()
+                    # A line from another upload, or left unfinished by an interruption, is ignored.
+                    if len(fields) == 3 and fields[0] == upload_id and fields[1].isdigit() and line.endswith('\n'):
+                        parts[int(fields[1])] = fields[2]
+        except OSError:
+            pass
+        return parts
+
+    def forget_parts(self, uuid: str, path: str) -> None:
+        """
+        Removes the parts log (if any) for uploading path to the item uuid.
+        """
+        self._remove_parts_log(self.entry_key(uuid, path))
+
+    def is_finished(self, uuid: str, path: str) -> bool:
+        """
+        Returns True if path (and any extra files that go with it) have been fully uploaded to the item uuid.
+        """
+        entry = self.get_entry(uuid, path)
+        return bool(entry and entry.get('finished'))
+
+    def mark_finished(self, uuid: str, path: str) -> None:
+        """
+        Records that path (and any extra files that go with it) have been fully uploaded to the item uuid,
+        provided the journal already shows the upload of path itself as completed.
+        """
+        entry = self.get_entry(uuid, path)
+        if entry and entry.get('completed'):
+            self.update_entry(uuid, path, finished=True)
+
+    def checkpoint(self, uuid: str, path: str) -> 'UploadCheckpoint':
+        """
+        Returns an UploadCheckpoint through which an upload engine can record, and later resume,
+        its progress uploading path to the item uuid.
+        """
+        return UploadCheckpoint(journal=self, uuid=uuid, path=path)
+
+
+class UploadCheckpoint:
+    """
+    The journal's view of the upload of one file to one item, as used by S3UploadEngine.
+    """
+
+    def __init__(self, journal: UploadJournal, uuid: str, path: str):
+        self.journal = journal
+        self.uuid = uuid
+        self.path = path
+        self._lock = threading.Lock()
+        self._upload_id: Optional[str] = None
+        self._batch: List[Tuple[int, str]] = []  # parts recorded but not yet logged
+        self._batch_started = 0.0
+
+    def resumable_upload(self, bucket: str, key: str, part_size: int) -> Optional[Tuple[str, Dict[int, str]]]:
+        """
+        If an incomplete multipart upload of this file to the given bucket and key, using the given part size,
+        was started earlier, returns (upload_id, parts) where parts maps the numbers of completed parts
+        to their ETags. Otherwise, returns None.
+        """
+        entry = self.journal.get_entry(self.uuid, self.path)
+        if (not entry or entry.get('completed') or not entry.get('upload_id')
+                or (entry.get('bucket'), entry.get('key'), entry.get('part_size')) != (bucket, key, part_size)):
+            return None
+        upload_id = entry['upload_id']
+        with self._lock:
+            self._upload_id = upload_id
+            parts = self.journal.logged_parts(self.uuid, self.path, upload_id)
+            parts.update(self._batch)
+        return upload_id, parts
+
+    def start(self, bucket: str, key: str, upload_id: Optional[str] = None, part_size: Optional[int] = None) -> None:
+        """
+        Records that a new upload of this file has started, replacing any earlier record of it.
+        """
+        with self._lock:
+            self._upload_id = upload_id
+            self._batch = []
+        self.journal.forget(self.uuid, self.path)
+        self.journal.update_entry(self.uuid, self.path, bucket=bucket, key=key, upload_id=upload_id,
+                                  part_size=part_size)
+
+    def record_part(self, part_number: int, etag: str) -> None:
+        """
+        Records that the given part of a multipart upload has been uploaded, with the given ETag.
+        Parts are logged in batches (see PARTS_LOG_BATCH_SIZE), or by flush.
+        """
+        with self._lock:
+            if not self._batch:
+                self._batch_started = time.monotonic()
+            self._batch.append((part_number, etag))
+            if (len(self._batch) >= PARTS_LOG_BATCH_SIZE
+                    or time.monotonic() - self._batch_started >= PARTS_LOG_BATCH_SECONDS):
+                self._log_batch()
+
+    def flush(self) -> None:
+        """
+        Logs any parts recorded since the last batch was logged.
+        """
+        with self._lock:
+            self._log_batch()
+
+    def _log_batch(self) -> None:
+        if self._batch:
+            upload_id = self._upload_id or (self.journal.get_entry(self.uuid, self.path) or {}).get('upload_id')
+            if upload_id:
+                self.journal.log_parts(self.uuid, self.path, upload_id, self._batch)
+            self._batch = []
+
+    def complete(self) -> None:
+        """
+        Records that the upload of this file has completed.
+        """
+        with self._lock:
+            self._batch = []
+        self.journal.update_entry(self.uuid, self.path, completed=True, upload_id=None)
+        self.journal.forget_parts(self.uuid, self.path)
+
+    def discard(self) -> None:
+        """
+        Forgets about this upload, so that a later attempt will start from scratch.
+        """
+        with self._lock:
+            self._batch = []
+        self.journal.forget(self.uuid, self.path)
+
+
+_UPLOAD_JOURNAL = None
+
+
+def get_upload_journal() -> UploadJournal:
+    """
+    Returns the UploadJournal shared by all uploads, creating it on first use.
+    Its file is DEFAULT_UPLOAD_JOURNAL_FILE, which can be set with SUBMITR_UPLOAD_JOURNAL.
+    """
+    global _UPLOAD_JOURNAL
+    if _UPLOAD_JOURNAL is None:
+        _UPLOAD_JOURNAL = UploadJournal()
+    return _UPLOAD_JOURNAL
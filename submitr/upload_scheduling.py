@@ -0,0 +1,87 @@
+# This file contains the upload schedulers, which decide the order in which do_uploads (see submitr.submission)
+# starts uploading files. Each file's extra files (e.g., indexes) are uploaded right after it, by the same worker,
+# so a file and its extra files are scheduled together, as one job.
+
+import os
+
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+
+# A found file, as do_uploads has it: an (upload_spec, file_path, error_msg) tuple.
+FoundFile = Tuple[dict, Optional[str], Optional[str]]
+# A scheduler takes the found files, in the order the portal listed them, and returns them in the order to upload them.
+UploadScheduler = Callable[[List[FoundFile]], List[FoundFile]]
+
+
+class UploadOrder:
+    PORTAL = 'portal'  # as the portal listed them
+    LARGEST_FIRST = 'largest-first'  # so that no big file starts late and finishes long after the rest
+    SMALLEST_FIRST = 'smallest-first'  # so that as many files as possible are done (or have failed) early on
+
+
+UPLOAD_ORDER_VAR = 'SUBMITR_UPLOAD_ORDER'
+# If this is not set, parallel uploads are done largest first (see resolve_upload_order), and others in portal order.
+DEFAULT_UPLOAD_ORDER = os.environ.get(UPLOAD_ORDER_VAR) or None
+
+
+def _file_size(found_file: FoundFile) -> int:
+    upload_spec, file_path, error_msg = found_file
+    try:
+        return os.path.getsize(file_path) if file_path and not error_msg else 0
+    except OSError:
+        return 0
+
+
+def _by_size(largest_first: bool) -> UploadScheduler:
+
+    def scheduler(found_files: List[FoundFile]) -> List[FoundFile]:
+        # Files that weren't found go first, so that their messages are seen early. Otherwise, ties keep portal order.
+        return sorted(found_files, key=lambda found_file: (not found_file[2],
+                                                           -_file_size(found_file) if largest_first
+                                                           else _file_size(found_file)))
+
+    return scheduler
+
+
+UPLOAD_SCHEDULERS: Dict[str, UploadScheduler] = {
+    UploadOrder.PORTAL: list,
+    UploadOrder.LARGEST_FIRST: _by_size(largest_first=True),
+    UploadOrder.SMALLEST_FIRST: _by_size(largest_first=False),
+}
+
+UPLOAD_ORDERS = list(UPLOAD_SCHEDULERS)
+
+
+def register_upload_scheduler(upload_order: str, scheduler: UploadScheduler) -> None:
+    """
+    Makes a new upload order available, by name (e.g., to a command's --upload-order argument).
+    """
+    UPLOAD_SCHEDULERS[upload_order] = scheduler
+    if upload_order not in UPLOAD_ORDERS:
+        UPLOAD_ORDERS.append(upload_order)
+
+
+def resolve_upload_order(upload_order: Union[str, UploadScheduler, None] = None,
+                         parallel_uploads: int = 1) -> UploadScheduler:
+    """
+    Returns the scheduler for the given upload order, which may be the name of one (see UPLOAD_ORDERS),
+    a scheduler itself, or None for the default (SUBMITR_UPLOAD_ORDER, if set, or else largest first
+    when uploading in parallel, where that shortens the total time, and portal order otherwise).
+    """
+    upload_order = upload_order or DEFAULT_UPLOAD_ORDER
+    if callable(upload_order):
+        return upload_order
+    if upload_order is None:
+        upload_order = UploadOrder.LARGEST_FIRST if parallel_uploads > 1 else UploadOrder.PORTAL
+    scheduler = UPLOAD_SCHEDULERS.get(upload_order)
+    if scheduler is None:
+        raise ValueError(f"Unknown upload order: {upload_order!r}. Expected one of: {', '.join(UPLOAD_ORDERS)}")
+    return scheduler
+
+
+def schedule_uploads(found_files: List[FoundFile], upload_order: Union[str, UploadScheduler, None] = None,
+                     parallel_uploads: int = 1) -> List[FoundFile]:
+    """
+    Returns the found files in the order in which to upload them (see resolve_upload_order).
+    """
+    return resolve_upload_order(upload_order, parallel_uploads=parallel_uploads)(list(found_files))
@@ -0,0 +1,106 @@
+# This file contains the upload throughput history, a local record of how quickly recent uploads went,
+# so that an upload plan (see plan_uploads in submitr.submission) can estimate how long a set of uploads will take.
+
+import json
+import os
+import threading
+import time
+
+from typing import List, Optional, Tuple
+from .base import SUBMITR_DIR
+
+
+DEFAULT_UPLOAD_THROUGHPUT_FILE = os.path.join(SUBMITR_DIR, 'upload_throughput.json')
+
+# Only this many of the most recent samples are kept, so that estimates follow changes in network conditions.
+MAX_THROUGHPUT_SAMPLES = 20
+# Runs that upload less than this are too dominated by overheads to say much about throughput.
+MIN_THROUGHPUT_SAMPLE_BYTES = 1024 ** 2
+# When there is no history, this much of the local files is read to measure how quickly they can be read.
+READ_SAMPLE_BYTES = 64 * 1024 ** 2
+
+
+class UploadThroughputHistory:
+    """
+    A history, kept in a JSON file, of the number of bytes uploaded, and the seconds it took, in recent runs.
+    """
+
+    def __init__(self, filename: str = DEFAULT_UPLOAD_THROUGHPUT_FILE):
+        self.filename = filename
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[dict]:
+        try:
+            with open(self.filename) as fp:
+                samples = json.load(fp)
+        except (OSError, ValueError):  # A missing or damaged history is just an empty one.
+            return []
+        return [sample for sample in samples if isinstance(sample, dict)
+                and sample.get('bytes', 0) > 0 and sample.get('seconds', 0) > 0] if isinstance(samples, list) else []
+
+    def record(self, n_bytes: int, seconds: float, parallel_uploads: int = 1) -> None:
+        """
+        Records that n_bytes were uploaded (parallel_uploads files at a time) in the given number of seconds.
+        """
+        if n_bytes < MIN_THROUGHPUT_SAMPLE_BYTES or seconds <= 0:
+            return
+        with self._lock:
+            samples = self.samples()
+            samples.append({'bytes': n_bytes, 'seconds': seconds, 'parallel_uploads': parallel_uploads,
+                            'recorded': time.time()})
+            directory = os.path.dirname(self.filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temporary_filename = f"{self.filename}.{os.getpid()}.tmp"
+            with open(temporary_filename, 'w') as fp:
+                json.dump(samples[-MAX_THROUGHPUT_SAMPLES:], fp, indent=1)
+            os.replace(temporary_filename, self.filename)
+
+    def throughput(self, parallel_uploads: Optional[int] = None) -> Optional[Tuple[float, int]]:
+        """
+        Returns the overall throughput, in bytes per second, of the recorded uploads (only those done with the given
+        number of parallel uploads, if there are any), and how many samples that's from, or None if there are none.
+        """
+        samples = self.samples()
+        matching = [sample for sample in samples if sample.get('parallel_uploads', 1) == parallel_uploads]
+        samples = matching or samples
+        if not samples:
+            return None
+        return sum(sample['bytes'] for sample in samples) / sum(sample['seconds'] for sample in samples), len(samples)
+
+
+def measure_read_throughput(paths: List[str], sample_bytes: int = READ_SAMPLE_BYTES) -> Optional[float]:
+    """
+    Returns how quickly, in bytes per second, up to sample_bytes of the given files could be read,
+    or None if none of them could be. Uploads can go no faster than this, so it gives a best case.
+    """
+    n_bytes = 0
+    start = time.perf_counter()
+    for path in paths:
+        try:
+            with open(path, 'rb') as fp:
+                while n_bytes < sample_bytes:
+                    data = fp.read(min(1024 ** 2, sample_bytes - n_bytes))
+                    if not data:
+                        break
+                    n_bytes += len(data)
+        except OSError:
+            continue
+        if n_bytes >= sample_bytes:
+            break
+    seconds = time.perf_counter() - start
+    return n_bytes / seconds if n_bytes and seconds > 0 else None
+
+
+_UPLOAD_THROUGHPUT_HISTORY: Optional[UploadThroughputHistory] = None
+
+
+def get_upload_throughput_history() -> UploadThroughputHistory:
+    """
+    Returns the UploadThroughputHistory shared by all uploads, creating it on first use.
+    Its file is DEFAULT_UPLOAD_THROUGHPUT_FILE, in the directory given by SUBMITR_DIR.
+    """
+    global _UPLOAD_THROUGHPUT_HISTORY
+    if _UPLOAD_THROUGHPUT_HISTORY is None:
+        _UPLOAD_THROUGHPUT_HISTORY = UploadThroughputHistory()
+    return _UPLOAD_THROUGHPUT_HISTORY
@@ -1,7 +1,11 @@
+import asyncio
 import datetime
 import io
+import math
+import random
+import re
 import time
-from typing import Any, Callable, Tuple, Union
+from typing import Any, Awaitable, Callable, Optional, Tuple, Union
 from dcicutils.misc_utils import ignored, PRINT
 from json import dumps as json_dumps, loads as json_loads
 
@@ -50,6 +54,53 @@ def keyword_as_title(keyword):
     return keyword.replace("_", " ").title()
 
 
+BYTE_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+BYTE_SIZE_REGEXP = re.compile(r"^\s*([0-9]+(?:[.][0-9]*)?)\s*([KMGT]?)(?:I?B)?\s*$", re.IGNORECASE)
+
+
+def parse_byte_size(size: Union[int, str]) -> int:
+    """
+    Given a size such as 1048576, '1048576', '64MB', '64M', '64MiB' or '1.5G', returns a number of bytes.
+
+    Unit prefixes are always taken to be binary (powers of 1024), as they are for the AWS CLI's own
+    multipart settings, so '8MB' means 8388608 bytes.
+
+    :param size: an integer or a string containing a number, optionally followed by a unit
+    :return: the number of bytes as an integer
+    """
+    if isinstance(size, int):
+        return size
+    matched = BYTE_SIZE_REGEXP.match(str(size))
+    if not matched:
+        raise ValueError(f"Not a valid byte size: {size!r}")
+    number, unit = matched.groups()
+    return int(float(number) * BYTE_SIZE_UNITS[unit.upper()])
+
+
+def format_byte_size(size: int) -> str:
+    """
+    Given a number of bytes, returns a short description of it (the inverse of parse_byte_size), such as '1.5GB'.
+    """
+    for unit, unit_size in reversed(list(BYTE_SIZE_UNITS.items())):  # Dicts aren't reversible before Python 3.8.
+        if size >= unit_size and unit:
+            return "%.1f%sB" % (size / unit_size, unit)
+    return f"{size} bytes" if size != 1 else "1 byte"
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Given a number of seconds, returns a short description of that duration, such as '2h 05m' or '42s'.
+    """
+    seconds = int(math.ceil(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
 class FakeResponse:
 
     def __init__(self, status_code, json=None, content=None):
@@ -77,6 +128,64 @@ class FakeResponse:
             raise Exception(f"{self} raised for status.")
 
 
+class PollingStrategy:
+    """
+    Says how long check_repeatedly should wait before each check after the first, and when it should give up.
+
+    The first wait is initial_interval seconds, and each after that is backoff times longer than the one before,
+    up to max_interval. Each wait is then randomly stretched or shrunk by up to the given jitter fraction
+    (so that many clients don't check in lockstep), and rounded to a whole number of seconds
+    (at least 1, unless initial_interval is 0, meaning not to wait at all).
+    Checking stops after max_attempts checks (if positive), or once deadline seconds (if given) have passed.
+    """
+
+    def __init__(self, initial_interval: int = 10, max_interval: Optional[int] = None, backoff: float = 1.0,
+                 jitter: float = 0.0, deadline: Optional[float] = None, max_attempts: int = -1):
+        if initial_interval < 0:
+            raise ValueError(f"The initial polling interval must not be negative: {initial_interval}")
+        if max_interval is not None and max_interval < initial_interval:
+            raise ValueError(f"The maximum polling interval, {max_interval},"
+                             f" must not be less than the initial interval, {initial_interval}.")
+        if backoff < 1:
+            raise ValueError(f"The polling backoff must be at least 1: {backoff}")
+        if not 0 <= jitter < 1:
+            raise ValueError(f"The polling jitter must be at least 0 and less than 1: {jitter}")
+        if deadline is not None and deadline <= 0:
+            raise ValueError(f"The polling deadline must be a positive number of seconds: {deadline}")
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+
+    def interval(self, attempts: int) -> int:
+        """
+        Returns how many seconds to wait after the given number of checks have been made.
+        """
+        seconds = self.initial_interval * self.backoff ** max(attempts - 1, 0)
+        if self.max_interval is not None:
+            seconds = min(seconds, self.max_interval)
+        if self.jitter:
+            seconds *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(int(round(seconds)), 1 if self.initial_interval else 0)
+
+    def exhausted(self, attempts: int, elapsed: float) -> bool:
+        """
+        Returns True if no more checks should be made after the given number of checks, and seconds elapsed.
+        """
+        return (attempts >= self.max_attempts > 0) or (self.deadline is not None and elapsed >= self.deadline)
+
+    def wait_seconds(self, attempts: int, elapsed: float) -> int:
+        """
+        Returns how many seconds to wait before the next check, never waiting much beyond the deadline.
+        """
+        seconds = self.interval(attempts)
+        if self.deadline is not None:
+            seconds = max(min(seconds, math.ceil(self.deadline - elapsed)), 1 if seconds else 0)
+        return seconds
+
+
 # TODO: If deemed generally useful then move to dcicutils.
 def check_repeatedly(check_function: Callable,
                      wait_seconds: int = 10,
@@ -87,7 +196,8 @@ def check_repeatedly(check_function: Callable,
                      stop_message: str = None,
                      response_message: bool = True,
                      messages: bool = True,
-                     verbose: bool = True) -> Union[Tuple[bool, str, Any], Any]:
+                     verbose: bool = True,
+                     polling_strategy: Optional[PollingStrategy] = None) -> Union[Tuple[bool, str, Any], Any]:
     """
     Calls the given function (check_function) repeatedly, until it returns either a tuple whose first element is
     truthy, or just a non-tuple truthy value, waiting between calls for the given number (wait_seconds) of seconds,
@@ -100,6 +210,9 @@ def check_repeatedly(check_function: Callable,
     the function is called, how long (in seconds) till the next call, and how many times in total it has been called.
     Additionally, if the response_message argument is True (default) then if the function finally returns a truthy
     value, then that value will be printed to the stdout.
+
+    If a polling_strategy is given, it is used instead of wait_seconds and repeat_count to decide how long
+    to wait between calls, and when to give up.
     """
     ignored(response_message)  # TODO: Why is this not used? -kmp 2-Aug-2023
 
@@ -113,6 +226,9 @@ def check_repeatedly(check_function: Callable,
         done_message = "Processing complete"
     if not stop_message:
         stop_message = "Giving up waiting for processing completion"
+    if polling_strategy is None:
+        polling_strategy = PollingStrategy(initial_interval=wait_seconds, max_attempts=repeat_count)
+    started = time.monotonic()
     ntimes = 0
     check_function_returning_tuple = True
     check_status = "Not Done Yet"
@@ -134,14 +250,42 @@ def check_repeatedly(check_function: Callable,
                 output(f"{done_message} {f'| Status: {check_status.title()}' if check_status else ''}"
                        f" | Checked: {ntimes} time{'s' if ntimes != 1 else ''}\n")
             return check_function_response
-        if ntimes >= repeat_count > 0:
+        elapsed = time.monotonic() - started
+        if polling_strategy.exhausted(ntimes, elapsed):
             if messages:
                 output(f"{stop_message} {f'| Status: {check_status.title()}' if check_status else ''}"
                        f" | Checked: {ntimes} time{'s' if ntimes != 1 else ''}\n")
             return check_function_response if check_function_returning_tuple else False
+        wait_seconds = polling_strategy.wait_seconds(ntimes, elapsed)
         for i in range(wait_seconds):
             time.sleep(1)
             if messages:
                 output(f"{wait_message} {f'| Status: {check_status.title()}' if check_status else ''}"
                        f" | Checked: {ntimes} time{'s' if ntimes != 1 else ''}"
                        f" | Next check: {wait_seconds - i} second{'s' if wait_seconds - i != 1 else ''} ...")
+
+
+async def check_repeatedly_async(check_function: Callable[[], Awaitable],
+                                 polling_strategy: PollingStrategy) -> Union[Tuple[bool, str, Any], Any]:
+    """
+    Like check_repeatedly, but awaits the given check_function (a coroutine function) for each check,
+    and awaits asyncio.sleep between checks (as the polling_strategy says), rather than blocking,
+    so that many things can be checked on at once from one event loop. It shows no messages.
+    """
+    started = time.monotonic()
+    ntimes = 0
+    while True:
+        check_function_response = await check_function()
+        ntimes += 1
+        if isinstance(check_function_response, Tuple) and len(check_function_response) >= 2:
+            check_done = check_function_response[0]
+            check_function_returning_tuple = True
+        else:
+            check_done = check_function_response
+            check_function_returning_tuple = False
+        if check_done:
+            return check_function_response
+        elapsed = time.monotonic() - started
+        if polling_strategy.exhausted(ntimes, elapsed):
+            return check_function_response if check_function_returning_tuple else False
+        await asyncio.sleep(polling_strategy.wait_seconds(ntimes, elapsed))